@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime
+from filtering_bigbox import filtering
+
+
+def filtering_baseline(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout):
+    """The original per-line loop of filtering(), kept as the baseline of the benchmark"""
+    with open(fout, 'w') as fo:
+        with open(fin, 'r') as fi:
+            for line in fi:
+                t = line.strip().split('\t')
+                pid    = t[0].strip()
+                uid    = t[1].strip()
+                time   = t[3].strip()
+                lng    = t[10].strip()
+                lat    = t[11].strip()
+                acc    = t[12].strip()
+                url    = t[13].strip()
+                marker = t[22].strip()
+
+                if len(pid) == 0 or len(uid) == 0 or \
+                   len(time) == 0 or len(lng) == 0 or \
+                   len(lat) == 0 or len(acc) == 0 or \
+                   len(url) == 0 or len(marker) == 0: continue
+
+                lng = float(lng)
+                lat = float(lat)
+                if lng < lng_min or lng > lng_max: continue
+                if lat < lat_min or lat > lat_max: continue
+
+                dt = datetime.strptime(time, '%Y-%m-%d %H:%M:%S.%f')
+                if dt < time_min or dt > time_max: continue
+
+                fo.write(pid + ',' + uid + ',' + time + ',' + \
+                         str(lng) + ',' + str(lat) + ',' + \
+                         acc + ',' + url + ',' + marker + '\n')
+
+
+def gen_synthetic(fname, nrows, ratio_in=0.05, seed=0):
+    """Generate a synthetic YFCC100M-like file, about ratio_in of the records are in the Melbourne big box"""
+    rng = random.Random(seed)
+    with open(fname, 'w') as f:
+        for i in range(nrows):
+            if rng.random() < ratio_in:
+                lng = rng.uniform(141.9, 147.1)
+                lat = rng.uniform(-39.3, -35.8)
+            else:
+                lng = rng.uniform(-180, 180)
+                lat = rng.uniform(-90, 90)
+            uid = '%d@N%02d' % (rng.randint(1, 10**8), rng.randint(0, 9))
+            pid = str(rng.randint(1, 10**10))
+            ts = '%04d-%02d-%02d %02d:%02d:%02d.0' % (rng.randint(2000, 2015), rng.randint(1, 12), rng.randint(1, 28), \
+                                                      rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))
+            t = [pid, uid, 'nick', ts, '1111467388', 'camera', 'title', 'description', 'tags', '', \
+                 '%.6f' % lng, '%.6f' % lat, '16', 'http://www.flickr.com/photos/' + uid + '/' + pid + '/', \
+                 'http://farm1.staticflickr.com/8/' + pid + '.jpg', 'Attribution License', \
+                 'http://creativecommons.org/licenses/by/2.0/', '8', '1', 'abc', 'abc', 'jpg', '0']
+            f.write('\t'.join(t) + '\n')
+
+
+if __name__ == '__main__':
+    nrows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    lng_min = 141.9
+    lat_min = -39.3
+    lng_max = 147.1
+    lat_max = -35.8
+    time_min = datetime.strptime('2000-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
+    time_max = datetime.strptime('2015-03-05 23:59:59', '%Y-%m-%d %H:%M:%S')
+
+    fin = tempfile.NamedTemporaryFile(suffix='.tsv', delete=False).name
+    fout1 = fin + '.out1'
+    fout2 = fin + '.out2'
+    try:
+        gen_synthetic(fin, nrows)
+        results = []
+        for func, fout in [(filtering_baseline, fout1), (filtering, fout2)]:
+            t0 = time.time()
+            func(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout)
+            elapsed = time.time() - t0
+            results.append(elapsed)
+            print('%-20s %8.2f seconds, %10.0f rows/sec' % (func.__name__, elapsed, nrows / elapsed))
+        with open(fout1, 'r') as f1, open(fout2, 'r') as f2:
+            assert(f1.read() == f2.read())
+        print('speedup: %.2fx' % (results[0] / results[1]))
+    finally:
+        for fname in [fin, fout1, fout2]:
+            if os.path.exists(fname): os.unlink(fname)
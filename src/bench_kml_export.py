@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import os
+import random
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+from generate_tables import HEADER1, HEADER2
+from traj_store import TrajectoryStore
+from kml_export import export_kml
+
+
+def measure(func, *args):
+    """Return (seconds, peak memory in MB) of func(*args)"""
+    t0 = time.time()
+    func(*args)
+    elapsed = time.time() - t0
+    tracemalloc.start()  # tracing slows down a lot, time it separately
+    func(*args)
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def gen_tables(ftable1, ftable2, ntrajs, nphotos=10, seed=0):
+    """Generate synthetic trajectory tables of generate_tables.py, nphotos photos per trajectory"""
+    rng = random.Random(seed)
+    with open(ftable1, 'w') as f1, open(ftable2, 'w') as f2:
+        f1.write(HEADER1)
+        f2.write(HEADER2)
+        for tid in range(ntrajs):
+            uid = '%d@N%02d' % (rng.randint(10**7, 10**8), rng.randint(0, 9))
+            lng = rng.uniform(144.6, 145.4)
+            lat = rng.uniform(-38.1, -37.6)
+            for j in range(nphotos):
+                pid = 10**9 + tid * nphotos + j
+                f1.write('%d,%d,%s,2013-12-28 %02d:%02d:00,%r,%r,16,0,http://www.flickr.com/photos/%s/%d/\n' % \
+                         (tid, pid, uid, 10 + j // 60, j % 60, round(lng + 0.001 * j, 6), round(lat + 0.001 * j, 6), uid, pid))
+            f2.write('%d,%s,%d,2013-12-28 10:00:00,%r,%r,%r\n' % (tid, uid, nphotos, 1.2345, nphotos - 1.0, 1.2345 / (nphotos - 1) * 60))
+
+
+def gen_kml_baseline(fname, ftable1, ftable2, traj_id_list):
+    """traj_visualise.gen_kml() with both tables in memory"""
+    from traj_visualise import load_traj, gen_kml
+    traj_data, traj_stats = load_traj(ftable1, ftable2)
+    gen_kml(fname, traj_data, traj_stats, traj_id_list)
+
+
+if __name__ == '__main__':
+    ntrajs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ftable1 = os.path.join(tmpdir, 'trajectory_photos.csv')
+        ftable2 = os.path.join(tmpdir, 'trajectory_stats.csv')
+        gen_tables(ftable1, ftable2, ntrajs)
+
+        with TrajectoryStore(ftable1, ftable2) as store:
+            traj_id_list = store.stats_table()['Trajectory_ID'].tolist()
+            print('%d trajectories' % len(traj_id_list))
+            for n in [len(traj_id_list) // 10, len(traj_id_list)]:
+                for ext in ['kml', 'kmz']:
+                    fout = os.path.join(tmpdir, 'out.' + ext)
+                    elapsed, peak = measure(export_kml, fout, store, traj_id_list[:n])
+                    print('export_kml  %6d trajectories to %s %8.2f seconds, %8.0f trajectories/sec, peak memory %6.1f MB' % \
+                          (n, ext.upper(), elapsed, n / elapsed, peak))
+
+        try:
+            import fastkml
+        except ImportError:
+            print('fastkml is not installed, skip the baseline traj_visualise.gen_kml()')
+            sys.exit(0)
+        n = min(len(traj_id_list), 1000)  # too slow for more
+        elapsed, peak = measure(gen_kml_baseline, os.path.join(tmpdir, 'baseline.kml'), ftable1, ftable2, traj_id_list[:n])
+        print('gen_kml     %6d trajectories to KML %8.2f seconds, %8.0f trajectories/sec, peak memory %6.1f MB' % \
+              (n, elapsed, n / elapsed, peak))
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from photo_table import load_csv
+
+
+def load_data_tuples(fname):
+    """The original generate_tables.load_data(), i.e. a list of tuples, kept as the baseline of the benchmark"""
+    data = []
+    firstline = True
+    with open(fname, 'r') as f:
+        for line in f:
+            if firstline:
+                firstline = False
+                continue
+            t = line.strip().split(',')
+            pid = t[0].strip()
+            uid = t[1].strip()
+            time = datetime.strptime(t[2].strip(), '%Y-%m-%d %H:%M:%S.%f')
+            lng = float(t[3].strip())
+            lat = float(t[4].strip())
+            acc = int(t[5].strip())
+            url = t[6].strip()
+            marker = int(t[7].strip())
+            data.append((pid, uid, time, lng, lat, acc, url, marker))
+    return data
+
+
+def gen_synthetic(fname, nrows, nusers=None, seed=0):
+    """Generate a synthetic photo file in the format of filtering_bigbox.filtering() (with header)"""
+    rng = random.Random(seed)
+    if nusers is None: nusers = max(1, nrows // 50)
+    uids = ['%d@N%02d' % (rng.randint(10**7, 10**8), rng.randint(0, 9)) for _ in range(nusers)]
+    t0 = datetime(2005, 1, 1)
+    with open(fname, 'w') as f:
+        f.write('Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, URL, Marker(photo=0 video=1)\n')
+        for i in range(nrows):
+            uid = uids[rng.randrange(nusers)]
+            pid = 10**9 + i
+            ts = t0 + timedelta(seconds=rng.randint(0, 3 * 10**8))
+            f.write('%d,%s,%s.0,%.6f,%.6f,%d,http://www.flickr.com/photos/%s/%d/,0\n' % \
+                    (pid, uid, ts.strftime('%Y-%m-%d %H:%M:%S'), rng.uniform(144.6, 145.4), rng.uniform(-38.1, -37.6), \
+                     rng.randint(1, 16), uid, pid))
+
+
+def measure(func, fname):
+    """Return (seconds, retained memory in MB, peak memory in MB) of data = func(fname)"""
+    t0 = time.time()
+    data = func(fname)
+    elapsed = time.time() - t0
+    del data
+    tracemalloc.start()  # tracing slows down loading a lot, time it separately
+    data = func(fname)
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert(len(data) > 0)
+    return elapsed, current / 2**20, peak / 2**20
+
+
+if __name__ == '__main__':
+    nrows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+
+    fin = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
+    try:
+        gen_synthetic(fin, nrows)
+        for func in [load_data_tuples, load_csv]:
+            elapsed, current, peak = measure(func, fin)
+            print('%-18s %8.2f seconds, memory %8.1f MB (%6.1f bytes/photo), peak memory %8.1f MB' % \
+                  (func.__name__, elapsed, current, current * 2**20 / nrows, peak))
+    finally:
+        os.unlink(fin)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import platform
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import profiling
+import pipeline
+import kml_export
+from datetime import datetime
+from traj_store import TrajectoryStore
+from synthetic_yfcc import SyntheticYFCC
+from generate_tables import load_data, segment_trajectories, filter_segments, dump_segments
+
+
+def gen_kml(fkml, fphotos, fstats):
+    """KML of all trajectories with more than one photo, traj_visualise.gen_kml() if fastkml is installed,
+       kml_export.export_kml() (the same stage name) otherwise, return the function used
+    """
+    try:
+        import traj_visualise
+    except ImportError:
+        traj_visualise = None
+    if traj_visualise is not None:
+        (traj_data, traj_stats) = traj_visualise.load_traj(fphotos, fstats)
+        traj_visualise.gen_kml(fkml, traj_data, traj_stats, pipeline.view_traj_ids(traj_stats, 'all'))
+        return 'traj_visualise.gen_kml'
+    with TrajectoryStore(fphotos, fstats) as store:
+        kml_export.export_kml(fkml, store, pipeline.view_traj_ids(store.stats_table(), 'all'))
+    return 'kml_export.export_kml'
+
+
+def bench(nrows, tmpdir, seed=0, filter_workers=1, time_gap=8, min_photos_per_traj=1):
+    """Generate nrows synthetic records and run each stage of the pipeline on them, return the profile records"""
+    start = len(profiling.RECORDS)
+    fyfcc = os.path.join(tmpdir, 'yfcc100m_synthetic.tsv')
+    fbigbox = os.path.join(tmpdir, 'bigbox.csv')
+    (fphotos, fstats) = (os.path.join(tmpdir, 'trajectory_photos.csv'), os.path.join(tmpdir, 'trajectory_stats.csv'))
+    with profiling.stage('generate', rows=nrows):
+        SyntheticYFCC(nrows, seed).write(fyfcc)
+    pipeline.stage_filtering([fyfcc], [fbigbox], pipeline.BIGBOX, pipeline.TIME_WINDOW, filter_workers)
+    os.unlink(fyfcc)
+    data = load_data(fbigbox)
+    (offsets, index) = segment_trajectories(data, time_gap)
+    (offsets, index) = filter_segments(*pipeline.BBOX, offsets, index, data, min_photos_per_traj)
+    dump_segments(fphotos, fstats, offsets, index, data)
+    del data, offsets, index
+    kml = gen_kml(os.path.join(tmpdir, 'trajectories.kml'), fphotos, fstats)
+    records = profiling.RECORDS[start:]
+    for rec in records:
+        if rec['stage'] == 'gen_kml': rec['function'] = kml
+    return records
+
+
+def meta(seed, filter_workers):
+    return {'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(), \
+            'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform(), \
+            'cpu_count': os.cpu_count(), 'seed': seed, 'filter_workers': filter_workers}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time and peak RSS of each stage of the pipeline on synthetic ' + \
+                                                 'YFCC100M records (synthetic_yfcc.py) of several sizes')
+    parser.add_argument('sizes', nargs='*', type=int, default=[10000, 100000, 1000000], metavar='NROWS')
+    parser.add_argument('--json', metavar='FILE', help='write the results to FILE (JSON), default: stdout')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--filter-workers', type=int, default=1)
+    parser.add_argument('--tmpdir', help='directory of the temporary files, default: the system default')
+    args = parser.parse_args()
+
+    profiling.enable(os.environ.get(profiling.ENV_VAR))
+    results = []
+    for nrows in args.sizes:
+        with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmpdir:
+            results.append({'nrows': nrows, 'stages': bench(nrows, tmpdir, args.seed, args.filter_workers)})
+
+    sys.stderr.write('%12s %20s %10s %12s %14s %12s\n' % ('#rows', 'stage', 'seconds', 'rows', 'rows/sec', \
+                                                          'peak RSS(MB)'))
+    for result in results:
+        for rec in result['stages']:
+            sys.stderr.write('%12d %20s %10.3f %12s %14s %12.1f\n' % \
+                             (result['nrows'], rec['stage'], rec['seconds'], rec['rows'], \
+                              '-' if rec['rows_per_sec'] is None else '%.0f' % rec['rows_per_sec'], rec['peak_rss_mb']))
+    output = json.dumps({'meta': meta(args.seed, args.filter_workers), 'results': results}, indent=1)
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
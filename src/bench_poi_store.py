@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from poi_mapping import calc_dist_vec
+from poi_store import calc_distmat, PoiStore
+
+
+def gen_poi_file(fname, npois, seed=0):
+    """Synthetic POI file (poi-Melb-all.csv) of POIs around Melbourne"""
+    rng = np.random.RandomState(seed)
+    pd.DataFrame({'poiID': np.arange(npois), 'poiName': ['POI %d' % x for x in range(npois)], \
+                  'poiTheme': ['cat%d' % (x % 6) for x in range(npois)], \
+                  'poiLat': rng.uniform(-37.85, -37.75, npois), 'poiLon': rng.uniform(144.9, 145.0, npois), \
+                  'poiURL': ['https://en.wikipedia.org/wiki/POI_%d' % x for x in range(npois)], \
+                  'poiPopularity': rng.randint(0, 100, npois)}).to_csv(fname, index=False)
+
+
+def distmat_loop(poi_all):
+    """POI_DISTMAT of dataset_Melb.ipynb, i.e. one row at a time"""
+    poi_distmat = pd.DataFrame(data=np.zeros((len(poi_all), len(poi_all)), dtype=float), \
+                               index=poi_all.index, columns=poi_all.index)
+    for poi in poi_all.index:
+        poi_distmat.loc[poi] = calc_dist_vec(poi_all.loc[poi, 'poiLon'], poi_all.loc[poi, 'poiLat'], \
+                                             poi_all['poiLon'].values, poi_all['poiLat'].values)
+    return poi_distmat
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ['-h', '--help']:
+        print('Usage:', sys.argv[0], '[NPOIS ...]')
+        print('e.g. :', sys.argv[0], '100  1000  5000')
+        print('time of building POI_DISTMAT row by row, vectorised, building the POI store and opening it again')
+        sys.exit(0)
+
+    sizes = [int(x) for x in sys.argv[1:]] if len(sys.argv) > 1 else [100, 1000, 5000]
+    print('%8s %12s %14s %12s %12s' % ('#POIs', 'loop(s)', 'vectorised(s)', 'build(s)', 'open(s)'))
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpoi = os.path.join(tmpdir, 'poi.csv')
+            gen_poi_file(fpoi, n)
+            poi_all = pd.read_csv(fpoi, index_col='poiID')
+            t0 = time.time()
+            distmat_loop(poi_all)
+            t_loop = time.time() - t0
+            t0 = time.time()
+            calc_distmat(poi_all['poiLon'].values, poi_all['poiLat'].values)
+            t_vec = time.time() - t0
+            t0 = time.time()
+            PoiStore(fpoi, tmpdir)
+            t_build = time.time() - t0
+            t0 = time.time()
+            PoiStore(fpoi, tmpdir)
+            t_open = time.time() - t0
+            print('%8d %12.3f %14.3f %12.3f %12.3f' % (n, t_loop, t_vec, t_build, t_open))
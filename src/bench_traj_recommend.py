@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+import sys
+import time
+import numpy as np
+from traj_recommend import TrajRecommender, BEAM_WIDTH
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage:', sys.argv[0], 'MODEL_FILE(PKL|NPZ)  [LENGTH ...]')
+        print('e.g. :', sys.argv[0], 'recommender/model-Melb.pkl  3 5 8 10 15 20')
+        print('latency (per query) of exact and beam search inference of queries starting at every POI')
+        sys.exit(0)
+
+    recommender = TrajRecommender.load(sys.argv[1])
+    lengths = [int(x) for x in sys.argv[2:]] if len(sys.argv) > 2 else [3, 5, 8, 10, 15, 20]
+    print('%8s %12s %12s %14s' % ('length', 'exact(ms)', 'beam(ms)', 'beam==exact'))
+    for L in lengths:
+        queries = [(p, L) for p in recommender.poi_ids.tolist()]
+        t0 = time.time()
+        beam = recommender.recommend(queries, beam=BEAM_WIDTH)
+        t_beam = (time.time() - t0) / len(queries) * 1000
+        if L <= 10:  # exact search of longer trajectories mostly falls back to beam search
+            t0 = time.time()
+            exact = recommender.recommend(queries)
+            t_exact = (time.time() - t0) / len(queries) * 1000
+            # the same scores, trajectories of the same score (e.g. permutations of POIs) may come in any order
+            same = np.mean([np.allclose(recommender.traj_scores(x), recommender.traj_scores(y), rtol=1e-9, atol=0) \
+                            for (x, y) in zip(exact, beam)])
+            print('%8d %12.1f %12.1f %14.2f' % (L, t_exact, t_beam, same))
+        else:
+            print('%8d %12s %12.1f %14s' % (L, '-', t_beam, '-'))
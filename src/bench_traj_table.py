@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import sys
+import time
+import numpy as np
+import pandas as pd
+from traj_table import build_traj_all, extract_trajs_withloop
+
+
+NSAMPLE = 100  # trajectories extracted by the per-trajectory baseline, its total time is extrapolated
+
+
+def gen_visits(nvisits, seed=0):
+    """Synthetic POI visits (userVisits-Melb.csv after traj_table.load_visits()), about 5 visits per trajectory"""
+    rng = np.random.RandomState(seed)
+    ntrajs = max(1, nvisits // 5)
+    users = np.array(['%d@N%02d' % (x, y) for (x, y) in zip(rng.randint(10**7, 10**8, size=max(1, ntrajs // 3)), \
+                                                              rng.randint(0, 10, size=max(1, ntrajs // 3)))])
+    tids = rng.randint(0, ntrajs, size=nvisits)
+    traj_users = users[rng.randint(0, len(users), size=ntrajs)]
+    return pd.DataFrame({'photoID': np.arange(nvisits) + 10**9, 'userID': traj_users[tids], \
+                         'dateTaken': 10**9 + tids * 10**5 + rng.randint(0, 3600, size=nvisits), \
+                         'poiID': rng.randint(0, 100, size=nvisits), 'trajID': tids})
+
+
+def extract_traj_baseline(tid, visits):
+    """extract_traj_withloop() in dataset_Melb.ipynb, i.e. one scan of all visits per trajectory"""
+    traj_df = visits[visits['trajID'] == tid].copy()
+    traj_df.sort_values(by='dateTaken', ascending=True, inplace=True)
+    traj = []
+    for ix in traj_df.index:
+        poi = traj_df.loc[ix, 'poiID']
+        if len(traj) == 0 or poi != traj[-1]:
+            traj.append(poi)
+    return traj
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ['-h', '--help']:
+        print('Usage:', sys.argv[0], '[NVISITS ...]')
+        print('e.g. :', sys.argv[0], '100000  1000000  3000000')
+        print('time of building the trajectory table and the trajectories with loops of synthetic visits')
+        sys.exit(0)
+
+    sizes = [int(x) for x in sys.argv[1:]] if len(sys.argv) > 1 else [10**5, 10**6, 3 * 10**6]
+    print('%10s %10s %14s %14s %20s' % ('#visits', '#trajs', 'table(s)', 'withloop(s)', 'baseline(s, est.)'))
+    for n in sizes:
+        visits = gen_visits(n)
+        t0 = time.time()
+        (traj_all, (traj_ids, _, _)) = build_traj_all(visits)
+        t_table = time.time() - t0
+        t0 = time.time()
+        extract_trajs_withloop(visits)
+        t_loop = time.time() - t0
+        t0 = time.time()
+        for tid in traj_ids[:NSAMPLE].tolist():
+            extract_traj_baseline(tid, visits)
+        t_baseline = (time.time() - t0) / min(NSAMPLE, len(traj_ids)) * len(traj_ids)
+        print('%10d %10d %14.2f %14.2f %20.0f' % (n, len(traj_ids), t_table, t_loop, t_baseline))
@@ -1,18 +1,65 @@
 #!/usr/bin/env python3
+import os
 import sys
+import bz2
+import gzip
+import time
+import shutil
+import argparse
 from datetime import datetime
+from multiprocessing import Pool
+from regions import RegionIndex, load_regions
+from photo_table import ColumnarWriter
+from profiling import profiled
 
-def filtering(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout):
-    """Filtering out all records outside the bounding box: 
-       [(lng_min, lat_min), (lng_max, lat_max)]
+
+CHUNK_SIZE = 1 << 24  # read input in chunks of (roughly) 16MB
+
+
+def open_input(fin):
+    """Open a YFCC100M data file for reading text, gzip/bz2 compressed files are decompressed transparently"""
+    if fin.endswith('.gz'):
+        return gzip.open(fin, 'rt')
+    if fin.endswith('.bz2'):
+        return bz2.open(fin, 'rt')
+    return open(fin, 'r')
+
+
+def open_output(fout):
+    """Open an output file for writing CSV lines,
+       if fout ends with '.cols' the lines are stored as a columnar photo table (see photo_table.py)
     """
-    assert(lng_min < lng_max)
-    assert(lat_min < lat_max)
-    assert(isinstance(time_min, datetime))
-    assert(isinstance(time_max, datetime))
-    assert(time_min < time_max)
-    
-    # 1    * Photo/video identifier 
+    if fout.endswith('.cols'):
+        return ColumnarWriter(fout)
+    return open(fout, 'w')
+
+
+def iter_chunks(f, chunk_size=CHUNK_SIZE):
+    """Read lines from file in bulk, each chunk is a list of (roughly) chunk_size bytes of complete lines"""
+    while True:
+        lines = f.readlines(chunk_size)
+        if len(lines) == 0: break
+        yield lines
+
+
+def extract_coords(line):
+    """Extract (lng, lat) of a YFCC100M record without splitting the whole line,
+       return None if longitude or latitude is missing
+    """
+    # longitude and latitude are the 11th and 12th columns, the columns after them are not split
+    t = line.split('\t', 12)
+    if len(t) < 13: return None
+    lng = t[10].strip()
+    lat = t[11].strip()
+    if len(lng) == 0 or len(lat) == 0: return None
+    return (float(lng), float(lat))
+
+
+def parse_record(line):
+    """Parse a YFCC100M record,
+       return (pid, uid, time, lng, lat, acc, url, marker) or None if any field is missing
+    """
+    # 1    * Photo/video identifier
     # 2    * User NSID
     # 4    * Date taken
     # 11   * Longitude
@@ -20,52 +67,240 @@ def filtering(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout)
     # 13   * Accuracy
     # 14   * Photo/video page URL
     # 23   * Photos/video marker (0 = photo, 1 = video)
+    t = line.strip().split('\t')
+    pid    = t[0].strip()
+    uid    = t[1].strip()
+    time   = t[3].strip()
+    lng    = t[10].strip()
+    lat    = t[11].strip()
+    acc    = t[12].strip()
+    url    = t[13].strip()
+    marker = t[22].strip()
+
+    if len(pid) == 0 or len(uid) == 0 or \
+       len(time) == 0 or len(lng) == 0 or \
+       len(lat) == 0 or len(acc) == 0 or \
+       len(url) == 0 or len(marker) == 0: return None
+
+    return (pid, uid, time, float(lng), float(lat), acc, url, marker)
+
+
+def format_record(rec):
+    """Format a parsed record as an output line"""
+    (pid, uid, time, lng, lat, acc, url, marker) = rec
+    return pid + ',' + uid + ',' + time + ',' + \
+           str(lng) + ',' + str(lat) + ',' + \
+           acc + ',' + url + ',' + marker + '\n'
+
+
+def parse_timestamp(time):
+    """Parse timestamp in fixed format '%Y-%m-%d %H:%M:%S.%f', e.g. 2011-05-09 19:19:58.0,
+       much faster than datetime.strptime()
+    """
+    if len(time) < 19 or time[4] != '-' or time[7] != '-' or time[10] != ' ' or time[13] != ':' or time[16] != ':':
+        return datetime.strptime(time, '%Y-%m-%d %H:%M:%S.%f')  # not in fixed format, let strptime() deal with it
+    frac = time[20:]
+    usec = int(frac.ljust(6, '0')) if len(frac) > 0 else 0
+    return datetime(int(time[0:4]), int(time[5:7]), int(time[8:10]), \
+                    int(time[11:13]), int(time[14:16]), int(time[17:19]), usec)
+
+
+def in_time_window(time, time_min, time_max):
+    dt = parse_timestamp(time)
+    return time_min <= dt <= time_max
+
+
+def filter_record(line, lng_min, lat_min, lng_max, lat_max, time_min, time_max):
+    """Filter a single YFCC100M record,
+       return the output line if the record is inside the bounding box and time window, otherwise None
+    """
+    # reject records outside the bounding box before parsing the whole line
+    coords = extract_coords(line)
+    if coords is None: return None
+    (lng, lat) = coords
+    if lng < lng_min or lng > lng_max: return None
+    if lat < lat_min or lat > lat_max: return None
+
+    rec = parse_record(line)
+    if rec is None: return None
+
+    if not in_time_window(rec[2], time_min, time_max): return None
+
+    return format_record(rec)
 
-    with open(fout, 'w') as fo:
+
+@profiled('filtering', rows=lambda nrows, arguments: nrows)
+def filtering(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout):
+    """Filtering out all records outside the bounding box:
+       [(lng_min, lat_min), (lng_max, lat_max)]
+       return the number of records scanned
+    """
+    assert(lng_min < lng_max)
+    assert(lat_min < lat_max)
+    assert(isinstance(time_min, datetime))
+    assert(isinstance(time_max, datetime))
+    assert(time_min < time_max)
+
+    nrows = 0
+    with open_output(fout) as fo:
         #fo.write('Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, URL, Marker(photo=0 video=1)\n')
-        with open(fin, 'r') as fi:
-            for line in fi:
-                t = line.strip().split('\t')
-                pid    = t[0].strip()
-                uid    = t[1].strip()
-                time   = t[3].strip()
-                lng    = t[10].strip()
-                lat    = t[11].strip()
-                acc    = t[12].strip()
-                url    = t[13].strip()
-                marker = t[22].strip()
-                
-                if len(pid) == 0 or len(uid) == 0 or \
-                   len(time) == 0 or len(lng) == 0 or \
-                   len(lat) == 0 or len(acc) == 0 or \
-                   len(url) == 0 or len(marker) == 0: continue
-
-                lng = float(lng)
-                lat = float(lat)
-                if lng < lng_min or lng > lng_max: continue
-                if lat < lat_min or lat > lat_max: continue
-
-                dt = datetime.strptime(time, '%Y-%m-%d %H:%M:%S.%f')
-                if dt < time_min or dt > time_max: continue
-
-                fo.write(pid + ',' + uid + ',' + time + ',' + \
-                         str(lng) + ',' + str(lat) + ',' + \
-                         acc + ',' + url + ',' + marker + '\n')
+        with open_input(fin) as fi:
+            for lines in iter_chunks(fi):
+                nrows += len(lines)
+                rows = [filter_record(line, lng_min, lat_min, lng_max, lat_max, time_min, time_max) for line in lines]
+                fo.write(''.join(row for row in rows if row is not None))
+    return nrows
+
+
+def split_ranges(fin, nparts):
+    """Split a file into (at most) nparts byte ranges [start, end),
+       each range starts at the beginning of a line and ends right after a newline (or at EOF)
+    """
+    assert(nparts >= 1)
+    size = os.path.getsize(fin)
+    bounds = [0]
+    with open(fin, 'rb') as f:
+        for i in range(1, nparts):
+            offset = size * i // nparts
+            if offset <= bounds[-1]: continue
+            f.seek(offset - 1)
+            f.readline()  # move to the start of next line
+            pos = f.tell()
+            if pos >= size: break
+            if pos > bounds[-1]: bounds.append(pos)
+    bounds.append(size)
+    return [(bounds[i], bounds[i+1]) for i in range(len(bounds)-1) if bounds[i] < bounds[i+1]]
+
+
+def filtering_range(args):
+    """Filter records in byte range [start, end) of file fin,
+       write the results to file fpart and return the number of records scanned
+    """
+    (lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, start, end, fpart) = args
+    nrows = 0
+    with open(fpart, 'w') as fo:
+        with open(fin, 'rb') as fi:
+            fi.seek(start)
+            pos = start
+            rest = b''
+            while pos < end:
+                buf = fi.read(min(CHUNK_SIZE, end - pos))
+                if len(buf) == 0: break
+                pos += len(buf)
+                buf = rest + buf
+                cut = buf.rfind(b'\n') + 1 if pos < end else len(buf)  # keep the incomplete line for next chunk
+                rest = buf[cut:]
+                lines = buf[:cut].decode('utf-8').split('\n')
+                if len(lines[-1]) == 0: lines.pop()
+                nrows += len(lines)
+                rows = [filter_record(line, lng_min, lat_min, lng_max, lat_max, time_min, time_max) for line in lines]
+                fo.write(''.join(row for row in rows if row is not None))
+    return nrows
+
+
+@profiled('filtering', rows=lambda nrows, arguments: nrows)
+def filtering_parallel(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout, workers=2):
+    """Filtering out all records outside the bounding box using multiple processes,
+       the input file is split into newline-aligned byte ranges which are filtered by workers,
+       results are merged in the order of byte ranges, i.e. the output is the same as filtering()
+       return the number of records scanned
+    """
+    assert(lng_min < lng_max)
+    assert(lat_min < lat_max)
+    assert(isinstance(time_min, datetime))
+    assert(isinstance(time_max, datetime))
+    assert(time_min < time_max)
+    assert(workers >= 1)
+    assert(not fin.endswith('.gz') and not fin.endswith('.bz2')), 'byte-range scan requires an uncompressed file'
+
+    ranges = split_ranges(fin, workers)
+    fparts = [fout + '.part' + str(i) for i in range(len(ranges))]
+    tasks = [(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, ranges[i][0], ranges[i][1], fparts[i]) \
+             for i in range(len(ranges))]
+    try:
+        with Pool(processes=workers) as pool:
+            counts = pool.map(filtering_range, tasks, chunksize=1)
+        with open_output(fout) as fo:
+            for fpart in fparts:
+                with open(fpart, 'r') as fp:
+                    shutil.copyfileobj(fp, fo)
+    finally:
+        for fpart in fparts:
+            if os.path.exists(fpart): os.unlink(fpart)
+    return sum(counts)
+
+
+@profiled('filtering', rows=lambda nrows, arguments: nrows)
+def filtering_regions(index, time_min, time_max, fin, fouts):
+    """Filtering records for many regions in a single scan,
+       each record is written to the output file of every region (in the RegionIndex) containing it
+       return the number of records scanned
+    """
+    assert(isinstance(time_min, datetime))
+    assert(isinstance(time_max, datetime))
+    assert(time_min < time_max)
+    assert(len(fouts) == len(index.regions))
+
+    fos = []
+    nrows = 0
+    try:
+        for fout in fouts:
+            fos.append(open_output(fout))
+        with open_input(fin) as fi:
+            for lines in iter_chunks(fi):
+                nrows += len(lines)
+                for line in lines:
+                    coords = extract_coords(line)
+                    if coords is None: continue
+                    matches = index.query(coords[0], coords[1])
+                    if len(matches) == 0: continue
+                    rec = parse_record(line)
+                    if rec is None: continue
+                    if not in_time_window(rec[2], time_min, time_max): continue
+                    row = format_record(rec)
+                    for i in matches:
+                        fos[i].write(row)
+    finally:
+        for fo in fos: fo.close()
+    return nrows
+
+
+def region_fname(name, fin, suffix=''):
+    """Output file name for a region"""
+    name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+    return './out.' + name + '.' + fin.split('/')[-1] + suffix
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print('Usage:', sys.argv[0], 'YFCC100M_DATA_FILE')
-        sys.exit(0)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('fin', metavar='YFCC100M_DATA_FILE')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1)')
+    parser.add_argument('--regions', metavar='REGION_FILE', \
+                        help='CSV/KML/KMZ file of regions, extract all regions in one scan instead of the default box')
+    parser.add_argument('--format', choices=['csv', 'columnar'], default='csv', \
+                        help='output format, columnar output is a directory named *.cols (default: csv)')
+    args = parser.parse_args()
+    if args.regions and args.workers > 1:
+        parser.error('--regions does not support --workers')
 
-    fin = sys.argv[1]
-    fout = './out.' + fin.split('/')[-1]
+    fin = args.fin
+    suffix = '.cols' if args.format == 'columnar' else ''
+    fout = './out.' + fin.split('/')[-1] + suffix
     lng_min = 141.9
-    lat_min = -39.3 
+    lat_min = -39.3
     lng_max = 147.1
-    lat_max = -35.8 
+    lat_max = -35.8
     time_min = datetime.strptime('2000-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
     time_max = datetime.strptime('2015-03-05 23:59:59', '%Y-%m-%d %H:%M:%S')
-    
-    filtering(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout)
 
+    t0 = time.time()
+    if args.regions:
+        index = RegionIndex(load_regions(args.regions))
+        fouts = [region_fname(r.name, fin, suffix) for r in index.regions]
+        nrows = filtering_regions(index, time_min, time_max, fin, fouts)
+    elif args.workers > 1:
+        nrows = filtering_parallel(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout, args.workers)
+    else:
+        nrows = filtering(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fin, fout)
+    elapsed = time.time() - t0
+    print('%d rows in %.1f seconds, %.0f rows/sec' % (nrows, elapsed, nrows / elapsed if elapsed > 0 else 0))
@@ -1,12 +1,32 @@
 #!/usr/bin/env python3
+import io
 import sys
+import json
 import math
+import heapq
+import itertools
+import zlib
+import shutil
+import argparse
+import calendar
+import tempfile
 import os.path
+import numpy as np
 from datetime import datetime
+from regions import PreparedRegion, load_regions
+from photo_table import PhotoTable, is_columnar, load_columnar, load_csv, format_times, parse_csv_rows, intern_users, \
+                        format_csv_rows
+from profiling import profiled
 
 
+@profiled('load_data', rows=lambda data, arguments: len(data))
 def load_data(fname):
-    """Load data records"""
+    """Load data records into a PhotoTable (see photo_table.py),
+       a columnar photo table is memory-mapped instead of parsed
+    """
+    if is_columnar(fname):
+        return load_columnar(fname)
+
     # * Photo/video identifier 
     # * User NSID
     # * Date taken
@@ -15,88 +35,146 @@ def load_data(fname):
     # * Accuracy
     # * Photo/video page URL
     # * Photos/video marker (0 = photo, 1 = video)
+    return load_csv(fname)  # the first line is the header
 
-    data = []
-    firstline = True
-    with open(fname, 'r') as f:
-        for line in f:
-            if firstline:
-                firstline = False
-                continue
-            t = line.strip().split(',')
-            pid = t[0].strip()
-            uid = t[1].strip()
-            time = datetime.strptime(t[2].strip(), '%Y-%m-%d %H:%M:%S.%f')  # 2011-05-09 19:19:58.0
-            lng = float(t[3].strip())
-            lat = float(t[4].strip())
-            acc = int(t[5].strip())
-            url = t[6].strip()
-            marker = int(t[7].strip())
-            data.append((pid, uid, time, lng, lat, acc, url, marker))
-    return data
 
+def sort_photos(data):
+    """Sort photos by user ID and then time (stable),
+       return the sorted photo indexes and the rank of user ID and time of the sorted photos
+    """
+    # rank of users sorted by user ID
+    users = data.users
+    user_rank = np.zeros(len(users), dtype=np.int64)
+    user_rank[sorted(range(len(users)), key=lambda x: users[x])] = np.arange(len(users))
+    ranks = user_rank[data.user]
+
+    # construct travel history (i.e. sort photos by time) for each user, lexsort is stable
+    index = np.lexsort((data.time, ranks)).astype(np.int64)
+    return index, ranks[index], np.asarray(data.time)[index]
 
-def gen_trajectories(data, time_gap=8):
-    """Generate trajectories"""
+
+def split_sorted(ranks, times, time_gap):
+    """Split sorted photos into trajectories, return the offsets of trajectories"""
     assert(time_gap > 0)
-    udict = dict()
-    
-    # group photos by user ID
-    for i in range(len(data)):
-        uid = data[i][1]
-        if uid not in udict: udict[uid] = []
-        udict[uid].append(i)
-
-    # construct travel history (i.e. sort photos by time) for each user
-    for uid, dlist in udict.items():
-        dlist.sort(key=lambda idx: data[idx][2])
-
-    # construct trajectories by splitting user's travel history
     TGAP = time_gap * 60 * 60  # 8 hours by default
-    trajs = []
-    for uid in sorted(udict.keys()): # sort by user ID
-        dlist = udict[uid]
-        if len(dlist) < 1: continue
-        if len(dlist) == 1: 
-            trajs.append(dlist)
-            continue
-        trajs.append([dlist[0]])
-        for j in range(1, len(dlist)):
-            p1 = dlist[j-1]
-            p2 = dlist[j]
-            t1 = data[p1][2]
-            t2 = data[p2][2]
-            assert(t1 <= t2)
-            if (t2 - t1).total_seconds() < TGAP:
-                trajs[-1].append(p2)
-            else:
-                trajs.append([p2])
-    return trajs
+    if len(times) == 0: return np.zeros(1, dtype=np.int64)
+    splits = np.flatnonzero((ranks[1:] != ranks[:-1]) | (np.diff(times) >= TGAP)) + 1
+    return np.concatenate(([0], splits, [len(times)])).astype(np.int64)
+
+
+@profiled('gen_trajectories', rows='data')
+def segment_trajectories(data, time_gap=8):
+    """Generate trajectories in compressed form (offsets, index):
+       the i-th trajectory is the photos index[offsets[i]:offsets[i+1]],
+       trajectories are sorted by user ID and then time, the same as gen_trajectories()
+    """
+    assert(time_gap > 0)
+    if len(data) == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    index, ranks, times = sort_photos(data)
+    return split_sorted(ranks, times, time_gap), index
+
+
+def segments_to_lists(offsets, index):
+    """Convert trajectories in compressed form to a list of lists of photo indexes"""
+    index = index.tolist()
+    offsets = offsets.tolist()
+    return [index[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+
+
+def lists_to_segments(trajlist):
+    """Convert a list of lists of photo indexes to trajectories in compressed form (offsets, index)"""
+    offsets = np.zeros(len(trajlist) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(traj) for traj in trajlist), dtype=np.int64, count=len(trajlist)), out=offsets[1:])
+    index = np.fromiter(itertools.chain.from_iterable(trajlist), dtype=np.int64, count=offsets[-1])
+    return offsets, index
+
+
+def take_segments(offsets, index, keep):
+    """Trajectories in compressed form (offsets, index) where keep (a boolean array) is True"""
+    lengths = np.diff(offsets)
+    kept = np.zeros(np.count_nonzero(keep) + 1, dtype=np.int64)
+    np.cumsum(lengths[keep], out=kept[1:])
+    return kept, index[np.repeat(keep, lengths)]
 
 
-def filter_trajectories(lng_min, lat_min, lng_max, lat_max, trajlist, data, min_photos_per_traj=1):
-    """Drop Trajectories which are completely out of the bounding box:
+def gen_trajectories(data, time_gap=8):
+    """Generate trajectories, as a list of lists of photo indexes (see segment_trajectories())"""
+    return segments_to_lists(*segment_trajectories(data, time_gap))
+
+
+def select_segments(inside, offsets, index, min_photos_per_traj=1, criterion='any', min_fraction=0.5):
+    """Select trajectories in compressed form with at least min_photos_per_traj photos,
+       given whether each photo is inside the region, return whether each trajectory is selected:
+       criterion 'any':      at least one photo is inside
+                 'all':      all photos are inside
+                 'fraction': at least min_fraction of the photos are inside
+    """
+    assert(min_photos_per_traj >= 1)
+    assert(criterion in ['any', 'all', 'fraction'])
+    assert(0 < min_fraction <= 1)
+    if len(offsets) == 1: return np.zeros(0, dtype=bool)
+
+    lengths = np.diff(offsets)
+    assert(lengths.min() > 0)
+    ninside = np.add.reduceat(np.asarray(inside, dtype=np.int64)[index], offsets[:-1])
+
+    if criterion == 'any':
+        keep = ninside > 0
+    elif criterion == 'all':
+        keep = ninside == lengths
+    else:
+        keep = ninside >= min_fraction * lengths
+    keep &= lengths >= min_photos_per_traj
+    return keep
+
+
+def select_trajectories(inside, trajlist, min_photos_per_traj=1, criterion='any', min_fraction=0.5):
+    """select_segments() for a list of lists of photo indexes, return the selected lists"""
+    keep = select_segments(inside, *lists_to_segments(trajlist), min_photos_per_traj, criterion, min_fraction)
+    return [trajlist[x] for x in np.flatnonzero(keep)]
+
+
+@profiled('filter_trajectories', rows='data')
+def filter_segments(lng_min, lat_min, lng_max, lat_max, offsets, index, data, min_photos_per_traj=1, \
+                    criterion='any', min_fraction=0.5):
+    """Drop Trajectories in compressed form which are completely out of the bounding box:
        [(lng_min, lat_min), (lng_max, lat_max)]
+       (or not inside enough, see select_segments()), return the trajectories kept in compressed form
     """
     assert(lng_min < lng_max)
     assert(lat_min < lat_max)
     assert(min_photos_per_traj >= 1)
 
-    indexes = []
-    for i in range(len(trajlist)):
-        traj = trajlist[i]
-        if len(traj) < min_photos_per_traj: continue
-        anyin = False
-        for p in traj:
-            assert(p in range(len(data)))
-            lng = data[p][3]
-            lat = data[p][4]
-            if lng_min < lng < lng_max and lat_min < lat < lat_max:
-                anyin = True
-                break
-        if anyin: 
-            indexes.append(i)
-    return [trajlist[x] for x in indexes]
+    # whether each photo is in the bounding box
+    inbox = (data.lng > lng_min) & (data.lng < lng_max) & (data.lat > lat_min) & (data.lat < lat_max)
+    keep = select_segments(inbox, offsets, index, min_photos_per_traj, criterion, min_fraction)
+    return take_segments(offsets, index, keep)
+
+
+def filter_trajectories(lng_min, lat_min, lng_max, lat_max, trajlist, data, min_photos_per_traj=1, \
+                        criterion='any', min_fraction=0.5):
+    """filter_segments() for a list of lists of photo indexes"""
+    return segments_to_lists(*filter_segments(lng_min, lat_min, lng_max, lat_max, *lists_to_segments(trajlist), \
+                                              data, min_photos_per_traj, criterion, min_fraction))
+
+
+@profiled('filter_trajectories', rows='data')
+def filter_segments_region(region, offsets, index, data, min_photos_per_traj=1, criterion='any', min_fraction=0.5):
+    """Drop Trajectories in compressed form which are completely out of the region (Region or PreparedRegion,
+       see regions.py), (or not inside enough, see select_segments())
+    """
+    if not isinstance(region, PreparedRegion):
+        region = PreparedRegion(region)
+    inside = region.contains(data.lng, data.lat)
+    keep = select_segments(inside, offsets, index, min_photos_per_traj, criterion, min_fraction)
+    return take_segments(offsets, index, keep)
+
+
+def filter_trajectories_region(region, trajlist, data, min_photos_per_traj=1, criterion='any', min_fraction=0.5):
+    """filter_segments_region() for a list of lists of photo indexes"""
+    return segments_to_lists(*filter_segments_region(region, *lists_to_segments(trajlist), data, \
+                                                     min_photos_per_traj, criterion, min_fraction))
 
 
 def calc_dist(longitude1, latitude1, longitude2, latitude2):
@@ -116,92 +194,680 @@ def calc_dist(longitude1, latitude1, longitude2, latitude2):
     return dist
 
 
-def dump_trajectories(fout1, fout2, trajlist, data):
-    """Save Trajectories"""
+HEADER1 = 'Trajectory_ID, Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, Marker(photo=0 video=1), URL\n'
+HEADER2 = 'Trajectory_ID, User_ID, #Photo, Start_Time, Travel_Distance(km), Total_Time(min), Average_Speed(km/h)\n'
+
+
+def take_urls(urls, indexes):
+    """List of URLs at indexes (an integer array)"""
+    if hasattr(urls, 'take'):
+        return urls.take(indexes)
+    return [urls[p] for p in indexes.tolist()]
+
+
+def trajectory_stats(offsets, index, data):
+    """Compute statistics of trajectories in compressed form (see segment_trajectories()), vectorised,
+       return (travel distance(km), total time(seconds)) of each trajectory
+    """
+    lngs = np.asarray(data.lng)[index]
+    lats = np.asarray(data.lat)[index]
+    times = np.asarray(data.time)[index]
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+
+    # distance between consecutive photos, the (last photo, first photo of next trajectory) pairs are set to 0,
+    # the sums may differ from the scalar computation (calc_dist()) in the last digits, by a relative 1e-12 or less
+    dists = np.zeros(len(index), dtype=np.float64)
+    if len(index) > 1:
+        dists[:-1] = calc_dist_vec(lngs[:-1], lats[:-1], lngs[1:], lats[1:])
+    dists[ends] = 0
+    dist = np.add.reduceat(dists, starts) if len(starts) > 0 else np.zeros(0)
+    seconds = times[ends] - times[starts]
+    assert(np.all(seconds >= 0))
+    return dist, seconds
+
+
+def write_segments(f1, f2, offsets, index, data, tid_start=0, block_size=100000, tids=None):
+    """Write rows of both tables for trajectories in compressed form to file objects f1 and f2 (None to skip a
+       table), trajectory IDs are tids if given, otherwise start from tid_start,
+       rows are formatted and written in blocks of block_size photos
+    """
+    lengths = np.diff(offsets)
+    assert(np.all(lengths > 0))
+    assert(np.all((index >= 0) & (index < len(data))))
+    users = data.users
+    if tids is None:
+        tids = np.arange(tid_start, tid_start + len(lengths))
+    tids = np.asarray(tids, dtype=np.int64)
+    assert(len(tids) == len(lengths))
+
     # data table 1
-    with open(fout1, 'w') as f1:
-        f1.write('Trajectory_ID, Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, Marker(photo=0 video=1), URL\n')
-        for i, dlist in enumerate(trajlist):
-            assert(len(dlist) > 0)
-            tid = str(i)
-            for p in dlist:
-                assert(p in range(len(data)))
-                pid = str(data[p][0])
-                uid = str(data[p][1])
-                time = str(data[p][2])
-                lng = str(data[p][3])
-                lat = str(data[p][4])
-                acc = str(data[p][5])
-                url = str(data[p][6])
-                marker = str(data[p][7])
-                f1.write(tid + ',' + pid + ',' + uid + ',' + \
-                         time + ',' + lng + ',' + lat + ',' + \
-                         acc + ',' + marker + ',' + url + '\n')
+    photo_tids = np.repeat(tids, lengths)
+    for start in range(0, len(index), block_size):
+        if f1 is None: break
+        ix = index[start:start+block_size]
+        rows = zip(photo_tids[start:start+block_size].tolist(), np.asarray(data.pid)[ix].tolist(), \
+                   np.asarray(data.user)[ix].tolist(), format_times(np.asarray(data.time)[ix]).tolist(), \
+                   np.asarray(data.lng)[ix].tolist(), np.asarray(data.lat)[ix].tolist(), \
+                   np.asarray(data.acc)[ix].tolist(), np.asarray(data.marker)[ix].tolist(), take_urls(data.url, ix))
+        f1.write(''.join([f'{tid},{pid},{users[code]},{time},{lng!r},{lat!r},{acc},{marker},{url}\n' \
+                          for (tid, pid, code, time, lng, lat, acc, marker, url) in rows]))
 
     # data table 2
-    with open(fout2, 'w') as f2:
-        f2.write('Trajectory_ID, User_ID, #Photo, Start_Time, Travel_Distance(km), Total_Time(min), Average_Speed(km/h)\n')
-        for i, dlist in enumerate(trajlist):
-            assert(len(dlist) > 0)
-            tid = str(i)
-            p1 = dlist[0]
-            p2 = dlist[-1]
-            uid = str(data[p1][1])
-            num = str(len(dlist))
-            dist = 0
-            if len(dlist) > 1:
-                for j in range(len(dlist)-1):
-                    dist += calc_dist(data[dlist[j]][3], data[dlist[j]][4], data[dlist[j+1]][3], data[dlist[j+1]][4])  # km
-            t1 = data[p1][2]
-            t2 = data[p2][2]
-            assert(t1 <= t2)
-            seconds = (t2 - t1).total_seconds()
-            ttime = seconds / 60  # minutes
-            speed = None
-            if seconds == 0: 
-                speed = 0
+    if f2 is None: return
+    dist, seconds = trajectory_stats(offsets, index, data)
+    ttime = seconds / 60  # minutes
+    speed = np.zeros(len(seconds), dtype=np.float64)
+    nonzero = seconds > 0
+    speed[nonzero] = dist[nonzero] * 60 * 60 / seconds[nonzero]  # km/h
+    firsts = index[offsets[:-1]]
+    # keep the format of scalar computation: 0 (int) for single photo trajectories and zero total time
+    dist_str = [str(x) if n > 1 else '0' for (x, n) in zip(dist.tolist(), lengths.tolist())]
+    speed_str = [str(x) if s > 0 else '0' for (x, s) in zip(speed.tolist(), seconds.tolist())]
+    rows = zip(tids.tolist(), np.asarray(data.user)[firsts].tolist(), lengths.tolist(), \
+               format_times(np.asarray(data.time)[firsts]).tolist(), dist_str, ttime.tolist(), speed_str)
+    lines = [f'{tid},{users[code]},{num},{t1},{d},{tt!r},{sp}\n' for (tid, code, num, t1, d, tt, sp) in rows]
+    for start in range(0, len(lines), block_size):
+        f2.write(''.join(lines[start:start+block_size]))
+
+
+def write_trajectories(f1, f2, trajlist, data, tid_start=0, block_size=100000, tids=None):
+    """write_segments() for a list of lists of photo indexes"""
+    write_segments(f1, f2, *lists_to_segments(trajlist), data, tid_start, block_size, tids)
+
+
+@profiled('dump_trajectories', rows='index')
+def dump_segments(fout1, fout2, offsets, index, data):
+    """Save Trajectories in compressed form"""
+    with open(fout1, 'w') as f1, open(fout2, 'w') as f2:
+        f1.write(HEADER1)  # data table 1
+        f2.write(HEADER2)  # data table 2
+        write_segments(f1, f2, offsets, index, data)
+
+
+def dump_trajectories(fout1, fout2, trajlist, data):
+    """Save Trajectories, a list of lists of photo indexes"""
+    dump_segments(fout1, fout2, *lists_to_segments(trajlist), data)
+
+
+def calc_dist_vec(longitudes1, latitudes1, longitudes2, latitudes2):
+    """Calculate the distance (unit: km) between two places on earth, vectorised"""
+    # convert degrees to radians
+    lng1 = np.radians(longitudes1)
+    lat1 = np.radians(latitudes1)
+    lng2 = np.radians(longitudes2)
+    lat2 = np.radians(latitudes2)
+    radius = 6371.009 # mean earth radius is 6371.009km, en.wikipedia.org/wiki/Earth_radius#Mean_radius
+
+    # The haversine formula, en.wikipedia.org/wiki/Great-circle_distance
+    dlng = np.fabs(lng1 - lng2)
+    dlat = np.fabs(lat1 - lat2)
+    dist =  2 * radius * np.arcsin( np.sqrt( 
+                (np.sin(0.5*dlat))**2 + np.cos(lat1) * np.cos(lat2) * (np.sin(0.5*dlng))**2 ))
+    return dist
+
+
+def sweep(data, lng_min, lat_min, lng_max, lat_max, time_gaps, min_photos_list):
+    """Generate and filter trajectories for every combination of time gap and minimum number of photos,
+       photos are loaded and sorted only once, and the same for the distances between consecutive photos
+       yield (time_gap, min_photos_per_traj, offsets, index, keep, stats) for each setting, where
+       (offsets, index) are all trajectories (see segment_trajectories()), keep[i] is True if the i-th
+       trajectory survives filter_trajectories(), and stats = (#photo, distance(km), time(min), speed(km/h))
+       of the kept trajectories, no trajectories for every setting if there are no photos
+    """
+    assert(lng_min < lng_max)
+    assert(lat_min < lat_max)
+    index, ranks, times = sort_photos(data)
+    lngs = np.asarray(data.lng)[index]
+    lats = np.asarray(data.lat)[index]
+    inbox = ((lngs > lng_min) & (lngs < lng_max) & (lats > lat_min) & (lats < lat_max)).astype(np.int64)
+
+    # distance between consecutive sorted photos, the last one is 0, i.e. the sum of a trajectory by np.add.reduceat()
+    # excludes the jump to the next trajectory once the pairs at its end are set to 0
+    dists = np.zeros(len(index), dtype=np.float64)
+    if len(index) > 1:
+        dists[:-1] = calc_dist_vec(lngs[:-1], lats[:-1], lngs[1:], lats[1:])
+
+    for time_gap in time_gaps:
+        offsets = split_sorted(ranks, times, time_gap)
+        starts = offsets[:-1]
+        ends = offsets[1:] - 1
+        lengths = ends - starts + 1
+        anyin = np.add.reduceat(inbox, starts) > 0 if len(starts) > 0 else np.zeros(0, dtype=bool)
+        inner = dists.copy()
+        inner[ends] = 0
+        dist = np.add.reduceat(inner, starts) if len(starts) > 0 else np.zeros(0)
+        seconds = times[ends] - times[starts]
+        speed = np.zeros(len(seconds))
+        nonzero = seconds > 0
+        speed[nonzero] = dist[nonzero] * 60 * 60 / seconds[nonzero]
+        for min_photos_per_traj in min_photos_list:
+            assert(min_photos_per_traj >= 1)
+            keep = anyin & (lengths >= min_photos_per_traj)
+            stats = (lengths[keep], dist[keep], seconds[keep] / 60, speed[keep])
+            yield time_gap, min_photos_per_traj, offsets, index, keep, stats
+
+
+def dump_sweep_summary(fout, results):
+    """Save the summary of trajectories for each setting of sweep()"""
+    with open(fout, 'w') as f:
+        f.write('Time_Gap(hour), Min_Photos, #Trajectory, #Photo, ' + \
+                'Length_Mean, Length_Median, Length_P90, Length_Max, ' + \
+                'Distance_Mean(km), Total_Time_Mean(min), ' + \
+                'Speed_Mean(km/h), Speed_Median(km/h), Speed_P90(km/h), Speed_Max(km/h)\n')
+        for (time_gap, min_photos_per_traj, stats) in results:
+            (lengths, dist, ttime, speed) = stats
+            row = [str(time_gap), str(min_photos_per_traj), str(len(lengths)), str(int(np.sum(lengths)))]
+            if len(lengths) > 0:
+                row += [str(x) for x in [np.mean(lengths), np.median(lengths), np.percentile(lengths, 90), \
+                                         np.max(lengths), np.mean(dist), np.mean(ttime), np.mean(speed), \
+                                         np.median(speed), np.percentile(speed, 90), np.max(speed)]]
             else:
-                speed = dist * 60 * 60 / seconds  # km/h
-            f2.write(tid + ',' + uid + ',' + num + ',' + str(t1) + ',' + \
-                     str(dist) + ',' + str(ttime) + ',' + str(speed) + '\n')
+                row += ['NA'] * 10
+            f.write(','.join(row) + '\n')
+
+
+def main_sweep(fin, fout, longitude_min, latitude_min, longitude_max, latitude_max, min_photos_list, time_gaps, \
+               dump_tables=False):
+    """Sweep over time gaps and minimum number of photos per trajectory,
+       save the summary to fout and, if dump_tables, both tables for each setting next to it
+    """
+    data = load_data(fin)
+    results = []
+    for (time_gap, min_photos_per_traj, offsets, index, keep, stats) in \
+        sweep(data, longitude_min, latitude_min, longitude_max, latitude_max, time_gaps, min_photos_list):
+        results.append((time_gap, min_photos_per_traj, stats))
+        if dump_tables:
+            suffix = '.gap' + str(time_gap) + '.min' + str(min_photos_per_traj) + '.csv'
+            path, filename = os.path.split(fout)
+            dump_segments(os.path.join(path, 'trajectory_photos' + suffix), \
+                          os.path.join(path, 'trajectory_stats' + suffix), *take_segments(offsets, index, keep), data)
+    dump_sweep_summary(fout, results)
+
+
+def epoch_seconds(time, cache):
+    """Seconds since epoch of a timestamp in format '%Y-%m-%d %H:%M:%S.%f' (fraction ignored),
+       cache keeps the seconds of dates seen before
+    """
+    date = time[:10]
+    days = cache.get(date)
+    if days is None:
+        days = calendar.timegm((int(time[0:4]), int(time[5:7]), int(time[8:10]), 0, 0, 0))
+        cache[date] = days
+    return days + int(time[11:13]) * 3600 + int(time[14:16]) * 60 + int(time[17:19])
+
+
+MERGE_FAN_IN = 128  # max number of runs merged at a time, well below the usual limit of 1024 open files
+
+
+def sort_runs(fin, tmpdir, run_bytes):
+    """Split data records (CSV with header) into runs of about run_bytes bytes,
+       sort each run by (user ID, time, line number) and save it to a file in tmpdir,
+       return the names of run files
+    """
+    runs = []
+    cache = dict()
+    lineno = 0
+    with open(fin, 'r') as f:
+        f.readline()  # header
+        while True:
+            lines = f.readlines(run_bytes)
+            if len(lines) == 0: break
+            recs = []
+            for line in lines:
+                if len(line.strip()) == 0: continue
+                t = line.split(',', 3)
+                recs.append((t[1].strip(), epoch_seconds(t[2].strip(), cache), lineno, line.strip()))
+                lineno += 1
+            recs.sort()
+            frun = os.path.join(tmpdir, 'run' + str(len(runs)))
+            write_run(frun, recs)
+            runs.append(frun)
+            del recs, lines
+    return runs
+
+
+def write_run(frun, records, block_size=10000):
+    """Save records (user ID, time, line number, line) sorted by (user ID, time, line number) to a run file"""
+    records = iter(records)
+    with open(frun, 'w') as fo:
+        for block in iter(lambda: list(itertools.islice(records, block_size)), []):
+            fo.write(''.join(uid + '\t' + str(sec) + '\t' + str(ln) + '\t' + line + '\n' \
+                             for (uid, sec, ln, line) in block))
+
+
+def merge_runs(runs, tmpdir, fan_in=MERGE_FAN_IN):
+    """Merge sorted runs in passes of at most fan_in runs at a time (i.e. at most fan_in open files),
+       until at most fan_in runs are left, merged runs are removed,
+       return the names of the remaining run files
+    """
+    assert(fan_in >= 2)
+    runs = list(runs)
+    npass = 0
+    while len(runs) > fan_in:
+        merged = []
+        for start in range(0, len(runs), fan_in):
+            group = runs[start:start+fan_in]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            frun = os.path.join(tmpdir, 'merge%d_%d' % (npass, len(merged)))
+            write_run(frun, heapq.merge(*[read_run(x) for x in group]))
+            for x in group:
+                os.unlink(x)
+            merged.append(frun)
+        runs = merged
+        npass += 1
+    return runs
+
+
+def read_run(frun):
+    """Iterate over the records (user ID, time, line number, line) of a sorted run"""
+    with open(frun, 'r') as f:
+        for line in f:
+            t = line.rstrip('\n').split('\t', 3)
+            yield (t[0], int(t[1]), int(t[2]), t[3])
+
 
+def iter_trajectories(records, time_gap):
+    """Split records sorted by (user ID, time) into trajectories, yield a list of records per trajectory"""
+    TGAP = time_gap * 60 * 60  # 8 hours by default
+    traj = []
+    for rec in records:
+        if len(traj) > 0 and (rec[0] != traj[-1][0] or rec[1] - traj[-1][1] >= TGAP):
+            yield traj
+            traj = []
+        traj.append(rec)
+    if len(traj) > 0:
+        yield traj
+
+
+def records_to_table(records):
+    """Make a PhotoTable from records (user ID, time, line number, line)"""
+    user_dict = dict()
+    (pids, uids, times, lngs, lats, accs, markers, urls) = parse_csv_rows([rec[3] for rec in records])
+    codes = intern_users(uids, user_dict)
+    users = sorted(user_dict.keys(), key=lambda x: user_dict[x])
+    return PhotoTable(np.array(pids, dtype=np.int64), codes, users, np.array([rec[1] for rec in records], dtype=np.int64), \
+                      np.array(lngs, dtype=np.float64), np.array(lats, dtype=np.float64), \
+                      np.array(accs, dtype=np.int8), np.array(markers, dtype=np.int8), urls)
 
-def main(fin, fout1, fout2, longitude_min, latitude_min, longitude_max, latitude_max, min_photos_per_traj=1, time_gap=8):
-    """Main Procedure"""
+
+def main_streaming(fin, fout1, fout2, longitude_min, latitude_min, longitude_max, latitude_max, min_photos_per_traj=1, \
+                   time_gap=8, memory_budget=512, tmpdir=None, fan_in=MERGE_FAN_IN, run_bytes=None):
+    """Streaming version of main() for data larger than memory, the output is the same as main(),
+       data is sorted by an external merge sort (runs of run_bytes bytes, merged fan_in runs at a time),
+       then trajectories are generated, filtered and saved in batches,
+       peak memory is (roughly) bounded by memory_budget (MB)
+    """
+    assert(longitude_min < longitude_max)
+    assert(latitude_min < latitude_max)
+    assert(min_photos_per_traj >= 1)
+    assert(time_gap > 0)
+    assert(memory_budget > 0)
+
+    # parsed records take about 10 times the size of text in memory, half of the budget for sorting
+    if run_bytes is None:
+        run_bytes = max(1 << 16, memory_budget * 2**20 // 20)
+    batch_size = max(1000, run_bytes // 100)  # number of photos per batch of output
+
+    tmpdir_ = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        runs = merge_runs(sort_runs(fin, tmpdir_, run_bytes), tmpdir_, fan_in)
+        records = heapq.merge(*[read_run(frun) for frun in runs])
+        with open(fout1, 'w') as f1, open(fout2, 'w') as f2:
+            f1.write(HEADER1)  # data table 1
+            f2.write(HEADER2)  # data table 2
+            tid = 0
+            batch = []
+            nphotos = 0
+            for traj in iter_trajectories(records, time_gap):
+                if len(traj) < min_photos_per_traj: continue
+                anyin = False
+                for rec in traj:
+                    t = rec[3].split(',', 5)
+                    lng = float(t[3])
+                    lat = float(t[4])
+                    if longitude_min < lng < longitude_max and latitude_min < lat < latitude_max:
+                        anyin = True
+                        break
+                if not anyin: continue
+                batch.append(traj)
+                nphotos += len(traj)
+                if nphotos >= batch_size:
+                    write_batch(f1, f2, batch, tid)
+                    tid += len(batch)
+                    batch = []
+                    nphotos = 0
+            if len(batch) > 0:
+                write_batch(f1, f2, batch, tid)
+    finally:
+        shutil.rmtree(tmpdir_)
+
+
+def write_batch(f1, f2, trajs, tid_start):
+    """Write a batch of trajectories (lists of records) to both tables"""
+    records = [rec for traj in trajs for rec in traj]
+    data = records_to_table(records)
+    offsets = np.zeros(len(trajs) + 1, dtype=np.int64)
+    np.cumsum([len(traj) for traj in trajs], out=offsets[1:])
+    write_segments(f1, f2, offsets, np.arange(len(records), dtype=np.int64), data, tid_start)
+
+
+def lines_to_table(lines):
+    """Make a PhotoTable from lines in the CSV format of filtering_bigbox.filtering()"""
+    user_dict = dict()
+    (pids, uids, times, lngs, lats, accs, markers, urls) = parse_csv_rows(lines)
+    codes = intern_users(uids, user_dict)
+    users = sorted(user_dict.keys(), key=lambda x: user_dict[x])
+    return PhotoTable(np.array(pids, dtype=np.int64), codes, users, np.asarray(times, dtype=np.int64), \
+                      np.array(lngs, dtype=np.float64), np.array(lats, dtype=np.float64), \
+                      np.array(accs, dtype=np.int8), np.array(markers, dtype=np.int8), urls)
+
+
+STATE_VERSION = 2
+STATE_SHARDS = 256  # open trajectories are kept in shards of users, an update rewrites the shards of its users
+STATS_ROW_BYTES = 192  # rows of trajectory_stats.csv are padded with spaces to patch them in place (incremental mode)
+
+
+def user_shard(uid):
+    return zlib.crc32(uid.encode('utf-8')) % STATE_SHARDS
+
+
+def shard_fname(fstate, shard, gen):
+    return os.path.join(fstate + '.open', '%d.%d.json' % (shard, gen))
+
+
+def stats_offset(tid):
+    """Byte offset of the row of Trajectory_ID tid in trajectory_stats.csv (incremental mode)"""
+    return len(HEADER2) + tid * STATS_ROW_BYTES
+
+
+def pad_stats_row(line):
+    row = line.rstrip('\n').encode('utf-8')
+    if len(row) >= STATS_ROW_BYTES:
+        raise ValueError('row of trajectory_stats.csv longer than %d bytes: %s' % (STATS_ROW_BYTES, line))
+    return row.ljust(STATS_ROW_BYTES - 1) + b'\n'
+
+
+def load_state(fstate, fout1, fout2):
+    """Load the state of incremental updates, and roll both tables back to the state,
+       i.e. drop the rows of an interrupted update
+    """
+    with open(fstate, 'r') as f:
+        state = json.load(f)
+    if state['version'] != STATE_VERSION:
+        raise ValueError('state of version %s, a full rebuild is needed' % state['version'])
+    with open(fout1, 'r+') as f1:
+        f1.truncate(state['photos_bytes'])
+    with open(fout2, 'r+b') as f2:
+        assert(f2.seek(0, os.SEEK_END) >= stats_offset(state['next_tid']))
+        f2.truncate(stats_offset(state['next_tid']))
+        if os.path.exists(fstate + '.undo'):
+            with open(fstate + '.undo', 'r') as f:
+                undo = json.load(f)
+            if undo['serial'] == state['serial']:  # rows patched by an interrupted update
+                for (tid, line) in undo['rows']:
+                    f2.seek(stats_offset(tid))
+                    f2.write(line.encode('utf-8'))
+            os.unlink(fstate + '.undo')
+    return state
+
+
+def load_open(fstate, state, uids):
+    """Open trajectories, [Trajectory_ID, photo rows], of users in the shards of uids, return {shard: {uid: ...}}"""
+    shards = dict()
+    for shard in sorted(set(user_shard(uid) for uid in uids)):
+        gen = state['shards'][shard]
+        shards[shard] = dict()
+        if gen > 0:
+            with open(shard_fname(fstate, shard, gen), 'r') as f:
+                shards[shard] = json.load(f)
+    return shards
+
+
+def save_state(fstate, state, shards):
+    """Save the state and the shards of open trajectories that changed,
+       a shard is written to a new file (generation) and the state is replaced atomically, i.e. an interrupted
+       update leaves the last state as it was
+    """
+    os.makedirs(fstate + '.open', exist_ok=True)
+    old = []
+    for (shard, users) in shards.items():
+        gen = state['shards'][shard]
+        with open(shard_fname(fstate, shard, gen + 1), 'w') as f:
+            json.dump(users, f)
+        if gen > 0: old.append(shard_fname(fstate, shard, gen))
+        state['shards'][shard] = gen + 1
+    state['serial'] += 1
+    ftmp = fstate + '.tmp'
+    with open(ftmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(ftmp, fstate)
+    for fname in old:
+        os.unlink(fname)
+    if os.path.exists(fstate + '.undo'):
+        os.unlink(fstate + '.undo')
+
+
+def patch_stats(fout2, fstate, state, ntids, rows):
+    """Write rows [(Trajectory_ID, row)] of trajectory_stats.csv in place, the rows of the first ntids
+       trajectories patched are saved to fstate.undo first to restore them if the update is interrupted
+    """
+    with open(fout2, 'r+b') as f2:
+        undo = []
+        for (tid, line) in rows:
+            if tid < ntids:
+                f2.seek(stats_offset(tid))
+                undo.append((tid, f2.read(STATS_ROW_BYTES).decode('utf-8')))
+        with open(fstate + '.undo', 'w') as f:
+            json.dump({'serial': state['serial'], 'rows': undo}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        for (tid, line) in rows:
+            f2.seek(stats_offset(tid))
+            f2.write(pad_stats_row(line))
+
+
+def main_incremental(fin, fout1, fout2, fstate, longitude_min, latitude_min, longitude_max, latitude_max, \
+                     min_photos_per_traj=1, time_gap=8):
+    """Incremental version of main(), fin is a batch of new photos,
+       the first run (fstate does not exist) gives the same trajectories as main(), the rows of trajectory_stats.csv
+       are padded with trailing spaces to STATS_ROW_BYTES bytes though (the same values for CSV readers skipping
+       spaces, e.g. pandas.read_csv(skipinitialspace=True), not the same bytes),
+       later runs only merge the new photos with the last (open) trajectory of their users, patch the rows
+       of changed trajectories in trajectory_stats.csv in place and append new rows to both tables,
+       Trajectory_IDs never change and rows of a trajectory in trajectory_photos.csv are in time order but not
+       necessarily contiguous.
+       The state is kept in fstate and the photos of the open trajectory of each user and its Trajectory_ID
+       (-1 if dropped) in shards of users next to it, i.e. an update costs the size of the new photos and the
+       shards of their users, not the size of both tables.
+       New photos of a user should not be older than the user's photos seen before.
+    """
+    assert(longitude_min < longitude_max)
+    assert(latitude_min < latitude_max)
+    assert(min_photos_per_traj >= 1)
+    assert(time_gap > 0)
+    params = [longitude_min, latitude_min, longitude_max, latitude_max, min_photos_per_traj, time_gap]
+
+    if os.path.exists(fstate):
+        state = load_state(fstate, fout1, fout2)
+        if state['params'] != params:
+            raise ValueError('parameters differ from the previous runs: ' + str(state['params']))
+        assert(not is_columnar(fin))
+        with open(fin, 'r') as f:
+            f.readline()  # header
+            lines = [line for line in f if len(line.strip()) > 0]
+        delta_users = set(line.split(',', 2)[1].strip() for line in lines)
+        shards = load_open(fstate, state, delta_users)
+        opened = {uid: x for users in shards.values() for (uid, x) in users.items()}
+        old_lines = [line for uid in sorted(delta_users) if uid in opened for line in opened[uid][1]]
+        data = lines_to_table(old_lines + lines)
+        nold = len(old_lines)
+    else:
+        state = {'version': STATE_VERSION, 'params': params, 'serial': 0, 'next_tid': 0, 'photos_bytes': 0, \
+                 'shards': [0] * STATE_SHARDS}
+        shutil.rmtree(fstate + '.open', ignore_errors=True)  # shards of an earlier state
+        with open(fout1, 'w') as f1, open(fout2, 'w') as f2:
+            f1.write(HEADER1)  # data table 1
+            f2.write(HEADER2)  # data table 2
+            state['photos_bytes'] = f1.tell()
+        data = load_data(fin)
+        nold = 0
+        shards = load_open(fstate, state, data.users)
+        opened = dict()
+
+    offsets, index = segment_trajectories(data, time_gap)
+    if len(index) == 0:
+        save_state(fstate, state, dict())
+        return
+    isold = index < nold
+    users = np.asarray(data.user)[index]
+    late = np.flatnonzero(isold[1:] & ~isold[:-1] & (users[1:] == users[:-1]))
+    if len(late) > 0:
+        raise ValueError('photos of user %s are older than the ones seen before, a full rebuild is needed' % \
+                         data.users[users[late[0]]])
+
+    # trajectories to keep, the same as filter_trajectories()
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    lngs = np.asarray(data.lng)[index]
+    lats = np.asarray(data.lat)[index]
+    inbox = (lngs > longitude_min) & (lngs < longitude_max) & (lats > latitude_min) & (lats < latitude_max)
+    keep = (np.add.reduceat(inbox.astype(np.int64), starts) > 0) & (lengths >= min_photos_per_traj)
+    seg_users = users[starts]
+    seg_of = np.repeat(np.arange(len(starts)), lengths)  # trajectory of each photo
+    lasts = np.ones(len(starts), dtype=bool)  # the last (open) trajectory of each user
+    lasts[:-1] = seg_users[1:] != seg_users[:-1]
+
+    # Trajectory_IDs, trajectories continuing an open one keep its ID, new ones kept get new IDs
+    tids = np.full(len(starts), -1, dtype=np.int64)
+    cont = isold[starts]
+    tids[cont] = [opened[data.users[u]][0] for u in seg_users[cont].tolist()]
+    changed = cont & (tids >= 0) & (np.add.reduceat(isold.astype(np.int64), starts) < lengths)
+    created = (tids < 0) & keep
+    ntids = state['next_tid']
+    tids[created] = np.arange(ntids, ntids + np.count_nonzero(created))
+    state['next_tid'] += int(np.count_nonzero(created))
+
+    # photos to append to data table 1: all photos of new trajectories, new photos of changed ones
+    append = created[seg_of] | (changed[seg_of] & ~isold)
+    photo_offsets = np.zeros(np.count_nonzero(created | changed) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(seg_of[append], minlength=len(starts))[created | changed], out=photo_offsets[1:])
+    photo_tids = tids[created | changed]
+
+    # the open trajectory of each user becomes the new state
+    open_lines = format_csv_rows(data, index[lasts[seg_of]])
+    start = 0
+    for (u, tid, n) in zip(seg_users[lasts].tolist(), tids[lasts].tolist(), lengths[lasts].tolist()):
+        shards[user_shard(data.users[u])][data.users[u]] = [tid, open_lines[start:start+n]]
+        start += n
+
+    with open(fout1, 'a') as f1:
+        write_segments(f1, None, photo_offsets, index[append], data, tids=photo_tids)
+        photos_bytes = f1.tell()
+    f = io.StringIO()
+    write_segments(None, f, *take_segments(offsets, index, created | changed), data, tids=photo_tids)
+    # patch the rows of changed trajectories, then append the rows of new ones
+    patch_stats(fout2, fstate, state, ntids, sorted(zip(photo_tids.tolist(), f.getvalue().splitlines())))
+    state['photos_bytes'] = photos_bytes
+    save_state(fstate, state, shards)
+
+
+def main(fin, fout1, fout2, longitude_min, latitude_min, longitude_max, latitude_max, min_photos_per_traj=1, time_gap=8, \
+         region=None, criterion='any', min_fraction=0.5):
+    """Main Procedure, if region is given, it is used instead of the bounding box"""
     assert(longitude_min < longitude_max)
     assert(latitude_min < latitude_max)
     assert(min_photos_per_traj >= 1)
     assert(time_gap > 0)
     data = load_data(fin)
-    trajs = gen_trajectories(data, time_gap)
-    trajs = filter_trajectories(longitude_min, latitude_min, longitude_max, latitude_max, trajs, data, min_photos_per_traj)
-    dump_trajectories(fout1, fout2, trajs, data)
+    offsets, index = segment_trajectories(data, time_gap)
+    if region is None:
+        offsets, index = filter_segments(longitude_min, latitude_min, longitude_max, latitude_max, offsets, index, \
+                                         data, min_photos_per_traj, criterion, min_fraction)
+    else:
+        offsets, index = filter_segments_region(region, offsets, index, data, min_photos_per_traj, criterion, \
+                                                min_fraction)
+    dump_segments(fout1, fout2, offsets, index, data)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2 and len(sys.argv) != 8:
-        print('Usage:', sys.argv[0], 'BIGBOX_DATA_FILE')
-        print('Usage:', sys.argv[0], \
-              'BIGBOX_DATA_FILE  MIN_LONGITUDE  MIN_LATITUDE  MAX_LONGITUDE  MAX_LATITUDE  MIN_PHOTOS_PER_TRAJECTORY  TIME_GAP(hour)')
-        sys.exit(0)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('fin', metavar='BIGBOX_DATA_FILE')
+    parser.add_argument('params', nargs='*', metavar='PARAM', \
+                        help='MIN_LONGITUDE  MIN_LATITUDE  MAX_LONGITUDE  MAX_LATITUDE  MIN_PHOTOS_PER_TRAJECTORY  ' + \
+                             'TIME_GAP(hour), the last two can be comma separated lists to sweep over all combinations')
+    parser.add_argument('--sweep-tables', action='store_true', \
+                        help='in sweep mode, also save both tables for each setting')
+    parser.add_argument('--memory-budget', type=int, metavar='MB', \
+                        help='streaming mode for data larger than memory, keep memory usage under (roughly) MB')
+    parser.add_argument('--state', metavar='STATE_FILE', \
+                        help='incremental mode, BIGBOX_DATA_FILE is a batch of new photos, ' + \
+                             'both tables are updated in the directory of STATE_FILE (created by the first run), ' + \
+                             'rows of trajectory_stats.csv are padded with trailing spaces to %d bytes' % \
+                             STATS_ROW_BYTES)
+    parser.add_argument('--region', metavar='REGION_FILE', \
+                        help='keep trajectories in a region (e.g. polygons in a KML file) instead of the bounding box')
+    parser.add_argument('--region-name', help='name of the region in REGION_FILE, default: the first one')
+    parser.add_argument('--criterion', choices=['any', 'all', 'fraction'], default='any', \
+                        help='keep trajectories with any/all/at least MIN_FRACTION of photos inside, default: any')
+    parser.add_argument('--min-fraction', type=float, default=0.5)
+    args = parser.parse_args()
+    if len(args.params) != 0 and len(args.params) != 6:
+        parser.error('expect either no PARAM or all 6 PARAMs')
 
-    fin = sys.argv[1]
+    region = None
+    if args.region:
+        regions = load_regions(args.region)
+        if args.region_name:
+            regions = [r for r in regions if r.name == args.region_name]
+        if len(regions) == 0:
+            parser.error('no such region in ' + args.region)
+        region = regions[0]
+    sweep_mode = len(args.params) == 6 and (',' in args.params[4] or ',' in args.params[5])
+    if (region is not None or args.criterion != 'any') and (args.memory_budget or sweep_mode):
+        parser.error('--region and --criterion are not supported in streaming or sweep mode')
+    if args.state and (region is not None or args.criterion != 'any' or args.memory_budget or sweep_mode):
+        parser.error('--state does not support --region, --criterion, streaming or sweep mode')
+
+    fin = args.fin
     path, filename = os.path.split(fin)
     fout1 = os.path.join(path, './trajectory_photos.csv')
     fout2 = os.path.join(path, './trajectory_stats.csv')
+    if args.state:
+        path = os.path.dirname(args.state)
+        fout1 = os.path.join(path, './trajectory_photos.csv')
+        fout2 = os.path.join(path, './trajectory_stats.csv')
 
-    if len(sys.argv) == 2:
+    if len(args.params) == 0:
         lng_min = 144.597363
         lat_min = -38.072257
         lng_max = 145.360413
         lat_max = -37.591764
-        main(fin, fout1, fout2, lng_min, lat_min, lng_max, lat_max)
+        if args.state:
+            main_incremental(fin, fout1, fout2, args.state, lng_min, lat_min, lng_max, lat_max)
+        elif args.memory_budget:
+            main_streaming(fin, fout1, fout2, lng_min, lat_min, lng_max, lat_max, memory_budget=args.memory_budget)
+        else:
+            main(fin, fout1, fout2, lng_min, lat_min, lng_max, lat_max, region=region, criterion=args.criterion, \
+                 min_fraction=args.min_fraction)
     else:
-        lng_min = float(sys.argv[2])
-        lat_min = float(sys.argv[3])
-        lng_max = float(sys.argv[4])
-        lat_max = float(sys.argv[5])
-        min_photos_per_traj = int(sys.argv[6])
-        time_gap = float(sys.argv[7])
-        main(fin, fout1, fout2, lng_min, lat_min, lng_max, lat_max, min_photos_per_traj, time_gap)
-
+        lng_min = float(args.params[0])
+        lat_min = float(args.params[1])
+        lng_max = float(args.params[2])
+        lat_max = float(args.params[3])
+        min_photos_list = [int(x) for x in args.params[4].split(',')]
+        time_gaps = [float(x) for x in args.params[5].split(',')]
+        if args.state:
+            main_incremental(fin, fout1, fout2, args.state, lng_min, lat_min, lng_max, lat_max, min_photos_list[0], \
+                             time_gaps[0])
+        elif len(min_photos_list) == 1 and len(time_gaps) == 1 and args.memory_budget:
+            main_streaming(fin, fout1, fout2, lng_min, lat_min, lng_max, lat_max, min_photos_list[0], time_gaps[0], \
+                           args.memory_budget)
+        elif len(min_photos_list) == 1 and len(time_gaps) == 1:
+            main(fin, fout1, fout2, lng_min, lat_min, lng_max, lat_max, min_photos_list[0], time_gaps[0], \
+                 region, args.criterion, args.min_fraction)
+        else:
+            fout = os.path.join(path, './trajectory_sweep.csv')
+            main_sweep(fin, fout, lng_min, lat_min, lng_max, lat_max, min_photos_list, time_gaps, args.sweep_tables)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import zipfile
+import numpy as np
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+from traj_store import TrajectoryStore
+from profiling import profiled
+
+
+# the same document as traj_visualise.gen_kml(), written without building it in memory
+KML_HEAD = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+  <Document id="001">
+    <name>Trajectories</name>
+    <description>Trajectory visualization</description>
+    <visibility>1</visibility>
+    <Style id="style1">
+      <LineStyle>
+        <color>2f0000ff</color>
+        <width>3</width>
+      </LineStyle>
+    </Style>
+"""
+KML_TAIL = """\
+  </Document>
+</kml>
+"""
+
+
+def split_rows(rows):
+    """Split raw CSV rows (bytes) of a table of generate_tables.py into columns (lists of str)"""
+    lines = rows.decode('utf-8').splitlines()
+    fields = [[x.strip() for x in line.split(',')] for line in lines if len(line.strip()) > 0]
+    return list(zip(*fields)) if len(fields) > 0 else []
+
+
+def format_coords(lngs, lats):
+    return ['%f,%f' % (lng, lat) for (lng, lat) in zip(lngs.tolist(), lats.tolist())]
+
+
+def traj_placemarks(store, traj_ids, names):
+    """KML of the trajectory placemarks of a batch of trajectories"""
+    stats = split_rows(b''.join(store.stats_row(traj_id) for traj_id in traj_ids))
+    (tids, uids, nphotos, starts, dists, ttimes, speeds) = stats
+    out = []
+    for i in range(len(traj_ids)):
+        photos = split_rows(store.photo_rows(traj_ids[i]))
+        coords = format_coords(np.array(photos[4], dtype=np.float64), np.array(photos[5], dtype=np.float64))
+        name = 'Trajectory_' + tids[i]
+        if names: name += '_' + names[i]
+        desc = 'User_ID: '              + uids[i] + \
+               '<br/>Start_Time: '      + starts[i] + \
+               '<br/>Travel_Distance: ' + str(round(float(dists[i]), 2)) + ' km' + \
+               '<br/>Total_Time: '      + str(round(float(ttimes[i]), 2)) + ' min' + \
+               '<br/>Average_Speed: '   + str(round(float(speeds[i]), 2)) + ' km/h' + \
+               '<br/>#Photos: '         + nphotos[i] + \
+               '<br/>Photos: ['         + ', '.join(str(int(x)) for x in photos[1]) + ']'
+        out.append('    <Placemark id="%s">\n      <name>%s</name>\n      <description>%s</description>\n'
+                   '      <visibility>1</visibility>\n      <styleUrl>#style1</styleUrl>\n'
+                   '      <LineString>\n        <coordinates>%s</coordinates>\n      </LineString>\n'
+                   '    </Placemark>\n' % (tids[i], escape(name), escape(desc), ' '.join(coords)))
+    return ''.join(out)
+
+
+def photo_placemarks(store, traj_ids):
+    """KML of the photo placemarks of a batch of trajectories"""
+    photos = split_rows(b''.join(store.photo_rows(traj_id) for traj_id in traj_ids))
+    if len(photos) == 0: return ''
+    (tids, pids, uids, times, lngs, lats, accs, markers, urls) = photos
+    lngs = np.array(lngs, dtype=np.float64)
+    lats = np.array(lats, dtype=np.float64)
+    coords = format_coords(lngs, lats)
+    lngs = lngs.tolist()
+    lats = lats.tolist()
+    out = []
+    for j in range(len(pids)):
+        desc = 'Trajectory_ID: '  + tids[j] + \
+               '<br/>Photo_ID: '  + pids[j] + \
+               '<br/>User_ID: '   + uids[j] + \
+               '<br/>Timestamp: ' + times[j] + \
+               '<br/>Coordinates: (' + repr(lngs[j]) + ', ' + repr(lats[j]) + ')' + \
+               '<br/>Accuracy: '  + accs[j] + \
+               '<br/>URL: '       + urls[j]
+        out.append('    <Placemark id="%s">\n      <name>Photo_%s</name>\n      <description>%s</description>\n'
+                   '      <visibility>1</visibility>\n'
+                   '      <Point>\n        <coordinates>%s</coordinates>\n      </Point>\n'
+                   '    </Placemark>\n' % (pids[j], pids[j], escape(desc), coords[j]))
+    return ''.join(out)
+
+
+@contextmanager
+def open_kml(fname):
+    """Open a KML file, or a KMZ file (zipped doc.kml) if fname ends with .kmz, for writing text"""
+    if fname.lower().endswith('.kmz'):
+        with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as z:
+            with io.TextIOWrapper(z.open('doc.kml', 'w'), encoding='utf-8') as f:
+                yield f
+    else:
+        with open(fname, 'w', encoding='utf-8') as f:
+            yield f
+
+
+@profiled('gen_kml', rows='traj_id_list')
+def export_kml(fname, store, traj_id_list, traj_name_list=None, batch_size=1000):
+    """Write the same document as traj_visualise.gen_kml() for trajectories in a TrajectoryStore to a KML/KMZ file,
+       placemarks are generated and written in batches of batch_size trajectories,
+       i.e. memory usage does not grow with the number of trajectories
+    """
+    assert(len(traj_id_list) > 0)
+    if traj_name_list:
+        assert(len(traj_id_list) == len(traj_name_list))
+    for traj_id in traj_id_list:
+        assert(traj_id in store)
+
+    with open_kml(fname) as f:
+        f.write(KML_HEAD)
+        # trajectories first, then photos, as gen_kml()
+        for start in range(0, len(traj_id_list), batch_size):
+            names = traj_name_list[start:start+batch_size] if traj_name_list else None
+            f.write(traj_placemarks(store, traj_id_list[start:start+batch_size], names))
+        for start in range(0, len(traj_id_list), batch_size):
+            f.write(photo_placemarks(store, traj_id_list[start:start+batch_size]))
+        f.write(KML_TAIL)
+
+
+def shard_fname(fname, i):
+    """trajectories.kmz --> trajectories.003.kmz"""
+    base, ext = os.path.splitext(fname)
+    return '%s.%03d%s' % (base, i, ext)
+
+
+def export_kml_shards(fname, store, traj_id_list, traj_name_list=None, shard_size=1000, batch_size=1000):
+    """Export trajectories to KML/KMZ files of (at most) shard_size trajectories each, see export_kml(),
+       return the file names
+    """
+    assert(shard_size > 0)
+    fnames = []
+    for start in range(0, len(traj_id_list), shard_size):
+        names = traj_name_list[start:start+shard_size] if traj_name_list else None
+        fnames.append(shard_fname(fname, len(fnames)))
+        export_kml(fnames[-1], store, traj_id_list[start:start+shard_size], names, batch_size)
+    return fnames
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [4, 5]:
+        print('Usage: ', sys.argv[0], 'TRAJECTORY_PHOTO_FILE  TRAJECTORY_STATS_FILE  OUTPUT(KML/KMZ)  [SHARD_SIZE]')
+        print('e.g. : ', sys.argv[0], 'trajectory_photos.csv  trajectory_stats.csv  trajectories.kmz  5000')
+        print('export all trajectories (with at least 2 photos)')
+        sys.exit(0)
+
+    with TrajectoryStore(sys.argv[1], sys.argv[2]) as store:
+        traj_stats = store.stats_table()
+        traj_id_list = traj_stats[traj_stats['#Photo'] > 1]['Trajectory_ID'].tolist()
+        if len(sys.argv) == 5:
+            print('\n'.join(export_kml_shards(sys.argv[3], store, traj_id_list, shard_size=int(sys.argv[4]))))
+        else:
+            export_kml(sys.argv[3], store, traj_id_list)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+import sys
+import time
+import json
+import heapq
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from poi_info import extract_trajs, PoiStats
+from rank_features import FeatureEngine, gen_query_id_dict
+from ranksvm import RankSVM, recommend as recommend_rank
+from transmat import TransitionCounter, gen_logbins, gen_poi_transmat
+
+
+RANK_C = 10  # regularisation parameter for rankSVM
+BIN_CLUSTER = 5  # number of bins/clusters for discritizing POI features
+ALPHA = 0.5  # weight of POI ranking when combined with transition probabilities
+# columns of data/Melb_recommendations*.csv, the last 3 are not computed here (see evaluate())
+METHODS = ['REAL', 'PoiPopularity', 'PoiRank', 'Markov', 'MarkovPath', 'Rank+Markov', 'Rank+MarkovPath', \
+           'StructuredSVM', 'PersTour', 'PersTour-L']
+EXTERNAL = ['StructuredSVM', 'PersTour', 'PersTour-L']
+PERCENTILES = [50, 90, 99, 100]
+
+
+def calc_F1(traj_act, traj_rec):
+    """F1 of the POIs of a recommended trajectory, the same as calc_F1() in dataset_Melb.ipynb"""
+    assert(len(traj_act) > 0)
+    assert(len(traj_rec) > 0)
+    intersize = len(set(traj_act) & set(traj_rec))
+    if intersize == 0: return 0
+    recall = intersize / len(traj_act)
+    precision = intersize / len(traj_rec)
+    return 2 * precision * recall / (precision + recall)
+
+
+def calc_pairsF1(traj_act, traj_rec):
+    """F1 of the ordered POI pairs of a recommended trajectory, i.e. pairs (traj_rec[i], traj_rec[j]), i < j,
+       visited in the same order in traj_act (without loops), as in data/Melb_recommendations_pairsF1.csv
+    """
+    assert(len(traj_act) > 0)
+    assert(len(traj_act) == len(set(traj_act)))
+    (n, nr) = (len(traj_act), len(traj_rec))
+    order = dict((poi, i) for (i, poi) in enumerate(traj_act))
+    ix = np.array([order.get(poi, -1) for poi in traj_rec])
+    (i, j) = np.triu_indices(nr, k=1)
+    nc = np.sum((ix[i] >= 0) & (ix[j] >= 0) & (ix[i] < ix[j]))
+    if nc == 0: return 0
+    precision = nc / (nr * (nr - 1) / 2)
+    recall = nc / (n * (n - 1) / 2)
+    return float(2 * precision * recall / (precision + recall))
+
+
+def softmax(x):
+    """Softmax of ranking scores, the same as softmax() in dataset_Melb.ipynb"""
+    expx = np.exp(x - np.max(x))
+    return expx / np.sum(expx)
+
+
+def step_costs(E, weights=None, alpha=ALPHA):
+    """Costs of moving from POI i to POI j, E[i, j] (edge weights), or alpha * weights[j] + (1 - alpha) * E[i, j]
+       with node weights
+    """
+    if weights is None: return E
+    assert(0 < alpha < 1)
+    return alpha * weights[None, :] + (1 - alpha) * E
+
+
+def find_path(E, ps, pe, L, weights=None, alpha=ALPHA):
+    """The trajectory (POI positions) from ps to pe with L POIs of the minimum total cost found by dynamic programming,
+       which may visit POIs more than once, the same as find_path() in dataset_Melb.ipynb (vectorised),
+       E is the matrix of edge weights (negative log of transition probabilities), weights are node weights (optional)
+    """
+    N = E.shape[0]
+    assert(0 <= ps < N and 0 <= pe < N)
+    assert(2 < L <= N)
+    A = np.full(N, np.inf)
+    B = np.zeros((L + 1, N), dtype=np.int64)
+    others = np.arange(N) != ps
+    if weights is None:
+        A[others] = E[ps, others]
+    else:
+        assert(0 < alpha < 1)
+        A[others] = alpha * (weights[ps] + weights[others]) + (1 - alpha) * E[ps, others]
+    B[2] = ps
+    for l in range(3, L + 1):
+        if weights is None:
+            values = A[:, None] + E
+        else:
+            values = A[:, None] + alpha * weights[None, :] + (1 - alpha) * E
+        B[l] = np.argmin(values, axis=0)
+        A = values[B[l], np.arange(N)]
+    path = [pe]
+    for l in range(L, 1, -1):
+        path.append(B[l, path[-1]])
+    return path[::-1]
+
+
+def find_path_simple(E, ps, pe, L, weights=None, alpha=ALPHA, deadline=None):
+    """The trajectory (POI positions) from ps to pe with L distinct POIs of the minimum total cost (the same objective
+       as find_path(), which is solved by ILP in dataset_Melb.ipynb) by best-first search: partial trajectories are
+       expanded in the order of their cost plus a lower bound of the rest (the larger of the minimum cost of walks to
+       pe and the sum of the cheapest costs into enough unvisited POIs), trajectories with the same set of POIs and
+       the same last POI are expanded only once, return None if time.time() passes deadline (checked every 256 pops)
+    """
+    N = E.shape[0]
+    (ps, pe) = (int(ps), int(pe))
+    assert(0 <= ps < N and 0 <= pe < N and ps != pe)
+    assert(2 < L <= N)
+    C = step_costs(E, weights, alpha)
+    C = np.where(np.eye(N, dtype=bool), np.inf, C)
+
+    # h[t, v]: the minimum cost of walks from v at position t to pe at position L-1, ps and pe are not in the middle
+    h = np.full((L, N), np.inf)
+    h[L-1, pe] = 0
+    middle = np.ones(N, dtype=bool)
+    middle[[ps, pe]] = False
+    for t in range(L - 2, -1, -1):
+        nxt = h[t+1] if t + 1 == L - 1 else np.where(middle, h[t+1], np.inf)
+        h[t] = np.min(C + nxt[None, :], axis=1)
+
+    # the other bound of simple paths: the cheapest way into pe plus the r cheapest ways into unvisited POIs
+    m = C.min(axis=0)
+    m[[ps, pe]] = np.inf
+
+    # heap entries (cost + bound, counter, cost, bitmask of POIs, prefix)
+    g0 = 0 if weights is None else alpha * weights[ps]
+    heap = [(g0 + h[0, ps], 0, g0, 1 << ps, (ps,))]
+    (count, expanded) = (1, set())
+    while len(heap) > 0:
+        if deadline is not None and count % 256 == 1 and time.time() > deadline:
+            return None
+        count += 1
+        (f, _, g, mask, prefix) = heapq.heappop(heap)
+        if not np.isfinite(f): break
+        if len(prefix) == L:
+            return list(prefix)
+        v = prefix[-1]
+        if (mask, v) in expanded: continue
+        expanded.add((mask, v))
+        costs = g + C[v]
+        fs = costs + h[len(prefix)]
+        r = L - len(prefix) - 2  # the number of POIs between children and pe
+        if r > 0:
+            mu = m.copy()
+            mu[list(prefix)] = np.inf
+            smallest = np.sort(mu)[:r+1]
+            # the r cheapest except each child (infinite if there are not enough POIs)
+            with np.errstate(invalid='ignore'):
+                bound = np.where(mu <= smallest[r-1], smallest.sum() - mu, smallest[:r].sum())
+                fs = np.maximum(fs, costs + bound + C[:, pe].min())
+        fs[list(prefix)] = np.inf
+        for w in np.flatnonzero(np.isfinite(fs)).tolist():
+            child = mask | (1 << w)
+            if (child, w) not in expanded:
+                heapq.heappush(heap, (fs[w], count, costs[w], child, prefix + (w,)))
+    return None
+
+
+class LeaveOneOut:
+    """Leave-one-out evaluation of trajectory recommendation methods of dataset_Melb.ipynb: for each query trajectory
+       the POI statistics, the POI ranking model (rankSVM) and the factorised transition matrix are built from all the
+       other trajectories, and the trajectory between its first and last POIs with the same length is recommended by
+       POI popularity, POI ranking, transition probabilities (Markov: walks by DP, MarkovPath: simple paths)
+       and both (Rank+Markov, Rank+MarkovPath),
+       POI statistics of folds are computed by PoiStats and transition counts by TransitionCounter from the totals,
+       distances between POIs are taken from poi_distmat (optional, e.g. poi_store.PoiStore.poi_distmat)
+    """
+    def __init__(self, traj_all, poi_all, poi_clusters, budget=None, poi_distmat=None):
+        assert(budget is None or budget > 0)
+        self.traj_dict = extract_trajs(traj_all)
+        self.trajid_set_all = sorted(self.traj_dict.keys())
+        self.query_id_dict = gen_query_id_dict(self.traj_dict)
+        self.stats = PoiStats(traj_all, poi_all)
+        self.counter = TransitionCounter(self.traj_dict, max_cache=1)
+        self.poi_clusters = poi_clusters
+        self.budget = budget
+        self.poi_distmat = poi_distmat
+
+        # feature classes of all trajectories, the same as dataset_Melb.ipynb
+        poi_info_all = self.stats.leave_out([])
+        self.poi_cats = sorted(poi_info_all['poiCat'].unique().tolist())
+        self.logbins_pop = gen_logbins(poi_info_all['popularity'], BIN_CLUSTER)
+        self.logbins_visit = gen_logbins(poi_info_all['nVisit'], BIN_CLUSTER)
+        self.logbins_duration = gen_logbins(poi_info_all['avgDuration'], BIN_CLUSTER, duration=True)
+
+
+    def evaluate(self, tid):
+        """Recommendations (lists of POI IDs, None if failed or timed out) of trajectory tid by each method and the
+           time (seconds) of each step, methods in EXTERNAL are not computed (None)
+        """
+        traj = self.traj_dict[tid]
+        assert(len(traj) > 2)
+        (ps, pe, L) = (traj[0], traj[-1], len(traj))
+        recs = dict((method, None) for method in METHODS)
+        recs['REAL'] = traj
+        times = dict()
+
+        t0 = time.time()
+        trajid_list = [x for x in self.trajid_set_all if x != tid]
+        poi_info = self.stats.leave_out([tid])
+        times['fold'] = time.time() - t0
+        if ps not in poi_info.index or pe not in poi_info.index:
+            return recs, times
+        poi_ids = poi_info.index.values  # sorted
+
+        t0 = time.time()
+        order = np.argsort(-poi_info['popularity'].values, kind='stable')
+        recs['PoiPopularity'] = [ps] + [x for x in poi_ids[order].tolist() if x not in {ps, pe}][:L-2] + [pe]
+        times['PoiPopularity'] = time.time() - t0
+
+        t0 = time.time()
+        engine = FeatureEngine(poi_info, self.poi_distmat)
+        (_, labels, qids, X) = engine.train_data(trajid_list, self.traj_dict, self.query_id_dict)
+        ranksvm = RankSVM().fit(X, labels, qids, cost=RANK_C)
+        (pois, scores) = ranksvm.predict_queries(engine, [(ps, pe, L)])
+        assert(np.all(pois == poi_ids))
+        recs['PoiRank'] = recommend_rank(pois, scores[0], ps, pe, L)
+        times['PoiRank'] = time.time() - t0
+
+        t0 = time.time()
+        transmats = self.counter.transmats(trajid_list, poi_info, self.poi_cats, self.logbins_pop, self.logbins_visit, \
+                                           self.logbins_duration, self.poi_clusters)
+        poi_transmat = gen_poi_transmat(transmats, set(poi_ids), poi_info, self.poi_cats, self.logbins_pop, \
+                                        self.logbins_visit, self.logbins_duration, self.poi_clusters)
+        with np.errstate(divide='ignore'):
+            E = -np.log(poi_transmat.values)  # edge weight is negative log of transition probability
+        weights = -np.log(softmax(scores[0]))  # node weight is negative log of ranking probability
+        (ips, ipe) = np.searchsorted(poi_ids, [ps, pe])
+        times['transmat'] = time.time() - t0
+
+        for (method, w) in [('Markov', None), ('Rank+Markov', weights)]:
+            t0 = time.time()
+            recs[method] = poi_ids[find_path(E, ips, ipe, L, weights=w)].tolist()
+            times[method] = time.time() - t0
+        for (method, w) in [('MarkovPath', None), ('Rank+MarkovPath', weights)]:
+            t0 = time.time()
+            deadline = None if self.budget is None else t0 + self.budget
+            path = find_path_simple(E, ips, ipe, L, weights=w, deadline=deadline)
+            recs[method] = None if path is None else poi_ids[path].tolist()
+            times[method] = time.time() - t0
+        return recs, times
+
+
+_LOO = None
+
+
+def init_worker(loo):
+    global _LOO
+    _LOO = loo
+
+
+def evaluate_traj(tid):
+    return (tid,) + _LOO.evaluate(tid)
+
+
+def evaluate_all(loo, trajid_list, workers=1):
+    """Evaluate trajectories by workers processes, a dictionary tid --> (recommendations, times),
+       longer trajectories (slower to evaluate) are started first
+    """
+    assert(workers >= 1)
+    tasks = sorted(trajid_list, key=lambda tid: -len(loo.traj_dict[tid]))
+    if workers > 1 and len(tasks) > 1:
+        with Pool(processes=workers, initializer=init_worker, initargs=(loo,)) as pool:
+            results = list(pool.imap_unordered(evaluate_traj, tasks, chunksize=1))
+    else:
+        init_worker(loo)
+        results = [evaluate_traj(tid) for tid in tasks]
+    return dict((tid, (recs, times)) for (tid, recs, times) in results)
+
+
+def load_recommendations(fname):
+    """Recommendations of a data/Melb_recommendations.csv file, a dictionary tid --> {method: list of POIs or None}"""
+    df = pd.read_csv(fname, sep=';', index_col='trajID')
+    return dict((tid, dict((method, json.loads(v) if isinstance(v, str) else None) for (method, v) in row.items())) \
+                for (tid, row) in df.iterrows())
+
+
+def write_table(fname, trajid_list, values, methods=METHODS):
+    """Write a table with the same format as data/Melb_recommendations*.csv, values[tid][method] is a list of POIs or
+       a number, None as NA
+    """
+    with open(fname, 'w') as f:
+        f.write(';'.join('"%s"' % x for x in ['trajID'] + methods) + '\n')
+        for tid in trajid_list:
+            f.write(';'.join([str(tid)] + ['"%s"' % ('NA' if values[tid][m] is None else str(values[tid][m])) \
+                                           for m in methods]) + '\n')
+
+
+def latency_percentiles(results):
+    """Percentiles (PERCENTILES) of the time (seconds) of each step over all trajectories, a DataFrame"""
+    steps = []
+    for (_, times) in results.values():
+        steps += [s for s in times.keys() if s not in steps]
+    rows = []
+    for step in steps:
+        values = [times[step] for (_, times) in results.values() if step in times]
+        rows.append([len(values)] + np.percentile(values, PERCENTILES).tolist())
+    return pd.DataFrame(rows, index=steps, columns=['count'] + ['p%d' % p for p in PERCENTILES])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [5, 6, 7, 8]:
+        print('Usage:', sys.argv[0], 'TRAJ_FILE(CSV)  POI_FILE(CSV)  CLUSTER_FILE(CSV)  OUTPUT_PREFIX  [WORKERS]  ' + \
+              '[BUDGET_SECONDS]  [PREVIOUS_RESULT(CSV)]')
+        print('e.g. :', sys.argv[0], 'traj-noloop-all-Melb.csv  poi-Melb-all.csv  cluster.1.csv  ' + \
+              'Melb_recommendations  4  60  Melb_recommendations.csv')
+        print('leave-one-out evaluation of trajectories with more than 2 POIs, write OUTPUT_PREFIX.csv, ' + \
+              'OUTPUT_PREFIX_F1.csv and OUTPUT_PREFIX_pairsF1.csv,')
+        print('results of ' + ', '.join(EXTERNAL) + ' are copied from PREVIOUS_RESULT (NA if not given), ' + \
+              'a simple path search taking more than BUDGET_SECONDS is NA')
+        sys.exit(0)
+
+    from poi_info import load_traj_all
+    from poi_store import PoiStore
+
+    traj_all = load_traj_all(sys.argv[1])
+    store = PoiStore(sys.argv[2])
+    poi_clusters = pd.read_csv(sys.argv[3], index_col='poiID')
+    prefix = sys.argv[4]
+    workers = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+    budget = float(sys.argv[6]) if len(sys.argv) > 6 else None
+    previous = load_recommendations(sys.argv[7]) if len(sys.argv) > 7 else dict()
+
+    loo = LeaveOneOut(traj_all, store.poi_all, poi_clusters, budget, store.poi_distmat)
+    trajid_list = [tid for tid in loo.trajid_set_all if len(loo.traj_dict[tid]) > 2]
+    t0 = time.time()
+    results = evaluate_all(loo, trajid_list, workers)
+    elapsed = time.time() - t0
+
+    recs = dict((tid, results[tid][0]) for tid in trajid_list)
+    for tid in trajid_list:
+        for method in EXTERNAL:
+            recs[tid][method] = previous.get(tid, dict()).get(method)
+    (F1s, pairsF1s) = (dict(), dict())
+    for tid in trajid_list:
+        traj = recs[tid]['REAL']
+        F1s[tid] = dict((m, None if r is None else calc_F1(traj, r)) for (m, r) in recs[tid].items())
+        pairsF1s[tid] = dict((m, None if r is None else calc_pairsF1(traj, r)) for (m, r) in recs[tid].items())
+    write_table(prefix + '.csv', trajid_list, recs)
+    write_table(prefix + '_F1.csv', trajid_list, F1s)
+    write_table(prefix + '_pairsF1.csv', trajid_list, pairsF1s)
+
+    print('%d trajectories, %d workers, %.1f seconds' % (len(trajid_list), workers, elapsed))
+    print('latency (seconds):')
+    print(latency_percentiles(results).to_string(float_format=lambda x: '%.4f' % x))
+    print('mean F1 / pairs-F1:')
+    for method in METHODS:
+        values = [(F1s[tid][method], pairsF1s[tid][method]) for tid in trajid_list if F1s[tid][method] is not None]
+        if len(values) > 0:
+            print('%16s %.4f %.4f (%d NA)' % (method, np.mean([x[0] for x in values]), \
+                                              np.mean([x[1] for x in values]), len(trajid_list) - len(values)))
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import numpy as np
+
+
+# Columnar photo table on disk: a directory with a header and one raw little-endian binary file per column,
+#   header.json       format version, number of rows/users and the dtype of each column
+#   pid.bin           Photo/video identifier
+#   user.bin          User NSID, interned to integer codes, i.e. index into the users string table
+#   time.bin          Date taken, whole seconds since epoch (the timestamps have no timezone)
+#   lng.bin           Longitude
+#   lat.bin           Latitude
+#   acc.bin           Accuracy
+#   marker.bin        Photos/video marker (0 = photo, 1 = video)
+#   url.bin           Photo/video page URL, UTF-8 strings concatenated
+#   url_offset.bin    offsets of the URLs in url.bin, the i-th URL is url.bin[url_offset[i]:url_offset[i+1]]
+#   users.bin         User NSIDs, UTF-8 strings concatenated
+#   users_offset.bin  offsets of the User NSIDs in users.bin
+FORMAT_NAME = 'flickr-photo-columns'
+FORMAT_VERSION = 1
+COLUMNS = [('pid', '<i8'), ('user', '<i4'), ('time', '<i8'), ('lng', '<f8'), ('lat', '<f8'), \
+           ('acc', '<i1'), ('marker', '<i1'), ('url_offset', '<i8')]
+STRINGS = ['url', 'users']
+
+
+def is_columnar(path):
+    """Check if path is a columnar photo table"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, 'header.json'))
+
+
+def parse_times(times):
+    """Convert timestamps in format '%Y-%m-%d %H:%M:%S.%f' to seconds since epoch, vectorised,
+       times are kept in whole seconds (format_times() writes '.0' back), a non-zero fraction raises ValueError
+    """
+    for frac in set(t[19:] for t in times):  # a few distinct fractions, '.0' in YFCC100M
+        if len(frac) > 0 and (frac[0] != '.' or frac[1:].strip('0') != ''):
+            t = next(t for t in times if t[19:] == frac)
+            raise ValueError('timestamp with a fraction of a second, only whole seconds are supported: ' + t)
+    return np.array([t[:19] for t in times], dtype='datetime64[s]').astype(np.int64)
+
+
+def format_times(seconds):
+    """Convert seconds since epoch to strings in format '%Y-%m-%d %H:%M:%S', vectorised"""
+    if np.size(seconds) == 0: return np.zeros(np.shape(seconds), dtype='<U19')
+    return np.char.replace(np.datetime_as_string(np.asarray(seconds, dtype='datetime64[s]')), 'T', ' ')
+
+
+def encode_strings(strs):
+    """Concatenate UTF-8 encoded strings, return the bytes and the offsets"""
+    encoded = [s.encode('utf-8') for s in strs]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return b''.join(encoded), offsets
+
+
+def parse_csv_rows(lines):
+    """Parse lines in the CSV format of filtering_bigbox.filtering() into columns
+       (pids, uids, times, lngs, lats, accs, markers, urls), times are seconds since epoch
+    """
+    rows = [[x.strip() for x in line.split(',')] for line in lines if len(line.strip()) > 0]
+    return ([t[0] for t in rows], [t[1] for t in rows], parse_times([t[2] for t in rows]), \
+            [float(t[3]) for t in rows], [float(t[4]) for t in rows], [int(t[5]) for t in rows], \
+            [int(t[7]) for t in rows], [t[6] for t in rows])
+
+
+def intern_users(uids, user_dict):
+    """Map User NSIDs to integer codes, new users are added to user_dict (User NSID --> code)"""
+    codes = np.zeros(len(uids), dtype=np.int32)
+    for i in range(len(uids)):
+        code = user_dict.get(uids[i])
+        if code is None:
+            code = len(user_dict)
+            user_dict[uids[i]] = code
+        codes[i] = code
+    return codes
+
+
+def flickr_url(uid, pid):
+    return 'http://www.flickr.com/photos/' + uid + '/' + str(pid) + '/'
+
+
+class StringColumn:
+    """Read-only sequence of strings stored as concatenated UTF-8 bytes and offsets"""
+    def __init__(self, blob, offsets):
+        assert(len(offsets) >= 1)
+        self.blob = blob
+        self.offsets = offsets
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i+1]]).decode('utf-8')
+
+
+    def tolist(self):
+        data = bytes(self.blob)
+        offsets = self.offsets.tolist()
+        return [data[offsets[i]:offsets[i+1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+    def take(self, indexes):
+        """List of strings at indexes (an integer array)"""
+        starts = np.asarray(self.offsets)[indexes].tolist()
+        ends = np.asarray(self.offsets)[indexes + 1].tolist()
+        blob = self.blob
+        return [bytes(blob[s:e]).decode('utf-8') for (s, e) in zip(starts, ends)]
+
+
+class FlickrUrlColumn:
+    """Read-only sequence of photo page URLs derived from User NSIDs and photo IDs,
+       used when all URLs follow the pattern http://www.flickr.com/photos/<User NSID>/<Photo ID>/
+    """
+    def __init__(self, pid, user, users):
+        self.pid = pid
+        self.user = user
+        self.users = users
+
+
+    def __len__(self):
+        return len(self.pid)
+
+
+    def __getitem__(self, i):
+        return flickr_url(self.users[self.user[i]], self.pid[i])
+
+
+    def tolist(self):
+        users = self.users
+        return [flickr_url(users[c], p) for (p, c) in zip(self.pid.tolist(), self.user.tolist())]
+
+
+    def take(self, indexes):
+        """List of URLs at indexes (an integer array)"""
+        users = self.users
+        pids = np.asarray(self.pid)[indexes].tolist()
+        codes = np.asarray(self.user)[indexes].tolist()
+        return ['http://www.flickr.com/photos/' + users[c] + '/' + str(p) + '/' for (p, c) in zip(pids, codes)]
+
+
+class PhotoTable:
+    """Photo records in struct-of-arrays form, see the comments above for the columns.
+       It also behaves like a list of records (pid, uid, time, lng, lat, acc, url, marker) as returned by
+       generate_tables.load_data(), at the cost of creating Python objects for every record accessed.
+    """
+    def __init__(self, pid, user, users, time, lng, lat, acc, marker, url):
+        n = len(pid)
+        assert(len(user) == n and len(time) == n and len(lng) == n and len(lat) == n)
+        assert(len(acc) == n and len(marker) == n and len(url) == n)
+        self.pid = pid
+        self.user = user
+        self.users = users
+        self.time = time
+        self.lng = lng
+        self.lat = lat
+        self.acc = acc
+        self.marker = marker
+        self.url = url
+
+
+    def __len__(self):
+        return len(self.pid)
+
+
+    def __getitem__(self, i):
+        return (str(self.pid[i]), self.users[self.user[i]], np.datetime64(int(self.time[i]), 's').astype(object), \
+                float(self.lng[i]), float(self.lat[i]), int(self.acc[i]), self.url[i], int(self.marker[i]))
+
+
+    def save(self, path):
+        """Save as a columnar photo table"""
+        with ColumnarWriter(path) as writer:
+            writer.write_columns(self.pid, [self.users[x] for x in self.user.tolist()], self.time, self.lng, \
+                                 self.lat, self.acc, self.marker, self.url.tolist())
+
+
+    def to_csv(self, fname, header=True):
+        """Export as a CSV file in the format of filtering_bigbox.filtering()"""
+        write_csv(fname, self, header)
+
+
+def mmap_column(path, name, dtype, shape):
+    fname = os.path.join(path, name + '.bin')
+    if shape == 0: return np.zeros(0, dtype=dtype)  # can not mmap empty files
+    return np.memmap(fname, dtype=dtype, mode='r', shape=(shape,))
+
+
+def load_columnar(path):
+    """Memory-map a columnar photo table (read-only, zero copy)"""
+    with open(os.path.join(path, 'header.json'), 'r') as f:
+        header = json.load(f)
+    assert(header['format'] == FORMAT_NAME)
+    assert(header['version'] == FORMAT_VERSION)
+    n = header['nrows']
+    nusers = header['nusers']
+    cols = dict()
+    for name, dtype in header['columns'].items():
+        cols[name] = mmap_column(path, name, dtype, n + 1 if name == 'url_offset' else n)
+    url = StringColumn(mmap_column(path, 'url', np.uint8, header['url_bytes']), cols['url_offset'])
+    users_offset = mmap_column(path, 'users_offset', '<i8', nusers + 1)
+    users = StringColumn(mmap_column(path, 'users', np.uint8, header['users_bytes']), users_offset).tolist()
+    return PhotoTable(cols['pid'], cols['user'], users, cols['time'], cols['lng'], cols['lat'], \
+                      cols['acc'], cols['marker'], url)
+
+
+class ColumnarWriter:
+    """Write a columnar photo table incrementally,
+       rows can be given as lines in the CSV format of filtering_bigbox.filtering() or as columns
+    """
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.nrows = 0
+        self.url_bytes = 0
+        self.user_dict = dict()  # User NSID --> code
+        self.files = dict()
+        for name, dtype in COLUMNS + [(x, None) for x in STRINGS]:
+            self.files[name] = open(os.path.join(path, name + '.bin'), 'wb')
+        self.files['url_offset'].write(np.zeros(1, dtype='<i8').tobytes())
+        self.rest = ''
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def write(self, text):
+        """Write CSV lines, a line can span multiple calls"""
+        text = self.rest + text
+        cut = text.rfind('\n') + 1
+        self.rest = text[cut:]
+        columns = parse_csv_rows(text[:cut].split('\n'))
+        if len(columns[0]) == 0: return
+        self.write_columns(*columns)
+
+
+    def write_columns(self, pids, uids, times, lngs, lats, accs, markers, urls):
+        """Append rows given as columns, times are seconds since epoch"""
+        n = len(pids)
+        codes = intern_users(uids, self.user_dict)
+        blob, offsets = encode_strings(urls)
+        columns = {'pid': pids, 'user': codes, 'time': times, 'lng': lngs, 'lat': lats, \
+                   'acc': accs, 'marker': markers, 'url_offset': offsets[1:] + self.url_bytes}
+        for name, dtype in COLUMNS:
+            self.files[name].write(np.asarray(columns[name], dtype=dtype).tobytes())
+        self.files['url'].write(blob)
+        self.url_bytes += len(blob)
+        self.nrows += n
+
+
+    def close(self):
+        if self.files is None: return
+        if len(self.rest) > 0: self.write('\n')
+        users = sorted(self.user_dict.keys(), key=lambda x: self.user_dict[x])
+        blob, offsets = encode_strings(users)
+        self.files['users'].write(blob)
+        with open(os.path.join(self.path, 'users_offset.bin'), 'wb') as f:
+            f.write(offsets.astype('<i8').tobytes())
+        for fo in self.files.values(): fo.close()
+        self.files = None
+        header = {'format': FORMAT_NAME, 'version': FORMAT_VERSION, 'nrows': self.nrows, 'nusers': len(users), \
+                  'url_bytes': self.url_bytes, 'users_bytes': len(blob), 'columns': dict(COLUMNS)}
+        with open(os.path.join(self.path, 'header.json'), 'w') as f:
+            json.dump(header, f, indent=1)
+
+
+def load_csv(fname, header=True, chunk_size=1 << 22):
+    """Load a CSV file in the format of filtering_bigbox.filtering() into a PhotoTable in memory"""
+    user_dict = dict()  # User NSID --> code
+    chunks = []
+    urls = []
+    derived = True  # if all URLs can be derived from User NSIDs and photo IDs
+    with open(fname, 'r') as f:
+        if header: f.readline()
+        while True:
+            lines = f.readlines(chunk_size)
+            if len(lines) == 0: break
+            (pids, uids, times, lngs, lats, accs, markers, urls_) = parse_csv_rows(lines)
+            if derived and any(urls_[i] != flickr_url(uids[i], pids[i]) for i in range(len(pids))):
+                derived = False
+            if not derived:
+                if len(urls) == 0 and len(chunks) > 0:  # recover the URLs of previous chunks
+                    urls = FlickrUrlColumn(np.concatenate([c[0] for c in chunks]), \
+                                           np.concatenate([c[1] for c in chunks]), \
+                                           sorted(user_dict.keys(), key=lambda x: user_dict[x])).tolist()
+                urls.extend(urls_)
+            chunks.append((np.array(pids, dtype=np.int64), intern_users(uids, user_dict), times, \
+                           np.array(lngs, dtype=np.float64), np.array(lats, dtype=np.float64), \
+                           np.array(accs, dtype=np.int8), np.array(markers, dtype=np.int8)))
+
+    if len(chunks) == 0:
+        chunks.append(tuple(np.zeros(0, dtype=dt) for dt in [np.int64, np.int32, np.int64, np.float64, \
+                                                              np.float64, np.int8, np.int8]))
+    (pid, user, time, lng, lat, acc, marker) = [np.concatenate([c[j] for c in chunks]) for j in range(7)]
+    users = sorted(user_dict.keys(), key=lambda x: user_dict[x])
+    if derived:
+        url = FlickrUrlColumn(pid, user, users)
+    else:
+        blob, offsets = encode_strings(urls)
+        url = StringColumn(np.frombuffer(blob, dtype=np.uint8), offsets)
+    return PhotoTable(pid, user, users, time, lng, lat, acc, marker, url)
+
+
+def format_csv_rows(table, index):
+    """Lines of the rows at index (an integer array) of a photo table in the format of filtering_bigbox.filtering()"""
+    times = format_times(table.time[index]).tolist()
+    pids = table.pid[index].tolist()
+    codes = table.user[index].tolist()
+    lngs = table.lng[index].tolist()
+    lats = table.lat[index].tolist()
+    accs = table.acc[index].tolist()
+    markers = table.marker[index].tolist()
+    urls = table.url.take(index) if hasattr(table.url, 'take') else [table.url[i] for i in index.tolist()]
+    return [str(pids[i]) + ',' + table.users[codes[i]] + ',' + times[i] + '.0,' + \
+            str(lngs[i]) + ',' + str(lats[i]) + ',' + str(accs[i]) + ',' + \
+            urls[i] + ',' + str(markers[i]) + '\n' for i in range(len(pids))]
+
+
+def write_csv(fname, table, header=True):
+    """Write a photo table as a CSV file in the format of filtering_bigbox.filtering()"""
+    block = 100000
+    with open(fname, 'w') as f:
+        if header:
+            f.write('Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, URL, Marker(photo=0 video=1)\n')
+        for start in range(0, len(table), block):
+            end = min(start + block, len(table))
+            f.write(''.join(format_csv_rows(table, np.arange(start, end))))
+
+
+def csv_to_columnar(fin, path, header=True):
+    """Convert a CSV file in the format of filtering_bigbox.filtering() to a columnar photo table"""
+    with open(fin, 'r') as f, ColumnarWriter(path) as writer:
+        if header: f.readline()
+        while True:
+            lines = f.readlines(1 << 24)
+            if len(lines) == 0: break
+            writer.write(''.join(lines))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage:', sys.argv[0], 'CSV_FILE  COLUMNAR_DIR   (convert CSV to columnar)')
+        print('Usage:', sys.argv[0], 'COLUMNAR_DIR  CSV_FILE   (export columnar as CSV)')
+        sys.exit(0)
+
+    if is_columnar(sys.argv[1]):
+        load_columnar(sys.argv[1]).to_csv(sys.argv[2])
+    else:
+        csv_to_columnar(sys.argv[1], sys.argv[2])
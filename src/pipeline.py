@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import filtering_bigbox
+import generate_tables
+import traj_store
+import kml_export
+from poi_store import file_hash
+from traj_store import file_signature
+
+
+# Stage cache on disk: a directory per stage run, CACHE_DIR/<stage>/<key>/, holding the output files of the stage and
+#   meta.json    the key and what it was computed from (stage, code, parameters and inputs)
+# the key is the SHA-1 of the format version, the stage name, the source code of the stage (stage_code()), its
+# parameters and its inputs, i.e. the SHA-1 of the content of external input files and the keys of upstream stages,
+# a stage runs in a temporary directory which is renamed when it succeeds, i.e. a cached directory is always complete
+CACHE_VERSION = 2
+RUNNER = os.path.abspath(__file__)  # this module, not part of the code of stages
+SOURCE_DIR = os.path.dirname(RUNNER)  # project-local modules are in this directory (or next to the stage function)
+BIGBOX = [141.9, -39.3, 147.1, -35.8]  # the big bounding box of filtering_bigbox.py
+TIME_WINDOW = ['2000-01-01 00:00:00', '2015-03-05 23:59:59']
+BBOX = [144.597363, -38.072257, 145.360413, -37.591764]  # Melbourne, the default box of generate_tables.py
+BIGBOX_HEADER = 'Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, URL, Marker(photo=0 video=1)\n'
+
+# KML views of traj_visualise.main(), trajectory with the max value of a column, 'all': all trajectories
+VIEWS = {'most_photos': '#Photo', 'longest_time': 'Total_Time(min)', 'longest_distance': 'Travel_Distance(km)', \
+         'highest_speed': 'Average_Speed(km/h)', 'all': None}
+
+
+def code_names(code):
+    """Global names used by a code object and the functions (lambdas, comprehensions) inside it"""
+    names = set(code.co_names)
+    for x in code.co_consts:
+        if inspect.iscode(x): names |= code_names(x)
+    return names
+
+
+def stage_code(func, modules=()):
+    """SHA-1 of the source code a stage function depends on: {name: SHA-1} of func, of the functions, classes and
+       constants of its module it uses, and of the project-local modules (in SOURCE_DIR or next to func) they and
+       modules use, transitively, the runner (pipeline.py) itself is not part of it
+    """
+    fname = os.path.abspath(inspect.getfile(func))
+    dirs = [SOURCE_DIR, os.path.dirname(fname)]
+    prefix = os.path.splitext(os.path.basename(fname))[0] + '.'  # the same when run as __main__
+    code = dict()
+    todo = [func]
+    modules = list(modules)
+    while len(todo) > 0:
+        f = todo.pop()
+        if prefix + f.__qualname__ in code: continue
+        code[prefix + f.__qualname__] = hashlib.sha1(inspect.getsource(f).encode('utf-8')).hexdigest()
+        if not inspect.isfunction(f): continue
+        for name in sorted(code_names(f.__code__)):
+            x = f.__globals__.get(name)
+            if inspect.ismodule(x):
+                modules.append(x)
+            elif inspect.isfunction(x) or inspect.isclass(x):
+                if x.__module__ == func.__module__: todo.append(x)
+                else: modules.append(sys.modules.get(x.__module__))
+            elif isinstance(x, (str, int, float, list, tuple, dict)):
+                code[prefix + name] = hashlib.sha1(repr(x).encode('utf-8')).hexdigest()
+
+    done = set()
+    while len(modules) > 0:
+        module = modules.pop()
+        mfile = getattr(module, '__file__', None)
+        if mfile is None or os.path.abspath(mfile) == RUNNER or os.path.abspath(mfile) in done or \
+           os.path.dirname(os.path.abspath(mfile)) not in dirs:
+            continue
+        done.add(os.path.abspath(mfile))
+        code[os.path.basename(mfile)] = file_hash(mfile)
+        for x in vars(module).values():
+            if inspect.ismodule(x): modules.append(x)
+            elif inspect.isfunction(x) or inspect.isclass(x): modules.append(sys.modules.get(x.__module__))
+    return code
+
+
+class Stage:
+    """A stage of a pipeline, func(inputs, outputs, **params, **options) reads files inputs and writes files outputs,
+       inputs are external files or (stage, output) of upstream stages, outputs are file names,
+       params and the source code of func (stage_code(), plus modules it depends on but does not import) make the
+       key, options (e.g. #processes) do not
+    """
+    def __init__(self, name, func, inputs, outputs, params=None, options=None, modules=None):
+        assert(len(outputs) > 0)
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = dict() if params is None else params
+        self.options = dict() if options is None else options
+        self.modules = [] if modules is None else modules
+
+
+    def upstream(self):
+        return [x[0] for x in self.inputs if not isinstance(x, str)]
+
+
+def run_stage(func, inputs, outputs, params, options, path, meta):
+    """Run a stage in a temporary directory next to path and rename it to path if it succeeds, return the seconds"""
+    t0 = time.time()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpdir = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+        fouts = [os.path.join(tmpdir, x) for x in outputs]
+        func(inputs, fouts, **params, **options)
+        for fout in fouts:
+            assert(os.path.exists(fout)), 'stage did not write ' + fout
+        with open(os.path.join(tmpdir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+        try:
+            os.rename(tmpdir, path)
+        except OSError:  # done by another run meanwhile
+            if not os.path.exists(os.path.join(path, 'meta.json')): raise
+    finally:
+        if os.path.exists(tmpdir): shutil.rmtree(tmpdir)
+    return time.time() - t0
+
+
+class Pipeline:
+    """Stages (see Stage) with outputs cached in cache_dir by key, a stage runs only if its output for the key of
+       its code, parameters and inputs is not cached, independent stages run concurrently
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.stages = dict()  # name --> Stage, in the order added
+        self.hashes = dict()  # external file --> (signature, SHA-1)
+        self.fhashes = os.path.join(cache_dir, 'hashes.json')
+        if os.path.exists(self.fhashes):
+            with open(self.fhashes, 'r') as f:
+                self.hashes = json.load(f)
+
+
+    def add(self, stage):
+        assert(stage.name not in self.stages)
+        for name in stage.upstream():
+            assert(name in self.stages), 'upstream stage must be added first'
+        for x in stage.inputs:
+            if not isinstance(x, str):
+                assert(x[1] in self.stages[x[0]].outputs)
+        self.stages[stage.name] = stage
+        return stage
+
+
+    def content_hash(self, fname):
+        """SHA-1 of an external file, recomputed only if its size or modification time changed"""
+        fname = os.path.abspath(fname)
+        sig = file_signature(fname)
+        if fname not in self.hashes or self.hashes[fname][0] != sig:
+            self.hashes[fname] = [sig, file_hash(fname)]
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.fhashes + '.tmp', 'w') as f:
+                json.dump(self.hashes, f)
+            os.replace(self.fhashes + '.tmp', self.fhashes)
+        return self.hashes[fname][1]
+
+
+    def meta(self, name, keys):
+        stage = self.stages[name]
+        inputs = [self.content_hash(x) if isinstance(x, str) else [keys[x[0]], x[1]] for x in stage.inputs]
+        code = stage_code(stage.func, stage.modules)
+        meta = {'version': CACHE_VERSION, 'stage': name, 'code': code, 'params': stage.params, 'inputs': inputs}
+        meta['key'] = hashlib.sha1(json.dumps(meta, sort_keys=True).encode('utf-8')).hexdigest()
+        return meta
+
+
+    def keys(self, names):
+        """Keys of stages names and all their upstream stages"""
+        keys = dict()
+        for name in self.closure(names):
+            keys[name] = self.meta(name, keys)['key']
+        return keys
+
+
+    def closure(self, names):
+        """Stages names and all their upstream stages, in the order added"""
+        needed = set()
+        todo = list(names)
+        while len(todo) > 0:
+            name = todo.pop()
+            if name in needed: continue
+            needed.add(name)
+            todo.extend(self.stages[name].upstream())
+        return [name for name in self.stages if name in needed]
+
+
+    def path(self, name, key):
+        return os.path.join(self.cache_dir, name, key)
+
+
+    def artifact(self, name, output, keys=None):
+        """Path of an output of a stage"""
+        if keys is None: keys = self.keys([name])
+        return os.path.join(self.path(name, keys[name]), output)
+
+
+    def is_cached(self, name, key):
+        return os.path.exists(os.path.join(self.path(name, key), 'meta.json'))
+
+
+    def inputs(self, name, keys):
+        return [x if isinstance(x, str) else self.artifact(x[0], x[1], keys) for x in self.stages[name].inputs]
+
+
+    def run(self, targets=None, workers=1):
+        """Run stages targets (default: all) and their upstream stages which are not cached using (at most)
+           workers processes, return the keys and the status (True if cached, seconds) of each stage in the order added
+        """
+        assert(workers >= 1)
+        names = self.closure(list(self.stages.keys()) if targets is None else targets)
+        metas = dict()
+        keys = dict()
+        for name in names:
+            metas[name] = self.meta(name, keys)
+            keys[name] = metas[name]['key']
+        status = dict((name, (True, 0.0)) for name in names if self.is_cached(name, keys[name]))
+        pending = [name for name in names if name not in status]
+
+        def args(name):
+            stage = self.stages[name]
+            return (stage.func, self.inputs(name, keys), stage.outputs, stage.params, stage.options, \
+                    self.path(name, keys[name]), metas[name])
+
+        if workers == 1:
+            for name in pending:
+                status[name] = (False, run_stage(*args(name)))
+            return keys, dict((name, status[name]) for name in names)
+
+        running = dict()  # future --> stage
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                for name in [x for x in pending if all(y in status for y in self.stages[x].upstream())]:
+                    if len(running) >= workers: break
+                    running[executor.submit(run_stage, *args(name))] = name
+                    pending.remove(name)
+                (done, _) = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    status[running.pop(future)] = (False, future.result())
+        return keys, dict((name, status[name]) for name in names)
+
+
+def stage_filtering(inputs, outputs, bbox, time_window, workers=1):
+    """Photos in the bounding box and time window (filtering_bigbox.py) with the header of generate_tables.py"""
+    (time_min, time_max) = [datetime.strptime(x, '%Y-%m-%d %H:%M:%S') for x in time_window]
+    frows = outputs[0] + '.rows'
+    if workers > 1:
+        filtering_bigbox.filtering_parallel(*bbox, time_min, time_max, inputs[0], frows, workers)
+    else:
+        filtering_bigbox.filtering(*bbox, time_min, time_max, inputs[0], frows)
+    with open(outputs[0], 'w') as fo:
+        fo.write(BIGBOX_HEADER)
+        with open(frows, 'r') as fi:
+            shutil.copyfileobj(fi, fo)
+    os.unlink(frows)
+
+
+def stage_trajectories(inputs, outputs, bbox, min_photos_per_traj, time_gap):
+    """trajectory_photos.csv and trajectory_stats.csv (generate_tables.py) and their index (traj_store.py)"""
+    generate_tables.main(inputs[0], outputs[0], outputs[1], *bbox, min_photos_per_traj, time_gap)
+    traj_store.build_index(outputs[0], outputs[1], outputs[0] + '.idx')
+
+
+def view_traj_ids(traj_stats, view):
+    """Trajectories of a view in VIEWS selected the same as traj_visualise.main()"""
+    if VIEWS[view] is None:
+        return traj_stats[traj_stats['#Photo'] > 1]['Trajectory_ID'].tolist()
+    traj_stats = traj_stats[traj_stats['#Photo'] > 1]
+    traj_stats = traj_stats[traj_stats['Travel_Distance(km)'] > 1e-4]
+    if len(traj_stats) == 0: return []
+    return [traj_stats.loc[traj_stats[VIEWS[view]].idxmax(), 'Trajectory_ID']]
+
+
+def stage_kml(inputs, outputs, view):
+    """KML/KMZ file of a view in VIEWS (kml_export.py), a document without placemarks if no trajectory is selected"""
+    with traj_store.TrajectoryStore(inputs[0], inputs[1]) as store:
+        traj_id_list = view_traj_ids(store.stats_table(), view)
+        if len(traj_id_list) == 0:
+            with kml_export.open_kml(outputs[0]) as f:
+                f.write(kml_export.KML_HEAD + kml_export.KML_TAIL)
+        else:
+            names = None if VIEWS[view] is None else [view]
+            kml_export.export_kml(outputs[0], store, traj_id_list, names)
+
+
+def build_pipeline(fin, cache_dir, bigbox=BIGBOX, time_window=TIME_WINDOW, bbox=BBOX, min_photos_per_traj=1, \
+                   time_gap=8, views=['most_photos', 'longest_time', 'longest_distance', 'highest_speed'], \
+                   filter_workers=1, kml_ext='.kml'):
+    """The pipeline of filtering_bigbox.py, generate_tables.py and KML views of trajectories"""
+    pipeline = Pipeline(cache_dir)
+    pipeline.add(Stage('filtering', stage_filtering, [fin], ['bigbox.csv'], \
+                       {'bbox': list(bigbox), 'time_window': list(time_window)}, {'workers': filter_workers}))
+    pipeline.add(Stage('trajectories', stage_trajectories, [('filtering', 'bigbox.csv')], \
+                       ['trajectory_photos.csv', 'trajectory_stats.csv'], \
+                       {'bbox': list(bbox), 'min_photos_per_traj': min_photos_per_traj, 'time_gap': time_gap}))
+    for view in views:
+        assert(view in VIEWS)
+        pipeline.add(Stage('kml_' + view, stage_kml, \
+                           [('trajectories', 'trajectory_photos.csv'), ('trajectories', 'trajectory_stats.csv')], \
+                           [view + kml_ext], {'view': view}))
+    return pipeline
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='run the stages filtering (filtering_bigbox.py), ' + \
+                                     'trajectories (generate_tables.py) and KML views, ' + \
+                                     'stages with cached outputs for the same code, parameters and inputs are skipped')
+    parser.add_argument('fin', metavar='YFCC100M_DATA_FILE')
+    parser.add_argument('--cache-dir', default='./pipeline_cache', help='default: ./pipeline_cache')
+    parser.add_argument('--output-dir', help='link the outputs of all stages into this directory')
+    parser.add_argument('--workers', type=int, default=1, help='number of stages run concurrently (default: 1)')
+    parser.add_argument('--filter-workers', type=int, default=1, help='number of processes of filtering (default: 1)')
+    parser.add_argument('--bigbox', type=float, nargs=4, default=BIGBOX, \
+                        metavar=('MIN_LONGITUDE', 'MIN_LATITUDE', 'MAX_LONGITUDE', 'MAX_LATITUDE'))
+    parser.add_argument('--time-window', nargs=2, default=TIME_WINDOW, metavar=('TIME_MIN', 'TIME_MAX'), \
+                        help='in format "%%Y-%%m-%%d %%H:%%M:%%S"')
+    parser.add_argument('--bbox', type=float, nargs=4, default=BBOX, \
+                        metavar=('MIN_LONGITUDE', 'MIN_LATITUDE', 'MAX_LONGITUDE', 'MAX_LATITUDE'))
+    parser.add_argument('--min-photos', type=int, default=1, help='min #photos per trajectory (default: 1)')
+    parser.add_argument('--time-gap', type=float, default=8, help='hours (default: 8)')
+    parser.add_argument('--views', default='most_photos,longest_time,longest_distance,highest_speed', \
+                        help='comma separated KML views in ' + ', '.join(VIEWS.keys()))
+    parser.add_argument('--kmz', action='store_true', help='write KMZ instead of KML files')
+    args = parser.parse_args()
+    views = [x for x in args.views.split(',') if len(x) > 0]
+    if any(x not in VIEWS for x in views):
+        parser.error('unknown view in ' + args.views)
+
+    pipeline = build_pipeline(args.fin, args.cache_dir, args.bigbox, args.time_window, args.bbox, args.min_photos, \
+                              args.time_gap, views, args.filter_workers, '.kmz' if args.kmz else '.kml')
+    (keys, status) = pipeline.run(workers=args.workers)
+    for name in pipeline.stages:
+        (cached, seconds) = status[name]
+        print('%-24s %-8s %8.1fs  %s' % (name, 'cached' if cached else 'ran', seconds, pipeline.path(name, keys[name])))
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            for output in pipeline.stages[name].outputs:
+                link = os.path.join(args.output_dir, output)
+                if os.path.lexists(link): os.unlink(link)
+                os.symlink(os.path.abspath(pipeline.artifact(name, output, keys)), link)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import sys
+import numpy as np
+import pandas as pd
+
+
+def load_traj_all(fname):
+    """Load the trajectory table (traj-noloop-all-Melb.csv), one row per (trajectory, POI) visit:
+       userID, trajID, poiID, startTime, endTime, #photo, trajLen, poiDuration
+    """
+    return pd.read_csv(fname)
+
+
+def traj_csr(traj_all):
+    """Trajectories of the trajectory table in compressed form (traj_ids, offsets, rows),
+       the rows (positions in traj_all) of trajectory traj_ids[i] are rows[offsets[i]:offsets[i+1]] sorted by startTime
+    """
+    tids = traj_all['trajID'].values
+    rows = np.lexsort((traj_all['startTime'].values, tids))  # stable
+    (traj_ids, counts) = np.unique(tids, return_counts=True)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    return traj_ids, offsets, rows
+
+
+def extract_trajs(traj_all):
+    """Dictionary maps every trajectory ID to the list of its POIs, the same as extract_traj() in dataset_Melb.ipynb"""
+    (traj_ids, offsets, rows) = traj_csr(traj_all)
+    pois = traj_all['poiID'].values[rows].tolist()
+    return {tid: pois[offsets[i]:offsets[i+1]] for (i, tid) in enumerate(traj_ids.tolist())}
+
+
+def calc_poi_info(trajid_list, traj_all, poi_all):
+    """POI statistics of trajectories (duplicated IDs are counted repeatedly), indexed by poiID:
+       avgDuration, nVisit, poiCat, poiLon, poiLat and popularity (the number of distinct users),
+       the same as calc_poi_info() in dataset_Melb.ipynb
+    """
+    assert(len(trajid_list) > 0)
+    (traj_ids, offsets, rows) = traj_csr(traj_all)
+    ix = np.searchsorted(traj_ids, trajid_list)
+    assert(np.all(traj_ids[np.minimum(ix, len(traj_ids) - 1)] == trajid_list))
+
+    # rows of trajectories in the order of trajid_list, and in the order of traj_all in each trajectory
+    order = np.argsort(traj_all['trajID'].values, kind='stable')
+    counts = offsets[ix + 1] - offsets[ix]
+    sel = order[np.repeat(offsets[ix] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+    visits = traj_all.iloc[sel]
+
+    poi_info = visits.groupby('poiID')['poiDuration'].agg(['mean', 'size'])
+    poi_info.rename(columns={'mean':'avgDuration', 'size':'nVisit'}, inplace=True)
+    poi_info['poiCat'] = poi_all.loc[poi_info.index, 'poiTheme']
+    poi_info['poiLon'] = poi_all.loc[poi_info.index, 'poiLon']
+    poi_info['poiLat'] = poi_all.loc[poi_info.index, 'poiLat']
+
+    # POI popularity: the number of distinct users that visited the POI
+    pop = visits.drop_duplicates(['poiID', 'userID']).groupby('poiID').size()
+    poi_info['popularity'] = pop.loc[poi_info.index]
+    return poi_info
+
+
+class PoiStats:
+    """Totals of POI statistics of all trajectories in the trajectory table (#visits, sum of visit durations and
+       #visits of each (POI, user) pair), calc_poi_info() of a fold which leaves out a few trajectories
+       (e.g. leave-one-out) is computed by subtracting the visits of the held-out trajectories from the totals
+    """
+    def __init__(self, traj_all, poi_all):
+        self.poi_all = poi_all
+        (self.traj_ids, self.offsets, rows) = traj_csr(traj_all)
+        (self.poi_ids, pois) = np.unique(traj_all['poiID'].values[rows], return_inverse=True)
+        users = np.unique(traj_all['userID'].values[rows], return_inverse=True)[1]
+        self.pois = pois.ravel()
+        self.durations = traj_all['poiDuration'].values[rows]
+        (pairs, self.pairs) = np.unique(self.pois * (users.max() + 1) + users.ravel(), return_inverse=True)
+        self.pairs = self.pairs.ravel()
+        self.pair_pois = self.pois[np.unique(self.pairs, return_index=True)[1]]
+        npois = len(self.poi_ids)
+        self.nvisit = np.bincount(self.pois, minlength=npois)
+        self.total_duration = np.bincount(self.pois, weights=self.durations, minlength=npois)
+        self.pair_counts = np.bincount(self.pairs)
+        self.popularity = np.bincount(self.pair_pois, minlength=npois)
+
+
+    def leave_out(self, trajid_list):
+        """The same DataFrame as calc_poi_info() of all trajectories except trajid_list"""
+        ix = np.searchsorted(self.traj_ids, trajid_list)
+        assert(np.all(self.traj_ids[np.minimum(ix, len(self.traj_ids) - 1)] == np.asarray(trajid_list)))
+        ix = np.unique(ix)
+        counts = self.offsets[ix + 1] - self.offsets[ix]
+        sel = np.repeat(self.offsets[ix] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        (pois, npois) = (self.pois[sel], len(self.poi_ids))
+        nvisit = self.nvisit - np.bincount(pois, minlength=npois)
+        total_duration = self.total_duration - np.bincount(pois, weights=self.durations[sel], minlength=npois)
+        gone = np.flatnonzero(self.pair_counts - np.bincount(self.pairs[sel], minlength=len(self.pair_counts)) == 0)
+        popularity = self.popularity - np.bincount(self.pair_pois[gone], minlength=npois)
+        keep = nvisit > 0
+        assert(np.any(keep))
+
+        poi_info = pd.DataFrame({'avgDuration': total_duration[keep] / nvisit[keep], 'nVisit': nvisit[keep]}, \
+                                index=pd.Index(self.poi_ids[keep], name='poiID'))
+        poi_info['poiCat'] = self.poi_all.loc[poi_info.index, 'poiTheme']
+        poi_info['poiLon'] = self.poi_all.loc[poi_info.index, 'poiLon']
+        poi_info['poiLat'] = self.poi_all.loc[poi_info.index, 'poiLat']
+        poi_info['popularity'] = popularity[keep]
+        return poi_info
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage:', sys.argv[0], 'TRAJ_FILE(CSV)  POI_FILE(CSV)')
+        print('e.g. :', sys.argv[0], 'traj-noloop-all-Melb.csv  poi-Melb-all.csv')
+        sys.exit(0)
+
+    traj_all = load_traj_all(sys.argv[1])
+    poi_all = pd.read_csv(sys.argv[2], index_col='poiID')
+    print(calc_poi_info(sorted(traj_all['trajID'].unique().tolist()), traj_all, poi_all).to_csv())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+import sys
+import numpy as np
+import pandas as pd
+
+
+RADIUS = 6371.0088  # mean earth radius (km), the same as calc_dist_vec() in the notebooks
+
+
+def calc_dist_vec(longitudes1, latitudes1, longitudes2, latitudes2):
+    """Calculate the distance (unit: km) between two places on earth, vectorised"""
+    # convert degrees to radians
+    lng1 = np.radians(longitudes1)
+    lat1 = np.radians(latitudes1)
+    lng2 = np.radians(longitudes2)
+    lat2 = np.radians(latitudes2)
+
+    # The haversine formula, en.wikipedia.org/wiki/Great-circle_distance
+    dlng = np.fabs(lng1 - lng2)
+    dlat = np.fabs(lat1 - lat2)
+    dist =  2 * RADIUS * np.arcsin( np.sqrt(
+                (np.sin(0.5*dlat))**2 + np.cos(lat1) * np.cos(lat2) * (np.sin(0.5*dlng))**2 ))
+    return dist
+
+
+def unit_vectors(lngs, lats):
+    """Points on earth as 3D unit vectors, the chord length between two vectors increases with the distance"""
+    lng = np.radians(np.asarray(lngs, dtype=np.float64))
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=1)
+
+
+def chord(dist):
+    """Chord length (on the unit sphere) of a distance (km), slightly enlarged to be safe for pruning"""
+    return 2 * np.sin(np.minimum(np.asarray(dist, dtype=np.float64) / (2 * RADIUS), np.pi / 2)) * (1 + 1e-9) + 1e-12
+
+
+class PoiIndex:
+    """Spatial index of POIs on 3D unit vectors for vectorised batch queries,
+       uniform grids (like the levels of an octree) with cell sizes h0, 2*h0, 4*h0, ... up to the whole sphere
+       (and chord(dist_max) for within()), all POIs within chord distance h of a point are in the 27 grid cells
+       around it in the grid of cell size h.
+       POIs are referred to by their positions (0, 1, ...) in poi_lngs/poi_lats.
+    """
+    def __init__(self, poi_lngs, poi_lats, cell_pois=1):
+        assert(len(poi_lngs) == len(poi_lats))
+        assert(len(poi_lngs) > 0)
+        assert(cell_pois > 0)
+        self.lngs = np.asarray(poi_lngs, dtype=np.float64)
+        self.lats = np.asarray(poi_lats, dtype=np.float64)
+        self.xyz = unit_vectors(self.lngs, self.lats)
+
+        # the finest cells hold about cell_pois POIs if POIs are spread evenly in their bounding box
+        extents = np.sort(self.xyz.max(axis=0) - self.xyz.min(axis=0))
+        h = min(max(np.sqrt(extents[1] * extents[2] * cell_pois / len(self.xyz)), 1e-6), 2.0)
+        self.levels = [h]  # cell sizes
+        while h < 2:
+            h *= 2
+            self.levels.append(h)
+        self.grids = dict()
+
+
+    def grid(self, h):
+        """(sorted cell keys, POIs in the order of keys) of the grid of cell size h"""
+        if h not in self.grids:
+            keys = self.cell_keys(np.floor(self.xyz / h).astype(np.int64), h)
+            order = np.argsort(keys, kind='stable')
+            self.grids[h] = (keys[order], order)
+        return self.grids[h]
+
+
+    def __len__(self):
+        return len(self.lngs)
+
+
+    def cell_keys(self, cells, h):
+        off = int(1 / h) + 2
+        m = 2 * off + 1
+        return ((cells[:, 0] + off) * m + (cells[:, 1] + off)) * m + (cells[:, 2] + off)
+
+
+    def candidates(self, q, h):
+        """(query, POI, squared chord length) pairs of POIs in the 27 cells around each query point (unit vectors q)
+           in the grid of cell size h
+        """
+        (keys, order) = self.grid(h)
+        cells = np.floor(q / h).astype(np.int64)
+        qixs = []
+        pois = []
+        for dx in [-1, 0, 1]:
+            for dy in [-1, 0, 1]:
+                for dz in [-1, 0, 1]:
+                    k = self.cell_keys(cells + np.array([dx, dy, dz]), h)
+                    starts = np.searchsorted(keys, k, side='left')
+                    counts = np.searchsorted(keys, k, side='right') - starts
+                    firsts = np.cumsum(counts) - counts
+                    pos = np.repeat(starts - firsts, counts) + np.arange(counts.sum())
+                    qixs.append(np.repeat(np.arange(len(q)), counts))
+                    pois.append(order[pos])
+        qix = np.concatenate(qixs)
+        poi = np.concatenate(pois)
+        return qix, poi, np.square(q[qix] - self.xyz[poi]).sum(axis=1)
+
+
+    def nearest(self, lngs, lats, batch_size=1 << 16, brute_max=256):
+        """The nearest POI of each point and its distance (km), ties are broken by the smaller POI position,
+           POIs are compared by chord length (which increases with the distance) and all POIs are scanned
+           if there are at most brute_max of them
+        """
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        nearest = np.full(len(lngs), -1, dtype=np.int64)
+        for start in range(0, len(lngs), batch_size):
+            q = unit_vectors(lngs[start:start+batch_size], lats[start:start+batch_size])
+            if len(self) <= brute_max:
+                sqdist = np.zeros((len(q), len(self)))
+                for k in range(3):
+                    sqdist += np.square(q[:, k:k+1] - self.xyz[:, k])
+                nearest[start:start+len(q)] = np.argmin(sqdist, axis=1)  # the first one of ties
+                continue
+            todo = np.arange(len(q))
+            for h in self.levels:
+                if len(todo) == 0: break
+                qix, poi, sqdist = self.candidates(q[todo], h)
+                best = np.full(len(todo), np.inf)
+                np.minimum.at(best, qix, sqdist)
+                tie = sqdist == best[qix]
+                bestpoi = np.full(len(todo), len(self), dtype=np.int64)
+                np.minimum.at(bestpoi, qix[tie], poi[tie])
+                # exact if the nearest candidate is within the cell size, i.e. all closer POIs are candidates,
+                # cells of the last level cover the whole sphere
+                done = (best < (h * (1 - 1e-9))**2) | ((h == self.levels[-1]) & (bestpoi < len(self)))
+                nearest[start + todo[done]] = bestpoi[done]
+                todo = todo[~done]
+        assert(np.all(nearest >= 0))
+        return nearest, calc_dist_vec(lngs, lats, self.lngs[nearest], self.lats[nearest])
+
+
+    def within(self, lngs, lats, dist_max, batch_size=1 << 16):
+        """All POIs within dist_max (km) of each point in compressed form (offsets, pois, dists),
+           the POIs of point i are pois[offsets[i]:offsets[i+1]] sorted by position
+        """
+        assert(dist_max > 0)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        h = min(float(chord(dist_max)), self.levels[-1])
+        counts = np.zeros(len(lngs), dtype=np.int64)
+        pois_list = [np.zeros(0, dtype=np.int64)]
+        dists_list = [np.zeros(0, dtype=np.float64)]
+        for start in range(0, len(lngs), batch_size):
+            blng = lngs[start:start+batch_size]
+            blat = lats[start:start+batch_size]
+            qix, poi, sqdist = self.candidates(unit_vectors(blng, blat), h)
+            keep = sqdist <= h * h
+            qix, poi = qix[keep], poi[keep]
+            dists = calc_dist_vec(blng[qix], blat[qix], self.lngs[poi], self.lats[poi])
+            keep = dists <= dist_max
+            qix, poi, dists = qix[keep], poi[keep], dists[keep]
+            order = np.lexsort((poi, qix))
+            counts[start:start+batch_size] = np.bincount(qix, minlength=len(blng))
+            pois_list.append(poi[order])
+            dists_list.append(dists[order])
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return offsets, np.concatenate(pois_list), np.concatenate(dists_list)
+
+
+def map_photos(photo_lngs, photo_lats, poi_lngs, poi_lats, dist_max):
+    """Map photos to their nearest POI (position, -1 if farther than dist_max km),
+       the same as photo_poi_distmat.loc[ix].idxmin() and the DIST_MAX check in traj_Melb.ipynb
+    """
+    nearest, dists = PoiIndex(poi_lngs, poi_lats).nearest(photo_lngs, photo_lats)
+    nearest[dists > dist_max] = -1
+    return nearest
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print('Usage:', sys.argv[0], 'PHOTO_FILE(CSV)  POI_FILE(CSV)  DIST_MAX(km)')
+        print('e.g. :', sys.argv[0], 'trajectory_photos.csv  poi-Melb-all.csv  0.2')
+        print('print Photo_ID and the nearest poiID within DIST_MAX (-1 if none) of each photo')
+        sys.exit(0)
+
+    photos = pd.read_csv(sys.argv[1], skipinitialspace=True)
+    pois = pd.read_csv(sys.argv[2])
+    nearest = map_photos(photos['Longitude'].values, photos['Latitude'].values, \
+                         pois['poiLon'].values, pois['poiLat'].values, float(sys.argv[3]))
+    poi_ids = np.where(nearest >= 0, pois['poiID'].values[nearest], -1)
+    print('Photo_ID,poiID')
+    for (pid, poi) in zip(photos['Photo_ID'].tolist(), poi_ids.tolist()):
+        print('%d,%d' % (pid, poi))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from poi_mapping import calc_dist_vec
+
+
+# POI store on disk: a directory (named by the format version and the SHA-1 of the POI file) with
+#   meta.json     format version, SHA-1 of the POI file, the columns of the POI file (name, dtype) and
+#                 the values of string columns
+#   poiID.npy     POI IDs, sorted
+#   <column>.npy  values of numeric columns of the POI file, in the order of poiID.npy
+#   distmat.npy   distances (km) between POIs, in the order of poiID.npy
+# arrays are memory-mapped read-only, i.e. processes using the same store share one copy (the page cache)
+STORE_VERSION = 1
+
+
+def file_hash(fname, chunk_size=1 << 20):
+    """SHA-1 of the content of a file"""
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def calc_distmat(lngs, lats):
+    """Distances (km) between all pairs of places, the same as calc_dist_vec() of each pair, vectorised"""
+    lngs = np.asarray(lngs, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    assert(lngs.shape == lats.shape)
+    return calc_dist_vec(lngs[:, None], lats[:, None], lngs[None, :], lats[None, :])
+
+
+def store_dir(fpoi, cache_dir=None):
+    """Directory of the store of POI file fpoi in cache_dir (default: .poi_store next to the POI file)"""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(fpoi)), '.poi_store')
+    return os.path.join(cache_dir, 'v%d-%s' % (STORE_VERSION, file_hash(fpoi)))
+
+
+def build_store(fpoi, path):
+    """Build the store of POI file fpoi (e.g. poi-Melb-all.csv) in directory path,
+       files are written to a temporary directory first which is then renamed, i.e. concurrent builders are safe
+    """
+    poi_all = pd.read_csv(fpoi, index_col='poiID').sort_index()
+    assert(poi_all.index.is_unique)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpdir = tempfile.mkdtemp(dir=os.path.dirname(path))
+    try:
+        meta = {'version': STORE_VERSION, 'sha1': file_hash(fpoi), 'columns': [], 'strings': dict()}
+        np.save(os.path.join(tmpdir, 'poiID.npy'), poi_all.index.values.astype(np.int64))
+        for col in poi_all.columns:
+            values = poi_all[col]
+            if pd.api.types.is_numeric_dtype(values):
+                np.save(os.path.join(tmpdir, col + '.npy'), values.values)
+            else:
+                meta['strings'][col] = [None if pd.isnull(x) else str(x) for x in values]
+            meta['columns'].append([col, str(values.dtype)])
+        np.save(os.path.join(tmpdir, 'distmat.npy'), calc_distmat(poi_all['poiLon'].values, poi_all['poiLat'].values))
+        with open(os.path.join(tmpdir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmpdir, path)
+        except OSError:  # built by another process meanwhile
+            if not os.path.exists(os.path.join(path, 'meta.json')): raise
+    finally:
+        if os.path.exists(tmpdir): shutil.rmtree(tmpdir)
+
+
+def is_valid_store(path):
+    fmeta = os.path.join(path, 'meta.json')
+    if not os.path.exists(fmeta): return False
+    with open(fmeta, 'r') as f:
+        return json.load(f).get('version') == STORE_VERSION
+
+
+class PoiStore:
+    """POI attributes of a POI file (e.g. poi-Melb-all.csv) and distances between POIs,
+       the store (see store_dir()) is built on first use, a changed POI file gets a new store,
+       poi_all is the same as pd.read_csv(fpoi, index_col='poiID') sorted by poiID,
+       poi_distmat is a read-only DataFrame of distances between POIs (POI_DISTMAT in dataset_Melb.ipynb)
+       backed by the memory-mapped matrix
+    """
+    def __init__(self, fpoi, cache_dir=None):
+        self.path = store_dir(fpoi, cache_dir)
+        if not is_valid_store(self.path):
+            build_store(fpoi, self.path)
+        with open(os.path.join(self.path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.poi_ids = np.load(os.path.join(self.path, 'poiID.npy'), mmap_mode='r')
+        self.distmat = np.load(os.path.join(self.path, 'distmat.npy'), mmap_mode='r')
+        assert(self.distmat.shape == (len(self.poi_ids), len(self.poi_ids)))
+
+        index = pd.Index(np.asarray(self.poi_ids), name='poiID')
+        cols = dict()
+        for (col, dtype) in meta['columns']:
+            if col in meta['strings']:
+                cols[col] = pd.Series(meta['strings'][col], index=index, dtype=dtype)
+            else:
+                cols[col] = pd.Series(np.load(os.path.join(self.path, col + '.npy'), mmap_mode='r'), index=index)
+        self.poi_all = pd.DataFrame(cols, index=index, columns=[col for (col, _) in meta['columns']])
+        self.poi_distmat = pd.DataFrame(self.distmat, index=pd.Index(index.values), columns=pd.Index(index.values), \
+                                        copy=False)
+
+
+    def __len__(self):
+        return len(self.poi_ids)
+
+
+    def positions(self, poi_ids):
+        """Positions of POIs in poi_ids, i.e. rows/columns of distmat"""
+        poi_ids = np.asarray(poi_ids)
+        ix = np.minimum(np.searchsorted(self.poi_ids, poi_ids), len(self.poi_ids) - 1)
+        assert(np.all(self.poi_ids[ix] == poi_ids)), 'POI not in store'
+        return ix
+
+
+    def dist(self, poi_ids1, poi_ids2):
+        """Distances between POIs poi_ids1[i] and poi_ids2[j] as a len(poi_ids1) x len(poi_ids2) array"""
+        return self.distmat[np.ix_(self.positions(poi_ids1), self.positions(poi_ids2))]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [2, 3]:
+        print('Usage:', sys.argv[0], 'POI_FILE(CSV)  [CACHE_DIR]')
+        print('e.g. :', sys.argv[0], 'poi-Melb-all.csv  .poi_store')
+        print('build (if needed) the store of POI attributes and distances between POIs')
+        sys.exit(0)
+
+    store = PoiStore(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print('%d POIs, store: %s' % (len(store), store.path))
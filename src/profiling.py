@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import inspect
+import resource
+import functools
+
+
+# Opt-in instrumentation of pipeline stages: functions decorated by profiled() record each call, i.e. the stage name,
+# seconds, #rows processed, rows/sec and peak RSS (MB) of the process while the stage runs (and of reaped child
+# processes), records are kept in RECORDS and written as JSON lines to the profile file if given,
+# enabled by enable() or by the environment variable FLICKR_PROFILE=PROFILE_FILE ('-' for stderr),
+# disabled it costs one check per call
+ENV_VAR = 'FLICKR_PROFILE'
+RECORDS = []
+_STATE = {'enabled': False, 'fname': None, 'stack': []}
+
+
+def enable(fname=None):
+    """Start recording stages, also append them to fname ('-' for stderr) if given"""
+    _STATE['enabled'] = True
+    _STATE['fname'] = fname
+
+
+def disable():
+    _STATE['enabled'] = False
+    _STATE['fname'] = None
+
+
+def is_enabled():
+    return _STATE['enabled']
+
+
+def read_status(field):
+    """A field (kB) of /proc/self/status in MB, None if not available"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of the process to the current RSS (Linux), return False if not supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak RSS (MB) since the last reset_peak_rss(), or of the lifetime of the process"""
+    hwm = read_status('VmHWM')
+    if hwm is not None: return hwm
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def children_peak_rss():
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2**20
+
+
+def emit(record):
+    RECORDS.append(record)
+    fname = _STATE['fname']
+    if fname is None: return
+    line = json.dumps(record) + '\n'
+    if fname == '-':
+        sys.stderr.write(line)
+    else:
+        with open(fname, 'a') as f:
+            f.write(line)
+
+
+class stage:
+    """Context manager recording a stage if profiling is enabled, set .rows to the number of rows processed,
+       stages may nest, the peak RSS of a stage includes the stages inside it
+    """
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+
+    def __enter__(self):
+        if not _STATE['enabled']: return self
+        stack = _STATE['stack']
+        if len(stack) > 0:  # the peak so far of the outer stage, the reset below loses it
+            stack[-1].peak = max(stack[-1].peak, peak_rss())
+        self.peak = 0.0
+        self.resettable = reset_peak_rss()
+        self.rss0 = read_status('VmRSS')
+        stack.append(self)
+        self.t0 = time.time()
+        return self
+
+
+    def __exit__(self, *args):
+        if not _STATE['enabled'] or self not in _STATE['stack']: return False
+        seconds = time.time() - self.t0
+        _STATE['stack'].remove(self)
+        self.peak = max(self.peak, peak_rss())
+        if len(_STATE['stack']) > 0:
+            outer = _STATE['stack'][-1]
+            outer.peak = max(outer.peak, self.peak)
+        record = {'stage': self.name, 'seconds': seconds, 'rows': self.rows, \
+                  'rows_per_sec': self.rows / seconds if self.rows is not None and seconds > 0 else None, \
+                  'peak_rss_mb': self.peak, 'peak_rss_exact': self.resettable, \
+                  'start_rss_mb': self.rss0, 'children_peak_rss_mb': children_peak_rss(), 'pid': os.getpid()}
+        if args[0] is not None:
+            record['error'] = args[0].__name__
+        emit(record)
+        return False
+
+
+def profiled(name, rows=None):
+    """Decorator recording each call of a function as a stage if profiling is enabled, the number of rows processed
+       is len() of the argument named rows, or rows(result, arguments) if rows is callable, where arguments are the
+       arguments of the call bound to the parameters of the function (defaults included), i.e. keyword or positional
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _STATE['enabled']:
+                return func(*args, **kwargs)
+            with stage(name) as s:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    bound = signature.bind(*args, **kwargs)
+                    bound.apply_defaults()
+                    s.rows = rows(result, bound.arguments) if callable(rows) else len(bound.arguments[rows])
+            return result
+        return wrapper
+    return decorator
+
+
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR])
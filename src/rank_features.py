@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import sys
+import numpy as np
+import pandas as pd
+from poi_store import calc_distmat
+
+
+DF_COLUMNS = ['poiID', 'label', 'queryID', 'popularity', 'nVisit', 'avgDuration', \
+              'sameCatStart', 'sameCatEnd', 'distStart', 'distEnd', 'trajLen', 'diffPopStart', \
+              'diffPopEnd', 'diffNVisitStart', 'diffNVisitEnd', 'diffDurationStart', 'diffDurationEnd']
+FEATURES = DF_COLUMNS[3:]  # columns 1, 2, ... in libsvm format
+
+
+def gen_query_id_dict(traj_dict):
+    """(start POI, end POI, #POI) --> query ID of trajectories with more than 2 POIs, the same as dataset_Melb.ipynb"""
+    query_id_dict = dict()
+    for tid in sorted(traj_dict.keys()):
+        t = traj_dict[tid]
+        if len(t) > 2:
+            key = (t[0], t[-1], len(t))
+            if key not in query_id_dict:
+                query_id_dict[key] = len(query_id_dict)
+    return query_id_dict
+
+
+class FeatureEngine:
+    """POI attributes of poi_info (see poi_info.calc_poi_info()) and distances between its POIs as arrays,
+       features of (POI, query) pairs are computed by broadcasting over them,
+       poi_distmat (optional) is a DataFrame of distances between POIs (POI_DISTMAT in dataset_Melb.ipynb,
+       e.g. poi_store.PoiStore.poi_distmat),
+       otherwise distances are computed from POI coordinates the same way
+    """
+    def __init__(self, poi_info, poi_distmat=None):
+        self.poi_ids = poi_info.index.values
+        self.index = pd.Index(self.poi_ids)
+        self.pop = poi_info['popularity'].values
+        self.nvisit = poi_info['nVisit'].values
+        self.duration = poi_info['avgDuration'].values
+        self.cat = pd.factorize(poi_info['poiCat'])[0]
+        if poi_distmat is None:
+            self.distmat = calc_distmat(poi_info['poiLon'].values, poi_info['poiLat'].values)
+        else:
+            self.distmat = poi_distmat.loc[self.poi_ids, self.poi_ids].values
+
+
+    def positions(self, poi_ids):
+        ix = self.index.get_indexer(np.asarray(poi_ids))
+        assert(np.all(ix >= 0)), 'POI not in poi_info'
+        return ix
+
+
+    def features(self, pois, starts, ends, traj_lens):
+        """Feature matrix (columns FEATURES) of (POI, query) pairs, i.e. rows (pois[i], (starts[i], ends[i], traj_lens[i])),
+           arguments are arrays of POI IDs and lengths, or scalars
+        """
+        (pois, starts, ends, traj_lens) = np.broadcast_arrays(pois, starts, ends, traj_lens)
+        (p, p0, pN) = (self.positions(pois.ravel()), self.positions(starts.ravel()), self.positions(ends.ravel()))
+        X = np.empty((len(p), len(FEATURES)), dtype=np.float64)
+        X[:, 0] = self.pop[p]
+        X[:, 1] = self.nvisit[p]
+        X[:, 2] = self.duration[p]
+        X[:, 3] = np.where(self.cat[p] == self.cat[p0], 1, -1)
+        X[:, 4] = np.where(self.cat[p] == self.cat[pN], 1, -1)
+        X[:, 5] = self.distmat[p, p0]
+        X[:, 6] = self.distmat[p, pN]
+        X[:, 7] = traj_lens.ravel()
+        X[:, 8] = self.pop[p] - self.pop[p0]
+        X[:, 9] = self.pop[p] - self.pop[pN]
+        X[:, 10] = self.nvisit[p] - self.nvisit[p0]
+        X[:, 11] = self.nvisit[p] - self.nvisit[pN]
+        X[:, 12] = self.duration[p] - self.duration[p0]
+        X[:, 13] = self.duration[p] - self.duration[pN]
+        return X
+
+
+    def train_data(self, trajid_list, traj_dict, query_id_dict):
+        """Training data of trajectories with more than 2 POIs as arrays (poi_ids, labels, qids, X),
+           rows are (POI, query) pairs of all POIs and queries of these trajectories in the order of gen_train_df()
+           in dataset_Melb.ipynb, the label is the number of times the POI is visited in the middle of trajectories
+           of the query
+        """
+        train_trajs = [traj_dict[x] for x in trajid_list if len(traj_dict[x]) > 2]
+        qid_set = sorted(set([query_id_dict[(t[0], t[-1], len(t))] for t in train_trajs]))
+        poi_set = set()
+        for tr in train_trajs:
+            poi_set = poi_set | set(tr)
+        poi_list = list(poi_set)  # the same order as the notebook
+
+        query_id_rdict = dict((v, k) for (k, v) in query_id_dict.items())  # qid --> (start, end, length)
+        (starts, ends, lens) = [np.array([query_id_rdict[q][j] for q in qid_set], dtype=np.int64) for j in range(3)]
+        (nq, npoi) = (len(qid_set), len(poi_list))
+        pois = np.repeat(np.array(poi_list, dtype=np.int64), nq)
+        qids = np.tile(np.array(qid_set, dtype=np.int64), npoi)
+        X = self.features(pois, np.tile(starts, npoi), np.tile(ends, npoi), np.tile(lens, npoi))
+
+        # labels: POIs in the middle of trajectories (NOT startPOI/endPOI)
+        poi_rank = dict((poi, i) for (i, poi) in enumerate(poi_list))
+        qid_rank = dict((q, i) for (i, q) in enumerate(qid_set))
+        rows = [poi_rank[poi] * nq + qid_rank[query_id_dict[(t[0], t[-1], len(t))]] for t in train_trajs for poi in t[1:-1]]
+        labels = np.bincount(np.array(rows, dtype=np.int64), minlength=nq * npoi).astype(np.float64)
+        return pois, labels, qids, X
+
+
+    def test_data(self, startPOI, endPOI, nPOI, query_id_dict):
+        """Test data of query (startPOI, endPOI, nPOI) as arrays (poi_ids, qids, X), one row per POI (sorted by ID)"""
+        key = (startPOI, endPOI, nPOI)
+        assert(key in query_id_dict)
+        pois = np.sort(self.poi_ids)
+        qids = np.full(len(pois), query_id_dict[key], dtype=np.int64)
+        return pois, qids, self.features(pois, startPOI, endPOI, nPOI)
+
+
+def gen_train_df(trajid_list, traj_dict, poi_info, query_id_dict, poi_distmat=None, engine=None):
+    """The same DataFrame as gen_train_df() in dataset_Melb.ipynb (columns queryID, poiID, label, features...)"""
+    if engine is None: engine = FeatureEngine(poi_info, poi_distmat)
+    (pois, labels, qids, X) = engine.train_data(trajid_list, traj_dict, query_id_dict)
+    df_ = pd.DataFrame(data=X, columns=FEATURES)
+    df_.insert(0, 'label', labels)
+    df_.insert(0, 'poiID', pois.astype(np.float64))
+    df_.insert(0, 'queryID', qids.astype(np.float64))
+    return df_
+
+
+def gen_test_df(startPOI, endPOI, nPOI, poi_info, query_id_dict, poi_distmat=None, engine=None):
+    """The same DataFrame as gen_test_df() in dataset_Melb.ipynb (columns DF_COLUMNS),
+       labels are random numbers (arbitrary for test data)
+    """
+    if engine is None: engine = FeatureEngine(poi_info, poi_distmat)
+    assert(startPOI in poi_info.index)
+    assert(endPOI in poi_info.index)
+    (pois, qids, X) = engine.test_data(startPOI, endPOI, nPOI, query_id_dict)
+    df_ = pd.DataFrame(data=X, columns=FEATURES)
+    df_.insert(0, 'queryID', qids)  # an integer column as in the notebook
+    df_.insert(0, 'label', np.random.rand(len(pois)))  # label for test data is arbitrary according to libsvm FAQ
+    df_.insert(0, 'poiID', pois.astype(np.float64))
+    return df_
+
+
+def format_data(labels, qids, X):
+    """Lines of libsvm ranking data 'label qid:N 1:v1 2:v2 ...' of arrays"""
+    cols = [list(map(str, np.asarray(labels, dtype=np.float64).tolist())), \
+            [' qid:%d' % q for q in np.asarray(qids).astype(np.int64).tolist()]]
+    for j in range(X.shape[1]):
+        prefix = ' %d:' % (j + 1)
+        cols.append([prefix + s for s in map(str, X[:, j].tolist())])
+    return ''.join(''.join(fields) + '\n' for fields in zip(*cols))
+
+
+def gen_data_str(df_, df_columns=DF_COLUMNS):
+    """The same string as gen_data_str() in dataset_Melb.ipynb for a training/test DataFrame, formatted by columns"""
+    columns = df_columns[1:]  # get rid of 'poiID'
+    for col in columns:
+        assert(col in df_.columns)
+    return format_data(df_['label'].values, df_['queryID'].values, df_[columns[2:]].values.astype(np.float64))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage:', sys.argv[0], 'TRAJ_FILE(CSV)  POI_FILE(CSV)')
+        print('e.g. :', sys.argv[0], 'traj-noloop-all-Melb.csv  poi-Melb-all.csv')
+        print('print the training data of all trajectories in libsvm format')
+        sys.exit(0)
+
+    from poi_info import load_traj_all, extract_trajs, calc_poi_info
+
+    traj_all = load_traj_all(sys.argv[1])
+    poi_all = pd.read_csv(sys.argv[2], index_col='poiID')
+    traj_dict = extract_trajs(traj_all)
+    trajid_set_all = sorted(traj_dict.keys())
+    poi_info = calc_poi_info(trajid_set_all, traj_all, poi_all)
+    (pois, labels, qids, X) = FeatureEngine(poi_info).train_data(trajid_set_all, traj_dict, gen_query_id_dict(traj_dict))
+    sys.stdout.write(format_data(labels, qids, X))
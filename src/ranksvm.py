@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+import sys
+import numpy as np
+import pandas as pd
+from rank_features import FEATURES
+
+
+def rank_pairs(labels, qids):
+    """All pairs (i, j) of rows of the same query with labels[i] > labels[j], as two arrays"""
+    labels = np.asarray(labels)
+    qids = np.asarray(qids)
+    order = np.lexsort((labels, qids))
+    (l, q) = (labels[order], qids[order])
+    # rows with smaller labels of the same query are order[group_start:lower_bound] for each sorted row
+    group_starts = np.searchsorted(q, q, side='left')
+    new = np.ones(len(l), dtype=bool)
+    new[1:] = (q[1:] != q[:-1]) | (l[1:] != l[:-1])
+    lower_bounds = np.maximum.accumulate(np.where(new, np.arange(len(l)), 0))
+    counts = lower_bounds - group_starts
+    j = np.repeat(group_starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return order[np.repeat(np.arange(len(l)), counts)], order[j]
+
+
+class RankSVM:
+    """Linear RankSVM trained and used in process, with the same train()/predict() interface as the python wrapper
+       of the libsvm/liblinear ranksvm commands in dataset_Melb.ipynb (svm-scale + train + predict):
+       features are scaled to [-1, 1] by the range of training data as svm-scale, and
+         min_w 0.5 * |w|^2 + C * sum(max(0, 1 - w.(x_i - x_j))^2)
+       over pairs of the same query with label_i > label_j (L2-loss ranksvm of liblinear) is solved by Newton's method,
+       the model is kept in memory and predictions of many queries can be computed in one batch
+    """
+    def __init__(self, lower=-1, upper=1, max_iter=100, tol=1e-6, debug=False):
+        assert(lower < upper)
+        self.lower = lower
+        self.upper = upper
+        self.max_iter = max_iter
+        self.tol = tol
+        self.debug = debug
+        self.w = None
+
+
+    def scale(self, X):
+        """Scale features as svm-scale, features with the same value in all training data are 0"""
+        span = self.feature_max - self.feature_min
+        scaled = self.lower + (self.upper - self.lower) * (X - self.feature_min) / np.where(span > 0, span, 1)
+        return np.where(span > 0, scaled, 0)
+
+
+    def fit(self, X, labels, qids, cost=1):
+        """Train with a feature matrix X, labels and query IDs of its rows, cost is parameter C in SVM"""
+        assert(cost > 0)
+        X = np.asarray(X, dtype=np.float64)
+        self.feature_min = X.min(axis=0)
+        self.feature_max = X.max(axis=0)
+        Xs = self.scale(X)
+        (pi, pj) = rank_pairs(labels, qids)
+        D = Xs[pi] - Xs[pj]
+        if self.debug:
+            print('#pairs:', len(D))
+
+        w = np.zeros(X.shape[1])
+        it = -1  # no iteration if max_iter is 0
+        for it in range(self.max_iter):
+            margins = 1 - D.dot(w)
+            active = margins > 0
+            Da = D[active]
+            grad = w - 2 * cost * Da.T.dot(margins[active])
+            if np.linalg.norm(grad) <= self.tol * max(1, np.linalg.norm(w)):
+                break
+            # the (generalised) Hessian is small, i.e. #features x #features
+            hess = np.eye(len(w)) + 2 * cost * Da.T.dot(Da)
+            step = np.linalg.solve(hess, -grad)
+            if grad.dot(step) >= 0: break  # not a descent direction (rounding errors near the optimum)
+            # backtracking line search
+            m = np.maximum(margins, 0)
+            f = 0.5 * w.dot(w) + cost * m.dot(m)  # computed the same as below, i.e. the objective never goes up
+            t = 1.0
+            while t > 1e-10:
+                w1 = w + t * step
+                m1 = np.maximum(1 - D.dot(w1), 0)
+                if 0.5 * w1.dot(w1) + cost * m1.dot(m1) <= f + 0.01 * t * grad.dot(step): break
+                t *= 0.5
+            else:
+                break  # no sufficient decrease along the step, keep w
+            w = w1
+        if self.debug:
+            print('Training finished after %d iterations.' % (it + 1))
+        self.w = w
+        return self
+
+
+    def decision_function(self, X):
+        """Ranking scores of rows of X, higher is better"""
+        assert(self.w is not None), 'Model should be trained before predicting'
+        return self.scale(np.asarray(X, dtype=np.float64)).dot(self.w)
+
+
+    def train(self, train_df, cost=1):
+        """Train with a DataFrame of rank_features.gen_train_df()"""
+        self.fit(train_df[FEATURES].values, train_df['label'].values, train_df['queryID'].values, cost)
+
+
+    def predict(self, test_df):
+        """Ranking scores of a DataFrame of rank_features.gen_test_df() (or many of them concatenated),
+           a DataFrame indexed by poiID with column 'rank', the same as the notebook
+        """
+        poi_rank_df = pd.DataFrame({'rank': self.decision_function(test_df[FEATURES].values)})
+        poi_rank_df['poiID'] = test_df['poiID'].astype(np.int64).values
+        poi_rank_df.set_index('poiID', inplace=True)  # duplicated 'poiID' when evaluating training data
+        return poi_rank_df
+
+
+    def predict_queries(self, engine, queries):
+        """Ranking scores of all POIs of a rank_features.FeatureEngine for many queries (startPOI, endPOI, nPOI),
+           return (POI IDs sorted, scores) where scores[i, j] is the score of POI j for query i
+        """
+        pois = np.sort(engine.poi_ids)
+        (starts, ends, lens) = [np.array([q[k] for q in queries])[:, None] for k in range(3)]
+        X = engine.features(pois[None, :], starts, ends, lens)
+        return pois, self.decision_function(X).reshape(len(queries), len(pois))
+
+
+def recommend(pois, scores, startPOI, endPOI, nPOI):
+    """Trajectory of the top ranked POIs between startPOI and endPOI, the same as the notebook"""
+    ranked = pois[np.argsort(-scores, kind='stable')].tolist()
+    return [startPOI] + [x for x in ranked if x not in {startPOI, endPOI}][:nPOI-2] + [endPOI]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage:', sys.argv[0], 'TRAJ_FILE(CSV)  POI_FILE(CSV)')
+        print('e.g. :', sys.argv[0], 'traj-noloop-all-Melb.csv  poi-Melb-all.csv')
+        print('leave-one-out evaluation (F1) of trajectories recommended by POI ranking')
+        sys.exit(0)
+
+    from poi_info import load_traj_all, extract_trajs, calc_poi_info
+    from rank_features import FeatureEngine, gen_query_id_dict
+
+    RANK_C = 10  # regularisation parameter for rankSVM
+    traj_all = load_traj_all(sys.argv[1])
+    poi_all = pd.read_csv(sys.argv[2], index_col='poiID')
+    traj_dict = extract_trajs(traj_all)
+    query_id_dict = gen_query_id_dict(traj_dict)
+    trajid_set_all = sorted(traj_dict.keys())
+    F1s = []
+    for tid in trajid_set_all:
+        traj = traj_dict[tid]
+        if len(traj) < 3: continue
+        trajid_list_train = [x for x in trajid_set_all if x != tid]
+        poi_info = calc_poi_info(trajid_list_train, traj_all, poi_all)
+        if traj[0] not in poi_info.index or traj[-1] not in poi_info.index: continue
+        engine = FeatureEngine(poi_info)
+        (_, labels, qids, X) = engine.train_data(trajid_list_train, traj_dict, query_id_dict)
+        ranksvm = RankSVM().fit(X, labels, qids, cost=RANK_C)
+        (pois, scores) = ranksvm.predict_queries(engine, [(traj[0], traj[-1], len(traj))])
+        rec = recommend(pois, scores[0], traj[0], traj[-1], len(traj))
+        intersize = len(set(traj) & set(rec))
+        F1s.append(2 * intersize / (len(traj) + len(rec)))
+        print(tid, traj, rec, F1s[-1])
+    print('mean F1: %.4f over %d trajectories' % (np.mean(F1s), len(F1s)))
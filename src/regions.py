@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import sys
+import csv
+import math
+import zipfile
+import numpy as np
+from collections import namedtuple
+from xml.etree import ElementTree
+
+
+# name:     region name
+# bbox:     (lng_min, lat_min, lng_max, lat_max)
+# polygons: None if the region is the (closed) bounding box itself,
+#           otherwise a list of polygons, each polygon is a list of rings [(lng, lat), ...],
+#           the first ring is the outer boundary and the others are holes
+Region = namedtuple('Region', ['name', 'bbox', 'polygons'])
+
+
+def calc_bbox(polygons):
+    """Bounding box of a list of polygons"""
+    lngs = [p[0] for poly in polygons for ring in poly for p in ring]
+    lats = [p[1] for poly in polygons for ring in poly for p in ring]
+    assert(len(lngs) > 0)
+    return (min(lngs), min(lats), max(lngs), max(lats))
+
+
+def is_box(polygons):
+    """Check if polygons is a single axis-aligned rectangle without holes"""
+    if len(polygons) != 1 or len(polygons[0]) != 1: return False
+    ring = polygons[0][0]
+    if len(ring) > 0 and ring[0] == ring[-1]: ring = ring[:-1]
+    if len(ring) != 4: return False
+    (lng_min, lat_min, lng_max, lat_max) = calc_bbox(polygons)
+    corners = {(lng_min, lat_min), (lng_min, lat_max), (lng_max, lat_min), (lng_max, lat_max)}
+    return set(ring) == corners
+
+
+def make_region(name, polygons):
+    """Make a region from polygons, axis-aligned rectangles are represented as bounding boxes"""
+    bbox = calc_bbox(polygons)
+    assert(bbox[0] < bbox[2])
+    assert(bbox[1] < bbox[3])
+    if is_box(polygons):
+        return Region(name, bbox, None)
+    return Region(name, bbox, polygons)
+
+
+def load_regions_csv(fname):
+    """Load regions from a CSV file with header: name, lng_min, lat_min, lng_max, lat_max"""
+    regions = []
+    with open(fname, 'r') as f:
+        reader = csv.reader(f, skipinitialspace=True)
+        next(reader)  # header
+        for t in reader:
+            if len(t) == 0: continue
+            name = t[0].strip()
+            bbox = tuple(float(x) for x in t[1:5])
+            assert(bbox[0] < bbox[2])
+            assert(bbox[1] < bbox[3])
+            regions.append(Region(name, bbox, None))
+    return regions
+
+
+def parse_coordinates(text):
+    """Parse KML coordinates 'lng,lat[,alt] lng,lat[,alt] ...'"""
+    ring = []
+    for item in text.split():
+        t = item.split(',')
+        ring.append((float(t[0]), float(t[1])))
+    return ring
+
+
+def load_regions_kml(fname):
+    """Load regions from a KML/KMZ file, each Placemark with (Multi)Polygon geometry is a region"""
+    if fname.lower().endswith('.kmz'):
+        with zipfile.ZipFile(fname) as z:
+            kmlname = [x for x in z.namelist() if x.lower().endswith('.kml')][0]
+            root = ElementTree.fromstring(z.read(kmlname))
+    else:
+        root = ElementTree.parse(fname).getroot()
+
+    ns = '{http://www.opengis.net/kml/2.2}'
+    regions = []
+    for pm in root.iter(ns + 'Placemark'):
+        name = pm.findtext(ns + 'name', default='region' + str(len(regions))).strip()
+        polygons = []
+        for pg in pm.iter(ns + 'Polygon'):
+            rings = []
+            for tag in ['outerBoundaryIs', 'innerBoundaryIs']:
+                for bd in pg.findall(ns + tag):
+                    for coords in bd.iter(ns + 'coordinates'):
+                        rings.append(parse_coordinates(coords.text))
+            if len(rings) > 0: polygons.append(rings)
+        if len(polygons) > 0:
+            regions.append(make_region(name, polygons))
+    return regions
+
+
+def load_regions(fname):
+    """Load regions from a CSV or KML/KMZ file"""
+    if fname.lower().endswith('.kml') or fname.lower().endswith('.kmz'):
+        return load_regions_kml(fname)
+    return load_regions_csv(fname)
+
+
+def point_in_ring(lng, lat, ring):
+    """Ray casting test of point (lng, lat) against a ring"""
+    inside = False
+    n = len(ring)
+    j = n - 1
+    for i in range(n):
+        (xi, yi) = ring[i]
+        (xj, yj) = ring[j]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def point_in_region(lng, lat, region):
+    """Check if point (lng, lat) is inside region"""
+    (lng_min, lat_min, lng_max, lat_max) = region.bbox
+    if lng < lng_min or lng > lng_max: return False
+    if lat < lat_min or lat > lat_max: return False
+    if region.polygons is None: return True
+    for poly in region.polygons:
+        if point_in_ring(lng, lat, poly[0]) and \
+           not any(point_in_ring(lng, lat, hole) for hole in poly[1:]):
+            return True
+    return False
+
+
+class RegionIndex:
+    """Uniform grid index of regions,
+       each grid cell keeps the list of regions whose bounding box overlaps the cell
+    """
+    def __init__(self, regions, cell_size=None):
+        assert(len(regions) > 0)
+        if cell_size is None:
+            # median region extent, i.e. a typical region overlaps a few cells
+            extents = sorted(max(r.bbox[2] - r.bbox[0], r.bbox[3] - r.bbox[1]) for r in regions)
+            cell_size = extents[len(extents) // 2]
+        assert(cell_size > 0)
+        self.regions = regions
+        self.cell_size = cell_size
+        self.cells = dict()
+        for i, r in enumerate(regions):
+            (lng_min, lat_min, lng_max, lat_max) = r.bbox
+            for cx in range(self.cell(lng_min), self.cell(lng_max) + 1):
+                for cy in range(self.cell(lat_min), self.cell(lat_max) + 1):
+                    key = (cx, cy)
+                    if key not in self.cells: self.cells[key] = []
+                    self.cells[key].append(i)
+
+
+    def cell(self, x):
+        return int(math.floor(x / self.cell_size))
+
+
+    def query(self, lng, lat):
+        """Indexes of all regions containing point (lng, lat)"""
+        candidates = self.cells.get((self.cell(lng), self.cell(lat)))
+        if candidates is None: return []
+        return [i for i in candidates if point_in_region(lng, lat, self.regions[i])]
+
+
+class PreparedRegion:
+    """Region prepared for vectorised point-in-polygon tests of many points,
+       edges of all rings are indexed by horizontal strips, so a point is only tested against
+       the edges overlapping its strip (even-odd rule, i.e. polygons of a region should not overlap)
+    """
+    def __init__(self, region, nstrips=None):
+        self.region = region
+        if region.polygons is None: return
+        rings = [ring for poly in region.polygons for ring in poly]
+        x1 = np.concatenate([np.array([p[0] for p in ring]) for ring in rings])
+        y1 = np.concatenate([np.array([p[1] for p in ring]) for ring in rings])
+        x2 = np.concatenate([np.roll(np.array([p[0] for p in ring]), -1) for ring in rings])
+        y2 = np.concatenate([np.roll(np.array([p[1] for p in ring]), -1) for ring in rings])
+        horizontal = y1 == y2  # never crossed by a horizontal ray
+        (x1, y1, x2, y2) = [v[~horizontal] for v in (x1, y1, x2, y2)]
+        if nstrips is None:
+            nstrips = max(1, int(np.sqrt(len(x1))))
+        (lng_min, lat_min, lng_max, lat_max) = region.bbox
+        self.lat_min = lat_min
+        self.strip_height = (lat_max - lat_min) / nstrips
+        self.nstrips = nstrips
+
+        # edges overlapping each strip, sorted by strip in CSR form (strip_offsets, strip_edges)
+        s1 = self.strip(np.minimum(y1, y2))
+        s2 = self.strip(np.maximum(y1, y2))
+        counts = s2 - s1 + 1
+        edge_ids = np.repeat(np.arange(len(x1)), counts)
+        strips = np.repeat(s1, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        order = np.argsort(strips, kind='stable')
+        self.strip_edges = edge_ids[order]
+        self.strip_offsets = np.searchsorted(strips[order], np.arange(nstrips + 1))
+        self.edges = (x1, y1, x2, y2)
+
+
+    def strip(self, lats):
+        return np.clip(((lats - self.lat_min) / self.strip_height).astype(np.int64), 0, self.nstrips - 1)
+
+
+    def contains(self, lngs, lats, chunk_size=1 << 22):
+        """Check if points (lngs, lats) are inside the region, vectorised"""
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        (lng_min, lat_min, lng_max, lat_max) = self.region.bbox
+        inside = (lngs >= lng_min) & (lngs <= lng_max) & (lats >= lat_min) & (lats <= lat_max)
+        if self.region.polygons is None: return inside
+
+        candidates = np.flatnonzero(inside)
+        inside[:] = False
+        strips = self.strip(lats[candidates])
+        # group points by strip with one sort, the points of strip s are candidates[bounds[s]:bounds[s+1]]
+        order = np.argsort(strips, kind='stable')
+        candidates = candidates[order]
+        bounds = np.searchsorted(strips[order], np.arange(self.nstrips + 1))
+        (x1, y1, x2, y2) = self.edges
+        for s in np.flatnonzero(bounds[1:] > bounds[:-1]):
+            points = candidates[bounds[s]:bounds[s+1]]
+            edges = self.strip_edges[self.strip_offsets[s]:self.strip_offsets[s+1]]
+            if len(edges) == 0: continue
+            ex1 = x1[edges]; ey1 = y1[edges]; ex2 = x2[edges]; ey2 = y2[edges]
+            step = max(1, chunk_size // len(edges))  # bound the size of the (points x edges) matrices
+            for start in range(0, len(points), step):
+                ps = points[start:start+step]
+                px = lngs[ps][:, None]
+                py = lats[ps][:, None]
+                # ray casting to the right, the same as point_in_ring()
+                crossing = ((ey1 > py) != (ey2 > py)) & (px < (ex2 - ex1) * (py - ey1) / (ey2 - ey1) + ex1)
+                inside[ps] = (np.count_nonzero(crossing, axis=1) % 2) == 1
+        return inside
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage:', sys.argv[0], 'REGION_FILE(CSV/KML/KMZ)')
+        sys.exit(0)
+
+    for r in load_regions(sys.argv[1]):
+        print(r.name, r.bbox, 'box' if r.polygons is None else '%d polygon(s)' % len(r.polygons))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+import sys
+import numpy as np
+import pandas as pd
+
+
+# tables read in chunks: file format (arguments of pd.read_csv()) of each kind of table
+#   visits  POI visits, userVisits-Melb.csv
+#   trajs   trajectory statistics, trajectory_stats.csv of generate_tables.py
+#   photos  photos of trajectories, trajectory_photos.csv of generate_tables.py
+TABLES = {'visits': {'sep': ';'}, 'trajs': {'skipinitialspace': True}, 'photos': {'skipinitialspace': True}}
+TRAJ_COLUMNS = ['#Photo', 'Travel_Distance(km)', 'Total_Time(min)', 'Average_Speed(km/h)']
+
+
+def read_chunks(fname, kind, chunk_size=1 << 20):
+    """Iterator of DataFrames of at most chunk_size rows of a table of kind in TABLES"""
+    assert(kind in TABLES)
+    return pd.read_csv(fname, chunksize=chunk_size, **TABLES[kind])
+
+
+def hash_values(values):
+    """64-bit hashes of values (compared as strings), the same in every process"""
+    return pd.util.hash_array(np.asarray([str(x) for x in values], dtype=object))
+
+
+def bit_length(x):
+    """Number of bits of unsigned integers, i.e. int.bit_length(), vectorised"""
+    x = np.array(x, dtype=np.uint64)
+    n = np.zeros(len(x), dtype=np.int64)
+    for s in [32, 16, 8, 4, 2, 1]:
+        high = x >> np.uint64(s)
+        big = high > 0
+        n[big] += s
+        x[big] = high[big]
+    return n + (x > 0)
+
+
+def hll_positions(hashes, p):
+    """Register indexes and ranks (position of the first 1-bit in the other bits) of 64-bit hashes for HyperLogLog"""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    q = 64 - p
+    index = (hashes >> np.uint64(q)).astype(np.int64)
+    rank = q + 1 - bit_length(hashes & np.uint64((1 << q) - 1))
+    return index, rank.astype(np.uint8)
+
+
+def hll_estimate(registers):
+    """HyperLogLog estimates of the number of distinct values of each row of registers,
+       with linear counting for small cardinalities (Flajolet et al. 2007, Heule et al. 2013)
+    """
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)), axis=1)
+    zeros = np.sum(registers == 0, axis=1)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / zeros)
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class HyperLogLogs:
+    """HyperLogLog sketches (2^p registers each) of the number of distinct values of each key,
+       sketches with the same p merge exactly, i.e. merging sketches of shards is the same as one sketch of all
+    """
+    def __init__(self, p=12):
+        assert(4 <= p <= 18)
+        self.p = p
+        self.keys = dict()  # key --> row of registers
+        self.registers = np.zeros((0, 1 << p), dtype=np.uint8)
+
+
+    def rows(self, keys):
+        """Rows of registers of keys, new keys are added"""
+        (uniq, inverse) = np.unique(np.asarray(keys), return_inverse=True)
+        rows = np.zeros(len(uniq), dtype=np.int64)
+        for (i, key) in enumerate(uniq.tolist()):
+            row = self.keys.get(key)
+            if row is None:
+                row = self.keys[key] = len(self.keys)
+            rows[i] = row
+        if len(self.keys) > len(self.registers):
+            grown = np.zeros((max(len(self.keys), 2 * len(self.registers)), 1 << self.p), dtype=np.uint8)
+            grown[:len(self.registers)] = self.registers
+            self.registers = grown
+        return rows[inverse.ravel()]
+
+
+    def add(self, keys, values):
+        """Add values[i] to the set of keys[i]"""
+        assert(len(keys) == len(values))
+        if len(keys) == 0: return
+        rows = self.rows(keys)  # may grow registers
+        (index, rank) = hll_positions(hash_values(values), self.p)
+        np.maximum.at(self.registers, (rows, index), rank)
+
+
+    def merge(self, other):
+        assert(self.p == other.p)
+        rows = self.rows(list(other.keys.keys()))
+        np.maximum.at(self.registers, rows, other.registers[list(other.keys.values())])
+        return self
+
+
+    def estimates(self):
+        """Series of the estimated number of distinct values of each key, sorted by key"""
+        keys = sorted(self.keys.keys())
+        rows = [self.keys[key] for key in keys]
+        return pd.Series(hll_estimate(self.registers[rows]) if len(rows) > 0 else [], index=keys, dtype=np.float64)
+
+
+class KLLSketch:
+    """KLL sketch (Karnin, Lang and Liberty 2016) of quantiles of a stream of numbers, i.e. compactors of levels
+       h = 0, 1, ... holding items of weight 2^h, a full compactor sorts its items and promotes every other one,
+       about k * (1 / (1 - c)) items are kept in total, the rank error is about 1.7 / k of n (with high probability),
+       quantiles are exact (inverted CDF) while n is at most k, min and max are always exact,
+       sketches merge by concatenating compactors of the same level, NaNs are ignored
+    """
+    def __init__(self, k=200, c=2/3, seed=0):
+        assert(k >= 8 and 0.5 <= c < 1)
+        self.k = k
+        self.c = c
+        self.rng = np.random.RandomState(seed)
+        self.levels = [np.zeros(0)]
+        self.n = 0
+        self.min = np.nan
+        self.max = np.nan
+
+
+    def capacity(self, h):
+        return max(2, int(np.ceil(self.k * self.c ** (len(self.levels) - 1 - h))))
+
+
+    def compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) <= self.capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append(np.zeros(0))
+            items = np.sort(self.levels[h])
+            even = len(items) - len(items) % 2
+            promoted = items[self.rng.randint(2):even:2]
+            self.levels[h] = items[even:]  # the odd item stays
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h = 0  # capacities shrink as levels are added
+
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0: return
+        self.n += len(values)
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for (h, items) in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.compress()
+        return self
+
+
+    def __len__(self):
+        return sum(len(items) for items in self.levels)
+
+
+    def quantile(self, qs):
+        """Estimated quantiles (0 <= q <= 1), i.e. the smallest item x with (weighted) rank(x) >= q * n, NaN if empty"""
+        qs = np.asarray(qs, dtype=np.float64)
+        assert(np.all((qs >= 0) & (qs <= 1)))
+        if self.n == 0: return np.full(qs.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(x), 2 ** h, dtype=np.int64) for (h, x) in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        (items, cumw) = (items[order], np.cumsum(weights[order]))
+        assert(cumw[-1] == self.n)
+        values = items[np.minimum(np.searchsorted(cumw, qs * self.n, side='left'), len(items) - 1)]
+        values = np.where(qs == 0, self.min, np.where(qs == 1, self.max, values))
+        return values
+
+
+class VisitStats:
+    """Statistics of POI visits (userVisits-Melb.csv), exact number of visits (poiFreq) of each POI and
+       HyperLogLog estimates of the number of distinct users of each POI (POI popularity) and of all visits
+    """
+    def __init__(self, p=12):
+        self.nvisits = dict()  # poiID --> #visits
+        self.poi_users = HyperLogLogs(p)
+        self.users = HyperLogLogs(p)
+
+
+    def add(self, visits):
+        """Add a chunk (DataFrame) of visits"""
+        (pois, counts) = np.unique(visits['poiID'].values, return_counts=True)
+        for (poi, count) in zip(pois.tolist(), counts.tolist()):
+            self.nvisits[poi] = self.nvisits.get(poi, 0) + count
+        self.poi_users.add(visits['poiID'].values, visits['userID'].values)
+        self.users.add(np.zeros(len(visits), dtype=np.int64), visits['userID'].values)
+        return self
+
+
+    def merge(self, other):
+        for (poi, count) in other.nvisits.items():
+            self.nvisits[poi] = self.nvisits.get(poi, 0) + count
+        self.poi_users.merge(other.poi_users)
+        self.users.merge(other.users)
+        return self
+
+
+    def poi_stats(self):
+        """DataFrame of POIs (index: poiID) with columns #distinctUsers (estimate) and #visits"""
+        pois = sorted(self.nvisits.keys())
+        return pd.DataFrame({'#distinctUsers': self.poi_users.estimates().loc[pois].values, \
+                             '#visits': [self.nvisits[poi] for poi in pois]}, index=pd.Index(pois, name='poiID'))
+
+
+    def num_users(self):
+        return self.users.estimates().sum()
+
+
+class TrajStats:
+    """Statistics of trajectories (trajectory_stats.csv), exact number of trajectories and count, min, max and mean of
+       each column in TRAJ_COLUMNS, KLL sketches of their quantiles and HyperLogLog estimate of the number of users
+    """
+    def __init__(self, k=200, p=12, seed=0):
+        self.ntrajs = 0
+        self.count = np.zeros(len(TRAJ_COLUMNS), dtype=np.int64)
+        self.sum = np.zeros(len(TRAJ_COLUMNS))
+        self.sketches = [KLLSketch(k, seed=seed + i) for i in range(len(TRAJ_COLUMNS))]
+        self.users = HyperLogLogs(p)
+
+
+    def add(self, stats):
+        """Add a chunk (DataFrame) of trajectory statistics"""
+        self.ntrajs += len(stats)
+        for (i, col) in enumerate(TRAJ_COLUMNS):
+            values = stats[col].values.astype(np.float64)
+            values = values[~np.isnan(values)]
+            self.count[i] += len(values)
+            self.sum[i] += values.sum()
+            self.sketches[i].add(values)
+        self.users.add(np.zeros(len(stats), dtype=np.int64), stats['User_ID'].values)
+        return self
+
+
+    def merge(self, other):
+        self.ntrajs += other.ntrajs
+        self.count += other.count
+        self.sum += other.sum
+        for (sketch, sketch2) in zip(self.sketches, other.sketches):
+            sketch.merge(sketch2)
+        self.users.merge(other.users)
+        return self
+
+
+    def num_users(self):
+        return self.users.estimates().sum()
+
+
+    def quantiles(self, qs):
+        """DataFrame of the estimated quantiles qs (index) of each column in TRAJ_COLUMNS"""
+        return pd.DataFrame(np.stack([sketch.quantile(qs) for sketch in self.sketches], axis=1), index=qs, \
+                            columns=TRAJ_COLUMNS)
+
+
+    def basic_stats(self):
+        """min, max, median (estimate) and mean of each column in TRAJ_COLUMNS, basic_stats in flickr_analysis.ipynb"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.sum / self.count
+        return pd.DataFrame([[s.min for s in self.sketches], [s.max for s in self.sketches], \
+                             self.quantiles([0.5]).values[0], mean], index=['min', 'max', 'median', 'mean'], \
+                            columns=TRAJ_COLUMNS)
+
+
+class PhotoStats:
+    """Statistics of photos of trajectories (trajectory_photos.csv), exact number of photos taken in each year and of
+       each accuracy, HyperLogLog estimates of the number of users and trajectories
+    """
+    def __init__(self, p=12):
+        self.years = dict()  # year --> #photos
+        self.accuracy = dict()  # accuracy --> #photos
+        self.ids = HyperLogLogs(p)  # key 0: users, key 1: trajectories
+
+
+    def add(self, photos):
+        """Add a chunk (DataFrame) of photos"""
+        years = photos['Timestamp'].astype(str).str[:4].astype(np.int64).values
+        for (counter, values) in [(self.years, years), (self.accuracy, photos['Accuracy'].values)]:
+            (uniq, counts) = np.unique(values, return_counts=True)
+            for (x, count) in zip(uniq.tolist(), counts.tolist()):
+                counter[x] = counter.get(x, 0) + count
+        self.ids.add(np.zeros(len(photos), dtype=np.int64), photos['User_ID'].values)
+        self.ids.add(np.ones(len(photos), dtype=np.int64), photos['Trajectory_ID'].values)
+        return self
+
+
+    def merge(self, other):
+        for (counter, counter2) in [(self.years, other.years), (self.accuracy, other.accuracy)]:
+            for (x, count) in counter2.items():
+                counter[x] = counter.get(x, 0) + count
+        self.ids.merge(other.ids)
+        return self
+
+
+    def num_photos(self):
+        return sum(self.years.values())
+
+
+    def num_users(self):
+        return self.ids.estimates().get(0, 0)
+
+
+    def num_trajs(self):
+        return self.ids.estimates().get(1, 0)
+
+
+STATS = {'visits': VisitStats, 'trajs': TrajStats, 'photos': PhotoStats}
+
+
+def table_stats(fname, kind, chunk_size=1 << 20):
+    """Statistics of a table of kind in TABLES by one pass over its chunks"""
+    stats = STATS[kind]()
+    for chunk in read_chunks(fname, kind, chunk_size):
+        stats.add(chunk)
+    return stats
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in TABLES:
+        print('Usage:', sys.argv[0], 'visits|trajs|photos  TABLE_FILE(CSV)  [TABLE_FILE(CSV) ...]')
+        print('e.g. :', sys.argv[0], 'trajs  trajectory_stats.csv')
+        print('statistics of tables in one pass over chunks with bounded memory, ' + \
+              'statistics of several files (shards) are merged')
+        sys.exit(0)
+
+    kind = sys.argv[1]
+    stats = table_stats(sys.argv[2], kind)
+    for fname in sys.argv[3:]:
+        stats.merge(table_stats(fname, kind))
+
+    if kind == 'visits':
+        print('# users (estimate) :', int(round(stats.num_users())))
+        print(stats.poi_stats().to_string())
+    elif kind == 'trajs':
+        print('# users (estimate) :', int(round(stats.num_users())))
+        print('# trajectories :', stats.ntrajs)
+        print(stats.basic_stats().to_string())
+        print(stats.quantiles([0.1, 0.25, 0.5, 0.75, 0.9, 0.99]).to_string())
+    else:
+        print('# photos :', stats.num_photos())
+        print('# users (estimate) :', int(round(stats.num_users())))
+        print('# trajectories (estimate) :', int(round(stats.num_trajs())))
+        print('#photos per year :', dict(sorted(stats.years.items())))
+        print('#photos per accuracy :', dict(sorted(stats.accuracy.items())))
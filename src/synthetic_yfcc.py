@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import sys
+import gzip
+import numpy as np
+from photo_table import format_times
+
+
+# Cities (longitude, latitude) where users live and travel to, Melbourne first
+CITIES = [(144.9631, -37.8136), (151.2093, -33.8688), (-0.1276, 51.5072), (-73.9857, 40.7484), \
+          (139.6917, 35.6895), (2.3522, 48.8566), (-122.4194, 37.7749), (103.8198, 1.3521)]
+NHOTSPOTS = 50  # hotspots (e.g. POIs) per city
+TIME_MIN = np.datetime64('2000-01-01T00:00:00').astype(np.int64)
+TIME_MAX = np.datetime64('2015-03-05T23:59:59').astype(np.int64)
+NCOLUMNS = 23
+# a record (line) of photo ID, user ID, date taken, longitude and latitude, accuracy, user ID, photo ID, photo ID and
+# marker
+RECORD = '\t'.join(['%d', '%s', 'nickname', '%s.0', '1400000000', 'Canon+EOS', 'title', 'description', 'tags', '', \
+                    '%s', '%d', 'http://www.flickr.com/photos/%s/%d/', 'http://farm1.staticflickr.com/1/%d_abc.jpg', \
+                    'Attribution License', 'http://creativecommons.org/licenses/by/2.0/', '1', '1', 'abc', 'abc', \
+                    'jpg', '%d']) + '\n'
+
+
+class SyntheticYFCC:
+    """Seeded generator of YFCC100M records (23 tab separated columns, see filtering_bigbox.parse_record()) clustered
+       like real photos: user activity is heavy-tailed, photos come in sessions (trajectories) of one user with minutes
+       between photos and a walk around a hotspot of a city, users mostly take photos in their home city
+       (melb_ratio of users live in Melbourne), geo_ratio of sessions are geotagged, a few photos are taken outside of
+       the time window of filtering_bigbox.py,
+       records are generated in chunks of chunk_size rows, i.e. memory does not grow with the number of rows,
+       the output depends on the seed, the number of rows and the chunk size only
+    """
+    def __init__(self, nrows, seed=0, rows_per_user=100, session_len=8, geo_ratio=0.5, melb_ratio=0.2, \
+                 travel_ratio=0.2, chunk_size=1 << 18):
+        assert(nrows >= 0 and rows_per_user > 0 and session_len >= 1 and chunk_size > 0)
+        assert(0 <= geo_ratio <= 1 and 0 <= melb_ratio <= 1 and 0 <= travel_ratio <= 1)
+        self.nrows = nrows
+        self.seed = seed
+        self.session_len = session_len
+        self.geo_ratio = geo_ratio
+        self.travel_ratio = travel_ratio
+        self.chunk_size = chunk_size
+
+        rng = np.random.RandomState(seed)
+        nusers = max(1, nrows // rows_per_user)
+        activity = rng.pareto(1.2, nusers) + 1
+        self.user_p = activity / activity.sum()
+        others = rng.randint(1, len(CITIES), nusers)
+        self.user_city = np.where(rng.rand(nusers) < melb_ratio, 0, others)
+        self.user_ids = np.array(['%d@N%02d' % (x, y) for (x, y) in zip(rng.randint(10**6, 10**9, nusers), \
+                                                                          rng.randint(0, 10, nusers))], dtype=object)
+        # hotspots of cities, within a few km of the city centre
+        centres = np.array(CITIES, dtype=np.float64)
+        self.hotspots = centres[:, None, :] + rng.normal(0, 0.03, (len(CITIES), NHOTSPOTS, 2))
+        self.hotspot_p = 1 / np.arange(1, NHOTSPOTS + 1)  # a few popular hotspots
+        self.hotspot_p /= self.hotspot_p.sum()
+
+
+    def chunk(self, i):
+        """Records of chunk i, lines of NCOLUMNS tab separated columns"""
+        rng = np.random.RandomState([self.seed, i])
+        start = i * self.chunk_size
+        n = min(self.chunk_size, self.nrows - start)
+        assert(n > 0)
+
+        # sessions: lengths, users, cities, hotspots, start times
+        lens = rng.geometric(1 / self.session_len, n)
+        nsessions = np.searchsorted(np.cumsum(lens), n) + 1
+        lens = lens[:nsessions]
+        lens[-1] = n - lens[:-1].sum()
+        users = rng.choice(len(self.user_p), nsessions, p=self.user_p)
+        cities = np.where(rng.rand(nsessions) < self.travel_ratio, rng.randint(0, len(CITIES), nsessions), \
+                          self.user_city[users])
+        spots = self.hotspots[cities, rng.choice(NHOTSPOTS, nsessions, p=self.hotspot_p)]
+        t0 = rng.randint(TIME_MIN, TIME_MAX, nsessions)
+        outside = rng.rand(nsessions) < 0.001  # photos with wrong dates
+        t0[outside] += rng.randint(1, 20, outside.sum()) * 365 * 86400
+        geo = rng.rand(nsessions) < self.geo_ratio
+
+        # photos: minutes apart, walking around the hotspot, within a session
+        session = np.repeat(np.arange(nsessions), lens)
+        offsets = np.zeros(nsessions + 1, dtype=np.int64)
+        np.cumsum(lens, out=offsets[1:])
+        def within(steps):
+            total = np.cumsum(steps, axis=0)
+            return total - np.repeat(total[offsets[:-1]] - steps[offsets[:-1]], lens, axis=0)
+        times = t0[session] + within(rng.exponential(600, n).astype(np.int64))
+        coords = spots[session] + within(rng.normal(0, 0.001, (n, 2)))
+        coords[~geo[session]] = np.nan
+
+        order = rng.permutation(n)  # records of a session are not adjacent
+        (session, times, coords) = (session[order], times[order], coords[order])
+        pids = (10**9 + start + np.arange(n)).tolist()
+        uids = self.user_ids[users[session]].tolist()
+        accuracy = np.where(rng.rand(n) < 0.6, 16, rng.randint(1, 16, n)).tolist()
+        marker = (rng.rand(n) < 0.03).astype(np.int64).tolist()
+        lnglat = ['\t'] * n  # not geotagged
+        ix = np.nonzero(~np.isnan(coords[:, 0]))[0]
+        for (j, xy) in zip(ix.tolist(), coords[ix].tolist()):
+            lnglat[j] = '%.6f\t%.6f' % tuple(xy)
+        return ''.join([RECORD % x for x in zip(pids, uids, format_times(times).tolist(), lnglat, accuracy, uids, \
+                                                 pids, pids, marker)])
+
+
+    def write(self, fname):
+        """Write all records to a TSV file (gzip compressed if fname ends with '.gz'), return the number of rows"""
+        with (gzip.open(fname, 'wt') if fname.endswith('.gz') else open(fname, 'w')) as f:
+            for i in range((self.nrows + self.chunk_size - 1) // self.chunk_size):
+                f.write(self.chunk(i))
+        return self.nrows
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [3, 4]:
+        print('Usage:', sys.argv[0], 'NROWS  OUTPUT_FILE(TSV)  [SEED]')
+        print('e.g. :', sys.argv[0], '1000000  yfcc100m_synthetic.tsv  0')
+        print('synthetic YFCC100M records in the format of yfcc100m_dataset, for tests and benchmarks')
+        sys.exit(0)
+
+    SyntheticYFCC(int(sys.argv[1]), int(sys.argv[3]) if len(sys.argv) > 3 else 0).write(sys.argv[2])
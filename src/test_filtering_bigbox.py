@@ -2,8 +2,13 @@
 import unittest
 import tempfile
 import os
+import gzip
+import shutil
 from datetime import datetime
-from filtering_bigbox import filtering
+from filtering_bigbox import filtering, filtering_parallel, split_ranges, filtering_regions, \
+                             extract_coords, parse_timestamp
+from regions import Region, RegionIndex
+from photo_table import load_columnar
 
 class FilterBigBoxTestCase(unittest.TestCase):
     def setUp(self):
@@ -20,6 +25,7 @@ class FilterBigBoxTestCase(unittest.TestCase):
         fi = tempfile.NamedTemporaryFile(mode='w', delete=False)
         fo = tempfile.NamedTemporaryFile(delete=False)
         fi.write(datastr)
+        self.datastr = datastr
         self.fin = fi.name
         self.fout = fo.name
         fi.close()
@@ -43,5 +49,107 @@ class FilterBigBoxTestCase(unittest.TestCase):
             self.assertEqual(f.read(), self.resultstr, 'unexpected results after filtering')
 
 
+    def test_filtering_gzip(self):
+        lng_min = 141.9
+        lat_min = -39.3 
+        lng_max = 147.1
+        lat_max = -35.8
+        time_min = datetime.strptime('2000-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
+        time_max = datetime.strptime('2015-03-05 23:59:59', '%Y-%m-%d %H:%M:%S')
+        fgz = self.fin + '.gz'
+        with gzip.open(fgz, 'wt') as f:
+            f.write(self.datastr)
+        try:
+            nrows = filtering(lng_min, lat_min, lng_max, lat_max, time_min, time_max, fgz, self.fout)
+        finally:
+            os.unlink(fgz)
+        self.assertEqual(nrows, 4)
+        with open(self.fout, 'r') as f:
+            self.assertEqual(f.read(), self.resultstr, 'unexpected results after filtering gzip input')
+
+
+    def test_filtering_columnar(self):
+        lng_min = 141.9
+        lat_min = -39.3 
+        lng_max = 147.1
+        lat_max = -35.8
+        time_min = datetime.strptime('2000-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
+        time_max = datetime.strptime('2015-03-05 23:59:59', '%Y-%m-%d %H:%M:%S')
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fcols = os.path.join(tmpdir, 'out.cols')
+            fcsv = os.path.join(tmpdir, 'out.csv')
+            filtering(lng_min, lat_min, lng_max, lat_max, time_min, time_max, self.fin, fcols)
+            load_columnar(fcols).to_csv(fcsv, header=False)
+            with open(fcsv, 'r') as f:
+                self.assertEqual(f.read(), self.resultstr, 'unexpected results after filtering to columnar')
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+    def test_extract_coords(self):
+        lines = self.datastr.split('\n')
+        self.assertEqual(extract_coords(lines[0]), (-122.288368, 47.622562))
+        self.assertEqual(extract_coords(lines[2]), (144.87957, -37.155665))
+        self.assertIsNone(extract_coords('1\t2\t3'))
+        self.assertIsNone(extract_coords('\t' * 10 + '\t-37.8\t16\t'))
+
+
+    def test_parse_timestamp(self):
+        for ts in ['2005-03-01 12:39:28.0', '4501-01-01 00:00:00.0', '2011-11-07 07:20:22.123456', '2011-11-07 07:20:22.5']:
+            with self.subTest(ts=ts):
+                self.assertEqual(parse_timestamp(ts), datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f'))
+
+
+    def test_split_ranges(self):
+        size = os.path.getsize(self.fin)
+        for nparts in range(1, 8):
+            with self.subTest(nparts=nparts):
+                ranges = split_ranges(self.fin, nparts)
+                self.assertEqual(ranges[0][0], 0)
+                self.assertEqual(ranges[-1][1], size)
+                with open(self.fin, 'rb') as f:
+                    data = f.read()
+                for i in range(len(ranges)):
+                    if i > 0: self.assertEqual(ranges[i][0], ranges[i-1][1])
+                    self.assertEqual(data[ranges[i][1]-1:ranges[i][1]], b'\n')
+
+
+    def test_filtering_parallel(self):
+        lng_min = 141.9
+        lat_min = -39.3 
+        lng_max = 147.1
+        lat_max = -35.8
+        time_min = datetime.strptime('2000-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
+        time_max = datetime.strptime('2015-03-05 23:59:59', '%Y-%m-%d %H:%M:%S')
+        nrows = filtering_parallel(lng_min, lat_min, lng_max, lat_max, time_min, time_max, self.fin, self.fout, 3)
+        self.assertEqual(nrows, 4)
+        with open(self.fout, 'r') as f:
+            self.assertEqual(f.read(), self.resultstr, 'unexpected results after parallel filtering')
+
+
+    def test_filtering_regions(self):
+        regions = [Region('big-box', (141.9, -39.3, 147.1, -35.8), None), \
+                   Region('Melbourne', (144.597363, -38.072257, 145.360413, -37.591764), None), \
+                   Region('Seattle', (-122.5, 47.4, -122.2, 47.8), None)]
+        time_min = datetime.strptime('2000-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
+        time_max = datetime.strptime('2015-03-05 23:59:59', '%Y-%m-%d %H:%M:%S')
+        fouts = [self.fout + '.' + str(i) for i in range(len(regions))]
+        try:
+            nrows = filtering_regions(RegionIndex(regions), time_min, time_max, self.fin, fouts)
+            self.assertEqual(nrows, 4)
+            results = []
+            for fout in fouts:
+                with open(fout, 'r') as f:
+                    results.append(f.read())
+        finally:
+            for fout in fouts:
+                if os.path.exists(fout): os.unlink(fout)
+        self.assertEqual(results[0], self.resultstr)
+        self.assertEqual(results[1], '')
+        self.assertEqual(results[2], '7088065,30302697@N00,2005-03-01 12:39:28.0,-122.288368,47.622562,15,' + \
+                                     'http://www.flickr.com/photos/30302697@N00/7088065/,0\n')
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -1,9 +1,36 @@
 #!/usr/bin/env python3
+import json
 import unittest
 import tempfile
 import os
+import heapq
+import shutil
+import numpy as np
+import pandas as pd
 from datetime import datetime
-from generate_tables import load_data, gen_trajectories, filter_trajectories, calc_dist
+from generate_tables import load_data, gen_trajectories, segment_trajectories, filter_trajectories, calc_dist, \
+                            sweep, segments_to_lists, main, main_streaming, sort_runs, read_run, dump_trajectories, \
+                            filter_trajectories_region, main_incremental, main_sweep, merge_runs, HEADER1, HEADER2, \
+                            lists_to_segments, take_segments, filter_segments, filter_segments_region, dump_segments, \
+                            trajectory_stats, patch_stats, user_shard, STATE_SHARDS, STATS_ROW_BYTES
+from regions import make_region, point_in_region
+from filtering_bigbox import filter_record
+from synthetic_yfcc import SyntheticYFCC
+
+
+def baseline_stats(trajlist, data):
+    """Rows of trajectory_stats.csv computed one photo at a time, as the original dump_trajectories() does"""
+    rows = []
+    for i, dlist in enumerate(trajlist):
+        dist = 0
+        for j in range(len(dlist) - 1):
+            dist += calc_dist(data[dlist[j]][3], data[dlist[j]][4], data[dlist[j+1]][3], data[dlist[j+1]][4])  # km
+        (t1, t2) = (data[dlist[0]][2], data[dlist[-1]][2])
+        seconds = (t2 - t1).total_seconds()
+        speed = 0 if seconds == 0 else dist * 60 * 60 / seconds  # km/h
+        rows.append(','.join([str(i), data[dlist[0]][1], str(len(dlist)), str(t1), str(dist), str(seconds / 60), \
+                              str(speed)]) + '\n')
+    return rows
 
 
 class GenTablesTestCase(unittest.TestCase):
@@ -44,6 +71,15 @@ Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, URL, Marker(photo=0
         self.assertEqual(trajs, self.result_gentraj)
 
 
+    def test_segment_trajectories(self):
+        offsets, index = segment_trajectories(self.rawdata)
+        self.assertEqual(offsets.tolist(), [0, 3, 6, 7, 9, 11, 13])
+        self.assertEqual(index.tolist(), [x for traj in self.result_gentraj for x in traj])
+        offsets, index = segment_trajectories(self.rawdata, time_gap=0.5)
+        self.assertEqual([index[offsets[i]:offsets[i+1]].tolist() for i in range(len(offsets)-1)], \
+                         [[2, 0, 1], [5], [3], [4], [6], [11], [10], [9, 12], [7, 8]])
+
+
     def test_filter_trajectories(self):
         lng_min = 144.597363
         lat_min = -38.072257
@@ -54,6 +90,319 @@ Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, URL, Marker(photo=0
         self.assertEqual(trajs, self.result_filtraj)
 
 
+    def test_filter_segments(self):
+        """The compressed form gives the same trajectories as lists"""
+        offsets, index = segment_trajectories(self.rawdata)
+        self.assertEqual([x.tolist() for x in lists_to_segments(self.result_gentraj)], [offsets.tolist(), index.tolist()])
+        kept = take_segments(offsets, index, np.array([True, False, False, True, False, True]))
+        self.assertEqual([x.tolist() for x in kept], [[0, 3, 5, 7], [2, 0, 1, 11, 10, 7, 8]])
+        kept = filter_segments(144.597363, -38.072257, 145.360413, -37.591764, offsets, index, self.rawdata)
+        self.assertEqual(segments_to_lists(*kept), self.result_filtraj)
+        triangle = make_region('triangle', [[[(144.9, -37.9), (145.4, -37.9), (144.9, -37.5)]]])
+        kept = filter_segments_region(triangle, offsets, index, self.rawdata, 1, 'all')
+        self.assertEqual(segments_to_lists(*kept), filter_trajectories_region(triangle, self.result_gentraj, \
+                                                                              self.rawdata, 1, 'all'))
+        empty = take_segments(offsets, index, np.zeros(6, dtype=bool))
+        self.assertEqual([x.tolist() for x in empty], [[0], []])
+        self.assertEqual([x.tolist() for x in filter_segments(0, 0, 1, 1, *empty, self.rawdata)], [[0], []])
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            tables = []
+            for (i, dump) in enumerate([lambda f1, f2: dump_segments(f1, f2, *kept, self.rawdata), \
+                                        lambda f1, f2: dump_trajectories(f1, f2, segments_to_lists(*kept), self.rawdata)]):
+                (fout1, fout2) = (os.path.join(tmpdir, '%d.photos.csv' % i), os.path.join(tmpdir, '%d.stats.csv' % i))
+                dump(fout1, fout2)
+                with open(fout1, 'r') as f1, open(fout2, 'r') as f2:
+                    tables.append(f1.read() + f2.read())
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(tables[0], tables[1])
+
+
+    def test_filter_trajectories_region(self):
+        triangle = make_region('triangle', [[[(144.9, -37.9), (145.4, -37.9), (144.9, -37.5)]]])
+        trajs = gen_trajectories(self.rawdata, time_gap=24)
+        self.assertIn([11, 10, 9, 12], trajs)  # half inside
+        expected = [t for t in trajs if any(point_in_region(self.rawdata.lng[p], self.rawdata.lat[p], triangle) for p in t)]
+        self.assertEqual(filter_trajectories_region(triangle, trajs, self.rawdata), expected)
+        self.assertEqual(expected, [[5, 3, 4], [11, 10, 9, 12], [7, 8]])
+        self.assertEqual(filter_trajectories_region(triangle, trajs, self.rawdata, criterion='all'), [[5, 3, 4], [7, 8]])
+        self.assertEqual(filter_trajectories_region(triangle, trajs, self.rawdata, criterion='fraction', min_fraction=0.5), \
+                         expected)
+        self.assertEqual(filter_trajectories_region(triangle, trajs, self.rawdata, 3, 'fraction', 0.75), [[5, 3, 4]])
+
+
+    def test_sweep(self):
+        lng_min = 144.597363
+        lat_min = -38.072257
+        lng_max = 145.360413
+        lat_max = -37.591764
+        time_gaps = [0.5, 8, 24]
+        min_photos_list = [1, 2, 3]
+        results = list(sweep(self.rawdata, lng_min, lat_min, lng_max, lat_max, time_gaps, min_photos_list))
+        self.assertEqual(len(results), 9)
+        for (time_gap, min_photos, offsets, index, keep, stats) in results:
+            with self.subTest(time_gap=time_gap, min_photos=min_photos):
+                trajs = gen_trajectories(self.rawdata, time_gap)
+                trajs = filter_trajectories(lng_min, lat_min, lng_max, lat_max, trajs, self.rawdata, min_photos)
+                kept = [t for (t, k) in zip(segments_to_lists(offsets, index), keep) if k]
+                self.assertEqual(kept, trajs)
+                self.assertEqual(stats[0].tolist(), [len(t) for t in trajs])
+                for j in range(len(trajs)):
+                    data = [self.rawdata[p] for p in trajs[j]]
+                    dist = sum(calc_dist(data[k][3], data[k][4], data[k+1][3], data[k+1][4]) for k in range(len(data)-1))
+                    self.assertAlmostEqual(stats[1][j], dist)
+                    self.assertAlmostEqual(stats[2][j], (data[-1][2] - data[0][2]).total_seconds() / 60)
+
+        # the distance of a trajectory does not depend on its position in the table, the same as main()
+        (time_min, time_max) = (datetime(2000, 1, 1), datetime(2015, 3, 5, 23, 59, 59))
+        lines = SyntheticYFCC(20000, seed=5, melb_ratio=0.6).chunk(0).splitlines()
+        rows = [filter_record(line, 141.9, -39.3, 147.1, -35.8, time_min, time_max) for line in lines]
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fin = os.path.join(tmpdir, 'bigbox.csv')
+            with open(fin, 'w') as f:
+                f.write(HEADER1 + ''.join(row for row in rows if row is not None))
+            data = load_data(fin)
+        finally:
+            shutil.rmtree(tmpdir)
+        for (time_gap, min_photos, offsets, index, keep, stats) in \
+            sweep(data, lng_min, lat_min, lng_max, lat_max, [1, 8], [1, 3]):
+            kept = filter_segments(lng_min, lat_min, lng_max, lat_max, *segment_trajectories(data, time_gap), data, \
+                                   min_photos)
+            self.assertEqual(stats[1].tolist(), trajectory_stats(*kept, data)[0].tolist())
+
+
+    def test_sweep_empty(self):
+        """No photos, e.g. nothing in the big box: no trajectories for every setting, tables with the header only"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fin = os.path.join(tmpdir, 'bigbox.csv')
+            with open(self.fin, 'r') as fi, open(fin, 'w') as fo:
+                fo.write(fi.readline())
+            fout = os.path.join(tmpdir, 'trajectory_sweep.csv')
+            main_sweep(fin, fout, 144.597363, -38.072257, 145.360413, -37.591764, [1, 2], [8, 24], True)
+            with open(fout, 'r') as f:
+                lines = f.read().splitlines()
+            with open(os.path.join(tmpdir, 'trajectory_photos.gap24.min2.csv'), 'r') as f:
+                self.assertEqual(f.read(), HEADER1)
+            with open(os.path.join(tmpdir, 'trajectory_stats.gap8.min1.csv'), 'r') as f:
+                self.assertEqual(f.read(), HEADER2)
+            main(fin, os.path.join(tmpdir, 'photos.csv'), os.path.join(tmpdir, 'stats.csv'), \
+                 144.597363, -38.072257, 145.360413, -37.591764)
+            with open(os.path.join(tmpdir, 'stats.csv'), 'r') as f:
+                self.assertEqual(f.read(), HEADER2)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[1], '8,1,0,0,' + ','.join(['NA'] * 10))
+
+
+    def test_dump_trajectories(self):
+        trajs = gen_trajectories(self.rawdata)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fout1 = os.path.join(tmpdir, 'trajectory_photos.csv')
+            fout2 = os.path.join(tmpdir, 'trajectory_stats.csv')
+            dump_trajectories(fout1, fout2, trajs, self.rawdata)
+            with open(fout1, 'r') as f:
+                lines1 = f.read().split('\n')
+            with open(fout2, 'r') as f:
+                lines2 = f.read().split('\n')
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(len(lines1), 15)
+        self.assertEqual(lines1[1], '0,4257973354,26303188@N00,2010-01-09 09:36:11,145.314132,-37.765855,16,0,' + \
+                                    'http://www.flickr.com/photos/26303188@N00/4257973354/')
+        self.assertEqual(lines2[3], '2,26303188@N00,1,2010-12-01 10:13:27,0,0.0,0')  # single photo trajectory
+        for i in range(len(trajs)):
+            with self.subTest(traj=i):
+                t = lines2[i+1].split(',')
+                data = [self.rawdata[p] for p in trajs[i]]
+                dist = sum(calc_dist(data[k][3], data[k][4], data[k+1][3], data[k+1][4]) for k in range(len(data)-1))
+                seconds = (data[-1][2] - data[0][2]).total_seconds()
+                self.assertEqual(t[:4], [str(i), data[0][1], str(len(data)), str(data[0][2])])
+                self.assertAlmostEqual(float(t[4]), dist, places=12)
+                self.assertEqual(float(t[5]), seconds / 60)
+                self.assertAlmostEqual(float(t[6]), dist * 3600 / seconds if seconds > 0 else 0, places=12)
+
+
+    def test_baseline_stats(self):
+        """trajectory_stats.csv is the same as the one of the original (scalar) code, distances and speeds within
+           a relative 1e-12 (summed in a different order)
+        """
+        (time_min, time_max) = (datetime(2000, 1, 1), datetime(2015, 3, 5, 23, 59, 59))
+        lines = SyntheticYFCC(100000, seed=4, melb_ratio=0.6).chunk(0).splitlines()
+        rows = [filter_record(line, 141.9, -39.3, 147.1, -35.8, time_min, time_max) for line in lines]
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fin = os.path.join(tmpdir, 'bigbox.csv')
+            with open(fin, 'w') as f:
+                f.write(HEADER1 + ''.join(row for row in rows if row is not None))
+            (fout1, fout2) = (os.path.join(tmpdir, 'photos.csv'), os.path.join(tmpdir, 'stats.csv'))
+            main(fin, fout1, fout2, 144.597363, -38.072257, 145.360413, -37.591764)
+            with open(fout2, 'r') as f:
+                stats = f.readlines()
+            data = load_data(fin)
+        finally:
+            shutil.rmtree(tmpdir)
+        trajs = filter_trajectories(144.597363, -38.072257, 145.360413, -37.591764, gen_trajectories(data), data)
+        self.assertGreater(max(len(t) for t in trajs), 20)
+        baseline = baseline_stats(trajs, data)
+        self.assertNotEqual(stats[1:], baseline)  # large enough for some sums to differ in the last digits
+        (rows, expected) = ([line.split(',') for line in stats[1:]], [line.split(',') for line in baseline])
+        self.assertEqual([t[:4] + t[5:6] for t in rows], [t[:4] + t[5:6] for t in expected])
+        for col in [4, 6]:
+            self.assertTrue(np.allclose([float(t[col]) for t in rows], [float(t[col]) for t in expected], \
+                                        rtol=1e-12, atol=0))
+
+
+    def test_sort_runs(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            runs = sort_runs(self.fin, tmpdir, 300)
+            self.assertTrue(len(runs) > 1)
+            records = list(heapq.merge(*[read_run(frun) for frun in runs]))
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual([rec[2] for rec in records], [x for traj in self.result_gentraj for x in traj])
+
+
+    def test_merge_runs(self):
+        """More runs than the fan-in are merged in passes"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            runs = sort_runs(self.fin, tmpdir, 100)
+            self.assertGreater(len(runs), 4)
+            expected = list(heapq.merge(*[read_run(frun) for frun in runs]))
+            for fan_in in [2, 3]:
+                with self.subTest(fan_in=fan_in):
+                    merged = merge_runs(runs, tmpdir, fan_in)
+                    self.assertLessEqual(len(merged), fan_in)
+                    self.assertEqual(list(heapq.merge(*[read_run(frun) for frun in merged])), expected)
+                    for frun in merged:
+                        os.unlink(frun)
+                    runs = sort_runs(self.fin, tmpdir, 100)
+            self.assertEqual(sorted(os.listdir(tmpdir)), sorted(os.path.basename(x) for x in runs))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+    def test_main_streaming(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            results = []
+            for func in [main, main_streaming]:
+                fout1 = os.path.join(tmpdir, func.__name__ + '.photos.csv')
+                fout2 = os.path.join(tmpdir, func.__name__ + '.stats.csv')
+                func(self.fin, fout1, fout2, 144.597363, -38.072257, 145.360413, -37.591764, 2, 1)
+                for fout in [fout1, fout2]:
+                    with open(fout, 'r') as f:
+                        results.append(f.read())
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[1], results[3])
+        self.assertEqual(len(results[3].strip().split('\n')), 3)  # header and 2 trajectories
+
+        # more runs than the fan-in
+        tmpdir = tempfile.mkdtemp()
+        try:
+            (fout1, fout2) = (os.path.join(tmpdir, 'photos.csv'), os.path.join(tmpdir, 'stats.csv'))
+            main_streaming(self.fin, fout1, fout2, 144.597363, -38.072257, 145.360413, -37.591764, 2, 1, \
+                           tmpdir=tmpdir, fan_in=2, run_bytes=100)
+            with open(fout1, 'r') as f1, open(fout2, 'r') as f2:
+                self.assertEqual([f1.read(), f2.read()], results[:2])
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['photos.csv', 'stats.csv'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+    def test_main_incremental(self):
+        def read_tables(fout1, fout2):
+            """Trajectories as (stats row, photo rows) without Trajectory_ID"""
+            photos = dict()
+            with open(fout1, 'r') as f:
+                for line in f.readlines()[1:]:
+                    t = line.rstrip('\n').split(',', 1)
+                    photos.setdefault(t[0], []).append(t[1])
+            with open(fout2, 'r') as f:
+                rows = [line.rstrip(' \n').split(',', 1) for line in f.readlines()[1:]]
+            self.assertEqual([t[0] for t in rows], [str(x) for x in range(len(rows))])
+            self.assertEqual(sorted(photos.keys()), sorted(t[0] for t in rows))
+            return sorted((t[1], photos[t[0]]) for t in rows)
+
+        with open(self.fin, 'r') as f:
+            header = f.readline()
+            lines = f.readlines()
+        cutoffs = ['2010-01-09 09:38', '2010-01-26 10:00', '2011-03-18 09:00', '2011-03-18 22:40', '9999']
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for (min_photos, time_gap) in [(1, 8), (2, 1), (3, 24)]:
+                with self.subTest(min_photos=min_photos, time_gap=time_gap):
+                    params = (144.597363, -38.072257, 145.360413, -37.591764, min_photos, time_gap)
+                    fout1 = os.path.join(tmpdir, 'photos.csv')
+                    fout2 = os.path.join(tmpdir, 'stats.csv')
+                    main(self.fin, fout1, fout2, *params)
+                    expected = read_tables(fout1, fout2)
+
+                    # a first run of all photos, the stats rows are padded but read as the same frame by pandas
+                    (fpadded, fstate) = (os.path.join(tmpdir, 'padded.csv'), os.path.join(tmpdir, 'state.json'))
+                    main_incremental(self.fin, os.path.join(tmpdir, 'photos0.csv'), fpadded, fstate, *params)
+                    os.unlink(fstate)
+                    with open(fpadded, 'r') as f1, open(fout2, 'r') as f2:
+                        self.assertNotEqual(f1.read(), f2.read())
+                    pd.testing.assert_frame_equal(pd.read_csv(fpadded, parse_dates=[3], skipinitialspace=True), \
+                                                  pd.read_csv(fout2, parse_dates=[3], skipinitialspace=True))
+
+                    fstate = os.path.join(tmpdir, 'state.json')
+                    fdelta = os.path.join(tmpdir, 'delta.csv')
+                    for i in range(len(cutoffs)):
+                        with open(fdelta, 'w') as f:
+                            f.write(header + ''.join(line for line in lines if \
+                                    (i == 0 or line.split(',')[2] >= cutoffs[i-1]) and line.split(',')[2] < cutoffs[i]))
+                        main_incremental(fdelta, fout1, fout2, fstate, *params)
+                    self.assertEqual(read_tables(fout1, fout2), expected)
+
+                    # rows of an interrupted update are dropped, patched rows restored
+                    with open(fstate, 'r') as f:
+                        state = json.load(f)
+                    with open(fout1, 'a') as f:
+                        f.write('0,1,2\n')
+                    with open(fout2, 'a') as f:
+                        f.write('0,1,2\n')
+                    patch_stats(fout2, fstate, state, state['next_tid'], [(0, '0,1,2')])
+                    with open(fdelta, 'w') as f:
+                        f.write(header)
+                    main_incremental(fdelta, fout1, fout2, fstate, *params)
+                    self.assertEqual(read_tables(fout1, fout2), expected)
+
+                    # a delta of one user rewrites one shard of the state, trajectory_stats.csv is patched in place
+                    t = lines[-1].split(',')
+                    (uid, t[2]) = (t[1].strip(), '2099' + t[2][4:])
+                    with open(fdelta, 'w') as f:
+                        f.write(header + ','.join(t))
+                    inode = os.stat(fout2).st_ino
+                    main_incremental(fdelta, fout1, fout2, fstate, *params)
+                    with open(fstate, 'r') as f:
+                        shards = json.load(f)['shards']
+                    self.assertEqual([i for i in range(STATE_SHARDS) if shards[i] != state['shards'][i]], \
+                                     [user_shard(uid)])
+                    self.assertEqual(os.stat(fout2).st_ino, inode)
+                    self.assertEqual(len(os.listdir(fstate + '.open')), sum(x > 0 for x in shards))
+                    with open(fout2, 'rb') as f:
+                        self.assertTrue(all(len(line) == STATS_ROW_BYTES for line in f.readlines()[1:]))
+
+                    # photos older than the ones seen before
+                    with open(fdelta, 'w') as f:
+                        f.write(header + lines[0])
+                    self.assertRaises(ValueError, main_incremental, fdelta, fout1, fout2, fstate, *params)
+                    os.unlink(fstate)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
     def test_calc_dist(self):
         coords = [(-37.85967, 144.73251), (-37.8615, 144.73306), (-38.14967, 144.32739)]
         index = [(0, 1), (0, 2), (1, 2)]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import unittest
+import tempfile
+import zipfile
+import shutil
+import os
+import re
+from xml.etree import ElementTree
+from traj_store import TrajectoryStore
+from kml_export import export_kml, export_kml_shards
+
+
+class KmlExportTestCase(unittest.TestCase):
+    def setUp(self):
+        t2data = """\
+Trajectory_ID, User_ID, #Photo, Start_Time, Travel_Distance(km), Total_Time(min), Average_Speed(km/h)
+26519,99804259@N00,3,2013-12-28 19:31:54,0.44294172719428504,84.01666666666667,0.3163241852607471
+"""
+        t1data = """\
+Trajectory_ID, Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, Marker(photo=0 video=1), URL
+26519,11617521194,99804259@N00,2013-12-28 19:31:54,144.962463,-37.810136,16,0,http://www.flickr.com/photos/99804259@N00/11617521194/
+26519,11617542904,99804259@N00,2013-12-28 19:48:28,144.96588,-37.812213,16,0,http://www.flickr.com/photos/99804259@N00/11617542904/
+26519,11617370033,99804259@N00,2013-12-28 20:55:55,144.966658,-37.812346,16,0,http://www.flickr.com/photos/99804259@N00/11617370033/
+"""
+        self.kmlstr = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document id="001">
+<name>Trajectories</name>
+<description>Trajectory visualization</description>
+<visibility>1</visibility>
+<Style id="style1">
+<LineStyle>
+<color>2f0000ff</color>
+<width>3</width>
+</LineStyle>
+</Style>
+<Placemark id="26519">
+<name>Trajectory_26519</name>
+<description>User_ID: 99804259@N00&lt;br/&gt;Start_Time: 2013-12-28 19:31:54&lt;br/&gt;Travel_Distance: 0.44 km&lt;br/&gt;Total_Time: 84.02 min&lt;br/&gt;Average_Speed: 0.32 km/h&lt;br/&gt;#Photos: 3&lt;br/&gt;Photos: [11617521194, 11617542904, 11617370033]</description>
+<visibility>1</visibility>
+<styleUrl>#style1</styleUrl>
+<LineString>
+<coordinates>144.962463,-37.810136 144.965880,-37.812213 144.966658,-37.812346</coordinates>
+</LineString>
+</Placemark>
+<Placemark id="11617521194">
+<name>Photo_11617521194</name>
+<description>Trajectory_ID: 26519&lt;br/&gt;Photo_ID: 11617521194&lt;br/&gt;User_ID: 99804259@N00&lt;br/&gt;Timestamp: 2013-12-28 19:31:54&lt;br/&gt;Coordinates: (144.962463, -37.810136)&lt;br/&gt;Accuracy: 16&lt;br/&gt;URL: http://www.flickr.com/photos/99804259@N00/11617521194/</description>
+<visibility>1</visibility>
+<Point>
+<coordinates>144.962463,-37.810136</coordinates>
+</Point>
+</Placemark>
+<Placemark id="11617542904">
+<name>Photo_11617542904</name>
+<description>Trajectory_ID: 26519&lt;br/&gt;Photo_ID: 11617542904&lt;br/&gt;User_ID: 99804259@N00&lt;br/&gt;Timestamp: 2013-12-28 19:48:28&lt;br/&gt;Coordinates: (144.96588, -37.812213)&lt;br/&gt;Accuracy: 16&lt;br/&gt;URL: http://www.flickr.com/photos/99804259@N00/11617542904/</description>
+<visibility>1</visibility>
+<Point>
+<coordinates>144.965880,-37.812213</coordinates>
+</Point>
+</Placemark>
+<Placemark id="11617370033">
+<name>Photo_11617370033</name>
+<description>Trajectory_ID: 26519&lt;br/&gt;Photo_ID: 11617370033&lt;br/&gt;User_ID: 99804259@N00&lt;br/&gt;Timestamp: 2013-12-28 20:55:55&lt;br/&gt;Coordinates: (144.966658, -37.812346)&lt;br/&gt;Accuracy: 16&lt;br/&gt;URL: http://www.flickr.com/photos/99804259@N00/11617370033/</description>
+<visibility>1</visibility>
+<Point>
+<coordinates>144.966658,-37.812346</coordinates>
+</Point>
+</Placemark>
+</Document>
+</kml>
+"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.ftable1 = os.path.join(self.tmpdir, 'trajectory_photos.csv')
+        self.ftable2 = os.path.join(self.tmpdir, 'trajectory_stats.csv')
+        with open(self.ftable1, 'w') as f:
+            f.write(t1data)
+        with open(self.ftable2, 'w') as f:
+            f.write(t2data)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def test_export_kml(self):
+        # the same as traj_visualise.gen_kml()
+        fout = os.path.join(self.tmpdir, 'out.kml')
+        with TrajectoryStore(self.ftable1, self.ftable2) as store:
+            export_kml(fout, store, [26519])
+        with open(fout, 'r') as f:
+            kmlstr1 = re.sub(r'\n\s+', '\n', f.read())
+        self.assertEqual(kmlstr1, self.kmlstr)
+
+
+    def test_export_kmz_shards(self):
+        # copies of the trajectory with different IDs
+        with open(self.ftable1, 'r') as f:
+            lines1 = f.readlines()
+        with open(self.ftable2, 'r') as f:
+            lines2 = f.readlines()
+        with open(self.ftable1, 'w') as f:
+            f.write(lines1[0] + ''.join(str(tid) + line[5:] for tid in range(5) for line in lines1[1:]))
+        with open(self.ftable2, 'w') as f:
+            f.write(lines2[0] + ''.join(str(tid) + line[5:] for tid in range(5) for line in lines2[1:]))
+
+        fout = os.path.join(self.tmpdir, 'out.kml')
+        with TrajectoryStore(self.ftable1, self.ftable2) as store:
+            export_kml(fout, store, [4, 0, 2], ['a', 'b', 'c'])
+            fnames = export_kml_shards(os.path.join(self.tmpdir, 'out.kmz'), store, [4, 0, 2], ['a', 'b', 'c'], \
+                                       shard_size=2, batch_size=1)
+        self.assertEqual([os.path.basename(x) for x in fnames], ['out.000.kmz', 'out.001.kmz'])
+
+        ns = '{http://www.opengis.net/kml/2.2}'
+        names = []
+        for fname in fnames:
+            with zipfile.ZipFile(fname) as z:
+                root = ElementTree.fromstring(z.read('doc.kml'))
+            names += [pm.findtext(ns + 'name') for pm in root.iter(ns + 'Placemark')]
+        root = ElementTree.parse(fout).getroot()
+        self.assertEqual(sorted(names), sorted(pm.findtext(ns + 'name') for pm in root.iter(ns + 'Placemark')))
+        self.assertEqual(names[:3], ['Trajectory_4_a', 'Trajectory_0_b', 'Photo_11617521194'])
+        self.assertEqual(names[8], 'Trajectory_2_c')
+        self.assertEqual(len(names), 3 * 4)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import os
+import time
+import unittest
+import itertools
+import tempfile
+import numpy as np
+import pandas as pd
+from poi_info import calc_poi_info
+from rank_features import FeatureEngine
+from ranksvm import RankSVM, recommend
+from loo_eval import calc_F1, calc_pairsF1, find_path, find_path_simple, LeaveOneOut, evaluate_all, write_table, \
+                     load_recommendations, latency_percentiles, METHODS, EXTERNAL, RANK_C
+from test_poi_info import gen_traj_all
+
+
+def calc_pairsF1_loop(y, y_hat):
+    """pairs-F1 of data/Melb_recommendations_pairsF1.csv"""
+    (n, nr) = (len(y), len(y_hat))
+    order_dict = dict((poi, i) for (i, poi) in enumerate(y))
+    nc = 0
+    for i in range(nr):
+        for j in range(i+1, nr):
+            (poi1, poi2) = (y_hat[i], y_hat[j])
+            if poi1 in order_dict and poi2 in order_dict and poi1 != poi2:
+                if order_dict[poi1] < order_dict[poi2]: nc += 1
+    if nc == 0: return 0
+    precision = nc / (nr * (nr - 1) / 2)
+    recall = nc / (n * (n - 1) / 2)
+    return 2 * precision * recall / (precision + recall)
+
+
+def find_path_loop(V, E, ps, pe, L, withNodeWeight=False, alpha=0.5):
+    """find_path() in dataset_Melb.ipynb"""
+    beta = 1 - alpha
+    A = pd.DataFrame(data=np.zeros((L-1, V.shape[0]), dtype=float), columns=V.index, index=np.arange(2, L+1))
+    B = pd.DataFrame(data=np.zeros((L-1, V.shape[0]), dtype=int), columns=V.index, index=np.arange(2, L+1))
+    A += np.inf
+    for v in V.index:
+        if v != ps:
+            if withNodeWeight == True:
+                A.loc[2, v] = alpha * (V.loc[ps, 'weight'] + V.loc[v, 'weight']) + beta * E.loc[ps, v]
+            else:
+                A.loc[2, v] = E.loc[ps, v]
+            B.loc[2, v] = ps
+    for l in range(3, L+1):
+        for v in V.index:
+            if withNodeWeight == True:
+                values = [A.loc[l-1, v1] + alpha * V.loc[v, 'weight'] + beta * E.loc[v1, v] for v1 in V.index]
+            else:
+                values = [A.loc[l-1, v1] + E.loc[v1, v] for v1 in V.index]
+            minix = np.argmin(values)
+            A.loc[l, v] = values[minix]
+            B.loc[l, v] = V.index[minix]
+    path = [pe]
+    v = path[-1]
+    l = L
+    while l >= 2:
+        path.append(B.loc[l, v])
+        v = path[-1]
+        l -= 1
+    path.reverse()
+    return path
+
+
+def path_cost(E, path, weights=None, alpha=0.5):
+    path = np.asarray(path)
+    if weights is None: return E[path[:-1], path[1:]].sum()
+    return alpha * weights[path].sum() + (1 - alpha) * E[path[:-1], path[1:]].sum()
+
+
+class LeaveOneOutTestCase(unittest.TestCase):
+    def test_F1(self):
+        rng = np.random.RandomState(0)
+        for _ in range(200):
+            y = rng.choice(12, rng.randint(2, 8), replace=False).tolist()
+            y_hat = rng.randint(0, 12, size=len(y)).tolist()  # with loops
+            self.assertAlmostEqual(calc_pairsF1(y, y_hat), calc_pairsF1_loop(y, y_hat), places=12)
+            intersize = len(set(y) & set(y_hat))
+            expected = 0 if intersize == 0 else 2 * intersize / (len(y) + len(y_hat))
+            self.assertAlmostEqual(calc_F1(y, y_hat), expected, places=12)
+        self.assertEqual((calc_F1([1, 2, 3], [1, 2, 3]), calc_pairsF1([1, 2, 3], [1, 2, 3])), (1, 1))
+        self.assertEqual(calc_pairsF1([1, 2, 3], [3, 2, 1]), 0)
+
+
+    def test_find_path(self):
+        rng = np.random.RandomState(1)
+        N = 8
+        pois = np.arange(N) * 2 + 3
+        for trial in range(6):
+            E = -np.log(rng.dirichlet(np.ones(N), size=N))
+            E[np.arange(N), np.arange(N)] = np.inf
+            weights = rng.rand(N) * 3
+            (ps, pe) = rng.choice(N, 2, replace=False).tolist()
+            V = pd.DataFrame({'weight': weights}, index=pois)
+            Edf = pd.DataFrame(E, index=pois, columns=pois)
+            for L in [3, 4, 6]:
+                with self.subTest(trial=trial, L=L):
+                    self.assertEqual(pois[find_path(E, ps, pe, L)].tolist(), find_path_loop(V, Edf, pois[ps], pois[pe], L))
+                    self.assertEqual(pois[find_path(E, ps, pe, L, weights)].tolist(), \
+                                     find_path_loop(V, Edf, pois[ps], pois[pe], L, withNodeWeight=True))
+                    # the simple path of the minimum cost
+                    for w in [None, weights]:
+                        path = find_path_simple(E, ps, pe, L, weights=w)
+                        self.assertEqual((path[0], path[-1], len(path), len(set(path))), (ps, pe, L, L))
+                        best = min(path_cost(E, (ps,) + y + (pe,), w) \
+                                   for y in itertools.permutations([p for p in range(N) if p not in {ps, pe}], L - 2))
+                        self.assertAlmostEqual(path_cost(E, path, w), best, places=10)
+        self.assertIsNone(find_path_simple(E, ps, pe, N, deadline=time.time() - 1))
+
+
+    def test_evaluate(self):
+        (traj_all, poi_all) = gen_traj_all(ntrajs=120, npois=20)
+        poi_clusters = pd.DataFrame({'clusterID': np.arange(len(poi_all)) % 3}, index=poi_all.index)
+        loo = LeaveOneOut(traj_all, poi_all, poi_clusters, budget=60)
+        trajid_list = [tid for tid in loo.trajid_set_all if len(loo.traj_dict[tid]) > 2][:12]
+        results = evaluate_all(loo, trajid_list)
+        parallel = evaluate_all(loo, trajid_list, workers=2)
+        self.assertEqual(dict((tid, parallel[tid][0]) for tid in trajid_list), \
+                         dict((tid, results[tid][0]) for tid in trajid_list))
+
+        tid = trajid_list[0]
+        traj = loo.traj_dict[tid]
+        (recs, times) = results[tid]
+        for method in METHODS:
+            if method in EXTERNAL:
+                self.assertIsNone(recs[method])
+                continue
+            self.assertEqual((recs[method][0], recs[method][-1], len(recs[method])), (traj[0], traj[-1], len(traj)))
+            self.assertTrue(method == 'REAL' or method in times)
+        for method in ['PoiPopularity', 'PoiRank', 'MarkovPath', 'Rank+MarkovPath']:
+            self.assertEqual(len(set(recs[method])), len(traj))
+        self.assertEqual(recs['REAL'], traj)
+
+        # the same as recomputing the fold from scratch
+        trajid_train = [x for x in loo.trajid_set_all if x != tid]
+        poi_info = calc_poi_info(trajid_train, traj_all, poi_all)
+        pop = poi_info.sort_values(by='popularity', ascending=False, kind='stable').index.tolist()
+        self.assertEqual(recs['PoiPopularity'], [traj[0]] + [x for x in pop if x not in {traj[0], traj[-1]}][:len(traj)-2] \
+                                                + [traj[-1]])
+        engine = FeatureEngine(poi_info)
+        (_, labels, qids, X) = engine.train_data(trajid_train, loo.traj_dict, loo.query_id_dict)
+        (pois, scores) = RankSVM().fit(X, labels, qids, cost=RANK_C).predict_queries(engine, [(traj[0], traj[-1], len(traj))])
+        self.assertEqual(recs['PoiRank'], recommend(pois, scores[0], traj[0], traj[-1], len(traj)))
+
+        percentiles = latency_percentiles(results)
+        self.assertEqual(percentiles.loc['PoiRank', 'count'], len(trajid_list))
+        self.assertTrue(np.all(np.diff(percentiles.values[:, 1:], axis=1) >= 0))
+
+        # tables
+        recs = dict((tid, results[tid][0]) for tid in trajid_list)
+        F1s = dict((tid, dict((m, None if r is None else calc_F1(recs[tid]['REAL'], r)) for (m, r) in recs[tid].items())) \
+                   for tid in trajid_list)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'recommendations.csv')
+            write_table(fname, trajid_list, recs)
+            self.assertEqual(load_recommendations(fname), recs)
+            write_table(fname, trajid_list, F1s)
+            with open(fname, 'r') as f:
+                lines = f.read().splitlines()
+        self.assertEqual(lines[0], ';'.join('"%s"' % x for x in ['trajID'] + METHODS))
+        self.assertEqual(lines[1], '%d;"1.0";' % tid + ';'.join('"%s"' % F1s[tid][m] for m in METHODS[1:7]) + ';"NA";"NA";"NA"')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import unittest
+import tempfile
+import shutil
+import os
+from datetime import datetime
+from photo_table import csv_to_columnar, load_columnar, load_csv, is_columnar, ColumnarWriter, \
+                        StringColumn, FlickrUrlColumn
+from generate_tables import load_data, gen_trajectories
+
+
+def records(table):
+    return [table[i] for i in range(len(table))]
+
+
+class PhotoTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.datastr = """\
+Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, URL, Marker(photo=0 video=1)
+4257224959,26303188@N00,2010-01-09 09:39:19.0,145.314132,-37.765855,16,http://www.flickr.com/photos/26303188@N00/4257224959/,0
+4258044588,26303188@N00,2010-01-09 10:08:50.0,145.314042,-37.765869,16,http://www.flickr.com/photos/26303188@N00/4258044588/,0
+4257973354,26303188@N00,2010-01-09 09:36:11.0,145.314132,-37.765855,16,http://www.flickr.com/photos/26303188@N00/4257973354/,0
+8246699008,89521819@N07,2012-11-23 23:50:37.0,145.011763,-37.768543,14,http://www.flickr.com/photos/89521819@N07/8246699008/,0
+8246697974,89521819@N07,2012-11-23 23:54:11.0,145.011763,-37.768543,14,http://www.flickr.com/photos/89521819@N07/8246697974/,1
+5548843638,52361622@N02,2011-03-18 22:36:54.0,145.387573,-37.581589,7,http://www.flickr.com/photos/52361622@N02/5548843638/,0
+5548265115,52361622@N02,2011-03-18 09:27:31.0,144.997619,-37.827316,15,http://www.flickr.com/photos/52361622@N02/5548265115/,0
+"""
+        fi = tempfile.NamedTemporaryFile(mode='w', delete=False)
+        fi.write(self.datastr)
+        self.fin = fi.name
+        fi.close()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'photos.cols')
+
+
+    def tearDown(self):
+        os.unlink(self.fin)
+        shutil.rmtree(self.tmpdir)
+
+
+    def test_roundtrip(self):
+        csv_to_columnar(self.fin, self.path)
+        self.assertTrue(is_columnar(self.path))
+        self.assertFalse(is_columnar(self.fin))
+        table = load_columnar(self.path)
+        self.assertEqual(len(table), 7)
+        self.assertEqual(table.users, ['26303188@N00', '89521819@N07', '52361622@N02'])
+        self.assertEqual(table.user.tolist(), [0, 0, 0, 1, 1, 2, 2])
+        self.assertEqual(records(table), records(load_data(self.fin)))
+        self.assertEqual(load_data(self.path)[4], load_data(self.fin)[4])
+
+        fcsv = os.path.join(self.tmpdir, 'photos.csv')
+        table.to_csv(fcsv)
+        with open(fcsv, 'r') as f:
+            self.assertEqual(f.read(), self.datastr)
+
+
+    def test_fraction(self):
+        """Whole seconds round trip in any format of '%f', a fraction of a second is an error, not dropped"""
+        fcsv = os.path.join(self.tmpdir, 'photos.csv')
+        with open(fcsv, 'w') as f:
+            f.write(self.datastr.replace('09:39:19.0', '09:39:19').replace('10:08:50.0', '10:08:50.000000'))
+        csv_to_columnar(fcsv, self.path)
+        fout = os.path.join(self.tmpdir, 'photos2.csv')
+        load_columnar(self.path).to_csv(fout)
+        with open(fout, 'r') as f:
+            self.assertEqual(f.read(), self.datastr)
+
+        with open(fcsv, 'w') as f:
+            f.write(self.datastr.replace('09:39:19.0', '09:39:19.25'))
+        with self.assertRaises(ValueError):
+            csv_to_columnar(fcsv, os.path.join(self.tmpdir, 'fraction.cols'))
+        with self.assertRaises(ValueError):
+            load_csv(fcsv)
+
+
+    def test_load_csv(self):
+        table = load_csv(self.fin)
+        self.assertEqual(len(table), 7)
+        self.assertIsInstance(table.url, FlickrUrlColumn)  # all URLs follow the Flickr pattern
+        self.assertEqual(table[4], ('8246697974', '89521819@N07', datetime(2012, 11, 23, 23, 54, 11), 145.011763, \
+                                    -37.768543, 14, 'http://www.flickr.com/photos/89521819@N07/8246697974/', 1))
+        self.assertEqual([table.pid.dtype, table.user.dtype, table.time.dtype, table.acc.dtype], ['int64', 'int32', 'int64', 'int8'])
+
+        fcsv = os.path.join(self.tmpdir, 'photos.csv')
+        with open(fcsv, 'w') as f:
+            f.write(self.datastr.replace('/5548265115/', '/5548265115/in/photostream/'))
+        table = load_csv(fcsv, chunk_size=200)  # URLs of the earlier chunks are recovered
+        self.assertIsInstance(table.url, StringColumn)
+        self.assertEqual(table.url[6], 'http://www.flickr.com/photos/52361622@N02/5548265115/in/photostream/')
+        self.assertEqual(records(table)[:6], records(load_csv(self.fin))[:6])
+
+
+    def test_gen_trajectories(self):
+        csv_to_columnar(self.fin, self.path)
+        self.assertEqual(gen_trajectories(load_data(self.path)), gen_trajectories(load_data(self.fin)))
+
+
+    def test_writer(self):
+        # lines can be split at any position between calls
+        lines = self.datastr[self.datastr.index('\n') + 1:]
+        with ColumnarWriter(self.path) as writer:
+            for i in range(0, len(lines), 37):
+                writer.write(lines[i:i+37])
+        table = load_columnar(self.path)
+        self.assertEqual(records(table), records(load_data(self.fin)))
+
+        empty = os.path.join(self.tmpdir, 'empty.cols')
+        with ColumnarWriter(empty):
+            pass
+        self.assertEqual(len(load_columnar(empty)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+import os
+import sys
+import unittest
+import importlib
+import tempfile
+import numpy as np
+from datetime import datetime
+from pipeline import Stage, Pipeline, build_pipeline, stage_code, BBOX
+from generate_tables import main as generate_tables_main
+
+
+def gen_yfcc(fname, seed=0, nusers=6, nphotos=40):
+    """Synthetic YFCC100M records, photos of a few users in Melbourne (a few outside of the big box)"""
+    rng = np.random.RandomState(seed)
+    with open(fname, 'w') as f:
+        for i in range(nphotos):
+            user = rng.randint(nusers)
+            t = datetime.fromtimestamp(1.3e9 + user * 1e6 + rng.randint(0, 3) * 1e5 + rng.randint(0, 7200)) \
+                .strftime('%Y-%m-%d %H:%M:%S.0')
+            (lng, lat) = (144.9 + rng.rand() * 0.1, -37.85 + rng.rand() * 0.1) if rng.rand() < 0.9 else (10.0, 50.0)
+            pid = str(10**9 + i)
+            uid = '%d@N0%d' % (10**7 + user, user % 10)
+            fields = [pid, uid, 'nick', t, '1400000000', 'cam', 'title', 'desc', 'tags', '', \
+                      '%.6f' % lng, '%.6f' % lat, '16', 'http://www.flickr.com/photos/%s/%s/' % (uid, pid), \
+                      'http://farm1.staticflickr.com/x.jpg', 'license', 'http://creativecommons.org/', '1', '1', \
+                      'abc', 'abc', 'jpg', '0']
+            f.write('\t'.join(fields) + '\n')
+
+
+def stage_copy(inputs, outputs, suffix, flog):
+    """Concatenate inputs and append suffix, log the call to flog"""
+    with open(flog, 'a') as f:
+        f.write(os.path.basename(outputs[0]) + '\n')
+    text = ''
+    for fin in inputs:
+        with open(fin, 'r') as f:
+            text += f.read()
+    with open(outputs[0], 'w') as f:
+        f.write(text + suffix)
+
+
+def stage_fail(inputs, outputs):
+    with open(outputs[0], 'w') as f:
+        f.write('partial')
+    raise ValueError('failed')
+
+
+class PipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+        self.fin = os.path.join(self.dir, 'input.txt')
+        self.flog = os.path.join(self.dir, 'log.txt')
+        with open(self.fin, 'w') as f:
+            f.write('x')
+
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def toy_pipeline(self, suffix_b='b'):
+        """a --> b, a --> c, (b, c) --> d"""
+        pipeline = Pipeline(os.path.join(self.dir, 'cache'))
+        options = {'flog': self.flog}
+        pipeline.add(Stage('a', stage_copy, [self.fin], ['a.txt'], {'suffix': 'a'}, options))
+        pipeline.add(Stage('b', stage_copy, [('a', 'a.txt')], ['b.txt'], {'suffix': suffix_b}, options))
+        pipeline.add(Stage('c', stage_copy, [('a', 'a.txt')], ['c.txt'], {'suffix': 'c'}, options))
+        pipeline.add(Stage('d', stage_copy, [('b', 'b.txt'), ('c', 'c.txt')], ['d.txt'], {'suffix': 'd'}, options))
+        return pipeline
+
+
+    def calls(self):
+        if not os.path.exists(self.flog): return []
+        with open(self.flog, 'r') as f:
+            calls = f.read().split()
+        os.unlink(self.flog)
+        return sorted(calls)
+
+
+    def read(self, pipeline, name, output):
+        with open(pipeline.artifact(name, output), 'r') as f:
+            return f.read()
+
+
+    def test_cache(self):
+        pipeline = self.toy_pipeline()
+        (keys, status) = pipeline.run()
+        self.assertEqual(self.calls(), ['a.txt', 'b.txt', 'c.txt', 'd.txt'])
+        self.assertEqual(self.read(pipeline, 'd', 'd.txt'), 'xabxacd')
+        self.assertFalse(any(cached for (cached, _) in status.values()))
+
+        # nothing runs again, also by a new pipeline of the same stages
+        (keys2, status) = self.toy_pipeline().run()
+        self.assertEqual((self.calls(), keys2), ([], keys))
+        self.assertTrue(all(cached for (cached, _) in status.values()))
+
+        # a parameter changes the stage and its downstream stages only
+        pipeline = self.toy_pipeline(suffix_b='B')
+        (_, status) = pipeline.run(targets=['b'])
+        self.assertEqual(self.calls(), ['b.txt'])
+        self.assertEqual(sorted(status.keys()), ['a', 'b'])
+        pipeline.run(workers=2)
+        self.assertEqual(self.calls(), ['d.txt'])
+        self.assertEqual(self.read(pipeline, 'd', 'd.txt'), 'xaBxacd')
+
+        # the content of an external input changes everything, not its modification time only
+        os.utime(self.fin, (0, 0))
+        pipeline.run()
+        self.assertEqual(self.calls(), [])
+        with open(self.fin, 'w') as f:
+            f.write('y')
+        pipeline.run(workers=3)
+        self.assertEqual(self.calls(), ['a.txt', 'b.txt', 'c.txt', 'd.txt'])
+        self.assertEqual(self.read(pipeline, 'd', 'd.txt'), 'yaByacd')
+
+
+    def test_failure(self):
+        pipeline = self.toy_pipeline()
+        pipeline.add(Stage('e', stage_fail, [('a', 'a.txt')], ['e.txt']))
+        with self.assertRaises(ValueError):
+            pipeline.run(targets=['e'])
+        self.assertTrue(pipeline.is_cached('a', pipeline.keys(['a'])['a']))
+        self.assertEqual(os.listdir(os.path.join(pipeline.cache_dir, 'e')), [])
+        with self.assertRaises(ValueError):
+            pipeline.run(workers=2)
+
+
+    def test_code(self):
+        """The key changes with the stage function and the modules it imports, not with the runner"""
+        pipeline = build_pipeline(self.fin, os.path.join(self.dir, 'cache'))
+        code = dict((name, stage_code(stage.func)) for (name, stage) in pipeline.stages.items())
+        self.assertFalse(any('pipeline.py' in x for x in code.values()))
+        self.assertTrue(all(x in code['filtering'] for x in ['filtering_bigbox.py', 'photo_table.py', 'regions.py']))
+        self.assertNotIn('generate_tables.py', code['filtering'])
+        for x in ['generate_tables.py', 'photo_table.py', 'profiling.py']:
+            self.assertIn(x, code['trajectories'])
+
+        # editing a helper imported by a stage module runs the stage and its downstream stages again
+        with open(os.path.join(self.dir, 'toy_helpers.py'), 'w') as f:
+            f.write('def suffix():\n    return "h"\n')
+        with open(os.path.join(self.dir, 'toy_stages.py'), 'w') as f:
+            f.write('import toy_helpers\n\n\ndef stage_helper(inputs, outputs):\n' + \
+                    '    with open(inputs[0], "r") as fi, open(outputs[0], "w") as fo:\n' + \
+                    '        fo.write(fi.read() + toy_helpers.suffix())\n')
+        sys.path.insert(0, self.dir)
+        try:
+            import toy_stages
+            def toy_pipeline():
+                pipeline = Pipeline(os.path.join(self.dir, 'cache'))
+                pipeline.add(Stage('a', stage_copy, [self.fin], ['a.txt'], {'suffix': 'a'}, {'flog': self.flog}))
+                pipeline.add(Stage('h', toy_stages.stage_helper, [('a', 'a.txt')], ['h.txt']))
+                pipeline.add(Stage('d', stage_copy, [('h', 'h.txt')], ['d.txt'], {'suffix': 'd'}, {'flog': self.flog}))
+                return pipeline
+            (keys, _) = toy_pipeline().run()
+            self.assertEqual(self.calls(), ['a.txt', 'd.txt'])
+            self.assertEqual(self.read(toy_pipeline(), 'd', 'd.txt'), 'xahd')
+            self.assertEqual(toy_pipeline().run()[1]['d'][0], True)
+
+            with open(os.path.join(self.dir, 'toy_helpers.py'), 'w') as f:
+                f.write('def suffix():\n    return "hh"\n')
+            importlib.reload(sys.modules['toy_helpers'])
+            (keys2, status) = toy_pipeline().run()
+            self.assertEqual(self.calls(), ['d.txt'])
+            self.assertEqual([name for (name, (cached, _)) in status.items() if cached], ['a'])
+            self.assertNotEqual(keys2['h'], keys['h'])
+            self.assertEqual(self.read(toy_pipeline(), 'd', 'd.txt'), 'xahhd')
+        finally:
+            sys.path.remove(self.dir)
+            for name in ['toy_stages', 'toy_helpers']:
+                sys.modules.pop(name, None)
+
+
+    def test_build_pipeline(self):
+        fyfcc = os.path.join(self.dir, 'yfcc.txt')
+        gen_yfcc(fyfcc)
+        cache_dir = os.path.join(self.dir, 'cache')
+        views = ['most_photos', 'longest_time', 'all']
+        pipeline = build_pipeline(fyfcc, cache_dir, views=views, kml_ext='.kmz')
+        (keys, status) = pipeline.run(workers=2)
+        self.assertEqual(list(status.keys()), ['filtering', 'trajectories', 'kml_most_photos', 'kml_longest_time', \
+                                               'kml_all'])
+        fbigbox = pipeline.artifact('filtering', 'bigbox.csv')
+        with open(fbigbox, 'r') as f:
+            lines = f.read().splitlines()
+        with open(fyfcc, 'r') as f:
+            self.assertEqual(len(lines) - 1, sum(1 for line in f if '\t10.000000\t' not in line))
+
+        # the same tables as generate_tables.py
+        (fout1, fout2) = (os.path.join(self.dir, 'photos.csv'), os.path.join(self.dir, 'stats.csv'))
+        generate_tables_main(fbigbox, fout1, fout2, *BBOX)
+        for (fout, output) in [(fout1, 'trajectory_photos.csv'), (fout2, 'trajectory_stats.csv')]:
+            with open(fout, 'r') as f:
+                self.assertEqual(f.read(), self.read(pipeline, 'trajectories', output))
+        for view in views:
+            self.assertGreater(os.path.getsize(pipeline.artifact('kml_' + view, view + '.kmz')), 0)
+
+        # a new time gap does not filter again
+        pipeline = build_pipeline(fyfcc, cache_dir, time_gap=1, views=views, kml_ext='.kmz')
+        (keys2, status) = pipeline.run()
+        self.assertEqual([name for (name, (cached, _)) in status.items() if cached], ['filtering'])
+        self.assertEqual(keys2['filtering'], keys['filtering'])
+        self.assertNotEqual(keys2['kml_all'], keys['kml_all'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+import pandas as pd
+from poi_info import extract_trajs, calc_poi_info, PoiStats
+
+
+def gen_traj_all(seed=0, ntrajs=200, npois=30):
+    """Synthetic trajectory table (traj-noloop-all-Melb.csv) and POI table (poi-Melb-all.csv)"""
+    rng = np.random.RandomState(seed)
+    rows = []
+    for tid in rng.permutation(ntrajs).tolist():
+        user = 'u%d@N0%d' % (rng.randint(20), rng.randint(3))
+        tlen = rng.randint(1, 7)
+        t = rng.randint(10**9, 2 * 10**9)
+        for poi in rng.choice(npois, tlen, replace=False).tolist():
+            duration = rng.randint(0, 3) * rng.randint(1, 5000)
+            rows.append([user, tid, poi, t, t + duration, rng.randint(1, 10), tlen, duration])
+            t += duration + rng.randint(0, 2) * rng.randint(1, 3000)  # the same startTime sometimes
+    traj_all = pd.DataFrame(rows, columns=['userID', 'trajID', 'poiID', 'startTime', 'endTime', '#photo', 'trajLen', \
+                                           'poiDuration'])
+    poi_all = pd.DataFrame({'poiTheme': ['cat%d' % (x % 4) for x in range(npois)], \
+                            'poiLon': rng.uniform(144.9, 145.0, npois), 'poiLat': rng.uniform(-37.85, -37.75, npois)}, \
+                           index=pd.Index(np.arange(npois), name='poiID'))
+    return traj_all, poi_all
+
+
+class PoiInfoTestCase(unittest.TestCase):
+    def setUp(self):
+        (self.traj_all, self.poi_all) = gen_traj_all()
+
+
+    def test_extract_trajs(self):
+        traj_dict = extract_trajs(self.traj_all)
+        for tid in self.traj_all['trajID'].unique().tolist():
+            # extract_traj() in dataset_Melb.ipynb
+            traj = self.traj_all[self.traj_all['trajID'] == tid].sort_values(by=['startTime'], kind='stable')
+            self.assertEqual(traj_dict[tid], traj['poiID'].tolist())
+
+
+    def test_calc_poi_info(self):
+        trajid_list = [5, 3, 7, 3] + list(range(20, 150))
+        # calc_poi_info() in dataset_Melb.ipynb
+        poi_info = pd.concat([self.traj_all[self.traj_all['trajID'] == tid][['poiID', 'poiDuration']] \
+                              for tid in trajid_list], ignore_index=True)
+        poi_info = poi_info.groupby('poiID').agg(['mean', 'size'])
+        poi_info.columns = poi_info.columns.droplevel()
+        poi_info.rename(columns={'mean':'avgDuration', 'size':'nVisit'}, inplace=True)
+        poi_info['poiCat'] = self.poi_all.loc[poi_info.index, 'poiTheme']
+        poi_info['poiLon'] = self.poi_all.loc[poi_info.index, 'poiLon']
+        poi_info['poiLat'] = self.poi_all.loc[poi_info.index, 'poiLat']
+        pop_df = self.traj_all[self.traj_all['trajID'].isin(trajid_list)][['poiID', 'userID']]
+        pop_df = pop_df.groupby('poiID').agg(pd.Series.nunique)
+        poi_info['popularity'] = pop_df.loc[poi_info.index, 'userID']
+
+        pd.testing.assert_frame_equal(calc_poi_info(trajid_list, self.traj_all, self.poi_all), poi_info, check_exact=True)
+
+
+    def test_leave_out(self):
+        stats = PoiStats(self.traj_all, self.poi_all)
+        trajid_set_all = sorted(self.traj_all['trajID'].unique().tolist())
+        for held_out in [[], [0], [17], [199], [3, 3, 8], list(range(100, 200))]:
+            with self.subTest(held_out=held_out[:3]):
+                trajid_list = [x for x in trajid_set_all if x not in held_out]
+                pd.testing.assert_frame_equal(stats.leave_out(held_out), \
+                                              calc_poi_info(trajid_list, self.traj_all, self.poi_all), check_exact=True)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
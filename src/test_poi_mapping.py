@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+from poi_mapping import PoiIndex, calc_dist_vec, map_photos
+
+
+class PoiMappingTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.poi_lngs = np.concatenate((rng.uniform(144.9, 145.0, 300), [144.95, 144.95]))  # the last two are the same
+        self.poi_lats = np.concatenate((rng.uniform(-37.85, -37.75, 300), [-37.8, -37.8]))
+        self.lngs = np.concatenate((rng.uniform(144.85, 145.05, 2000), [144.95, 150.0]))
+        self.lats = np.concatenate((rng.uniform(-37.9, -37.7, 2000), [-37.8, -30.0]))
+        # dense distance matrix
+        self.distmat = calc_dist_vec(self.lngs[:, None], self.lats[:, None], self.poi_lngs[None, :], self.poi_lats[None, :])
+
+
+    def test_nearest(self):
+        for cell_pois in [1, 5, 16, 1000]:
+            with self.subTest(cell_pois=cell_pois):
+                index = PoiIndex(self.poi_lngs, self.poi_lats, cell_pois)
+                nearest, dists = index.nearest(self.lngs, self.lats)
+                self.assertEqual(nearest.tolist(), np.argmin(self.distmat, axis=1).tolist())
+                self.assertTrue(np.array_equal(dists, self.distmat.min(axis=1)))
+        self.assertEqual(nearest[-2], 300)  # ties are broken by position
+
+        # scan all POIs
+        nearest, dists = PoiIndex(self.poi_lngs, self.poi_lats).nearest(self.lngs, self.lats, brute_max=1000)
+        self.assertEqual(nearest.tolist(), np.argmin(self.distmat, axis=1).tolist())
+        self.assertTrue(np.array_equal(dists, self.distmat.min(axis=1)))
+
+
+    def test_within(self):
+        dist_max = 0.5
+        offsets, pois, dists = PoiIndex(self.poi_lngs, self.poi_lats, 4).within(self.lngs, self.lats, dist_max)
+        for i in range(len(self.lngs)):
+            expected = np.flatnonzero(self.distmat[i] <= dist_max)
+            self.assertEqual(pois[offsets[i]:offsets[i+1]].tolist(), expected.tolist())
+            self.assertTrue(np.array_equal(dists[offsets[i]:offsets[i+1]], self.distmat[i, expected]))
+        self.assertEqual(offsets[-1] - offsets[-2], 0)  # far from all POIs
+
+
+    def test_map_photos(self):
+        nearest = map_photos(self.lngs, self.lats, self.poi_lngs, self.poi_lats, 0.2)
+        expected = np.where(self.distmat.min(axis=1) > 0.2, -1, np.argmin(self.distmat, axis=1))
+        self.assertEqual(nearest.tolist(), expected.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import os
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+from poi_mapping import calc_dist_vec
+from poi_info import calc_poi_info, extract_trajs
+from rank_features import FeatureEngine
+from poi_store import calc_distmat, store_dir, PoiStore
+from test_poi_info import gen_traj_all
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def gen_poi_file(fname, seed=0, npois=30):
+    """Synthetic POI file (poi-Melb-all.csv), POIs not sorted and with missing values"""
+    rng = np.random.RandomState(seed)
+    poi_ids = rng.permutation(npois) * 3
+    urls = ['https://en.wikipedia.org/wiki/POI_%d,_Victoria' % x for x in poi_ids]
+    urls[1] = ''
+    poi_all = pd.DataFrame({'poiID': poi_ids, 'poiName': ['POI "%d"' % x for x in poi_ids], \
+                            'poiTheme': ['cat%d' % (x % 4) for x in poi_ids], \
+                            'poiLat': rng.uniform(-37.85, -37.75, npois), 'poiLon': rng.uniform(144.9, 145.0, npois), \
+                            'poiURL': urls, 'poiPopularity': rng.randint(0, 100, npois)})
+    poi_all.to_csv(fname, index=False)
+
+
+class PoiStoreTestCase(unittest.TestCase):
+    def test_calc_distmat(self):
+        rng = np.random.RandomState(1)
+        (lngs, lats) = (rng.uniform(-180, 180, 50), rng.uniform(-90, 90, 50))
+        expected = np.stack([calc_dist_vec(lngs[i], lats[i], lngs, lats) for i in range(len(lngs))])
+        self.assertTrue(np.array_equal(calc_distmat(lngs, lats), expected))
+        self.assertEqual(calc_distmat([], []).shape, (0, 0))
+
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpoi = os.path.join(tmpdir, 'poi.csv')
+            cache_dir = os.path.join(tmpdir, 'cache')
+            gen_poi_file(fpoi)
+            store = PoiStore(fpoi, cache_dir)
+            expected = pd.read_csv(fpoi, index_col='poiID').sort_index()
+            pd.testing.assert_frame_equal(store.poi_all, expected, check_exact=True)
+            self.assertEqual(store.poi_ids.tolist(), expected.index.tolist())
+            self.assertTrue(np.array_equal(store.distmat, calc_distmat(expected['poiLon'], expected['poiLat'])))
+            self.assertIsInstance(store.distmat, np.memmap)
+            self.assertFalse(store.poi_distmat.values.flags.writeable)
+            with self.assertRaises(ValueError):
+                store.distmat[0, 1] = 0
+
+            (p1, p2) = (expected.index[[3, 7, 7]], expected.index[[0, 5]])
+            self.assertTrue(np.array_equal(store.dist(p1, p2), store.poi_distmat.loc[p1, p2].values))
+            with self.assertRaises(AssertionError):
+                store.positions([1])
+
+            # reused while the POI file is the same, a new store otherwise
+            mtime = os.stat(os.path.join(store.path, 'distmat.npy')).st_mtime_ns
+            self.assertEqual(PoiStore(fpoi, cache_dir).path, store.path)
+            self.assertEqual(os.stat(os.path.join(store.path, 'distmat.npy')).st_mtime_ns, mtime)
+            gen_poi_file(fpoi, seed=2)
+            self.assertNotEqual(store_dir(fpoi, cache_dir), store.path)
+            store2 = PoiStore(fpoi, cache_dir)
+            pd.testing.assert_frame_equal(store2.poi_all, pd.read_csv(fpoi, index_col='poiID').sort_index())
+            self.assertEqual(sorted(os.listdir(cache_dir)), sorted([os.path.basename(store.path), \
+                                                                     os.path.basename(store2.path)]))
+
+
+    def test_feature_engine(self):
+        (traj_all, poi_all) = gen_traj_all()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpoi = os.path.join(tmpdir, 'poi.csv')
+            poi_all.reset_index().to_csv(fpoi, index=False)
+            store = PoiStore(fpoi, os.path.join(tmpdir, 'cache'))
+            traj_dict = extract_trajs(traj_all)
+            poi_info = calc_poi_info(sorted(traj_dict.keys())[:100], traj_all, store.poi_all)
+            engine = FeatureEngine(poi_info, store.poi_distmat)
+            self.assertTrue(np.allclose(engine.distmat, FeatureEngine(poi_info).distmat, rtol=0, atol=1e-12))
+
+
+    def test_melb(self):
+        fpoi = os.path.join(DATA_DIR, 'poi-Melb-all.csv')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = PoiStore(fpoi, tmpdir)
+            pd.testing.assert_frame_equal(store.poi_all, pd.read_csv(fpoi, index_col='poiID').sort_index(), \
+                                          check_exact=True)
+            self.assertEqual(store.distmat.shape, (len(store), len(store)))
+            self.assertTrue(np.allclose(store.distmat, store.distmat.T))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
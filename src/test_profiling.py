@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import os
+import sys
+import mmap
+import json
+import unittest
+import tempfile
+import subprocess
+import numpy as np
+import profiling
+from profiling import profiled
+import generate_tables
+from pipeline import BIGBOX_HEADER
+
+
+DATASTR = """\
+10000000,1@N01,2010-01-01 10:00:00.0,144.96,-37.81,16,http://www.flickr.com/photos/1@N01/10000000/,0
+10000001,1@N01,2010-01-01 10:30:00.0,144.97,-37.82,16,http://www.flickr.com/photos/1@N01/10000001/,0
+10000002,2@N01,2010-01-02 10:00:00.0,144.98,-37.83,16,http://www.flickr.com/photos/2@N01/10000002/,0
+"""
+
+
+@profiled('allocate', rows=lambda result, arguments: arguments['n'])
+def allocate(n, fail=False):
+    """Touch n float64 values (8n bytes) of new pages, memory freed by earlier tests may be reused by np.ones()"""
+    buf = mmap.mmap(-1, 8 * n)
+    x = np.frombuffer(buf, dtype=np.float64)
+    x[:] = 1
+    if fail: raise ValueError('failed')
+    total = x.sum()
+    del x
+    buf.close()
+    return total
+
+
+@profiled('count', rows='values')
+def count(values, scale=1, *args, **kwargs):
+    return len(values) * scale
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        profiling.RECORDS.clear()
+        profiling.enable()
+
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.RECORDS.clear()
+
+
+    def test_profiled(self):
+        self.assertEqual(allocate(1000), 1000)
+        rec = profiling.RECORDS[-1]
+        self.assertEqual((rec['stage'], rec['rows'], rec['pid']), ('allocate', 1000, os.getpid()))
+        self.assertAlmostEqual(rec['rows_per_sec'], 1000 / rec['seconds'])
+        self.assertGreater(rec['peak_rss_mb'], 0)
+
+        # peak RSS of a stage and of the stages inside it
+        with profiling.stage('outer') as outer:
+            allocate(50 * 2**17)  # 50MB
+            allocate(1000)
+            outer.rows = 3
+        (big, small, rec) = profiling.RECORDS[-3:]
+        self.assertEqual((rec['stage'], rec['rows']), ('outer', 3))
+        if rec['peak_rss_exact']:
+            self.assertGreater(big['peak_rss_mb'] - big['start_rss_mb'], 40)
+            self.assertLess(small['peak_rss_mb'] - small['start_rss_mb'], 20)
+        self.assertGreaterEqual(rec['peak_rss_mb'], big['peak_rss_mb'])
+
+        with self.assertRaises(ValueError):
+            allocate(10, fail=True)
+        self.assertEqual((profiling.RECORDS[-1]['error'], profiling.RECORDS[-1]['rows']), ('ValueError', None))
+
+        profiling.disable()
+        n = len(profiling.RECORDS)
+        allocate(10)
+        self.assertEqual(len(profiling.RECORDS), n)
+
+
+    def test_arguments(self):
+        """rows of a parameter passed by position or keyword"""
+        self.assertEqual(count([1, 2, 3]) + count(values=[1, 2], scale=2) + count([1], 3, 4, x=5), 10)
+        self.assertEqual([rec['rows'] for rec in profiling.RECORDS], [3, 2, 1])
+        with self.assertRaises(TypeError):
+            count(scale=2)
+        profiling.disable()
+        self.assertEqual(count(values=[1, 2]), 2)
+
+
+    def test_keywords(self):
+        """Stages called with keyword arguments are recorded too"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fin = os.path.join(tmpdir, 'bigbox.csv')
+            with open(fin, 'w') as f:
+                f.write(BIGBOX_HEADER + DATASTR)
+            data = generate_tables.load_data(fname=fin)
+            trajs = generate_tables.gen_trajectories(data=data, time_gap=8)
+            trajs = generate_tables.filter_trajectories(lng_min=144, lat_min=-38, lng_max=145, lat_max=-37, \
+                                                        trajlist=trajs, data=data, min_photos_per_traj=1)
+            (fout1, fout2) = (os.path.join(tmpdir, 'photos.csv'), os.path.join(tmpdir, 'stats.csv'))
+            generate_tables.dump_trajectories(fout1=fout1, fout2=fout2, trajlist=trajs, data=data)
+            with open(fout1, 'r') as f:
+                self.assertEqual(len(f.readlines()), 4)
+            (offsets, index) = generate_tables.segment_trajectories(time_gap=8, data=data)
+            (offsets, index) = generate_tables.filter_segments(144, -38, 145, -37, data=data, index=index, \
+                                                               offsets=offsets, min_photos_per_traj=2)
+            generate_tables.dump_segments(data=data, index=index, offsets=offsets, fout2=fout2, fout1=fout1)
+        self.assertEqual([(rec['stage'], rec['rows']) for rec in profiling.RECORDS], \
+                         [('load_data', 3), ('gen_trajectories', 3), ('filter_trajectories', 3), \
+                          ('dump_trajectories', 3), ('gen_trajectories', 3), ('filter_trajectories', 3), \
+                          ('dump_trajectories', 2)])
+
+
+    def test_env(self):
+        """FLICKR_PROFILE=FILE records the stages of generate_tables.py"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (fin, fprofile) = (os.path.join(tmpdir, 'bigbox.csv'), os.path.join(tmpdir, 'profile.json'))
+            with open(fin, 'w') as f:
+                f.write(BIGBOX_HEADER + DATASTR)
+            env = dict(os.environ, FLICKR_PROFILE=fprofile)
+            srcdir = os.path.dirname(os.path.abspath(__file__))
+            subprocess.check_call([sys.executable, os.path.join(srcdir, 'generate_tables.py'), fin], env=env, \
+                                  cwd=srcdir, stdout=subprocess.DEVNULL)
+            with open(fprofile, 'r') as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual([rec['stage'] for rec in records], \
+                         ['load_data', 'gen_trajectories', 'filter_trajectories', 'dump_trajectories'])
+        self.assertEqual([rec['rows'] for rec in records], [3, 3, 3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
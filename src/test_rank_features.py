@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+import pandas as pd
+from poi_mapping import calc_dist_vec
+from poi_info import extract_trajs, calc_poi_info
+from rank_features import DF_COLUMNS, FeatureEngine, gen_query_id_dict, gen_train_df, gen_test_df, gen_data_str
+from test_poi_info import gen_traj_all
+
+
+def gen_train_subdf(poi_id, query_id_set, poi_info, query_id_rdict, poi_distmat):
+    """gen_train_subdf() in dataset_Melb.ipynb"""
+    columns = DF_COLUMNS
+    df_ = pd.DataFrame(data=np.zeros((len(query_id_set), len(columns)), dtype=float), columns=columns)
+    pop = poi_info.loc[poi_id, 'popularity']; nvisit = poi_info.loc[poi_id, 'nVisit']
+    cat = poi_info.loc[poi_id, 'poiCat']; duration = poi_info.loc[poi_id, 'avgDuration']
+    for j in range(len(query_id_set)):
+        qid = query_id_set[j]
+        (p0, pN, trajLen) = query_id_rdict[qid]
+        idx = df_.index[j]
+        df_.loc[idx, 'poiID'] = poi_id
+        df_.loc[idx, 'queryID'] = qid
+        df_.loc[idx, 'popularity'] = pop
+        df_.loc[idx, 'nVisit'] = nvisit
+        df_.loc[idx, 'avgDuration'] = duration
+        df_.loc[idx, 'sameCatStart'] = 1 if cat == poi_info.loc[p0, 'poiCat'] else -1
+        df_.loc[idx, 'sameCatEnd']   = 1 if cat == poi_info.loc[pN, 'poiCat'] else -1
+        df_.loc[idx, 'distStart'] = poi_distmat.loc[poi_id, p0]
+        df_.loc[idx, 'distEnd']   = poi_distmat.loc[poi_id, pN]
+        df_.loc[idx, 'trajLen'] = trajLen
+        df_.loc[idx, 'diffPopStart'] = pop - poi_info.loc[p0, 'popularity']
+        df_.loc[idx, 'diffPopEnd']   = pop - poi_info.loc[pN, 'popularity']
+        df_.loc[idx, 'diffNVisitStart'] = nvisit - poi_info.loc[p0, 'nVisit']
+        df_.loc[idx, 'diffNVisitEnd']   = nvisit - poi_info.loc[pN, 'nVisit']
+        df_.loc[idx, 'diffDurationStart'] = duration - poi_info.loc[p0, 'avgDuration']
+        df_.loc[idx, 'diffDurationEnd']   = duration - poi_info.loc[pN, 'avgDuration']
+    return df_
+
+
+def gen_train_df_loop(trajid_list, traj_dict, poi_info, query_id_dict, poi_distmat):
+    """gen_train_df() in dataset_Melb.ipynb"""
+    train_trajs = [traj_dict[x] for x in trajid_list if len(traj_dict[x]) > 2]
+    qid_set = sorted(set([query_id_dict[(t[0], t[-1], len(t))] for t in train_trajs]))
+    poi_set = set()
+    for tr in train_trajs:
+        poi_set = poi_set | set(tr)
+    query_id_rdict = dict((v, k) for (k, v) in query_id_dict.items())
+    df_ = pd.concat([gen_train_subdf(poi, qid_set, poi_info, query_id_rdict, poi_distmat) for poi in poi_set], \
+                    ignore_index=True)
+    df_.set_index(['queryID', 'poiID'], inplace=True)
+    for t in train_trajs:
+        qid = query_id_dict[(t[0], t[-1], len(t))]
+        for poi in t[1:-1]:
+            df_.loc[(qid, poi), 'label'] += 1
+    df_.reset_index(inplace=True)
+    return df_
+
+
+def gen_data_str_loop(df_, df_columns=DF_COLUMNS):
+    """gen_data_str() in dataset_Melb.ipynb"""
+    columns = df_columns[1:].copy()
+    lines = []
+    for idx in df_.index:
+        slist = [str(df_.loc[idx, 'label'])]
+        slist.append(' qid:')
+        slist.append(str(int(df_.loc[idx, 'queryID'])))
+        for j in range(2, len(columns)):
+            slist.append(' ')
+            slist.append(str(j-1))
+            slist.append(':')
+            slist.append(str(df_.loc[idx, columns[j]]))
+        slist.append('\n')
+        lines.append(''.join(slist))
+    return ''.join(lines)
+
+
+class RankFeaturesTestCase(unittest.TestCase):
+    def setUp(self):
+        (self.traj_all, self.poi_all) = gen_traj_all(ntrajs=120, npois=20)
+        self.traj_dict = extract_trajs(self.traj_all)
+        self.query_id_dict = gen_query_id_dict(self.traj_dict)
+        self.poi_distmat = pd.DataFrame(data=np.zeros((len(self.poi_all), len(self.poi_all))), \
+                                        index=self.poi_all.index, columns=self.poi_all.index)
+        for ix in self.poi_all.index:  # POI_DISTMAT in dataset_Melb.ipynb
+            self.poi_distmat.loc[ix] = calc_dist_vec(self.poi_all.loc[ix, 'poiLon'], self.poi_all.loc[ix, 'poiLat'], \
+                                                     self.poi_all['poiLon'], self.poi_all['poiLat'])
+        # leave one out
+        self.tid = [x for x in sorted(self.traj_dict.keys()) if len(self.traj_dict[x]) > 2][0]
+        self.trajid_list = [x for x in sorted(self.traj_dict.keys()) if x != self.tid]
+        self.poi_info = calc_poi_info(self.trajid_list, self.traj_all, self.poi_all)
+
+
+    def test_train_df(self):
+        expected = gen_train_df_loop(self.trajid_list, self.traj_dict, self.poi_info, self.query_id_dict, self.poi_distmat)
+        for poi_distmat in [self.poi_distmat, None]:
+            df_ = gen_train_df(self.trajid_list, self.traj_dict, self.poi_info, self.query_id_dict, poi_distmat)
+            pd.testing.assert_frame_equal(df_, expected, check_exact=True)
+        self.assertGreater(df_['label'].max(), 1)
+        self.assertEqual(gen_data_str(df_), gen_data_str_loop(expected))
+
+
+    def test_test_df(self):
+        traj = self.traj_dict[self.tid]
+        (start, end, length) = (traj[0], traj[-1], len(traj))
+
+        # gen_test_df() in dataset_Melb.ipynb
+        expected = pd.DataFrame(data=np.zeros((self.poi_info.shape[0], len(DF_COLUMNS)), dtype=float), columns=DF_COLUMNS)
+        expected['queryID'] = self.query_id_dict[(start, end, length)]
+        np.random.seed(1)
+        expected['label'] = np.random.rand(expected.shape[0])
+        for (i, poi) in enumerate(sorted(self.poi_info.index)):
+            df_ = gen_train_subdf(poi, [expected.loc[i, 'queryID']], self.poi_info, \
+                                  {expected.loc[i, 'queryID']: (start, end, length)}, self.poi_distmat)
+            for col in DF_COLUMNS[3:] + ['poiID']:
+                expected.loc[i, col] = df_.loc[0, col]
+
+        np.random.seed(1)
+        df_ = gen_test_df(start, end, length, self.poi_info, self.query_id_dict, \
+                          engine=FeatureEngine(self.poi_info, self.poi_distmat))
+        pd.testing.assert_frame_equal(df_, expected, check_exact=True)
+        self.assertEqual(gen_data_str(df_), gen_data_str_loop(expected))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+from poi_info import extract_trajs, calc_poi_info
+from rank_features import FeatureEngine, gen_query_id_dict, gen_train_df, gen_test_df
+from ranksvm import RankSVM, rank_pairs, recommend
+from test_poi_info import gen_traj_all
+
+
+class RankSVMTestCase(unittest.TestCase):
+    def test_rank_pairs(self):
+        np.random.seed(0)
+        labels = np.random.randint(0, 4, size=60)
+        qids = np.random.randint(0, 5, size=60)
+        expected = sorted((i, j) for i in range(60) for j in range(60) if qids[i] == qids[j] and labels[i] > labels[j])
+        (pi, pj) = rank_pairs(labels, qids)
+        self.assertEqual(sorted(zip(pi.tolist(), pj.tolist())), expected)
+
+
+    def test_fit(self):
+        np.random.seed(1)
+        X = np.random.randn(300, 5) * [1, 10, 100, 1, 0]  # a constant feature
+        w_true = np.array([1, -0.2, 0.01, 0, 3])
+        qids = np.repeat(np.arange(10), 30)
+        labels = np.argsort(np.argsort(X.dot(w_true)))  # ranks of true scores
+        cost = 10
+        ranksvm = RankSVM().fit(X, labels, qids, cost)
+        scores = ranksvm.decision_function(X)
+        self.assertGreater(np.corrcoef(scores, X.dot(w_true))[0, 1], 0.99)
+        self.assertEqual(ranksvm.w[4], 0)
+
+        # optimality: gradient of the objective vanishes
+        Xs = ranksvm.scale(X)
+        self.assertTrue(np.all((Xs >= -1) & (Xs <= 1)))
+        (pi, pj) = rank_pairs(labels, qids)
+        D = Xs[pi] - Xs[pj]
+        margins = np.maximum(1 - D.dot(ranksvm.w), 0)
+        grad = ranksvm.w - 2 * cost * D.T.dot(margins)
+        self.assertLess(np.linalg.norm(grad), 1e-5)
+
+
+    def test_line_search(self):
+        """The objective never goes up, also when the line search fails near the optimum (tol=0)"""
+        np.random.seed(2)
+        X = np.random.randn(300, 5) * [1, 10, 100, 1, 0]
+        qids = np.repeat(np.arange(10), 30)
+        labels = np.argsort(np.argsort(X.dot([1, -0.2, 0.01, 0, 3])))
+        cost = 10
+        ranksvm = RankSVM(max_iter=0, debug=True).fit(X, labels, qids, cost)
+        self.assertEqual(ranksvm.w.tolist(), [0] * 5)
+        (pi, pj) = rank_pairs(labels, qids)
+        D = ranksvm.scale(X)[pi] - ranksvm.scale(X)[pj]
+        def objective(w):
+            m = np.maximum(1 - D.dot(w), 0)
+            return 0.5 * w.dot(w) + cost * m.dot(m)
+        values = [objective(RankSVM(max_iter=k, tol=0).fit(X, labels, qids, cost).w) for k in range(40)]
+        self.assertEqual([i for i in range(len(values) - 1) if values[i+1] > values[i]], [])
+
+
+    def test_predict(self):
+        (traj_all, poi_all) = gen_traj_all(ntrajs=120, npois=20)
+        traj_dict = extract_trajs(traj_all)
+        query_id_dict = gen_query_id_dict(traj_dict)
+        trajid_list = sorted(traj_dict.keys())
+        poi_info = calc_poi_info(trajid_list, traj_all, poi_all)
+        engine = FeatureEngine(poi_info)
+
+        ranksvm = RankSVM()
+        ranksvm.train(gen_train_df(trajid_list, traj_dict, poi_info, query_id_dict, engine=engine), cost=10)
+        queries = list(query_id_dict.keys())[:5]
+        (pois, scores) = ranksvm.predict_queries(engine, queries)
+        self.assertEqual(scores.shape, (5, len(poi_info)))
+        for (i, (start, end, length)) in enumerate(queries):
+            rank_df = ranksvm.predict(gen_test_df(start, end, length, poi_info, query_id_dict, engine=engine))
+            self.assertEqual(rank_df.index.tolist(), pois.tolist())
+            np.testing.assert_allclose(rank_df['rank'].values, scores[i])
+            rank_df.sort_values(by='rank', ascending=False, inplace=True)
+            rec = [start] + [x for x in rank_df.index.tolist() if x not in {start, end}][:length-2] + [end]
+            self.assertEqual(recommend(pois, scores[i], start, end, length), rec)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
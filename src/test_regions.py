@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import unittest
+import tempfile
+import os
+import math
+import random
+from regions import Region, load_regions, point_in_region, RegionIndex, PreparedRegion, make_region
+
+
+class RegionsTestCase(unittest.TestCase):
+    def setUp(self):
+        kmlstr = """\
+<?xml version='1.0' encoding='UTF-8'?>
+<kml xmlns='http://www.opengis.net/kml/2.2'>
+<Document>
+<Placemark>
+<name>Melbourne bbox</name>
+<Polygon><outerBoundaryIs><LinearRing>
+<coordinates>144.597363,-37.591764,0.0 144.597363,-38.072257,0.0 145.360413,-38.072257,0.0 145.360413,-37.591764,0.0 144.597363,-37.591764,0.0</coordinates>
+</LinearRing></outerBoundaryIs></Polygon>
+</Placemark>
+<Placemark>
+<name>triangle</name>
+<Polygon><outerBoundaryIs><LinearRing>
+<coordinates>0,0 10,0 0,10 0,0</coordinates>
+</LinearRing></outerBoundaryIs>
+<innerBoundaryIs><LinearRing>
+<coordinates>1,1 2,1 2,2 1,2 1,1</coordinates>
+</LinearRing></innerBoundaryIs></Polygon>
+</Placemark>
+</Document>
+</kml>
+"""
+        csvstr = """\
+name, lng_min, lat_min, lng_max, lat_max
+Melbourne, 144.597363, -38.072257, 145.360413, -37.591764
+big-box, 141.9, -39.3, 147.1, -35.8
+"""
+        fk = tempfile.NamedTemporaryFile(mode='w', suffix='.kml', delete=False)
+        fc = tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False)
+        fk.write(kmlstr)
+        fc.write(csvstr)
+        self.fkml = fk.name
+        self.fcsv = fc.name
+        fk.close()
+        fc.close()
+
+
+    def tearDown(self):
+        os.unlink(self.fkml)
+        os.unlink(self.fcsv)
+
+
+    def test_load_regions(self):
+        regions = load_regions(self.fkml)
+        self.assertEqual([r.name for r in regions], ['Melbourne bbox', 'triangle'])
+        self.assertEqual(regions[0].bbox, (144.597363, -38.072257, 145.360413, -37.591764))
+        self.assertIsNone(regions[0].polygons)  # rectangles are kept as boxes
+        self.assertEqual(len(regions[1].polygons[0]), 2)
+
+        regions = load_regions(self.fcsv)
+        self.assertEqual([r.name for r in regions], ['Melbourne', 'big-box'])
+        self.assertEqual(regions[1].bbox, (141.9, -39.3, 147.1, -35.8))
+
+
+    def test_point_in_region(self):
+        triangle = load_regions(self.fkml)[1]
+        self.assertTrue(point_in_region(3, 3, triangle))
+        self.assertFalse(point_in_region(6, 6, triangle))   # inside bbox, outside polygon
+        self.assertFalse(point_in_region(1.5, 1.5, triangle))  # in the hole
+        box = Region('box', (0, 0, 1, 1), None)
+        self.assertTrue(point_in_region(1, 1, box))  # boundary is inclusive for boxes
+
+
+    def test_region_index(self):
+        regions = load_regions(self.fcsv) + load_regions(self.fkml)
+        index = RegionIndex(regions, cell_size=0.5)
+        points = [(144.87957, -37.155665), (144.972976, -37.811378), (-73.458709, 41.394066), (3, 3), (141.9, -39.3)]
+        for (lng, lat) in points:
+            with self.subTest(lng=lng, lat=lat):
+                expected = [i for i in range(len(regions)) if point_in_region(lng, lat, regions[i])]
+                self.assertEqual(index.query(lng, lat), expected)
+        self.assertEqual(index.query(144.972976, -37.811378), [0, 1, 2])
+
+
+    def test_prepared_region(self):
+        rng = random.Random(0)
+        star = [(5 + (4 if i % 2 == 0 else 2) * math.cos(i * math.pi / 50), 5 + (4 if i % 2 == 0 else 2) * math.sin(i * math.pi / 50)) \
+                for i in range(100)]
+        regions = load_regions(self.fkml) + load_regions(self.fcsv) + [make_region('star', [[star], [[(20, 20), (21, 20), (20, 21)]]])]
+        lngs = [rng.uniform(-1, 22) for i in range(2000)] + [3, 1.5, 144.597363]
+        lats = [rng.uniform(-1, 22) for i in range(2000)] + [3, 1.5, -37.591764]
+        for r in regions:
+            with self.subTest(region=r.name):
+                expected = [point_in_region(lngs[i], lats[i], r) for i in range(len(lngs))]
+                self.assertEqual(PreparedRegion(r).contains(lngs, lats).tolist(), expected)
+                self.assertEqual(PreparedRegion(r, nstrips=1).contains(lngs, lats, chunk_size=7).tolist(), expected)
+                self.assertEqual(PreparedRegion(r, nstrips=5000).contains(lngs, lats).tolist(), expected)  # sparse strips
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+import os
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+from generate_tables import HEADER1, HEADER2
+from stream_stats import bit_length, HyperLogLogs, KLLSketch, VisitStats, TrajStats, PhotoStats, TRAJ_COLUMNS, \
+                         table_stats
+
+
+def rank_error(sketch, values, qs):
+    """Max distance between qs and the ranges of fractions of values below estimated quantiles (values may tie)"""
+    values = np.sort(values)
+    estimates = sketch.quantile(qs)
+    low = np.searchsorted(values, estimates, side='left') / len(values)
+    high = np.searchsorted(values, estimates, side='right') / len(values)
+    return np.max(np.maximum(0, np.maximum(low - qs, qs - high)))
+
+
+def gen_visits(seed=0, nvisits=20000, nusers=3000, npois=40):
+    """Synthetic POI visits (userVisits-Melb.csv), POI popularity varies"""
+    rng = np.random.RandomState(seed)
+    pois = np.minimum(rng.zipf(1.5, nvisits), npois) - 1
+    users = ['%d@N0%d' % (x, x % 10) for x in rng.randint(0, nusers, nvisits) * 7919]
+    return pd.DataFrame({'photoID': np.arange(nvisits) + 10**9, 'userID': users, \
+                         'dateTaken': rng.randint(10**9, 2 * 10**9, nvisits), 'poiID': pois, \
+                         'poiTheme': ['cat%d' % (x % 4) for x in pois], 'poiFreq': 1, 'seqID': np.arange(nvisits) // 5})
+
+
+def write_traj_tables(fdir, seed=0, ntrajs=5000):
+    """Synthetic trajectory_photos.csv and trajectory_stats.csv in the format of generate_tables.py"""
+    rng = np.random.RandomState(seed)
+    stats = pd.DataFrame({'Trajectory_ID': np.arange(ntrajs), 'User_ID': ['%d@N01' % x for x in rng.randint(0, 800, ntrajs)], \
+                          '#Photo': rng.zipf(2, ntrajs) + 1, 'Start_Time': '2010-01-01 10:00:00', \
+                          'Travel_Distance(km)': rng.lognormal(1, 1.5, ntrajs), 'Total_Time(min)': rng.exponential(200, ntrajs)})
+    stats['Average_Speed(km/h)'] = stats['Travel_Distance(km)'] / (stats['Total_Time(min)'] / 60)
+    nphotos = 3 * ntrajs
+    tids = rng.randint(0, ntrajs, nphotos)
+    times = pd.to_datetime(rng.randint(10**9, 1.4 * 10**9, nphotos), unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    photos = pd.DataFrame({'Trajectory_ID': tids, 'Photo_ID': np.arange(nphotos), 'User_ID': stats['User_ID'].values[tids], \
+                           'Timestamp': times, 'Longitude': 144.9, 'Latitude': -37.8, 'Accuracy': rng.randint(11, 17, nphotos), \
+                           'Marker': 0, 'URL': 'http://www.flickr.com/photos/x/1/'})
+    (fphotos, fstats) = (os.path.join(fdir, 'trajectory_photos.csv'), os.path.join(fdir, 'trajectory_stats.csv'))
+    with open(fphotos, 'w') as f:
+        f.write(HEADER1)
+        photos.to_csv(f, header=False, index=False)
+    with open(fstats, 'w') as f:
+        f.write(HEADER2)
+        stats.to_csv(f, header=False, index=False)
+    return fphotos, fstats
+
+
+class StreamStatsTestCase(unittest.TestCase):
+    def test_bit_length(self):
+        rng = np.random.RandomState(0)
+        x = np.concatenate([np.array([0, 1, 2, 3, 2**63, 2**64 - 1], dtype=np.uint64), \
+                            (np.uint64(1) << np.arange(1, 64, dtype=np.uint64)) - np.uint64(1), \
+                            rng.randint(0, 2**63, 1000, dtype=np.int64).astype(np.uint64) >> rng.randint(0, 63, 1000).astype(np.uint64)])
+        self.assertEqual(bit_length(x).tolist(), [int(v).bit_length() for v in x.tolist()])
+
+
+    def test_hyperloglog(self):
+        rng = np.random.RandomState(0)
+        p = 12
+        ndistinct = [1, 10, 1000, 30000]
+        keys = np.concatenate([np.full(2 * n, i) for (i, n) in enumerate(ndistinct)])
+        values = np.concatenate([rng.randint(0, n, 2 * n) + 10**6 * i for (i, n) in enumerate(ndistinct)])
+        exact = pd.Series(values).groupby(keys).nunique()
+        hll = HyperLogLogs(p)
+        hll.add(keys, values)
+        error = np.abs(hll.estimates().values / exact.values - 1)
+        self.assertTrue(np.all(error < 4 * 1.04 / np.sqrt(1 << p)))
+        self.assertEqual(round(hll.estimates()[0]), 1)
+
+        # merging shards is the same as one sketch
+        shards = [HyperLogLogs(p) for _ in range(3)]
+        for (i, ix) in enumerate(np.array_split(rng.permutation(len(keys)), 3)):
+            shards[i].add(keys[ix], values[ix])
+        merged = shards[2].merge(shards[0]).merge(shards[1])
+        pd.testing.assert_series_equal(merged.estimates(), hll.estimates())
+        self.assertTrue(HyperLogLogs().estimates().empty)
+
+
+    def test_kll(self):
+        rng = np.random.RandomState(1)
+        qs = np.linspace(0, 1, 41)
+        values = rng.lognormal(0, 2, 150)
+        sketch = KLLSketch(k=200)
+        sketch.add(values)
+        self.assertTrue(np.array_equal(sketch.quantile(qs), np.quantile(values, qs, method='inverted_cdf')))
+        self.assertTrue(np.all(np.isnan(KLLSketch().quantile([0, 0.5]))))
+
+        values = rng.lognormal(0, 2, 200000)
+        sketch = KLLSketch(k=200)
+        for chunk in np.array_split(values, 37):
+            sketch.add(chunk)
+        self.assertEqual((sketch.n, sketch.min, sketch.max), (len(values), values.min(), values.max()))
+        self.assertLess(len(sketch), 3 * 200 + 2 * len(sketch.levels))
+        self.assertLess(rank_error(sketch, values, qs), 0.02)
+
+        shards = [KLLSketch(k=200, seed=i) for i in range(8)]
+        for (i, chunk) in enumerate(np.array_split(np.sort(values), 8)):  # shards of different ranges
+            shards[i].add(chunk)
+        merged = shards[0]
+        for shard in shards[1:]:
+            merged.merge(shard)
+        self.assertEqual((merged.n, merged.min, merged.max), (len(values), values.min(), values.max()))
+        self.assertLess(rank_error(merged, values, qs), 0.02)
+
+
+    def test_visit_stats(self):
+        visits = gen_visits()
+        stats = VisitStats()
+        for chunk in np.array_split(np.arange(len(visits)), 7):
+            stats.add(visits.iloc[chunk])
+        poi_stats = stats.poi_stats()
+        # poi_visits_stats in dataset_Melb.ipynb, poiFreq in traj_Melb.ipynb
+        exact = visits[['userID', 'poiID']].groupby('poiID')['userID'].agg(['nunique', 'size'])
+        self.assertEqual(poi_stats.index.tolist(), exact.index.tolist())
+        self.assertEqual(poi_stats['#visits'].tolist(), exact['size'].tolist())
+        self.assertTrue(np.all(np.abs(poi_stats['#distinctUsers'].values / exact['nunique'].values - 1) < 0.07))
+        self.assertLess(abs(stats.num_users() / visits['userID'].nunique() - 1), 0.07)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'visits.csv')
+            visits.to_csv(fname, sep=';', index=False)
+            pd.testing.assert_frame_equal(table_stats(fname, 'visits', chunk_size=3000).poi_stats(), poi_stats)
+        shard = VisitStats().add(visits.iloc[:5000]).merge(VisitStats().add(visits.iloc[5000:]))
+        pd.testing.assert_frame_equal(shard.poi_stats(), poi_stats)
+
+
+    def test_traj_stats(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (fphotos, fstats) = write_traj_tables(tmpdir)
+            traj_stats = pd.read_csv(fstats, delimiter=',', parse_dates=[3], skipinitialspace=True)
+            traj = pd.read_csv(fphotos, delimiter=',', parse_dates=[3], skipinitialspace=True)
+            stats = table_stats(fstats, 'trajs', chunk_size=700)
+            photo_stats = table_stats(fphotos, 'photos', chunk_size=1000)
+            shards = table_stats(fphotos, 'photos', chunk_size=1000)  # a shard merged with an empty one
+            shards.merge(PhotoStats())
+
+        self.assertEqual(stats.ntrajs, traj_stats['Trajectory_ID'].unique().size)
+        self.assertLess(abs(stats.num_users() / traj_stats['User_ID'].unique().size - 1), 0.07)
+        basic_stats = stats.basic_stats()
+        expected = pd.DataFrame([traj_stats[TRAJ_COLUMNS].min(), traj_stats[TRAJ_COLUMNS].max(), \
+                                 traj_stats[TRAJ_COLUMNS].median(), traj_stats[TRAJ_COLUMNS].mean()], \
+                                index=['min', 'max', 'median', 'mean'])
+        pd.testing.assert_frame_equal(basic_stats.loc[['min', 'max', 'mean']], \
+                                      expected.loc[['min', 'max', 'mean']].astype(np.float64), check_exact=False, rtol=1e-12)
+        for (i, col) in enumerate(TRAJ_COLUMNS):
+            self.assertLess(rank_error(stats.sketches[i], traj_stats[col].values, np.linspace(0, 1, 21)), 0.02)
+
+        # yeardict and accuracy counts in flickr_analysis.ipynb
+        self.assertEqual(photo_stats.years, traj['Timestamp'].dt.year.value_counts().to_dict())
+        self.assertEqual(photo_stats.accuracy, traj['Accuracy'].value_counts().to_dict())
+        self.assertEqual(photo_stats.num_photos(), len(traj))
+        self.assertLess(abs(photo_stats.num_trajs() / traj['Trajectory_ID'].nunique() - 1), 0.07)
+        self.assertEqual((shards.years, shards.num_users()), (photo_stats.years, photo_stats.num_users()))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
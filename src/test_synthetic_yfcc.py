@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import os
+import gzip
+import unittest
+import tempfile
+import numpy as np
+from datetime import datetime
+from filtering_bigbox import parse_record, filter_record
+from synthetic_yfcc import SyntheticYFCC, NCOLUMNS, CITIES
+from pipeline import BIGBOX, TIME_WINDOW
+
+
+class SyntheticYFCCTestCase(unittest.TestCase):
+    def test_records(self):
+        lines = SyntheticYFCC(5000, seed=1, chunk_size=2000).chunk(0).splitlines()
+        self.assertEqual(len(lines), 2000)
+        self.assertTrue(all(len(line.split('\t')) == NCOLUMNS for line in lines))
+        recs = [parse_record(line) for line in lines]
+        geotagged = [rec for rec in recs if rec is not None]
+        self.assertTrue(0.3 < len(geotagged) / len(lines) < 0.7)
+        for (pid, uid, time, lng, lat, acc, url, marker) in geotagged:
+            self.assertTrue(url.endswith('/%s/%s/' % (uid, pid)))
+            self.assertTrue(1 <= int(acc) <= 16 and marker in ['0', '1'])
+            self.assertLess(min(abs(lng - x) + abs(lat - y) for (x, y) in CITIES), 1)
+        self.assertEqual(len(set(rec[0] for rec in geotagged)), len(geotagged))
+
+        # sessions of a user: photos in the same place within hours
+        users = {}
+        for rec in geotagged:
+            users.setdefault(rec[1], []).append(rec)
+        (uid, photos) = max(users.items(), key=lambda x: len(x[1]))
+        self.assertGreater(len(photos), 20)
+        times = sorted(datetime.strptime(rec[2], '%Y-%m-%d %H:%M:%S.0').timestamp() for rec in photos)
+        self.assertGreater(np.mean(np.diff(times) < 3 * 3600), 0.5)
+
+
+    def test_seed(self):
+        (gen1, gen2) = (SyntheticYFCC(3000, seed=0, chunk_size=1000), SyntheticYFCC(3000, seed=0, chunk_size=1000))
+        self.assertEqual(gen1.chunk(2), gen2.chunk(2))
+        self.assertNotEqual(gen1.chunk(1), gen1.chunk(2))
+        self.assertNotEqual(SyntheticYFCC(3000, seed=1, chunk_size=1000).chunk(2), gen1.chunk(2))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (fname, fgz) = (os.path.join(tmpdir, 'yfcc.tsv'), os.path.join(tmpdir, 'yfcc.tsv.gz'))
+            self.assertEqual(gen1.write(fname), 3000)
+            gen2.write(fgz)
+            with open(fname, 'r') as f:
+                text = f.read()
+            with gzip.open(fgz, 'rt') as f:
+                self.assertEqual(f.read(), text)
+        self.assertEqual(text, ''.join(gen1.chunk(i) for i in range(3)))
+        self.assertEqual(len(text.splitlines()), 3000)
+
+
+    def test_filtering(self):
+        """Photos of Melbourne in the big box and the time window, a few outside of the time window"""
+        (time_min, time_max) = [datetime.strptime(x, '%Y-%m-%d %H:%M:%S') for x in TIME_WINDOW]
+        lines = SyntheticYFCC(20000, seed=2, melb_ratio=0.5).chunk(0).splitlines()
+        inside = [filter_record(line, *BIGBOX, time_min, time_max) for line in lines]
+        in_box = [filter_record(line, *BIGBOX, datetime.min, datetime.max) for line in lines]
+        nkept = sum(x is not None for x in inside)
+        self.assertTrue(0.1 * len(lines) < nkept < 0.5 * len(lines))
+        self.assertLessEqual(nkept, sum(x is not None for x in in_box))
+        lines = SyntheticYFCC(100000, seed=2).chunk(0).splitlines()
+        nlate = sum(line.split('\t')[3] > TIME_WINDOW[1] for line in lines)
+        self.assertTrue(0 < nlate < 0.01 * len(lines))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
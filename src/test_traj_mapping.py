@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+import pandas as pd
+from poi_mapping import calc_dist_vec
+from traj_mapping import map_trajectories, calc_cost
+
+
+def decode_photo_seq(photo_seq, poi_distmat, photo_poi_distmat, DIST_MAX, ALPHA=1):
+    """decode_photo_seq() in traj_Melb.ipynb"""
+    if len(photo_seq) == 1:
+        return [photo_poi_distmat.loc[photo_seq[0]].idxmin()]
+    poi_t = []
+    for jx in photo_seq:
+        poi_t = poi_t + poi_distmat.index[~(photo_poi_distmat.loc[jx] > DIST_MAX)].tolist()
+    columns = sorted(set(poi_t))
+    cost_df = pd.DataFrame(data=np.zeros((len(photo_seq), len(columns)), dtype=float), index=photo_seq, columns=columns)
+    trace_df = pd.DataFrame(data=np.zeros((len(photo_seq), len(columns)), dtype=int), index=photo_seq, columns=columns)
+    trace_df.iloc[0] = -1
+    for kx in cost_df.columns:
+        ix = photo_seq[0]
+        dist = photo_poi_distmat.loc[ix, kx]
+        cost_df.loc[ix, kx] = np.inf if dist > DIST_MAX else dist
+    for i in range(1, len(photo_seq)):
+        ix = cost_df.index[i]
+        prev = cost_df.index[i-1]
+        for jx in cost_df.columns:
+            costs = [np.inf if photo_poi_distmat.loc[ix, jx] > DIST_MAX else \
+                     photo_poi_distmat.loc[ix, jx] + ALPHA * poi_distmat.loc[kx, jx] + cost_df.loc[prev, kx] \
+                     for kx in cost_df.columns]
+            min_idx = np.argmin(costs)
+            cost_df.loc[ix, jx] = costs[min_idx]
+            trace_df.loc[ix, jx] = cost_df.columns[min_idx]
+    pN = cost_df.loc[cost_df.index[-1]].idxmin()
+    seq_reverse = [pN]
+    row_idx = trace_df.shape[0] - 1
+    while (row_idx > 0):
+        seq_reverse.append(trace_df.loc[trace_df.index[row_idx], seq_reverse[-1]])
+        row_idx -= 1
+    return seq_reverse[::-1]
+
+
+class TrajMappingTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        npois = 40
+        nphotos = 300
+        self.poi_lngs = rng.uniform(144.95, 144.97, npois)
+        self.poi_lats = rng.uniform(-37.82, -37.80, npois)
+        self.poi_lngs[-1] = self.poi_lngs[0]  # the same location
+        self.poi_lats[-1] = self.poi_lats[0]
+        self.photo_lngs = rng.uniform(144.94, 144.98, nphotos)
+        self.photo_lats = rng.uniform(-37.83, -37.79, nphotos)
+        self.users = np.array(['u%d' % x for x in rng.randint(0, 12, nphotos)], dtype=object)
+        self.times = rng.randint(0, 5, nphotos) * 4 * 3600 + rng.randint(0, 100, nphotos)
+        self.times[:3] = 1000  # ties
+
+        photo_df = pd.DataFrame({'userID': self.users, 'dateTaken': self.times}, index=np.arange(100, 100 + nphotos))
+        self.poi_distmat = pd.DataFrame(calc_dist_vec(self.poi_lngs[:, None], self.poi_lats[:, None], \
+                                                      self.poi_lngs[None, :], self.poi_lats[None, :]))
+        self.photo_poi_distmat = pd.DataFrame(calc_dist_vec(self.photo_lngs[:, None], self.photo_lats[:, None], \
+                                                            self.poi_lngs[None, :], self.poi_lats[None, :]), \
+                                              index=photo_df.index)
+        self.photo_df = photo_df
+
+
+    def expected(self, DIST_MAX, TIME_GAP, ALPHA):
+        """The driver loop of traj_Melb.ipynb"""
+        traj_dp = self.photo_df.copy()
+        traj_dp['poiID'] = -1
+        traj_dp['trajID'] = -1
+        tid = 0
+        for user in sorted(traj_dp['userID'].unique().tolist()):
+            udf = traj_dp[traj_dp['userID'] == user].sort_values(by='dateTaken', kind='stable')
+            udf = udf[[self.photo_poi_distmat.loc[ix].min() <= DIST_MAX for ix in udf.index]]
+            if udf.shape[0] == 0: continue
+            photo_seqs = [[udf.index[0]]]
+            for i in range(1, udf.shape[0]):
+                if udf['dateTaken'].iloc[i] - udf['dateTaken'].iloc[i-1] > TIME_GAP:
+                    photo_seqs.append([])
+                photo_seqs[-1].append(udf.index[i])
+            for photo_seq in photo_seqs:
+                poi_seq = decode_photo_seq(photo_seq, self.poi_distmat, self.photo_poi_distmat, DIST_MAX, ALPHA)
+                traj_dp.loc[photo_seq, 'poiID'] = poi_seq
+                traj_dp.loc[photo_seq, 'trajID'] = tid
+                tid += 1
+        return traj_dp
+
+
+    def test_map_trajectories(self):
+        for (dist_max, alpha, workers) in [(0.2, 1, 1), (0.5, 1, 2), (0.3, 0.5, 1)]:
+            with self.subTest(dist_max=dist_max, alpha=alpha, workers=workers):
+                traj_dp = self.expected(dist_max, 8 * 3600, alpha)
+                pois, traj_ids = map_trajectories(self.users, self.times, self.photo_lngs, self.photo_lats, \
+                                                  self.poi_lngs, self.poi_lats, dist_max, 8 * 3600, alpha, workers)
+                self.assertEqual(pois.tolist(), traj_dp['poiID'].tolist())
+                self.assertEqual(traj_ids.tolist(), traj_dp['trajID'].tolist())
+                self.assertGreater(len(set(traj_ids.tolist())), 10)
+                self.assertIn(-1, pois.tolist())
+
+
+    def test_calc_cost(self):
+        traj_dp = self.expected(0.3, 8 * 3600, 1)
+        # calc_cost() in traj_Melb.ipynb
+        expected = 0
+        traj_df = traj_dp[traj_dp['poiID'] != -1]
+        for tid in sorted(traj_df['trajID'].unique().tolist()):
+            tdf = traj_df[traj_df['trajID'] == tid].sort_values(by='dateTaken', kind='stable')
+            expected += np.trace(self.photo_poi_distmat.loc[tdf.index, tdf['poiID']])
+            expected += np.trace(self.poi_distmat.loc[tdf['poiID'][:-1].values, tdf['poiID'][1:].values])
+        cost = calc_cost(traj_dp['trajID'].values, traj_dp['dateTaken'].values, traj_dp['poiID'].values, \
+                         self.photo_lngs, self.photo_lats, self.poi_lngs, self.poi_lats)
+        self.assertAlmostEqual(cost, expected, places=9)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import os
+import unittest
+import itertools
+import tempfile
+import numpy as np
+import pandas as pd
+from traj_recommend import TrajRecommender, ModelUnpickler, backward, list_viterbi, beam_search, \
+                           LOG_SMALL, BEAM_WIDTH
+
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recommender', 'model-Melb.pkl')
+
+
+def gen_params(M=9, seed=0):
+    """Random scoring parameters of M POIs"""
+    rng = np.random.RandomState(seed)
+    return {'poi_ids': np.arange(M) * 3 + 1, 'cat': rng.randint(0, 3, size=M), 'ncats': 3, \
+            'cluster': rng.randint(0, 2, size=M), 'nclusters': 2, 'pop': rng.randint(0, 100, size=M).astype(float), \
+            'nvisit': rng.randint(0, 100, size=M).astype(float), 'duration': rng.rand(M) * 1000, \
+            'distmat': rng.rand(M, M), 'node_scale': rng.rand(15), 'node_min': rng.randn(15), \
+            'w_node': rng.randn(15), 'edge_features': rng.randn(M, M, 5), 'w_edge': rng.randn(5)}
+
+
+def calc_node_features(startPOI, nPOI, poi_list, poi_info, poi_clusters, cats, clusters, poi_distmat):
+    """calc_node_features() of ssvm.py of the trained model"""
+    df_ = pd.DataFrame(index=poi_list, columns=['popularity', 'nVisit', 'avgDuration', 'trajLen', 'sameCatStart', \
+                       'distStart', 'diffPopStart', 'diffNVisitStart', 'diffDurationStart', 'sameNeighbourhoodStart'])
+    (p0, trajLen) = (startPOI, nPOI)
+    (cat_features, neigh_features) = ([], [])
+    for poi in poi_list:
+        (pop, nvisit) = (poi_info.loc[poi, 'popularity'], poi_info.loc[poi, 'nVisit'])
+        (cat, cluster) = (poi_info.loc[poi, 'poiCat'], poi_clusters.loc[poi, 'clusterID'])
+        duration = poi_info.loc[poi, 'avgDuration']
+        cat_features.append((cat == np.array(cats)).astype(int) * 2 - 1)
+        neigh_features.append((cluster == np.array(clusters)).astype(int) * 2 - 1)
+        df_.loc[poi, 'popularity'] = LOG_SMALL if pop < 1 else np.log10(pop)
+        df_.loc[poi, 'nVisit'] = LOG_SMALL if nvisit < 1 else np.log10(nvisit)
+        df_.loc[poi, 'avgDuration'] = LOG_SMALL if duration < 1 else np.log10(duration)
+        df_.loc[poi, 'trajLen'] = trajLen
+        df_.loc[poi, 'sameCatStart'] = 1 if cat == poi_info.loc[p0, 'poiCat'] else -1
+        df_.loc[poi, 'distStart'] = poi_distmat.loc[poi, p0]
+        df_.loc[poi, 'diffPopStart'] = pop - poi_info.loc[p0, 'popularity']
+        df_.loc[poi, 'diffNVisitStart'] = nvisit - poi_info.loc[p0, 'nVisit']
+        df_.loc[poi, 'diffDurationStart'] = duration - poi_info.loc[p0, 'avgDuration']
+        df_.loc[poi, 'sameNeighbourhoodStart'] = 1 if cluster == poi_clusters.loc[p0, 'clusterID'] else -1
+    return np.hstack([np.vstack(cat_features), np.vstack(neigh_features), df_.values]).astype(float)
+
+
+def brute_force(u, P, ps, L, k):
+    """The best k trajectories without loops by enumerating all of them"""
+    M = len(u)
+    paths = [(ps,) + y for y in itertools.permutations([p for p in range(M) if p != ps], L - 1)]
+    scores = [u[list(y)].sum() + sum(P[a, b] for (a, b) in zip(y[:-1], y[1:])) for y in paths]
+    order = np.argsort(-np.array(scores), kind='stable')[:k]
+    return [paths[i] for i in order], np.array(scores)[order]
+
+
+class TrajRecommendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.params = gen_params()
+        self.recommender = TrajRecommender(self.params)
+
+
+    def test_node_features(self):
+        p = self.params
+        poi_list = p['poi_ids'].tolist()
+        cats = ['cat%d' % j for j in range(p['ncats'])]
+        poi_info = pd.DataFrame({'popularity': p['pop'], 'nVisit': p['nvisit'], 'avgDuration': p['duration'], \
+                                 'poiCat': [cats[j] for j in p['cat']]}, index=poi_list)
+        poi_clusters = pd.DataFrame({'clusterID': p['cluster'] + 10}, index=poi_list)
+        poi_distmat = pd.DataFrame(p['distmat'], index=poi_list, columns=poi_list)
+        starts = np.array([0, 4, 8])
+        X = self.recommender.node_features(starts, [3, 5, 9])
+        for (b, (s, L)) in enumerate(zip(starts, [3, 5, 9])):
+            expected = calc_node_features(poi_list[s], L, poi_list, poi_info, poi_clusters, cats, [10, 11], poi_distmat)
+            np.testing.assert_array_equal(X[b], expected)
+
+
+    def test_decode(self):
+        r = self.recommender
+        for L in range(2, 6):
+            starts = np.array([0, 3, 7])
+            U = r.node_scores(starts, [L] * len(starts))
+            beta = backward(U, r.P, starts, L)
+            (paths, scores) = beam_search(U, r.P, starts, L, 10, 10**4, beta)
+            for (b, ps) in enumerate(starts):
+                with self.subTest(L=L, start=ps):
+                    (expected, expected_scores) = brute_force(U[b], r.P, ps, L, 10)
+                    (ys, ss) = list_viterbi(U[b], r.P, ps, L, 10, beta[b])
+                    self.assertEqual([tuple(y) for y in ys], expected)
+                    np.testing.assert_allclose(ss, expected_scores, rtol=1e-12)
+                    nvalid = len(expected)
+                    self.assertEqual([tuple(y) for y in paths[b][:nvalid]], expected)
+                    self.assertTrue(np.all(np.isneginf(scores[b][nvalid:])))
+        # the exact search gives up if it needs too many expansions
+        self.assertIsNone(list_viterbi(U[0], r.P, starts[0], L, 10, beta[0], max_pops=5))
+
+
+    def test_recommend(self):
+        r = self.recommender
+        queries = [(1, 4), (25, 3), (2, 4), (7, 5), (1, 4)]
+        results = r.recommend(queries)
+        self.assertIsNone(results[2])  # unknown POI
+        self.assertEqual(len(results[1]), 10)
+        for (res, (start, L)) in zip(results, queries):
+            if res is None: continue
+            for y in res:
+                self.assertEqual((y[0], len(y), len(set(y))), (start, L, L))
+        for (a, b) in zip(results[0], results[4]):
+            np.testing.assert_array_equal(a, b)
+        scores = r.traj_scores(results[3])
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+        np.testing.assert_allclose(scores, brute_force(r.node_scores([2], [5])[0], r.P, 2, 5, 10)[1], rtol=1e-12)
+        beam = r.recommend(queries, beam=50)
+        fallback = r.recommend(queries, max_pops=1)
+        for res in [beam, fallback]:
+            for (x, y) in zip(results, res):
+                self.assertEqual(x is None, y is None)
+                if x is not None:
+                    np.testing.assert_array_equal(np.array(x), np.array(y))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'model.npz')
+            r.export(fname)
+            r2 = TrajRecommender.load(fname)
+        for (a, b) in zip(r2.recommend(queries)[0], results[0]):
+            np.testing.assert_array_equal(a, b)
+
+
+    def test_load_model(self):
+        with open(MODEL_FILE, 'rb') as f:
+            model = ModelUnpickler(f).load()['MODEL']
+        r = TrajRecommender.load(MODEL_FILE)
+        self.assertEqual(r.poi_ids.tolist(), model.poi_list)
+        # node features of training trajectories have the same range as when the model was trained
+        dat_obj = model.dat_obj
+        trajs = [dat_obj.traj_dict[tid] for tid in dat_obj.trajid_set_all if len(dat_obj.traj_dict[tid]) >= 2]
+        X = r.node_features(r.index.get_indexer([t[0] for t in trajs]), [len(t) for t in trajs])
+        X = X.reshape(-1, X.shape[2])
+        self.assertEqual(X.shape[0], model.scaler_node.n_samples_seen_)
+        np.testing.assert_allclose(X.min(axis=0), model.scaler_node.data_min_, atol=1e-12)
+        np.testing.assert_allclose(X.max(axis=0), model.scaler_node.data_max_, atol=1e-12)
+        results = r.recommend([(9, 4), (9, 8)], beam=BEAM_WIDTH)
+        self.assertEqual([len(x) for x in results], [10, 10])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
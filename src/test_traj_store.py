@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import unittest
+import tempfile
+import shutil
+import os
+import pandas as pd
+from traj_store import TrajectoryStore, scan_runs
+
+
+class TrajStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        # rows of trajectory 0 are not contiguous, e.g. after incremental updates by generate_tables.py
+        self.t1data = """\
+Trajectory_ID, Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, Marker(photo=0 video=1), URL
+0,4257973354,26303188@N00,2010-01-09 09:36:11,145.314132,-37.765855,16,0,http://www.flickr.com/photos/26303188@N00/4257973354/
+0,4257224959,26303188@N00,2010-01-09 09:39:19,145.314132,-37.765855,16,0,http://www.flickr.com/photos/26303188@N00/4257224959/
+1,4308515366,26303188@N00,2010-01-26 08:34:17,144.978418,-37.821446,14,0,http://www.flickr.com/photos/26303188@N00/4308515366/
+1,4307776599,26303188@N00,2010-01-26 09:59:49,144.978418,-37.821446,14,0,http://www.flickr.com/photos/26303188@N00/4307776599/
+12,5548848742,52361622@N02,2011-03-18 08:10:26,144.997619,-37.827316,15,0,http://www.flickr.com/photos/52361622@N02/5548848742/
+0,4258044588,26303188@N00,2010-01-09 10:08:50,145.314042,-37.765869,16,0,http://www.flickr.com/photos/26303188@N00/4258044588/
+"""
+        self.t2data = """\
+Trajectory_ID, User_ID, #Photo, Start_Time, Travel_Distance(km), Total_Time(min), Average_Speed(km/h)
+0,26303188@N00,3,2010-01-09 09:36:11,0.007924735620219506,32.65,0.01456181432381234
+1,26303188@N00,2,2010-01-26 08:34:17,0,85.53333333333333,0
+12,52361622@N02,1,2011-03-18 08:10:26,0,0.0,0
+"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.ftable1 = os.path.join(self.tmpdir, 'trajectory_photos.csv')
+        self.ftable2 = os.path.join(self.tmpdir, 'trajectory_stats.csv')
+        with open(self.ftable1, 'w') as f:
+            f.write(self.t1data)
+        with open(self.ftable2, 'w') as f:
+            f.write(self.t2data)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def test_scan_runs(self):
+        expected = ([0, 1, 12, 0], [105, 359, 613, 741], [359, 613, 741, 868])
+        for chunk_size in [7, 100, 1 << 20]:
+            with self.subTest(chunk_size=chunk_size):
+                (ids, starts, ends) = scan_runs(self.ftable1, chunk_size)
+                self.assertEqual((ids.tolist(), starts.tolist(), ends.tolist()), expected)
+        with open(self.ftable1, 'w') as f:
+            f.write(self.t1data.rstrip('\n'))  # no newline at the end
+        self.assertEqual(scan_runs(self.ftable1, 7)[2].tolist()[-1], 868)  # as if the newline was there
+        with TrajectoryStore(self.ftable1, self.ftable2) as store:
+            self.assertEqual(store.photos(0)['Photo_ID'].tolist(), [4257973354, 4257224959, 4258044588])
+
+
+    def test_store(self):
+        traj_data = pd.read_csv(self.ftable1, parse_dates=[3], skipinitialspace=True)
+        traj_stats = pd.read_csv(self.ftable2, parse_dates=[3], skipinitialspace=True)
+        with TrajectoryStore(self.ftable1, self.ftable2) as store:
+            self.assertTrue(os.path.exists(self.ftable1 + '.idx'))
+            self.assertEqual([x for x in range(20) if x in store], [0, 1, 12])
+            for traj_id in [0, 1, 12]:
+                with self.subTest(traj_id=traj_id):
+                    photos = traj_data[traj_data['Trajectory_ID'] == traj_id].reset_index(drop=True)
+                    pd.testing.assert_frame_equal(store.photos(traj_id), photos)
+                    stats = traj_stats[traj_stats['Trajectory_ID'] == traj_id].iloc[0]
+                    pd.testing.assert_series_equal(store.stats(traj_id), stats, check_names=False)
+            self.assertEqual(len(store.photos(5)), 0)
+            self.assertRaises(KeyError, store.stats, 5)
+            pd.testing.assert_frame_equal(store.stats_table(), traj_stats)
+
+        # the index is rebuilt if a table changed
+        with open(self.ftable2, 'a') as f:
+            f.write('13,52361622@N02,1,2011-03-18 09:27:31,0,0.0,0\n')
+        with TrajectoryStore(self.ftable1, self.ftable2) as store:
+            self.assertEqual(store.stats(13)['Start_Time'], pd.Timestamp('2011-03-18 09:27:31'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
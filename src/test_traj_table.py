@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import os
+import unittest
+import numpy as np
+import pandas as pd
+from poi_info import extract_trajs
+from traj_table import load_visits, build_traj_all, extract_trajs_withloop
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def gen_visits(seed=0, nvisits=2000, ntrajs=300, npois=25):
+    """Synthetic POI visits (userVisits-Melb.csv after load_visits()), visits of a trajectory belong to one user,
+       with loops and visits at the same time
+    """
+    rng = np.random.RandomState(seed)
+    traj_users = np.array(['%d@N0%d' % (rng.randint(10**7, 10**8), rng.randint(3)) for _ in range(ntrajs // 4)])
+    traj_users = traj_users[rng.randint(0, len(traj_users), size=ntrajs)]
+    tids = rng.randint(0, ntrajs, size=nvisits)
+    return pd.DataFrame({'photoID': rng.permutation(nvisits) + 10**9, 'userID': traj_users[tids], \
+                         'dateTaken': 10**9 + tids * 10**5 + rng.randint(0, 300, size=nvisits) * 10, \
+                         'poiID': rng.randint(0, npois, size=nvisits), 'trajID': tids})
+
+
+def build_traj_all_notebook(visits):
+    """The trajectory table of dataset_Melb.ipynb"""
+    traj_all = visits[['userID', 'trajID', 'poiID', 'dateTaken']].copy().groupby(['userID', 'trajID', 'poiID'])\
+               .agg(['min', 'max', 'size'])
+    traj_all.columns = traj_all.columns.droplevel()
+    traj_all.reset_index(inplace=True)
+    traj_all.rename(columns={'min':'startTime', 'max':'endTime', 'size':'#photo'}, inplace=True)
+    traj_len = traj_all[['userID', 'trajID', 'poiID']].copy().groupby(['userID', 'trajID']).agg('size')
+    traj_len = traj_len.reset_index()
+    traj_len.rename(columns={0:'trajLen'}, inplace=True)
+    traj_all = pd.merge(traj_all, traj_len, on=['userID', 'trajID'])
+    traj_all['poiDuration'] = traj_all['endTime'] - traj_all['startTime']
+    return traj_all
+
+
+def extract_traj_withloop(tid, visits):
+    """extract_traj_withloop() in dataset_Melb.ipynb (with a stable sort)"""
+    traj_df = visits[visits['trajID'] == tid].copy()
+    traj_df.sort_values(by='dateTaken', ascending=True, inplace=True, kind='stable')
+    traj = []
+    for ix in traj_df.index:
+        poi = traj_df.loc[ix, 'poiID']
+        if len(traj) == 0 or poi != traj[-1]:
+            traj.append(poi)
+    return traj
+
+
+class TrajTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.visits = gen_visits()
+
+
+    def test_build_traj_all(self):
+        (traj_all, (traj_ids, offsets, pois)) = build_traj_all(self.visits)
+        pd.testing.assert_frame_equal(traj_all, build_traj_all_notebook(self.visits), check_exact=True)
+        traj_dict = extract_trajs(traj_all)
+        self.assertEqual(traj_ids.tolist(), sorted(traj_dict.keys()))
+        for (i, tid) in enumerate(traj_ids.tolist()):
+            self.assertEqual(pois[offsets[i]:offsets[i+1]].tolist(), traj_dict[tid])
+
+
+    def test_extract_trajs_withloop(self):
+        trajs = extract_trajs_withloop(self.visits)
+        self.assertEqual(sorted(trajs.keys()), sorted(self.visits['trajID'].unique().tolist()))
+        for tid in sorted(trajs.keys()):
+            self.assertEqual(trajs[tid], extract_traj_withloop(tid, self.visits))
+        self.assertTrue(any(len(t) != len(set(t)) for t in trajs.values()))
+
+
+    def test_melb(self):
+        fvisits = os.path.join(DATA_DIR, 'userVisits-Melb.csv')
+        ftraj = os.path.join(DATA_DIR, 'traj-noloop-all-Melb.csv')
+        (traj_all, _) = build_traj_all(load_visits(fvisits))
+        with open(ftraj, 'r') as f:
+            self.assertEqual(traj_all.to_csv(index=False), f.read())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -3,7 +3,9 @@ import unittest
 import tempfile
 import os
 import re
+import shutil
 from traj_visualise import load_traj, gen_kml
+from traj_store import TrajectoryStore
 
 
 class TrajVisualiseTestCase(unittest.TestCase):
@@ -11,12 +13,15 @@ class TrajVisualiseTestCase(unittest.TestCase):
         t2data = """\
 Trajectory_ID, User_ID, #Photo, Start_Time, Travel_Distance(km), Total_Time(min), Average_Speed(km/h)
 26519,99804259@N00,3,2013-12-28 19:31:54,0.44294172719428504,84.01666666666667,0.3163241852607471
+26520,99804259@N00,2,2013-12-29 10:00:00,0.3,30.0,0.6
 """
         t1data = """\
 Trajectory_ID, Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, Marker(photo=0 video=1), URL
 26519,11617521194,99804259@N00,2013-12-28 19:31:54,144.962463,-37.810136,16,0,http://www.flickr.com/photos/99804259@N00/11617521194/
 26519,11617542904,99804259@N00,2013-12-28 19:48:28,144.96588,-37.812213,16,0,http://www.flickr.com/photos/99804259@N00/11617542904/
 26519,11617370033,99804259@N00,2013-12-28 20:55:55,144.966658,-37.812346,16,0,http://www.flickr.com/photos/99804259@N00/11617370033/
+26520,11617370034,99804259@N00,2013-12-29 10:00:00,144.96,-37.81,16,0,http://www.flickr.com/photos/99804259@N00/11617370034/
+26520,11617370035,99804259@N00,2013-12-29 10:30:00,144.962,-37.811,16,0,http://www.flickr.com/photos/99804259@N00/11617370035/
 """
         self.kmlstr = """\
 <?xml version="1.0" encoding="UTF-8"?>
@@ -84,6 +89,7 @@ Trajectory_ID, Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, Mark
         os.unlink(self.ftable1)
         os.unlink(self.ftable2)
         os.unlink(self.fout)
+        shutil.rmtree(self.ftable1 + '.idx', ignore_errors=True)
 
 
     def test_gen_kml(self):
@@ -96,6 +102,31 @@ Trajectory_ID, Photo_ID, User_ID, Timestamp, Longitude, Latitude, Accuracy, Mark
             self.assertEqual(kmlstr1, self.kmlstr)
 
 
+    def test_gen_kml_store(self):
+        with TrajectoryStore(self.ftable1, self.ftable2) as store:
+            gen_kml(self.fout, store, None, [26519])
+        with open(self.fout, 'r') as f:
+            kmlstr1 = re.sub('\n\s+', '\n', f.read())
+            self.assertEqual(kmlstr1, self.kmlstr)
+
+
+
+    def test_order(self):
+        """Placemarks in the order of traj_id_list, the same for a DataFrame and a TrajectoryStore"""
+        kmlstrs = []
+        traj_data, traj_stats = load_traj(self.ftable1, self.ftable2)
+        gen_kml(self.fout, traj_data, traj_stats, [26520, 26519], ['second', 'first'])
+        with open(self.fout, 'r') as f:
+            kmlstrs.append(f.read())
+        with TrajectoryStore(self.ftable1, self.ftable2) as store:
+            gen_kml(self.fout, store, None, [26520, 26519], ['second', 'first'])
+        with open(self.fout, 'r') as f:
+            kmlstrs.append(f.read())
+        self.assertEqual(kmlstrs[0], kmlstrs[1])
+        names = re.findall('<name>(Trajectory_[^<]*)</name>', kmlstrs[0])
+        self.assertEqual(names, ['Trajectory_26520_second', 'Trajectory_26519_first'])
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
 
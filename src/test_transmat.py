@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import unittest
+import itertools
+import numpy as np
+import pandas as pd
+from poi_info import extract_trajs, calc_poi_info
+from transmat import TransitionCounter, normalise_transmat, gen_logbins, gen_poi_transmat, KINDS
+from test_poi_info import gen_traj_all
+
+
+def normalise_transmat_loop(transmat_cnt):
+    """normalise_transmat() in dataset_Melb.ipynb"""
+    transmat = transmat_cnt.copy()
+    for row in range(transmat.index.shape[0]):
+        rowsum = np.sum(transmat.iloc[row] + 1)
+        transmat.iloc[row] = (transmat.iloc[row] + 1) / rowsum
+    return transmat
+
+
+def gen_transmat_loop(trajid_list, traj_dict, labels, feature):
+    """gen_transmat_cat(), gen_transmat_pop(), ... in dataset_Melb.ipynb, feature(POI) is the label of a POI"""
+    transmat_cnt = pd.DataFrame(data=np.zeros((len(labels), len(labels)), dtype=float), columns=labels, index=labels)
+    for tid in trajid_list:
+        t = traj_dict[tid]
+        for pi in range(len(t)-1):
+            transmat_cnt.loc[feature(t[pi]), feature(t[pi+1])] += 1
+    return normalise_transmat_loop(transmat_cnt)
+
+
+def gen_poi_transmat_loop(transmats, poi_set, poi_info, features):
+    """gen_poi_transmat() in dataset_Melb.ipynb, features(POI) is the tuple of labels of a POI"""
+    transmat_ix = list(itertools.product(*[transmats[kind].index for kind in KINDS]))
+    transmat_value = transmats[KINDS[0]].values
+    for kind in KINDS[1:]:
+        transmat_value = np.kron(transmat_value, transmats[kind].values)
+    transmat_feature = pd.DataFrame(data=transmat_value, index=transmat_ix, columns=transmat_ix)
+
+    poi_train = sorted(poi_set)
+    poi_logtransmat = pd.DataFrame(data=np.zeros((len(poi_train), len(poi_train)), dtype=float), \
+                                   columns=poi_train, index=poi_train)
+    for p1 in poi_logtransmat.index:
+        for p2 in poi_logtransmat.columns:
+            poi_logtransmat.loc[p1, p2] = transmat_feature.loc[(features(p1),), (features(p2),)].values[0, 0]
+    features_dup = dict()
+    for poi in poi_train:
+        features_dup.setdefault(features(poi), []).append(poi)
+    for feature in sorted(features_dup.keys()):
+        n = len(features_dup[feature])
+        if n > 1:
+            group = features_dup[feature]
+            v1 = poi_logtransmat.loc[group[0], group[0]]
+            for poi in group:
+                poi_logtransmat[poi] /= n
+            for pair in itertools.permutations(group, 2):
+                poi_logtransmat.loc[pair[0], pair[1]] = v1 / (n - 1)
+    for p1 in poi_logtransmat.index:
+        poi_logtransmat.loc[p1, p1] = 0
+        logrowsum = np.log10(poi_logtransmat.loc[p1].sum())
+        for p2 in poi_logtransmat.columns:
+            if p1 == p2:
+                poi_logtransmat.loc[p1, p2] = -np.inf
+            else:
+                poi_logtransmat.loc[p1, p2] = np.log10(poi_logtransmat.loc[p1, p2]) - logrowsum
+    return np.power(10, poi_logtransmat)
+
+
+class TransmatTestCase(unittest.TestCase):
+    def setUp(self):
+        (self.traj_all, self.poi_all) = gen_traj_all()
+        self.traj_dict = extract_trajs(self.traj_all)
+        self.trajid_set_all = sorted(self.traj_dict.keys())
+        poi_info = calc_poi_info(self.trajid_set_all, self.traj_all, self.poi_all)
+        self.poi_cats = sorted(poi_info['poiCat'].unique().tolist())
+        self.logbins_pop = gen_logbins(poi_info['popularity'], 5)
+        self.logbins_visit = gen_logbins(poi_info['nVisit'], 5)
+        self.logbins_duration = gen_logbins(poi_info['avgDuration'], 5, duration=True)
+        self.poi_clusters = pd.DataFrame({'clusterID': np.arange(len(self.poi_all)) % 3}, index=self.poi_all.index)
+
+
+    def expected(self, trajid_list, poi_info):
+        nbins = len(self.logbins_pop) - 1
+        features = {'cat': (self.poi_cats, lambda p: poi_info.loc[p, 'poiCat']), \
+                    'pop': (np.arange(1, nbins+1), lambda p: np.digitize(poi_info.loc[p, 'popularity'], self.logbins_pop)), \
+                    'visit': (np.arange(1, nbins+1), lambda p: np.digitize(poi_info.loc[p, 'nVisit'], self.logbins_visit)), \
+                    'duration': (np.arange(1, nbins+1), \
+                                 lambda p: np.digitize(poi_info.loc[p, 'avgDuration'], self.logbins_duration)), \
+                    'neighbor': (np.arange(3), lambda p: self.poi_clusters.loc[p, 'clusterID'])}
+        return {kind: gen_transmat_loop(trajid_list, self.traj_dict, *features[kind]) for kind in KINDS}, \
+               (lambda p: tuple(features[kind][1](p) for kind in KINDS))
+
+
+    def transmats(self, counter, trajid_list, poi_info):
+        return counter.transmats(trajid_list, poi_info, self.poi_cats, self.logbins_pop, self.logbins_visit, \
+                                 self.logbins_duration, self.poi_clusters)
+
+
+    def test_normalise_transmat(self):
+        cnt = pd.DataFrame(np.arange(12, dtype=float).reshape(3, 4), index=['a', 'b', 'c'])
+        pd.testing.assert_frame_equal(normalise_transmat(cnt), normalise_transmat_loop(cnt))
+
+
+    def test_transmats(self):
+        counter = TransitionCounter(self.traj_dict)
+        # all trajectories, leave-one-out folds, a small fold and repeated trajectories
+        folds = [self.trajid_set_all] + [[x for x in self.trajid_set_all if x != tid] for tid in [0, 17, 199]] + \
+                [list(range(10, 40)), [3, 3, 5, 8, 8, 8] + list(range(50, 120))]
+        for trajid_list in folds:
+            with self.subTest(n=len(trajid_list)):
+                poi_info = calc_poi_info(trajid_list, self.traj_all, self.poi_all)
+                (expected, _) = self.expected(trajid_list, poi_info)
+                result = self.transmats(counter, trajid_list, poi_info)
+                for kind in KINDS:
+                    pd.testing.assert_frame_equal(result[kind], expected[kind], check_exact=True)
+
+        # cached
+        poi_info = calc_poi_info(folds[1], self.traj_all, self.poi_all)
+        self.assertIs(self.transmats(counter, folds[1], poi_info), self.transmats(counter, folds[1], poi_info))
+
+
+
+    def test_poi_transmat(self):
+        counter = TransitionCounter(self.traj_dict)
+        # few POI clusters and classes, i.e. many POIs with the same classes
+        self.poi_clusters['clusterID'] = np.arange(len(self.poi_all)) % 2
+        for trajid_list in [self.trajid_set_all, list(range(10, 60))]:
+            with self.subTest(n=len(trajid_list)):
+                poi_info = calc_poi_info(trajid_list, self.traj_all, self.poi_all)
+                transmats = self.transmats(counter, trajid_list, poi_info)
+                (_, features) = self.expected(trajid_list, poi_info)
+                expected = gen_poi_transmat_loop(transmats, set(poi_info.index), poi_info, features)
+                result = gen_poi_transmat(transmats, set(poi_info.index), poi_info, self.poi_cats, self.logbins_pop, \
+                                          self.logbins_visit, self.logbins_duration, self.poi_clusters)
+                pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+                np.testing.assert_allclose(result.sum(axis=1), 1, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+import sys
+import numpy as np
+from multiprocessing import Pool
+from poi_mapping import PoiIndex, calc_dist_vec
+
+
+def decode_batch(photo_dists, poi_dists, dist_max, alpha=1):
+    """Map a batch of photo sequences of the same length to POI sequences with minimum total cost, i.e.
+         cost = sum(distance(photo_i, POI_i)) + alpha * sum(distance(POI_i, POI_{i+1}))
+       the same DP (Viterbi) as decode_photo_seq() in traj_Melb.ipynb on NumPy arrays,
+       photo_dists: (B, n, C) distances from photos to the candidate POIs of each sequence,
+       poi_dists:   (B, C, C) distances between candidate POIs,
+       POIs farther than dist_max from a photo (or padding, np.inf) are not mapped to it,
+       return the (B, n) positions of candidates, ties are broken by the smaller position
+    """
+    (B, n, C) = photo_dists.shape
+    assert(n > 0)
+    assert(poi_dists.shape == (B, C, C))
+    far = photo_dists > dist_max
+
+    # cost[b, j] is the minimum cost of the photos so far among POI sequences ending with candidate j
+    cost = np.where(far[:, 0], np.inf, photo_dists[:, 0])
+    trace = np.zeros((B, n, C), dtype=np.int64)
+    for i in range(1, n):
+        # costs[b, k, j]: distance(photo_i, POI_j) + alpha * distance(POI_k, POI_j) + previous cost of POI_k
+        costs = photo_dists[:, i, None, :] + alpha * poi_dists
+        costs += cost[:, :, None]
+        trace[:, i] = np.argmin(costs, axis=1)
+        cost = costs.min(axis=1)
+        cost[far[:, i]] = np.inf
+        trace[:, i][far[:, i]] = 0
+
+    # trace back from the end POIs
+    seqs = np.zeros((B, n), dtype=np.int64)
+    seqs[:, -1] = np.argmin(cost, axis=1)
+    for i in range(n - 1, 0, -1):
+        seqs[:, i-1] = trace[np.arange(B), i, seqs[:, i]]
+    return seqs
+
+
+def decode_sequences(seq_offsets, offsets, pois, dists, poi_lngs, poi_lats, dist_max, alpha=1, batch_size=1 << 22):
+    """Map photo sequences to POI sequences, see decode_batch(),
+       photos of sequence s are photos seq_offsets[s]:seq_offsets[s+1] (in time order),
+       the candidate POIs of photo i are pois[offsets[i]:offsets[i+1]] at distances dists[...] (see PoiIndex.within()),
+       candidates of a sequence are the POIs close to any of its photos (sorted by position as the notebook),
+       sequences of the same length are decoded together in batches of about batch_size DP cells,
+       return the POI of each photo
+    """
+    nphotos = len(offsets) - 1
+    assert(seq_offsets[-1] == nphotos)
+    result = np.full(nphotos, -1, dtype=np.int64)
+    if nphotos == 0: return result
+    assert(np.all(np.diff(offsets) > 0)), 'every photo needs a POI within dist_max'
+
+    npois = len(poi_lngs)
+    lens = np.diff(seq_offsets)
+    seq_of_photo = np.repeat(np.arange(len(lens)), lens)
+    seq_of_entry = np.repeat(seq_of_photo, np.diff(offsets))
+
+    # candidates of each sequence in CSR form (cand_offsets, cand_pois), sorted by position
+    keys = np.unique(seq_of_entry * npois + pois)
+    cand_offsets = np.searchsorted(keys, np.arange(len(lens) + 1) * npois).astype(np.int64)
+    cand_pois = keys % npois
+    ncands = np.diff(cand_offsets)
+    # column of each candidate entry in the matrix of its sequence
+    cols = np.searchsorted(keys, seq_of_entry * npois + pois) - cand_offsets[seq_of_entry]
+
+    order = np.lexsort((ncands, lens))  # similar sizes together, i.e. little padding
+    start = 0
+    while start < len(order):
+        n = lens[order[start]]
+        # a batch of sequences of length n
+        end = start + 1
+        C = ncands[order[start]]
+        while end < len(order) and lens[order[end]] == n and (end - start + 1) * max(n, ncands[order[end]]) * \
+                                                                   ncands[order[end]] <= batch_size:
+            C = ncands[order[end]]
+            end += 1
+        seqs = order[start:end]
+        B = len(seqs)
+        start = end
+
+        # distances from photos to candidates, np.inf if not a candidate of a photo
+        photo_dists = np.full((B, n, C), np.inf)
+        photos = (seq_offsets[seqs][:, None] + np.arange(n)).ravel()
+        counts = np.diff(offsets)[photos]
+        entries = np.repeat(offsets[photos] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        photo_dists[np.repeat(np.arange(B * n) // n, counts), np.repeat(np.arange(B * n) % n, counts), cols[entries]] = \
+            dists[entries]
+
+        # distances between candidates (padded with the first candidate)
+        cand = np.zeros((B, C), dtype=np.int64)
+        valid = np.arange(C) < ncands[seqs][:, None]
+        counts = ncands[seqs]
+        cand[valid] = cand_pois[np.repeat(cand_offsets[seqs] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        cand[~valid] = np.repeat(cand[:, 0], C - counts)
+        poi_dists = calc_dist_vec(poi_lngs[cand][:, :, None], poi_lats[cand][:, :, None], \
+                                  poi_lngs[cand][:, None, :], poi_lats[cand][:, None, :])
+
+        result[photos] = np.take_along_axis(cand, decode_batch(photo_dists, poi_dists, dist_max, alpha), axis=1).ravel()
+    return result
+
+
+def map_chunk(args):
+    """Map a chunk of photos sorted by user and time (all photos of its users) in a worker process,
+       return (POI position, sequence number in the chunk) of each photo, -1 for dropped photos
+    """
+    (ranks, times, photo_lngs, photo_lats, poi_lngs, poi_lats, dist_max, time_gap, alpha) = args
+    pois = np.full(len(times), -1, dtype=np.int64)
+    seq_ids = np.full(len(times), -1, dtype=np.int64)
+    (offsets, cands, dists) = PoiIndex(poi_lngs, poi_lats).within(photo_lngs, photo_lats, dist_max)
+    kept = np.flatnonzero(np.diff(offsets) > 0)
+    if len(kept) == 0: return pois, seq_ids
+
+    # split the travel history of each user into sequences
+    (r, t) = (ranks[kept], times[kept])
+    splits = np.flatnonzero((r[1:] != r[:-1]) | (t[1:] - t[:-1] > time_gap)) + 1
+    seq_offsets = np.concatenate(([0], splits, [len(kept)])).astype(np.int64)
+
+    # candidates of the kept photos
+    counts = np.diff(offsets)[kept]
+    entries = np.repeat(offsets[kept] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    kept_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    pois[kept] = decode_sequences(seq_offsets, kept_offsets, cands[entries], dists[entries], poi_lngs, poi_lats, \
+                                  dist_max, alpha)
+    seq_ids[kept] = np.repeat(np.arange(len(seq_offsets) - 1), np.diff(seq_offsets))
+    return pois, seq_ids
+
+
+def map_trajectories(users, times, photo_lngs, photo_lats, poi_lngs, poi_lats, dist_max=0.2, time_gap=8*60*60, \
+                     alpha=1, workers=1):
+    """Map photos to POIs and build trajectories, the same as the DP approach (map_dp) in traj_Melb.ipynb:
+       photos farther than dist_max (km) from all POIs are dropped, the photos of each user (in the order of user IDs)
+       are sorted by time (stable) and split into trajectories if the time gap (seconds) is more than time_gap,
+       and the photos of each trajectory are mapped to POIs by decode_batch(),
+       users are split into chunks of about the same number of photos which are mapped by workers processes,
+       return (POI position, trajectory ID) of each photo, -1 for dropped photos,
+       POI positions are used to break ties, i.e. POIs should be sorted by poiID as the columns in the notebook
+    """
+    assert(dist_max > 0)
+    assert(time_gap > 0)
+    assert(workers >= 1)
+    nphotos = len(times)
+    assert(len(users) == nphotos and len(photo_lngs) == nphotos and len(photo_lats) == nphotos)
+    photo_lngs = np.asarray(photo_lngs, dtype=np.float64)
+    photo_lats = np.asarray(photo_lats, dtype=np.float64)
+    poi_lngs = np.asarray(poi_lngs, dtype=np.float64)
+    poi_lats = np.asarray(poi_lats, dtype=np.float64)
+    times = np.asarray(times)
+
+    # sort photos by user and time (stable), dropping photos later does not change the order of the others
+    ranks = np.unique(np.asarray(users), return_inverse=True)[1].ravel()
+    index = np.lexsort((times, ranks))
+    ranks = ranks[index]
+
+    # chunks of users with about the same number of photos
+    user_starts = np.flatnonzero(np.diff(ranks)) + 1
+    bounds = user_starts[np.unique(np.searchsorted(user_starts, np.linspace(0, nphotos, workers + 1)[1:-1]))] \
+             if len(user_starts) > 0 else np.zeros(0, dtype=np.int64)
+    bounds = np.unique(np.concatenate(([0], bounds, [nphotos]))).astype(np.int64)
+    tasks = [(ranks[p1:p2], times[index[p1:p2]], photo_lngs[index[p1:p2]], photo_lats[index[p1:p2]], \
+              poi_lngs, poi_lats, dist_max, time_gap, alpha) for (p1, p2) in zip(bounds[:-1], bounds[1:])]
+    if workers > 1 and len(tasks) > 1:
+        with Pool(processes=workers) as pool:
+            results = pool.map(map_chunk, tasks, chunksize=1)
+    else:
+        results = [map_chunk(task) for task in tasks]
+
+    pois = np.full(nphotos, -1, dtype=np.int64)
+    traj_ids = np.full(nphotos, -1, dtype=np.int64)
+    tid = 0
+    for ((p1, p2), (chunk_pois, seq_ids)) in zip(zip(bounds[:-1], bounds[1:]), results):
+        pois[index[p1:p2]] = chunk_pois
+        traj_ids[index[p1:p2]] = np.where(seq_ids >= 0, seq_ids + tid, -1)
+        tid += seq_ids.max() + 1 if len(seq_ids) > 0 else 0
+    return pois, traj_ids
+
+
+def calc_cost(traj_ids, times, pois, photo_lngs, photo_lats, poi_lngs, poi_lats):
+    """Total cost of mapped trajectories, the same as calc_cost() in traj_Melb.ipynb (up to the order of summation),
+       i.e. the distances from photos to their POIs plus the distances between consecutive POIs of each trajectory,
+       photos with POI -1 are ignored
+    """
+    pois = np.asarray(pois)
+    mapped = np.flatnonzero(pois != -1)
+    index = mapped[np.lexsort((np.asarray(times)[mapped], np.asarray(traj_ids)[mapped]))]
+    (tids, pois) = (np.asarray(traj_ids)[index], pois[index])
+    poi_lngs = np.asarray(poi_lngs, dtype=np.float64)
+    poi_lats = np.asarray(poi_lats, dtype=np.float64)
+    cost = calc_dist_vec(np.asarray(photo_lngs, dtype=np.float64)[index], np.asarray(photo_lats, dtype=np.float64)[index], \
+                         poi_lngs[pois], poi_lats[pois]).sum()
+    same = tids[1:] == tids[:-1]
+    cost += calc_dist_vec(poi_lngs[pois[:-1][same]], poi_lats[pois[:-1][same]], \
+                          poi_lngs[pois[1:][same]], poi_lats[pois[1:][same]]).sum()
+    return cost
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [3, 4]:
+        print('Usage:', sys.argv[0], 'PHOTO_FILE(CSV)  POI_FILE(CSV)  [WORKERS]')
+        print('e.g. :', sys.argv[0], 'Melb_photos_bigbox.csv  poi-Melb-all.csv  4')
+        print('print Photo_ID, poiID and trajID of each photo (-1 if it is farther than 0.2km from all POIs)')
+        sys.exit(0)
+
+    import pandas as pd
+    from generate_tables import load_data
+
+    data = load_data(sys.argv[1])
+    poi_df = pd.read_csv(sys.argv[2]).sort_values(by='poiID')
+    users = np.array(data.users.tolist(), dtype=object)[np.asarray(data.user)]
+    (pois, traj_ids) = map_trajectories(users, np.asarray(data.time), data.lng, data.lat, \
+                                        poi_df['poiLon'].values, poi_df['poiLat'].values, \
+                                        workers=int(sys.argv[3]) if len(sys.argv) == 4 else 1)
+    print('cost:', calc_cost(traj_ids, data.time, pois, data.lng, data.lat, poi_df['poiLon'].values, \
+                             poi_df['poiLat'].values), file=sys.stderr)
+    poi_ids = np.where(pois >= 0, poi_df['poiID'].values[pois], -1)
+    print('Photo_ID,poiID,trajID')
+    for (pid, poi, tid) in zip(np.asarray(data.pid).tolist(), poi_ids.tolist(), traj_ids.tolist()):
+        print('%d,%d,%d' % (pid, poi, tid))
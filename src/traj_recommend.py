@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+import sys
+import heapq
+import pickle
+import numpy as np
+import pandas as pd
+
+
+LOG_SMALL = -10  # log10 of counts/durations less than 1, the same as shared.py of the trained model
+BEAM_WIDTH = 300  # #states of beam search if the exact search is too expensive, the same top 10 of Melbourne up to length 10
+PARAMS = ['poi_ids', 'cat', 'ncats', 'cluster', 'nclusters', 'pop', 'nvisit', 'duration', 'distmat', \
+          'node_scale', 'node_min', 'w_node', 'edge_features', 'w_edge']
+
+
+class Stub:
+    """Placeholder of classes of the trained model that are not available (ssvm, shared, sklearn, pystruct)"""
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+# index classes of the pandas version used to pickle the model
+PANDAS_RENAMES = {('pandas.indexes.base', '_new_Index'): pd.core.indexes.base._new_Index, \
+                  ('pandas.indexes.base', 'Index'): pd.Index, \
+                  ('pandas.indexes.numeric', 'Int64Index'): pd.Index, \
+                  ('pandas.indexes.numeric', 'Float64Index'): pd.Index, \
+                  ('pandas.indexes.range', 'RangeIndex'): pd.RangeIndex}
+
+
+class ModelUnpickler(pd.compat.pickle_compat.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) in PANDAS_RENAMES:
+            return PANDAS_RENAMES[(module, name)]
+        try:
+            return super().find_class(module, name)
+        except (ImportError, AttributeError):
+            return type(name, (Stub,), {'__module__': module})
+
+
+def load_pickle(fname):
+    """Scoring parameters (a dictionary of arrays, see PARAMS) of the trained SSVM in recommender/model-Melb.pkl,
+       read without ssvm.pyc/shared.pyc (python 3.5.3 only), sklearn or pystruct
+    """
+    with open(fname, 'rb') as f:
+        model = ModelUnpickler(f).load()['MODEL']
+    assert(model.trained == True)
+    assert(model.share_params == True)
+    dat_obj = model.dat_obj
+    poi_ids = np.array(model.poi_list, dtype=np.int64)
+    info = model.poi_info.loc[poi_ids]
+    (nfeatures, nedge_features) = (model.fdim_node[1], model.edge_features.shape[2])
+    w = model.osssvm.w
+    assert(len(w) == nfeatures + nedge_features)
+    params = dict()
+    params['poi_ids'] = poi_ids
+    params['cat'] = pd.Index(dat_obj.POI_CAT_LIST).get_indexer(info['poiCat'])
+    params['ncats'] = len(dat_obj.POI_CAT_LIST)
+    params['cluster'] = pd.Index(dat_obj.POI_CLUSTER_LIST).get_indexer(dat_obj.POI_CLUSTERS.loc[poi_ids, 'clusterID'])
+    params['nclusters'] = len(dat_obj.POI_CLUSTER_LIST)
+    params['pop'] = info['popularity'].values.astype(np.float64)
+    params['nvisit'] = info['nVisit'].values.astype(np.float64)
+    params['duration'] = info['avgDuration'].values.astype(np.float64)
+    params['distmat'] = dat_obj.POI_DISTMAT.loc[poi_ids, poi_ids].values.astype(np.float64)
+    params['node_scale'] = model.scaler_node.scale_
+    params['node_min'] = model.scaler_node.min_
+    params['w_node'] = w[:nfeatures]
+    params['edge_features'] = model.edge_features  # scaled when training
+    params['w_edge'] = w[nfeatures:]
+    return params
+
+
+def backward(U, P, starts, L):
+    """Best scores of (loopy) suffixes: beta[b, t, p] is the maximum score of POIs at positions t+1, ..., L-1 of
+       query b given POI p at position t, U is a (#queries, #POIs) array of node scores and P a (#POIs, #POIs) array of
+       transition scores, transitions to the start POIs and self-loops are excluded
+    """
+    (B, M) = U.shape
+    beta = np.zeros((B, L, M))
+    for t in range(L - 2, -1, -1):
+        S = P[None, :, :] + (U + beta[:, t+1])[:, None, :]
+        S[np.arange(B), :, starts] = -np.inf
+        beta[:, t] = S.max(axis=2)
+    return beta
+
+
+def simple_bounds(h, visited, r):
+    """Upper bounds of the scores of r more POIs without loops after each POI p (taken next), i.e. the sum of the
+       best r entry scores h (node score plus the best incoming transition) of POIs not visited and not p,
+       h is an array of #POIs values and visited a boolean array (..., #POIs)
+    """
+    if r == 0:
+        return np.zeros(visited.shape)
+    vals = -np.sort(np.where(visited, np.inf, -h), axis=-1)  # descending, visited POIs are -inf
+    vals = np.concatenate([vals, np.full(vals.shape[:-1] + (1,), -np.inf)], axis=-1)
+    S = vals[..., :r].sum(axis=-1)[..., None]
+    (vr, vnext) = (vals[..., r-1:r], vals[..., r:r+1])
+    return np.where(h >= vr, S - h + vnext, S)
+
+
+def list_viterbi(u, P, ps, L, k, beta, max_pops=20000):
+    """The k best trajectories (POI indices) without loops of length L starting at POI ps, and their scores,
+       u is an array of node scores, P the transition scores and beta[t, p] the scores of backward(),
+       trajectories come out in the order of the list Viterbi algorithm with loops rejected (the inference of the
+       trained model), i.e. best-first search of prefixes bounded by their best completion (the smaller of the
+       best loopy completion and simple_bounds()), return None if it needs more than max_pops expansions,
+       prefixes with the same POIs and the same last POI have the same completions, so only the best k of them are
+       expanded (they are popped in the order of their scores)
+    """
+    M = len(u)
+    h = u + P.max(axis=0)
+    results = []
+    counter = 0
+    heap = []
+    expanded = dict()  # (POIs as a bit mask, last POI) --> #prefixes expanded
+
+    def push_children(prefix, score):
+        # children of a prefix sorted by bound, pushed lazily one after another
+        nonlocal counter
+        t = len(prefix)
+        visited = np.zeros(M, dtype=bool)
+        visited[list(prefix)] = True
+        cand = score + P[prefix[-1]] + u
+        cand[visited] = -np.inf
+        bound = cand + np.minimum(beta[t], simple_bounds(h, visited, L - 1 - t))
+        order = np.argsort(-bound, kind='stable')
+        order = order[np.isfinite(bound[order])]
+        if len(order) > 0:
+            heapq.heappush(heap, (-bound[order[0]], counter, prefix, (order, cand, bound, 0)))
+            counter += 1
+
+    push_children((ps,), u[ps])
+    npops = 0
+    while len(heap) > 0 and len(results) < k:
+        npops += 1
+        if npops > max_pops:
+            return None
+        (_, _, prefix, (order, cand, bound, j)) = heapq.heappop(heap)
+        if j + 1 < len(order):  # the next sibling
+            heapq.heappush(heap, (-bound[order[j+1]], counter, prefix, (order, cand, bound, j + 1)))
+            counter += 1
+        p = order[j]
+        if len(prefix) + 1 == L:
+            results.append((prefix + (p,), cand[p]))
+            continue
+        state = (sum(1 << int(x) for x in prefix) | (1 << int(p)), p)
+        n = expanded.get(state, 0)
+        if n < k:
+            expanded[state] = n + 1
+            push_children(prefix + (p,), cand[p])
+    return [np.array(y) for (y, _) in results], np.array([s for (_, s) in results])
+
+
+def select_states(bound, keys, k, width):
+    """Positions of the candidates kept in a beam (a boolean array like bound): candidates of the best width states
+       (ranked by their best bound) of each row, at most k of each state, candidates are sorted by bound in rows
+    """
+    (B, T) = bound.shape
+    rows = np.repeat(np.arange(B), T)
+    pos = np.tile(np.arange(T), B)
+    order = np.lexsort((pos, keys.ravel(), rows))
+    (r, key) = (rows[order], keys.ravel()[order])
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (r[1:] != r[:-1]) | (key[1:] != key[:-1])
+    group_starts = np.flatnonzero(first)
+    group = np.cumsum(first) - 1
+    rank_in_group = np.arange(len(order)) - group_starts[group]
+    # groups of a row ranked by the position of their first (best) candidate
+    gorder = np.lexsort((pos[order][group_starts], r[group_starts]))
+    grow = r[group_starts][gorder]
+    gfirst = np.ones(len(gorder), dtype=bool)
+    gfirst[1:] = grow[1:] != grow[:-1]
+    gstarts = np.flatnonzero(gfirst)
+    state_rank = np.empty(len(gorder), dtype=np.int64)
+    state_rank[gorder] = np.arange(len(gorder)) - gstarts[np.cumsum(gfirst) - 1]
+    keep = np.zeros(B * T, dtype=bool)
+    keep[order] = (rank_in_group < k) & (state_rank[group] < width)
+    return keep.reshape(B, T) & np.isfinite(bound)
+
+
+def beam_search(U, P, starts, L, k, width, beta, seed=0):
+    """The best k trajectories without loops of length L of each query (batched, starts[b] is the start POI of
+       query b) by beam search, prefixes of the best width states (POIs visited, last POI) of each query are kept at
+       each position, at most k of each state (the others cannot be in the top k), ranked by the bound of their
+       completion as list_viterbi(), return (trajectories (#queries, k, L), scores (#queries, k)),
+       scores are -inf if there are less than k trajectories
+    """
+    (B, M) = U.shape
+    H = U + P.max(axis=0)[None, :]
+    rng = np.random.RandomState(seed)  # random keys of POIs, a set of POIs is hashed to the sum of its keys
+    (zset, zlast) = [rng.randint(0, 2**63, size=M, dtype=np.int64).astype(np.uint64) for _ in range(2)]
+    rows = np.arange(B)
+    paths = starts.reshape(B, 1, 1)
+    scores = U[rows, starts].reshape(B, 1)
+    visited = np.zeros((B, 1, M), dtype=bool)
+    visited[rows, 0, starts] = True
+    hashes = zset[starts].reshape(B, 1)
+    for t in range(1, L):
+        cand = scores[:, :, None] + P[paths[:, :, -1]] + U[:, None, :]
+        cand[visited] = -np.inf
+        bound = cand + np.minimum(beta[:, t][:, None, :], simple_bounds(H[:, None, :], visited, L - 1 - t))
+        bound = bound.reshape(B, -1)
+        T = min(width * k, bound.shape[1])
+        ix = np.argpartition(-bound, T - 1, axis=1)[:, :T] if T < bound.shape[1] else np.tile(np.arange(T), (B, 1))
+        ix = np.take_along_axis(ix, np.argsort(-np.take_along_axis(bound, ix, axis=1), axis=1, kind='stable'), axis=1)
+        (parent, poi) = (ix // M, ix % M)
+        child_hashes = hashes[rows[:, None], parent] + zset[poi]
+        keep = select_states(np.take_along_axis(bound, ix, axis=1), child_hashes ^ zlast[poi], k, width)
+        N = max(1, keep.sum(axis=1).max())
+        sel = np.argsort(~keep, axis=1, kind='stable')[:, :N]  # kept candidates first, in the order of bound
+        (ix, parent, poi) = [np.take_along_axis(a, sel, axis=1) for a in (ix, parent, poi)]
+        paths = np.concatenate([paths[rows[:, None], parent], poi[:, :, None]], axis=2)
+        scores = np.where(np.take_along_axis(keep, sel, axis=1), cand.reshape(B, -1)[rows[:, None], ix], -np.inf)
+        hashes = np.take_along_axis(child_hashes, sel, axis=1)
+        visited = visited[rows[:, None], parent]
+        visited[rows[:, None], np.arange(N)[None, :], poi] = True
+    return paths[:, :k], np.pad(scores[:, :k], ((0, 0), (0, k - min(k, scores.shape[1]))), constant_values=-np.inf)
+
+
+class TrajRecommender:
+    """Trajectory recommendation with the scoring parameters of the trained SSVM (recommender/model-Melb.pkl),
+       node scores of POIs are computed for a batch of queries (start POI, length) at once, the top k trajectories
+       are decoded exactly as the list Viterbi inference of the model, or by beam search of a bounded width
+    """
+    def __init__(self, params):
+        for key in PARAMS:
+            assert(key in params)
+        self.params = params
+        self.poi_ids = np.asarray(params['poi_ids'])
+        self.index = pd.Index(self.poi_ids)
+        self.M = len(self.poi_ids)
+        P = np.asarray(params['edge_features']).dot(params['w_edge'])
+        P[np.arange(self.M), np.arange(self.M)] = -np.inf  # no self-loops
+        self.P = P
+
+        # features which do not depend on queries
+        (cat, cluster) = (np.asarray(params['cat']), np.asarray(params['cluster']))
+        logs = [np.where(params[key] < 1, LOG_SMALL, np.log10(np.maximum(params[key], 1))) \
+                for key in ['pop', 'nvisit', 'duration']]
+        self.static = np.hstack([np.where(cat[:, None] == np.arange(params['ncats']), 1., -1.), \
+                                 np.where(cluster[:, None] == np.arange(params['nclusters']), 1., -1.), \
+                                 np.stack(logs, axis=1)])
+
+
+    @classmethod
+    def load(cls, fname):
+        """A recommender of a pickled model, or of parameters exported by export()"""
+        if fname.endswith('.npz'):
+            with np.load(fname) as data:
+                return cls(dict((key, data[key]) for key in PARAMS))
+        return cls(load_pickle(fname))
+
+
+    def export(self, fname):
+        """Save scoring parameters as a .npz file (arrays only)"""
+        np.savez(fname, **self.params)
+
+
+    def node_features(self, starts, lens):
+        """Node features of all POIs for queries (starts[b], lens[b]) where starts are POI indices,
+           a (#queries, #POIs, #features) array, the same as calc_node_features() in ssvm.py of the model
+        """
+        p = self.params
+        (B, M) = (len(starts), self.M)
+        X = np.empty((B, M, self.static.shape[1] + 7))
+        n = self.static.shape[1]
+        X[:, :, :n] = self.static[None, :, :]
+        X[:, :, n] = np.asarray(lens)[:, None]
+        X[:, :, n+1] = np.where(p['cat'][None, :] == p['cat'][starts][:, None], 1, -1)
+        X[:, :, n+2] = p['distmat'][:, starts].T
+        X[:, :, n+3] = p['pop'][None, :] - p['pop'][starts][:, None]
+        X[:, :, n+4] = p['nvisit'][None, :] - p['nvisit'][starts][:, None]
+        X[:, :, n+5] = p['duration'][None, :] - p['duration'][starts][:, None]
+        X[:, :, n+6] = np.where(p['cluster'][None, :] == p['cluster'][starts][:, None], 1, -1)
+        return X
+
+
+    def node_scores(self, starts, lens):
+        """Scores of all POIs for queries, i.e. scaled node features times the node weights"""
+        X = self.node_features(starts, lens) * self.params['node_scale'] + self.params['node_min']
+        return X.dot(self.params['w_node'])
+
+
+    def traj_scores(self, trajs):
+        """Scores of trajectories (sequences of POI IDs) given their queries (start POI, length)"""
+        scores = np.empty(len(trajs))
+        for (i, traj) in enumerate(trajs):
+            y = self.index.get_indexer(traj)
+            assert(np.all(y >= 0))
+            u = self.node_scores(y[:1], [len(y)])[0]
+            scores[i] = u[y].sum() + self.P[y[:-1], y[1:]].sum()
+        return scores
+
+
+    def recommend(self, queries, k=10, beam=None, max_pops=20000):
+        """Top k trajectories (arrays of POI IDs) of each query (startPOI, length), None if startPOI is unknown
+           (the same as the predict() of the model), exact if beam is None (falling back to beam search of width
+           BEAM_WIDTH if a query needs more than max_pops expansions), otherwise beam search of width beam
+        """
+        results = [None] * len(queries)
+        ix = self.index.get_indexer([q[0] for q in queries])
+        lens = np.array([q[1] for q in queries], dtype=np.int64)
+        for L in np.unique(lens[ix >= 0]).tolist():
+            assert(2 <= L <= self.M)
+            qix = np.flatnonzero((ix >= 0) & (lens == L))
+            starts = ix[qix]
+            U = self.node_scores(starts, lens[qix])
+            beta = backward(U, self.P, starts, L)
+            todo = np.arange(len(qix))
+            if beam is None:
+                todo = []
+                for b in range(len(qix)):
+                    res = list_viterbi(U[b], self.P, starts[b], L, k, beta[b], max_pops)
+                    if res is None:
+                        todo.append(b)
+                    else:
+                        results[qix[b]] = [self.poi_ids[y] for y in res[0]]
+                todo = np.array(todo, dtype=np.int64)
+            if len(todo) > 0:
+                width = BEAM_WIDTH if beam is None else beam
+                (paths, scores) = beam_search(U[todo], self.P, starts[todo], L, k, width, beta[todo])
+                for (i, b) in enumerate(todo.tolist()):
+                    results[qix[b]] = [self.poi_ids[y] for (y, s) in zip(paths[i], scores[i]) if np.isfinite(s)]
+        return results
+
+
+    def predict(self, startPOI, nPOI):
+        """The same as the predict() of the model: a list of 10 trajectories, or None if startPOI is unknown"""
+        return self.recommend([(startPOI, nPOI)])[0]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [3, 4, 5]:
+        print('Usage:', sys.argv[0], 'MODEL_FILE(PKL|NPZ)  START_POI  LENGTH  [BEAM_WIDTH]')
+        print('       ', sys.argv[0], 'MODEL_FILE(PKL)  OUTPUT_FILE(NPZ)')
+        print('e.g. :', sys.argv[0], 'recommender/model-Melb.pkl  9  8')
+        sys.exit(0)
+
+    recommender = TrajRecommender.load(sys.argv[1])
+    if len(sys.argv) == 3:
+        recommender.export(sys.argv[2])
+        sys.exit(0)
+    beam = int(sys.argv[4]) if len(sys.argv) == 5 else None
+    recommendations = recommender.recommend([(int(sys.argv[2]), int(sys.argv[3]))], beam=beam)[0]
+    assert(recommendations is not None), 'Unknown start POI'
+    for i in range(len(recommendations)):
+        print('Top %d recommendation: %s' % (i+1, str(recommendations[i].tolist())))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+
+
+# Index of the trajectory tables of generate_tables.py, a directory with
+#   meta.json:          format version, sizes and modification times of both tables
+#   photos_offsets.npy: CSR offsets of Trajectory_ID --> runs of rows in the photo table (trajectory_photos.csv)
+#   photos_runs.npy:    (start, end) byte offsets of each run of rows of the same trajectory
+#   stats_offsets.npy:  the same for the stats table (trajectory_stats.csv)
+#   stats_runs.npy
+INDEX_VERSION = 1
+
+
+def scan_runs(fname, chunk_size=1 << 26):
+    """Scan a table (CSV with header, the first column is Trajectory_ID) in binary chunks,
+       return (ids, starts, ends) of runs of consecutive rows with the same Trajectory_ID,
+       where [starts, ends) are byte offsets
+    """
+    runs = []
+    with open(fname, 'rb') as f:
+        pos = len(f.readline())  # header
+        rest = b''
+        while True:
+            chunk = f.read(chunk_size)
+            buf = rest + chunk
+            if len(chunk) == 0 and len(buf.strip()) > 0:
+                buf += b'\n'  # the last line may not end with a newline
+            end = buf.rfind(b'\n') + 1
+            rest = buf[end:]
+            if end > 0:
+                runs.append(scan_lines(np.frombuffer(buf, dtype=np.uint8, count=len(buf)), end, pos))
+                pos += end
+            if len(chunk) == 0: break
+
+    runs = [r for r in runs if len(r[0]) > 0]
+    if len(runs) == 0:
+        return tuple(np.zeros(0, dtype=np.int64) for i in range(3))
+    (ids, starts, ends) = [np.concatenate([r[j] for r in runs]) for j in range(3)]
+    # merge runs across chunk boundaries
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = (ids[1:] != ids[:-1]) | (starts[1:] != ends[:-1])
+    last = np.ones(len(ids), dtype=bool)
+    last[:-1] = first[1:]
+    return ids[first], starts[first], ends[last]
+
+
+def scan_lines(arr, end, pos):
+    """Runs of complete lines in arr[:end] (see scan_runs()), pos is the offset of arr in the file"""
+    newlines = np.flatnonzero(arr[:end] == ord('\n'))
+    if len(newlines) == 0:
+        return tuple(np.zeros(0, dtype=np.int64) for i in range(3))
+    starts = np.concatenate(([0], newlines[:-1] + 1))
+    ends = newlines + 1
+    nonempty = ends - starts > 1 + (arr[starts] == ord('\r'))
+    starts = starts[nonempty]
+    ends = ends[nonempty]
+
+    # parse Trajectory_ID, the digits before the first comma of each line
+    commas = np.flatnonzero(arr[:end] == ord(','))
+    widths = commas[np.searchsorted(commas, starts)] - starts
+    assert(np.all((widths > 0) & (widths < 19)))
+    ids = np.zeros(len(starts), dtype=np.int64)
+    for k in range(widths.max() if len(widths) > 0 else 0):
+        m = k < widths
+        digits = arr[starts[m] + k].astype(np.int64) - ord('0')
+        assert(np.all((digits >= 0) & (digits <= 9)))
+        ids[m] = ids[m] * 10 + digits
+
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = (ids[1:] != ids[:-1]) | (starts[1:] != ends[:-1])
+    last = np.ones(len(ids), dtype=bool)
+    last[:-1] = first[1:]
+    return ids[first], starts[first] + pos, ends[last] + pos
+
+
+def runs_to_csr(ids, starts, ends):
+    """Sort runs by Trajectory_ID (stable), return (offsets, runs) where runs[offsets[i]:offsets[i+1]] are
+       the byte ranges of trajectory i
+    """
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    nids = ids[-1] + 1 if len(ids) > 0 else 0
+    offsets = np.searchsorted(ids, np.arange(nids + 1)).astype(np.int64)
+    runs = np.stack([starts[order], ends[order]], axis=1).astype(np.int64)
+    return offsets, runs
+
+
+def file_signature(fname):
+    st = os.stat(fname)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def build_index(ftable1, ftable2, findex):
+    """Build the index of both tables and save it to directory findex"""
+    os.makedirs(findex, exist_ok=True)
+    for (name, fname) in [('photos', ftable1), ('stats', ftable2)]:
+        offsets, runs = runs_to_csr(*scan_runs(fname))
+        np.save(os.path.join(findex, name + '_offsets.npy'), offsets)
+        np.save(os.path.join(findex, name + '_runs.npy'), runs)
+    meta = {'version': INDEX_VERSION, 'photos': file_signature(ftable1), 'stats': file_signature(ftable2)}
+    with open(os.path.join(findex, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def is_valid_index(ftable1, ftable2, findex):
+    """Check if the index exists and both tables did not change since it was built"""
+    fmeta = os.path.join(findex, 'meta.json')
+    if not os.path.exists(fmeta): return False
+    with open(fmeta, 'r') as f:
+        meta = json.load(f)
+    return meta.get('version') == INDEX_VERSION and meta['photos'] == file_signature(ftable1) and \
+           meta['stats'] == file_signature(ftable2)
+
+
+class TrajectoryStore:
+    """Random access to trajectories of the tables generated by generate_tables.py by Trajectory_ID,
+       the index (findex, default: TRAJECTORY_PHOTO_FILE.idx) is built on first use and rebuilt if a table changed,
+       it is memory-mapped, i.e. nothing is loaded up front,
+       reading a trajectory costs O(#photos) and its statistics O(1)
+    """
+    def __init__(self, ftable1, ftable2, findex=None):
+        if findex is None:
+            findex = ftable1 + '.idx'
+        if not is_valid_index(ftable1, ftable2, findex):
+            build_index(ftable1, ftable2, findex)
+        self.ftable1 = ftable1
+        self.ftable2 = ftable2
+        self.photos_offsets = np.load(os.path.join(findex, 'photos_offsets.npy'), mmap_mode='r')
+        self.photos_runs = np.load(os.path.join(findex, 'photos_runs.npy'), mmap_mode='r')
+        self.stats_offsets = np.load(os.path.join(findex, 'stats_offsets.npy'), mmap_mode='r')
+        self.stats_runs = np.load(os.path.join(findex, 'stats_runs.npy'), mmap_mode='r')
+        self.f1 = open(ftable1, 'rb')
+        self.f2 = open(ftable2, 'rb')
+        self.header1 = self.f1.readline()
+        self.header2 = self.f2.readline()
+
+
+    def close(self):
+        self.f1.close()
+        self.f2.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __contains__(self, traj_id):
+        return 0 <= traj_id < len(self.stats_offsets) - 1 and \
+               self.stats_offsets[traj_id + 1] > self.stats_offsets[traj_id]
+
+
+    def read_rows(self, f, offsets, runs, traj_id):
+        assert(traj_id >= 0)
+        if traj_id + 1 >= len(offsets): return b''
+        rows = []
+        for j in range(offsets[traj_id], offsets[traj_id + 1]):
+            f.seek(runs[j, 0])
+            row = f.read(runs[j, 1] - runs[j, 0])
+            if not row.endswith(b'\n'): row += b'\n'  # the last line of the file
+            rows.append(row)
+        return b''.join(rows)
+
+
+    def photo_rows(self, traj_id):
+        """Raw CSV rows (bytes) of the photos of a trajectory"""
+        return self.read_rows(self.f1, self.photos_offsets, self.photos_runs, traj_id)
+
+
+    def stats_row(self, traj_id):
+        """Raw CSV row (bytes) of the statistics of a trajectory"""
+        return self.read_rows(self.f2, self.stats_offsets, self.stats_runs, traj_id)
+
+
+    def photos(self, traj_id):
+        """Photos of a trajectory as a DataFrame, the same as the rows of traj_visualise.load_traj()"""
+        return pd.read_csv(io.BytesIO(self.header1 + self.photo_rows(traj_id)), parse_dates=[3], skipinitialspace=True)
+
+
+    def stats(self, traj_id):
+        """Statistics of a trajectory as a Series, the same as a row of traj_visualise.load_traj()"""
+        if traj_id not in self: raise KeyError(traj_id)
+        df = pd.read_csv(io.BytesIO(self.header2 + self.stats_row(traj_id)), parse_dates=[3], skipinitialspace=True)
+        return df.iloc[0]
+
+
+    def stats_table(self):
+        """Statistics of all trajectories as a DataFrame"""
+        return pd.read_csv(self.ftable2, parse_dates=[3], skipinitialspace=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: ', sys.argv[0], 'TRAJECTORY_PHOTO_FILE  TRAJECTORY_STATS_FILE')
+        print('e.g. : ', sys.argv[0], 'trajectory_photos.csv  trajectory_stats.csv')
+        sys.exit(0)
+
+    # (re)build the index
+    with TrajectoryStore(sys.argv[1], sys.argv[2]) as store:
+        print(len(store.stats_offsets) - 1, 'trajectory IDs indexed')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import sys
+import numpy as np
+import pandas as pd
+from poi_info import traj_csr
+
+
+TRAJ_COLUMNS = ['userID', 'trajID', 'poiID', 'startTime', 'endTime', '#photo', 'trajLen', 'poiDuration']
+
+
+def load_visits(fname):
+    """Load POI visits (userVisits-Melb.csv) the same as dataset_Melb.ipynb, i.e. columns photoID, userID, dateTaken,
+       poiID and trajID (seqID)
+    """
+    visits = pd.read_csv(fname, sep=';')
+    visits.drop(['poiTheme', 'poiFreq'], axis=1, inplace=True)
+    visits.rename(columns={'seqID':'trajID'}, inplace=True)
+    return visits
+
+
+def group_starts(*keys):
+    """Positions where any of the (sorted) key arrays changes, starting with 0"""
+    n = len(keys[0])
+    new = np.zeros(n, dtype=bool)
+    new[:1] = True
+    for key in keys:
+        new[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(new)
+
+
+def build_traj_all(visits):
+    """The trajectory table (traj-noloop-all-Melb.csv) of POI visits assuming NO loops/subtours in trajectories, i.e.
+       one row per (userID, trajID, poiID) with columns TRAJ_COLUMNS sorted by them, the same as dataset_Melb.ipynb,
+       computed by one sort of visits and reductions over groups of consecutive rows,
+       and the POI sequences of trajectories (sorted by startTime, the same as poi_info.extract_trajs()) in compressed
+       form (traj_ids, offsets, pois), i.e. the POIs of trajectory traj_ids[i] are pois[offsets[i]:offsets[i+1]]
+    """
+    assert(len(visits) > 0)
+    (users, user_list) = pd.factorize(visits['userID'], sort=True)
+    tids = visits['trajID'].values
+    pois = visits['poiID'].values
+    times = visits['dateTaken'].values
+    order = np.lexsort((times, pois, tids, users))
+    (users, tids, pois, times) = (users[order], tids[order], pois[order], times[order])
+
+    # visits of the same (user, trajectory, POI) are consecutive, sorted by time
+    starts = group_starts(users, tids, pois)
+    ends = np.append(starts[1:], len(order))
+    (users, tids, pois) = (users[starts], tids[starts], pois[starts])
+    traj_starts = group_starts(users, tids)
+    traj_lens = np.diff(np.append(traj_starts, len(starts)))
+
+    traj_all = pd.DataFrame({'userID': np.asarray(user_list)[users], 'trajID': tids, 'poiID': pois, \
+                             'startTime': times[starts], 'endTime': times[ends - 1], '#photo': ends - starts, \
+                             'trajLen': np.repeat(traj_lens, traj_lens)}, columns=TRAJ_COLUMNS)
+    traj_all['poiDuration'] = traj_all['endTime'] - traj_all['startTime']
+    (traj_ids, offsets, rows) = traj_csr(traj_all)
+    return traj_all, (traj_ids, offsets, traj_all['poiID'].values[rows])
+
+
+def extract_trajs_withloop(visits):
+    """Dictionary maps every trajectory ID to the list of its POIs considering loops/subtours, i.e. POIs of visits
+       sorted by dateTaken (visits at the same time in their order) without consecutive duplicates,
+       the same as extract_traj_withloop() in dataset_Melb.ipynb
+    """
+    tids = visits['trajID'].values
+    order = np.lexsort((visits['dateTaken'].values, tids))  # stable
+    (tids, pois) = (tids[order], visits['poiID'].values[order])
+    keep = group_starts(tids, pois)
+    (tids, pois) = (tids[keep], pois[keep].tolist())
+    starts = group_starts(tids)
+    ends = np.append(starts[1:], len(tids)).tolist()
+    return dict((tid, pois[s:e]) for (tid, s, e) in zip(tids[starts].tolist(), starts.tolist(), ends))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage:', sys.argv[0], 'VISITS_FILE(CSV)  OUTPUT_FILE(CSV)')
+        print('e.g. :', sys.argv[0], 'userVisits-Melb.csv  traj-noloop-all-Melb.csv')
+        sys.exit(0)
+
+    visits = load_visits(sys.argv[1])
+    (traj_all, _) = build_traj_all(visits)
+    traj_all.to_csv(sys.argv[2], index=False)
+    trajs = extract_trajs_withloop(visits)
+    print('#trajectories: %d, with loops/subtours: %d' % \
+          (len(trajs), sum(len(t) != len(set(t)) for t in trajs.values())))
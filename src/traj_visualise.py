@@ -6,6 +6,8 @@ import pandas as pd
 from datetime import datetime
 from fastkml import kml, styles
 from shapely.geometry import Point, LineString
+from traj_store import TrajectoryStore
+from profiling import profiled
 
 
 def load_traj(ftable1, ftable2):
@@ -15,8 +17,11 @@ def load_traj(ftable1, ftable2):
     return traj_data, traj_stats
 
 
+@profiled('gen_kml', rows='traj_id_list')
 def gen_kml(fname, traj_data, traj_stats, traj_id_list, traj_name_list=None):
-    """Generate KML file"""
+    """Generate KML file, traj_data is either the photo table (DataFrame) or a TrajectoryStore,
+       placemarks are in the order of traj_id_list in both cases
+    """
     assert(len(traj_id_list) > 0)
     if traj_name_list: 
         assert(len(traj_id_list) == len(traj_name_list))
@@ -30,42 +35,46 @@ def gen_kml(fname, traj_data, traj_stats, traj_id_list, traj_name_list=None):
     doc = kml.Document(ns, '001', 'Trajectories', 'Trajectory visualization', styles=[st])
     k.append(doc)
 
-    stats = traj_stats[traj_stats['Trajectory_ID'].isin(traj_id_list)]
-    assert(stats.shape[0] == len(traj_id_list))
+    if isinstance(traj_data, TrajectoryStore):
+        # random access by Trajectory_ID, traj_stats is not used
+        trajs = [(traj_data.stats(traj_id), traj_data.photos(traj_id)) for traj_id in traj_id_list]
+    else:
+        stats = traj_stats[traj_stats['Trajectory_ID'].isin(traj_id_list)].set_index('Trajectory_ID', drop=False)
+        assert(stats.shape[0] == len(traj_id_list))
+        trajs = [(stats.loc[traj_id], traj_data[traj_data['Trajectory_ID'] == traj_id]) for traj_id in traj_id_list]
 
     pm_traj = []
     pm_photo = []
 
-    for i in range(len(stats.index)):
-        ri = stats.index[i]
-        traj_id = stats.ix[ri]['Trajectory_ID']
-        photos = traj_data[traj_data['Trajectory_ID'] == traj_id]
+    for i in range(len(trajs)):
+        (st, photos) = trajs[i]
+        traj_id = st['Trajectory_ID']
         lngs = [lng for lng in photos['Longitude'].tolist()]
         lats = [lat for lat in photos['Latitude'].tolist()]
         name = 'Trajectory_' + str(traj_id)
         if traj_name_list: name += '_' + traj_name_list[i]
-        desc = 'User_ID: '              + str(stats.ix[ri]['User_ID']) + \
-               '<br/>Start_Time: '      + str(stats.ix[ri]['Start_Time']) + \
-               '<br/>Travel_Distance: ' + str(round(stats.ix[ri]['Travel_Distance(km)'], 2)) + ' km' + \
-               '<br/>Total_Time: '      + str(round(stats.ix[ri]['Total_Time(min)'], 2)) + ' min' + \
-               '<br/>Average_Speed: '   + str(round(stats.ix[ri]['Average_Speed(km/h)'], 2)) + ' km/h' + \
-               '<br/>#Photos: '         + str(stats.ix[ri]['#Photo']) + \
+        desc = 'User_ID: '              + str(st['User_ID']) + \
+               '<br/>Start_Time: '      + str(st['Start_Time']) + \
+               '<br/>Travel_Distance: ' + str(round(st['Travel_Distance(km)'], 2)) + ' km' + \
+               '<br/>Total_Time: '      + str(round(st['Total_Time(min)'], 2)) + ' min' + \
+               '<br/>Average_Speed: '   + str(round(st['Average_Speed(km/h)'], 2)) + ' km/h' + \
+               '<br/>#Photos: '         + str(st['#Photo']) + \
                '<br/>Photos: '          + str(photos['Photo_ID'].tolist())
         pm = kml.Placemark(ns, str(traj_id), name, desc, styleUrl='#' + stid)
         pm.geometry = LineString([(lngs[j], lats[j]) for j in range(len(lngs))])
         pm_traj.append(pm)
 
         for rj in photos.index:
-            name = 'Photo_' + str(photos.ix[rj]['Photo_ID'])
+            name = 'Photo_' + str(photos.loc[rj, 'Photo_ID'])
             desc = 'Trajectory_ID: '  + str(traj_id) + \
-                   '<br/>Photo_ID: '  + str(photos.ix[rj]['Photo_ID']) + \
-                   '<br/>User_ID: '   + str(photos.ix[rj]['User_ID']) + \
-                   '<br/>Timestamp: ' + str(photos.ix[rj]['Timestamp']) + \
-                   '<br/>Coordinates: (' + str(photos.ix[rj]['Longitude']) + ', ' + str(photos.ix[rj]['Latitude']) + ')' + \
-                   '<br/>Accuracy: '  + str(photos.ix[rj]['Accuracy']) + \
-                   '<br/>URL: '       + str(photos.ix[rj]['URL'])
-            pm = kml.Placemark(ns, str(photos.ix[rj]['Photo_ID']), name, desc)
-            pm.geometry = Point(photos.ix[rj]['Longitude'], photos.ix[rj]['Latitude'])
+                   '<br/>Photo_ID: '  + str(photos.loc[rj, 'Photo_ID']) + \
+                   '<br/>User_ID: '   + str(photos.loc[rj, 'User_ID']) + \
+                   '<br/>Timestamp: ' + str(photos.loc[rj, 'Timestamp']) + \
+                   '<br/>Coordinates: (' + str(photos.loc[rj, 'Longitude']) + ', ' + str(photos.loc[rj, 'Latitude']) + ')' + \
+                   '<br/>Accuracy: '  + str(photos.loc[rj, 'Accuracy']) + \
+                   '<br/>URL: '       + str(photos.loc[rj, 'URL'])
+            pm = kml.Placemark(ns, str(photos.loc[rj, 'Photo_ID']), name, desc)
+            pm.geometry = Point(photos.loc[rj, 'Longitude'], photos.loc[rj, 'Latitude'])
             pm_photo.append(pm)
 
     for pm in pm_traj:  doc.append(pm)
@@ -79,8 +88,9 @@ def gen_kml(fname, traj_data, traj_stats, traj_id_list, traj_name_list=None):
 
 def main(ftable1, ftable2):
     """Main Procedure"""
-    # load data
-    traj_data, traj_stats = load_traj(ftable1, ftable2)
+    # load statistics, photos of trajectories are read on demand
+    store = TrajectoryStore(ftable1, ftable2)
+    traj_stats = store.stats_table()
 
     # remove trajctories with only one photos
     traj_stats = traj_stats[traj_stats['#Photo'] > 1]
@@ -90,32 +100,33 @@ def main(ftable1, ftable2):
 
     # trajectory with the most number of photos 
     ri = traj_stats['#Photo'].idxmax()
-    traj_id = traj_stats.ix[ri]['Trajectory_ID']
+    traj_id = traj_stats.loc[ri, 'Trajectory_ID']
     fname = 'most_photos.kml'
-    gen_kml(fname, traj_data, traj_stats, [traj_id], ['most_photos'])
+    gen_kml(fname, store, traj_stats, [traj_id], ['most_photos'])
 
     # trajectory took the longest time
     ri = traj_stats['Total_Time(min)'].idxmax()
-    traj_id = traj_stats.ix[ri]['Trajectory_ID']
+    traj_id = traj_stats.loc[ri, 'Trajectory_ID']
     fname = 'longest_time.kml'
-    gen_kml(fname, traj_data, traj_stats, [traj_id], ['longest_time'])
+    gen_kml(fname, store, traj_stats, [traj_id], ['longest_time'])
 
     # trajectory took the longest distance
     ri = traj_stats['Travel_Distance(km)'].idxmax()
-    traj_id = traj_stats.ix[ri]['Trajectory_ID']
+    traj_id = traj_stats.loc[ri, 'Trajectory_ID']
     fname = 'longest_distance.kml'
-    gen_kml(fname, traj_data, traj_stats, [traj_id], ['longest_distance'])
+    gen_kml(fname, store, traj_stats, [traj_id], ['longest_distance'])
 
     # trajectory has the highest speed
     ri = traj_stats['Average_Speed(km/h)'].idxmax()
-    traj_id = traj_stats.ix[ri]['Trajectory_ID']
+    traj_id = traj_stats.loc[ri, 'Trajectory_ID']
     fname = 'highest_speed.kml'
-    gen_kml(fname, traj_data, traj_stats, [traj_id], ['highest_speed'])
+    gen_kml(fname, store, traj_stats, [traj_id], ['highest_speed'])
 
     # random 5 trajectories
     traj_id_list = traj_stats['Trajectory_ID'].sample(n=5).tolist() # requires pandas version >= 0.16.1
     fname = 'random5.kml'
-    gen_kml(fname, traj_data, traj_stats, traj_id_list)
+    gen_kml(fname, store, traj_stats, traj_id_list)
+    store.close()
 
 
 if __name__ == '__main__':
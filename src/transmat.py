@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+
+# kinds of POI features used to factorise the transition matrix between POIs, see dataset_Melb.ipynb
+KINDS = ['cat', 'pop', 'visit', 'duration', 'neighbor']
+
+
+def normalise_transmat(transmat_cnt):
+    """Add 1 to every count and normalise each row, the same as normalise_transmat() in dataset_Melb.ipynb,
+       for a DataFrame or an array of counts, vectorised
+    """
+    values = np.asarray(transmat_cnt, dtype=np.float64) + 1
+    transmat = values / values.sum(axis=1, keepdims=True)
+    if isinstance(transmat_cnt, pd.DataFrame):
+        return pd.DataFrame(data=transmat, index=transmat_cnt.index, columns=transmat_cnt.columns)
+    return transmat
+
+
+def gen_logbins(values, nbins, duration=False):
+    """Uniform log-scale bins of POI popularity/#visit (or average visit duration), the same as dataset_Melb.ipynb"""
+    expo1 = np.log10(max(1, min(values)))
+    expo2 = np.log10(max(values))
+    logbins = np.logspace(np.floor(expo1), np.ceil(expo2), nbins + 1)
+    logbins[0] = 0  # deal with underflow
+    if duration:
+        logbins[-1] = np.power(10, expo2 + 2)
+    elif logbins[-1] < max(values):
+        logbins[-1] = max(values) + 1
+    return logbins
+
+
+class TransitionCounter:
+    """Transitions (consecutive POI pairs) of all trajectories in traj_dict extracted once as integer arrays,
+       transition matrices between POI feature classes of a set of trajectories (a training fold) are computed from
+       the POI pair counts of all trajectories by adding/subtracting the counts of trajectories not in the fold
+       (or repeated), and the last max_cache results are cached
+    """
+    def __init__(self, traj_dict, max_cache=16):
+        self.traj_ids = np.array(sorted(traj_dict.keys()), dtype=np.int64)
+        trajs = [traj_dict[tid] for tid in self.traj_ids.tolist()]
+        lens = np.array([len(t) for t in trajs], dtype=np.int64)
+        pois = np.array([p for t in trajs for p in t], dtype=np.int64)
+        self.poi_ids = np.unique(pois)
+        pois = np.searchsorted(self.poi_ids, pois)
+        npois = len(self.poi_ids)
+
+        # (p1, p2) pairs of each trajectory as keys p1 * #POIs + p2, in CSR form (pair_offsets, keys)
+        offsets = np.concatenate(([0], np.cumsum(lens)))
+        last = np.zeros(len(pois), dtype=bool)
+        last[offsets[1:][lens > 0] - 1] = True
+        self.keys = pois[:-1][~last[:-1]] * npois + pois[1:][~last[:-1]] if len(pois) > 0 else np.zeros(0, np.int64)
+        self.pair_offsets = np.concatenate(([0], np.cumsum(np.maximum(lens - 1, 0)))).astype(np.int64)
+        self.all_counts = np.bincount(self.keys, minlength=npois * npois)
+        self.max_cache = max_cache
+        self.cache = OrderedDict()
+
+
+    def pair_counts(self, trajid_list):
+        """Number of transitions between each pair of POIs (a flattened #POIs x #POIs array) in trajectories
+           trajid_list (duplicated IDs are counted repeatedly)
+        """
+        ix = np.searchsorted(self.traj_ids, trajid_list)
+        assert(np.all(self.traj_ids[np.minimum(ix, len(self.traj_ids) - 1)] == np.asarray(trajid_list)))
+        weights = np.bincount(ix, minlength=len(self.traj_ids))
+        diff = weights - 1
+        changed = np.flatnonzero(diff)
+        if len(changed) > len(self.traj_ids) // 2:
+            changed = np.flatnonzero(weights)
+            (base, diff) = (np.zeros_like(self.all_counts), weights)
+        else:
+            base = self.all_counts
+        counts = self.pair_offsets[changed + 1] - self.pair_offsets[changed]
+        pairs = np.repeat(self.pair_offsets[changed] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        delta = np.bincount(self.keys[pairs], weights=np.repeat(diff[changed], counts), minlength=len(base))
+        return base + np.rint(delta).astype(np.int64)
+
+
+    def poi_classes(self, pois, poi_info, poi_cats, logbins_pop, logbins_visit, logbins_duration, poi_clusters):
+        """Feature classes (0, 1, ...) of POIs (positions in poi_ids) of each kind, and the labels of classes"""
+        poi_ids = self.poi_ids[pois]
+        assert(np.all(pd.Index(poi_ids).isin(poi_info.index)))
+        info = poi_info.loc[poi_ids]
+        classes = dict()
+        labels = dict()
+        classes['cat'] = pd.Index(poi_cats).get_indexer(info['poiCat'])
+        labels['cat'] = poi_cats
+        for (kind, col, logbins) in [('pop', 'popularity', logbins_pop), ('visit', 'nVisit', logbins_visit), \
+                                     ('duration', 'avgDuration', logbins_duration)]:
+            classes[kind] = np.digitize(info[col].values, logbins) - 1
+            labels[kind] = np.arange(1, len(logbins))
+        nclusters = len(poi_clusters['clusterID'].unique())
+        classes['neighbor'] = poi_clusters.loc[poi_ids, 'clusterID'].values
+        labels['neighbor'] = np.arange(nclusters)
+        for kind in KINDS:
+            assert(np.all((classes[kind] >= 0) & (classes[kind] < len(labels[kind]))))
+        return classes, labels
+
+
+    def transmats(self, trajid_list, poi_info, poi_cats, logbins_pop, logbins_visit, logbins_duration, poi_clusters):
+        """Normalised transition matrices (DataFrames) between POI categories, popularity/#visit/average duration
+           classes and neighborhood clusters of trajectories trajid_list, a dictionary kind --> matrix, the same as
+           gen_transmat_cat(), gen_transmat_pop(), gen_transmat_visit(), gen_transmat_duration() and
+           gen_transmat_neighbor() in dataset_Melb.ipynb
+        """
+        counts = self.pair_counts(trajid_list)
+        npois = len(self.poi_ids)
+        nz = np.flatnonzero(counts)
+        pois = np.unique(np.concatenate((nz // npois, nz % npois)))
+        (classes, labels) = self.poi_classes(pois, poi_info, poi_cats, logbins_pop, logbins_visit, logbins_duration, \
+                                             poi_clusters)
+
+        # the result only depends on the fold and the classes of POIs with transitions
+        digest = hashlib.sha1(pois.tobytes())
+        for kind in KINDS:
+            digest.update(np.asarray(classes[kind], dtype=np.int64).tobytes())
+            digest.update(repr(list(labels[kind])).encode('utf-8'))
+        key = (tuple(np.sort(trajid_list).tolist()), digest.hexdigest())
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        (p1, p2) = (np.searchsorted(pois, nz // npois), np.searchsorted(pois, nz % npois))
+        result = dict()
+        for kind in KINDS:
+            n = len(labels[kind])
+            cnt = np.bincount(classes[kind][p1] * n + classes[kind][p2], weights=counts[nz], minlength=n * n)
+            result[kind] = normalise_transmat(pd.DataFrame(data=cnt.reshape(n, n), index=labels[kind], \
+                                                           columns=labels[kind]))
+        self.cache[key] = result
+        while len(self.cache) > self.max_cache:
+            self.cache.popitem(last=False)
+        return result
+
+
+def gen_poi_transmat(transmats, poi_set, poi_info, poi_cats, logbins_pop, logbins_visit, logbins_duration, poi_clusters):
+    """Transition matrix (a DataFrame) between POIs in poi_set factorised by the transition matrices between POI
+       feature classes (a dictionary kind --> matrix, see TransitionCounter.transmats()), the same as
+       gen_poi_transmat() in dataset_Melb.ipynb, vectorised:
+       the transition value of (p1, p2) is the product of the values of their classes, incoming values of POIs with
+       the same classes are divided uniformly among them, the value of the self-loop of such a group is divided among
+       the transitions between its POIs, and each row is normalised with no self-loops
+    """
+    poi_train = sorted(poi_set)
+    info = poi_info.loc[poi_train]
+    labels = {'cat': info['poiCat'].values, \
+              'pop': np.digitize(info['popularity'].values, logbins_pop), \
+              'visit': np.digitize(info['nVisit'].values, logbins_visit), \
+              'duration': np.digitize(info['avgDuration'].values, logbins_duration), \
+              'neighbor': poi_clusters.loc[poi_train, 'clusterID'].values}
+    assert(set(labels['cat']) <= set(poi_cats))
+    classes = []
+    value = np.ones((len(poi_train), len(poi_train)))
+    for kind in KINDS:  # the order of the Kronecker product
+        c = transmats[kind].index.get_indexer(labels[kind])
+        assert(np.all(c >= 0))
+        classes.append(c)
+        value = value * transmats[kind].values[c[:, None], c[None, :]]
+
+    # POIs with the same classes
+    (_, group, counts) = np.unique(np.stack(classes, axis=1), axis=0, return_inverse=True, return_counts=True)
+    group = group.ravel()
+    n = counts[group]
+    selfloop = np.diag(value).copy()
+    value = value / n[None, :]
+    same = (group[:, None] == group[None, :]) & (n[:, None] > 1)
+    value = np.where(same, selfloop[:, None] / np.maximum(n[:, None] - 1, 1), value)
+
+    # normalise each row
+    value[np.arange(len(poi_train)), np.arange(len(poi_train))] = 0
+    with np.errstate(divide='ignore'):
+        logvalue = np.log10(value) - np.log10(value.sum(axis=1, keepdims=True))
+    return pd.DataFrame(data=np.power(10, logvalue), index=poi_train, columns=poi_train)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print('Usage:', sys.argv[0], 'TRAJ_FILE(CSV)  POI_FILE(CSV)  CLUSTER_FILE(CSV)')
+        print('e.g. :', sys.argv[0], 'traj-noloop-all-Melb.csv  poi-Melb-all.csv  cluster.1.csv')
+        print('print the transition matrices between POI features of all trajectories')
+        sys.exit(0)
+
+    from poi_info import load_traj_all, extract_trajs, calc_poi_info
+
+    BIN_CLUSTER = 5
+    traj_all = load_traj_all(sys.argv[1])
+    poi_all = pd.read_csv(sys.argv[2], index_col='poiID')
+    poi_clusters = pd.read_csv(sys.argv[3], index_col='poiID')
+    trajid_set_all = sorted(traj_all['trajID'].unique().tolist())
+    poi_info = calc_poi_info(trajid_set_all, traj_all, poi_all)
+    poi_cats = sorted(poi_info['poiCat'].unique().tolist())
+    transmats = TransitionCounter(extract_trajs(traj_all)).transmats(trajid_set_all, poi_info, poi_cats, \
+                    gen_logbins(poi_info['popularity'], BIN_CLUSTER), gen_logbins(poi_info['nVisit'], BIN_CLUSTER), \
+                    gen_logbins(poi_info['avgDuration'], BIN_CLUSTER, duration=True), poi_clusters)
+    for kind in KINDS:
+        print(kind)
+        print(transmats[kind])